@@ -0,0 +1,1125 @@
+"""Mesures de performance du générateur de factures
+
+Usage : python benchmark.py [scenario ...]
+Sans argument, tous les scénarios sont exécutés.
+"""
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from facture_modeles import Article, Composant
+from facture_registre import AXES, ENTETE, Registre, journaliser
+from facture_seiko import Color
+
+
+def _composants_exemple(i):
+    """Cinq composants typiques d'une montre"""
+    return [
+        ('Mouvement', 'Valjoux 7750', 650.0 + i % 7),
+        ('Cadran', 'Noir mat', 120.0),
+        ('Boîtier', 'Acier 316L 42mm', 280.0),
+        ('Bracelet', 'Cuir noir', 90.0),
+        ('Main d\'œuvre', 'Assemblage', 210.0),
+    ]
+
+
+def _mesurer_memoire(fabrique, n):
+    """Retourne (octets alloués, objets) pour n articles créés par fabrique"""
+    tracemalloc.start()
+    objets = [fabrique(i) for i in range(n)]
+    taille, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return taille, objets
+
+
+def bench_memoire_articles(n=100_000):
+    """Compare l'empreinte mémoire des articles en dict et en dataclass"""
+    def article_dict(i):
+        composants = [{'nom': nom, 'reference': ref, 'prix': prix}
+                      for nom, ref, prix in _composants_exemple(i)]
+        return {
+            'modele': 'Chronographe Classique',
+            'reference': 'CC-2024-01',
+            'composants': composants,
+            'prix_total': sum(c['prix'] for c in composants),
+            'quantite': 1,
+        }
+
+    def article_slots(i):
+        composants = tuple(Composant(nom, ref, prix)
+                           for nom, ref, prix in _composants_exemple(i))
+        return Article('Chronographe Classique', 'CC-2024-01', composants, 1)
+
+    taille_dict, _ = _mesurer_memoire(article_dict, n)
+    taille_slots, _ = _mesurer_memoire(article_slots, n)
+    gain = 100 * (1 - taille_slots / taille_dict)
+    print(f"  {n} articles en dict      : {taille_dict / 1e6:8.1f} Mo")
+    print(f"  {n} articles en dataclass : {taille_slots / 1e6:8.1f} Mo")
+    print(f"  {Color.GREEN}Réduction : {gain:.0f} %{Color.RESET}")
+
+
+def bench_registre(n=1_000_000):
+    """Agrégations du registre en colonnes sur un million de lignes, en mémoire
+    puis depuis le journal CSV comme la commande rapport"""
+    registre = Registre()
+    clients = [f"Client {i}" for i in range(5_000)]
+    modeles = [f"Modèle {i}" for i in range(200)]
+    for i in range(n):
+        ht = 500.0 + i % 1000
+        registre.ajouter(f"01/{1 + i % 12:02d}/{2020 + i % 5}",
+                         clients[i % len(clients)], modeles[i % len(modeles)],
+                         1 + i % 3, 5, ht, ht * 0.2)
+
+    for axe in AXES:
+        debut = time.perf_counter()
+        totaux = registre.totaux_par(axe)
+        duree = time.perf_counter() - debut
+        print(f"  totaux par {axe:7} : {len(totaux):5} groupes en {duree * 1000:7.1f} ms")
+    debut = time.perf_counter()
+    registre.top_modeles(10)
+    print(f"  top 10 modèles      : {(time.perf_counter() - debut) * 1000:7.1f} ms")
+
+    # Chemin de `rapport` : chargement du registre, puis agrégation
+    with tempfile.TemporaryDirectory() as dossier:
+        chemin = os.path.join(dossier, 'registre.csv')
+        with open(chemin, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(ENTETE)
+            for i in range(n):
+                ht = 500.0 + i % 1000
+                # Trois lignes par facture
+                writer.writerow((f"01/{1 + i % 12:02d}/{2020 + i % 5}", f"SM-{i // 3:07d}",
+                                 clients[i % len(clients)], modeles[i % len(modeles)],
+                                 1 + i % 3, 5, f"{ht:.2f}", f"{ht * 0.2:.2f}"))
+
+        def rapport():
+            debut = time.perf_counter()
+            registre = Registre.charger(chemin)
+            registre.totaux_par('mois')
+            return registre, time.perf_counter() - debut
+
+        _, duree = rapport()
+        print(f"  rapport, CSV seul   : {duree:7.2f} s (colonnes reconstruites)")
+        _, duree = min((rapport() for _ in range(3)), key=lambda r: r[1])
+        print(f"  {Color.GREEN}rapport, colonnes   : {duree:7.2f} s{Color.RESET}")
+
+        # Factures régénérées : journalisées à nouveau, sous le même numéro
+        regenerees = n // 3000
+        composants = [Composant(*c) for c in _composants_exemple(0)]
+        debut = time.perf_counter()
+        for i in range(regenerees):
+            facture = SimpleNamespace(
+                donnees={'date_facture': '01/01/2020', 'num_commande': f"SM-{i * 1000:07d}",
+                         'client_nom': clients[0]},
+                articles=[Article(modeles[0], 'REF', composants)], tva=0.2)
+            journaliser(facture, chemin)
+        par_facture = (time.perf_counter() - debut) / regenerees
+        registre, duree = min((rapport() for _ in range(3)), key=lambda r: r[1])
+        print(f"  journaliser        : {par_facture * 1000:7.2f} ms par facture")
+        print(f"  rapport, {regenerees} régénérées : {duree:7.2f} s ({len(registre)} lignes retenues)")
+
+
+def bench_polices(n=50):
+    """Création et sortie de documents : add_font par chemin contre chargeur
+    partagé"""
+    from fpdf import FPDF
+    from facture_polices import POLICES_DEJAVU, ajouter_polices_dejavu, chemin_police
+
+    def document_classique():
+        pdf = FPDF()
+        for style, nom_fichier in POLICES_DEJAVU.items():
+            pdf.add_font('DejaVu', style, chemin_police(nom_fichier))
+        pdf.add_page()
+        pdf.set_font('DejaVu', 'B', 10)
+        pdf.cell(0, 5, 'Atelier S-MOD')
+        return pdf
+
+    def document_partage():
+        pdf = FPDF()
+        ajouter_polices_dejavu(pdf)
+        pdf.add_page()
+        pdf.set_font('DejaVu', 'B', 10)
+        pdf.cell(0, 5, 'Atelier S-MOD')
+        return pdf
+
+    # Mesures alternées, la meilleure de chaque ; la sortie (sous-ensemble
+    # des polices) fait partie du coût d'un document
+    fabriques = {'add_font par chemin': document_classique, 'chargeur partagé': document_partage}
+    durees = dict.fromkeys(fabriques, float('inf'))
+    for _ in range(n):
+        for libelle, fabrique in fabriques.items():
+            debut = time.perf_counter()
+            fabrique().output()
+            durees[libelle] = min(durees[libelle], time.perf_counter() - debut)
+    for libelle, duree in durees.items():
+        print(f"  {libelle:20} : {duree * 1000:6.1f} ms par document")
+
+
+def _articles_exemple(n):
+    """n articles de cinq composants"""
+    return [
+        Article(f"Modèle {i % 20}", f"REF-{i:05d}",
+                tuple(Composant(*c) for c in _composants_exemple(i)), 1 + i % 3)
+        for i in range(n)
+    ]
+
+
+def _facture_exemple(n):
+    """Facture reproductible de n articles, prête à être mise en page"""
+    from facture_seiko import FactureMouvementAbsolu
+
+    facture = FactureMouvementAbsolu({
+        'num_commande': 'SM-BENCH-0001',
+        'date_facture': '01/01/2026',
+        'client_nom': 'Client Test',
+        'client_adresse': '1 rue de la Paix',
+        'client_cp': '75002',
+        'client_ville': 'Paris',
+    }, deterministe=True)
+    facture.articles = _articles_exemple(n)
+    return facture
+
+
+def bench_lignes(n=1_000):
+    """Mise en page du tableau : cell() par colonne contre écriture directe"""
+    from facture_seiko import FactureMouvementAbsolu
+
+    for direct in (False, True):
+        FactureMouvementAbsolu.rendu_direct = direct
+        facture = _facture_exemple(n)
+        debut = time.perf_counter()
+        facture._mettre_en_page()
+        duree = time.perf_counter() - debut
+        libelle = 'écriture directe' if direct else 'cell() par colonne'
+        print(f"  {libelle:18} : {duree * 1000:7.1f} ms pour {n} articles")
+    FactureMouvementAbsolu.rendu_direct = True
+
+
+def _pic_generation(n, flux):
+    """Pic de mémoire (octets) de la génération d'une facture de n articles"""
+    facture = _facture_exemple(n)
+    facture.flux = flux
+    dossier_initial = os.getcwd()
+    with tempfile.TemporaryDirectory() as dossier:
+        os.chdir(dossier)
+        try:
+            tracemalloc.start()
+            facture.generer_facture()
+            _, pic = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            os.chdir(dossier_initial)
+    return pic, len(facture.pdf.pages)
+
+
+def bench_memoire_flux(tailles=(250, 2_000)):
+    """Pic de mémoire de generer_facture, document entier contre mode flux
+
+    Le mode flux doit rester borné : son pic ne doit pas croître comme le
+    nombre de pages.
+    """
+    # Chauffe : métriques des polices et caches de module hors mesure
+    _facture_exemple(1).rendre_pdf()
+    pics = {}
+    for flux in (False, True):
+        for n in tailles:
+            pic, pages = _pic_generation(n, flux)
+            pics[flux, n] = pic
+            libelle = 'mode flux' if flux else 'document entier'
+            print(f"  {libelle:16} : {n:5} articles, {pages:4} pages, pic {pic / 1e6:6.1f} Mo")
+
+    petit, grand = tailles
+    croissance = pics[True, grand] / pics[True, petit]
+    # Tolérance pour ce qui reste proportionnel aux pages (objets PDFPage)
+    borne = 1.5
+    couleur = Color.GREEN if croissance <= borne else Color.RED
+    print(f"  {couleur}Mode flux : pic × {croissance:.2f} pour {grand // petit} fois "
+          f"plus d'articles (borne {borne}){Color.RESET}")
+    assert croissance <= borne, "mémoire du mode flux non bornée"
+
+
+def bench_lot(n=100, processus=None):
+    """Lot de factures : rendu puis écriture en série contre pipeline"""
+    from facture_lot import generer_lot
+
+    factures = []
+    for i in range(n):
+        facture = _facture_exemple(10)
+        facture.donnees['num_commande'] = f"SM-BENCH-{i:04d}"
+        factures.append(facture)
+
+    dossier_initial = os.getcwd()
+    with tempfile.TemporaryDirectory() as dossier:
+        os.chdir(dossier)
+        try:
+            debut = time.perf_counter()
+            for facture in factures:
+                facture.generer_facture()
+            duree_serie = time.perf_counter() - debut
+
+            debut = time.perf_counter()
+            generer_lot([(f.donnees, tuple(f.articles)) for f in factures],
+                        processus=processus, deterministe=True)
+            duree_lot = time.perf_counter() - debut
+        finally:
+            os.chdir(dossier_initial)
+    print(f"  en série               : {n / duree_serie:6.1f} factures/s (sans fsync)")
+    processus = processus or os.cpu_count()
+    print(f"  pipeline, {processus} processus : {n / duree_lot:6.1f} factures/s (avec fsync)")
+
+
+def bench_surveillance(n=100, processus=None):
+    """Débit du démon de surveillance sur n commandes déjà déposées"""
+    import json
+    from facture_surveillance import Surveillance
+
+    dossier_initial = os.getcwd()
+    with tempfile.TemporaryDirectory() as dossier:
+        os.chdir(dossier)
+        try:
+            os.mkdir('commandes')
+            for i in range(n):
+                facture = _facture_exemple(5)
+                commande = dict(facture.donnees, num_commande=f"SM-BENCH-{i:04d}")
+                commande['articles'] = [
+                    {'modele': a.modele, 'reference': a.reference, 'quantite': a.quantite,
+                     'composants': [{'nom': c.nom, 'reference': c.reference, 'prix': c.prix}
+                                    for c in a.composants]}
+                    for a in facture.articles
+                ]
+                with open(os.path.join('commandes', f"{i:04d}.json"), 'w', encoding='utf-8') as f:
+                    json.dump(commande, f)
+            surveillance = Surveillance('commandes', processus=processus, delai=0.1)
+            debut = time.perf_counter()
+            surveillance.executer(limite=n)
+            duree = time.perf_counter() - debut
+        finally:
+            os.chdir(dossier_initial)
+    print(f"  {surveillance.traitees} commandes en {duree:.1f} s "
+          f"({surveillance.processus} processus) : {60 * n / duree:5.0f} factures/min")
+
+
+def bench_catalogue(n=50_000, requetes=1_000):
+    """Recherche par préfixe dans un catalogue de n composants"""
+    from facture_catalogue import Catalogue
+
+    calibres = ['Valjoux 7750', 'Miyota 9015', 'Seiko NH35', 'ETA 2824', 'Sellita SW200',
+                'Ronda 515', 'Soprod P024', 'Zenith El Primero']
+    saisies = ['v', 'val', 'valjoux 77', 'miyota 90', '7750', 'sel', 'sw2', 'zen', 'e', 'ronda 5']
+    with tempfile.TemporaryDirectory() as dossier:
+        catalogue = Catalogue(os.path.join(dossier, 'catalogue.sqlite'))
+        csv_chemin = os.path.join(dossier, 'catalogue.csv')
+        with open(csv_chemin, 'w', encoding='utf-8') as f:
+            f.write("categorie;reference;prix\n")
+            for i in range(n):
+                calibre = calibres[i % len(calibres)]
+                f.write(f"Mouvement;{calibre} v{i // len(calibres)};{100 + i % 900},50\n")
+        debut = time.perf_counter()
+        catalogue.importer_csv(csv_chemin)
+        print(f"  import de {len(catalogue)} composants : {time.perf_counter() - debut:.2f} s")
+
+        for categorie in (None, 'Mouvement'):
+            debut = time.perf_counter()
+            for i in range(requetes):
+                resultats = catalogue.rechercher(saisies[i % len(saisies)], categorie)
+            duree = (time.perf_counter() - debut) / requetes
+            libelle = 'toutes catégories' if categorie is None else 'une catégorie'
+            print(f"  recherche, {libelle:17} : {duree * 1e3:6.3f} ms par frappe")
+        assert resultats and all(c.reference.startswith('Ronda 5') for c in resultats)
+        assert catalogue.rechercher('7750')[0].reference.startswith('Valjoux 7750')
+        catalogue.fermer()
+
+
+def bench_clients(n=100_000, requetes=1_000):
+    """Recherche au fil de la frappe dans un annuaire de n clients"""
+    from facture_clients import Annuaire, Client
+
+    prenoms = ['Jean', 'Marie', 'Pierre', 'Sophie', 'Luc', 'Anne', 'Paul', 'Julie']
+    noms = ['Martin', 'Bernard', 'Dubois', 'Thomas', 'Lefèvre', 'Moreau', 'Garcia', 'Roux']
+    villes = ['Paris', 'Lyon', 'Marseille', 'Toulouse', 'Nantes', 'Saint-Étienne', 'Lille']
+    saisies = ['m', 'ma', 'mart', 'jean ly', 'lefe', 'saint et', 'dubois par', 'julie roux 9']
+    with tempfile.TemporaryDirectory() as dossier:
+        annuaire = Annuaire(os.path.join(dossier, 'clients.sqlite'))
+        debut = time.perf_counter()
+        with annuaire._cnx:
+            for i in range(n):
+                annuaire._enregistrer(Client(
+                    f"{prenoms[i % 8]} {noms[i // 8 % 8]} {i}", f"{i} rue de la Paix",
+                    f"{10000 + i % 85000:05d}", villes[i % 7],
+                ))
+        print(f"  {len(annuaire)} clients indexés en {time.perf_counter() - debut:.2f} s")
+
+        fts5 = annuaire.plein_texte
+        for plein_texte in (False, True) if fts5 else (False,):
+            annuaire.plein_texte = plein_texte
+            debut = time.perf_counter()
+            for i in range(requetes):
+                resultats = annuaire.rechercher(saisies[i % len(saisies)])
+            duree = (time.perf_counter() - debut) / requetes
+            libelle = 'index FTS5' if plein_texte else 'LIKE sur la table'
+            print(f"  {libelle:17} : {duree * 1e3:6.3f} ms par frappe")
+            assert resultats and all(c.nom.startswith('Julie Roux 9') for c in resultats)
+        annuaire.fermer()
+
+
+def bench_recherche(n=50_000, requetes=200):
+    """Recherche plein texte dans une archive de n factures"""
+    from facture_recherche import IndexFactures
+
+    calibres = [('Mouvement', 'Valjoux 7750'), ('Mouvement', 'Miyota 9015'),
+                ('Mouvement', 'Seiko NH35'), ('Mouvement', 'ETA 2824')]
+    villes = ['Paris', 'Lyon', 'Marseille', 'Toulouse', 'Nantes', 'Lille']
+    with tempfile.TemporaryDirectory() as dossier:
+        index = IndexFactures(os.path.join(dossier, 'recherche.sqlite'))
+        modele = _facture_exemple(3)
+
+        def archive():
+            for i in range(n):
+                mouvement = Composant(*calibres[i % len(calibres)], 650.0)
+                modele.articles = [
+                    Article(f"Modèle {i % 40}", f"CC-{2020 + i % 5}-{i % 97:02d}",
+                            (mouvement,) + article.composants[1:], 1)
+                    for article in modele.articles
+                ]
+                modele.donnees.update(
+                    num_commande=f"SM-{2020 + i % 5}-{i:06d}",
+                    date_facture=f"{1 + i % 28:02d}/{1 + i % 12:02d}/{2020 + i % 5}",
+                    client_nom=f"Client {i % 5_000}", client_ville=villes[i % 6],
+                )
+                yield modele
+
+        debut = time.perf_counter()
+        index.indexer_lot(archive())
+        print(f"  {len(index)} factures indexées en {time.perf_counter() - debut:.2f} s")
+
+        for texte in ('valjoux 7750', 'CC-2023-42', 'client 4242 paris', 'miy', 'cadran'):
+            debut = time.perf_counter()
+            for page in range(1, requetes + 1):
+                resultats = index.rechercher(texte, page=1 + page % 5)
+            duree = (time.perf_counter() - debut) / requetes
+            print(f"  {texte!r:20} : {resultats.total:6} factures, "
+                  f"{duree * 1e3:6.2f} ms par page de {resultats.par_page}")
+        assert index.rechercher('"valjoux 7750"').total == n // len(calibres)
+        index.fermer()
+
+
+def bench_rapprochement(n=20_000):
+    """Rapprochement d'une année de relevés avec n factures ouvertes"""
+    from facture_comptes import Comptes
+    from facture_rapprochement import rapprocher
+
+    def numero(i):
+        return f"SM-2025{1 + i % 12:02d}-{i // 12:04d}"
+
+    def euros(montant):
+        return f"{montant // 100},{montant % 100:02d}"
+
+    with tempfile.TemporaryDirectory() as dossier:
+        base = os.path.join(dossier, 'comptes.sqlite')
+        comptes = Comptes(base)
+        with comptes.transaction():
+            for i in range(n):
+                comptes.inscrire(numero(i), '01/01/2025',
+                                 f"Client {i}", 100_000 + i * 7)
+        comptes.fermer()
+
+        # Un virement par facture : numéro dans le libellé (forme variable),
+        # montant seul, acompte puis solde, ou virement groupé de deux factures
+        releve = os.path.join(dossier, 'releve.csv')
+        with open(releve, 'w', encoding='utf-8') as f:
+            f.write("Relevé du compte 0001\nDate;Libellé;Débit;Crédit\n")
+            i = 0
+            while i < n:
+                num, ttc = numero(i), 100_000 + i * 7
+                if i % 4 == 0:
+                    f.write(f"02/03/2025;VIR SEPA CLIENT {i} REF {num.replace('-', '')};;{euros(ttc)}\n")
+                elif i % 4 == 1:
+                    f.write(f"02/03/2025;VIR SEPA CLIENT {i};;{euros(ttc)}\n")
+                elif i % 4 == 2:
+                    f.write(f"02/03/2025;ACOMPTE {num};;{euros(ttc // 2)}\n")
+                    f.write(f"09/03/2025;SOLDE {num};;{euros(ttc - ttc // 2)}\n")
+                else:
+                    suivant = numero(i + 1)
+                    total = ttc + 100_000 + (i + 1) * 7
+                    f.write(f"02/03/2025;FACTURES {num} {suivant};;{euros(total)}\n")
+                    i += 1
+                f.write("03/03/2025;PRLV URSSAF;1234,00;\n")
+                i += 1
+
+        debut = time.perf_counter()
+        bilan = rapprocher([releve], base)
+        duree = time.perf_counter() - debut
+        print(f"  {bilan.lues} crédits, {bilan.factures_soldees} factures soldées "
+              f"en {duree:.2f} s ({bilan.lues / duree:,.0f} lignes/s)")
+        deuxieme = rapprocher([releve], base)
+        print(f"  relecture : {deuxieme.deja_traitees} crédits déjà rapprochés, "
+              f"{deuxieme.rapprochees} nouveaux")
+        assert bilan.factures_soldees == n and not bilan.non_rapprochees
+        assert deuxieme.rapprochees == 0
+
+
+def bench_echeances(n=500_000, ouvertes=2_000):
+    """Balance âgée sur dix ans d'historique : n factures, dont quelques-unes ouvertes"""
+    from datetime import date, timedelta
+    from facture_comptes import Comptes
+
+    # Factures ouvertes réparties sur la dernière année
+    pas = n // 10 // ouvertes
+    with tempfile.TemporaryDirectory() as dossier:
+        comptes = Comptes(os.path.join(dossier, 'comptes.sqlite'))
+        debut_historique = date(2016, 1, 1)
+        lignes = []
+        for i in range(n):
+            jour = debut_historique + timedelta(days=i * 3650 // n)
+            ouverte = i >= n - n // 10 and i % pas == 0
+            lignes.append((f"SM-{i:08d}", jour.isoformat(), f"Client {i % 5_000}", 100_000,
+                           0 if ouverte else 100_000, 'ouverte' if ouverte else 'payee',
+                           (jour + timedelta(days=30)).isoformat()))
+        with comptes.transaction():
+            comptes._cnx.executemany(
+                "INSERT INTO factures (num_commande, date, client, ttc, regle, statut, echeance) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", lignes,
+            )
+        jour = debut_historique + timedelta(days=3650)
+
+        debut = time.perf_counter()
+        balance = comptes.balance_agee(jour)
+        duree_index = time.perf_counter() - debut
+        debut = time.perf_counter()
+        comptes._cnx.execute(
+            "SELECT COUNT(*), SUM(ttc - regle - avoir) FROM factures "
+            "WHERE +statut IN ('ouverte', 'partielle') AND +echeance < ?", (jour.isoformat(),)
+        ).fetchone()
+        duree_parcours = time.perf_counter() - debut
+        comptes.fermer()
+    for tranche, (nombre, reste) in balance.items():
+        print(f"  {tranche:9} : {nombre:5} factures, {reste / 100:12.2f} EUR")
+    print(f"  balance âgée (5 lectures d'index) : {duree_index * 1e3:7.2f} ms sur {n} factures")
+    print(f"  une seule somme par parcours      : {duree_parcours * 1e3:7.2f} ms")
+    assert sum(nombre for nombre, _ in balance.values()) == ouvertes
+
+
+def bench_devis(n=20, articles=30, processus=None):
+    """Devis convertis en factures : ressaisie contre reprise du devis"""
+    from dataclasses import asdict
+    from facture_devis import CarnetDevis, DevisMouvementAbsolu, convertir_acceptes
+    from facture_seiko import FactureMouvementAbsolu
+
+    dossier_initial = os.getcwd()
+    with tempfile.TemporaryDirectory() as dossier:
+        os.chdir(dossier)
+        try:
+            tous_devis = []
+            for i in range(n):
+                devis = DevisMouvementAbsolu(dict(_facture_exemple(0).donnees,
+                                                  num_commande=f"DV-BENCH-{i:04d}"),
+                                             deterministe=True)
+                devis.articles = _articles_exemple(articles)
+                devis.generer_facture()
+                tous_devis.append(devis)
+
+            # Ressaisie : la commande est relue et la facture mise en page de zéro
+            debut = time.perf_counter()
+            ressaisies = []
+            for i, devis in enumerate(tous_devis):
+                commande = dict(devis.donnees, num_commande=f"SM-BENCH-{i:04d}",
+                                num_devis=devis.donnees['num_commande'],
+                                articles=[asdict(a) for a in devis.articles])
+                facture = FactureMouvementAbsolu.depuis_commande(commande, deterministe=True)
+                ressaisies.append(facture.rendre_pdf())
+            duree_ressaisie = time.perf_counter() - debut
+
+            debut = time.perf_counter()
+            converties = [devis.convertir(f"SM-BENCH-{i:04d}", devis.donnees['date_facture']).rendre_pdf()
+                          for i, devis in enumerate(tous_devis)]
+            duree_conversion = time.perf_counter() - debut
+            assert converties == ressaisies, "la facture convertie diffère de la facture ressaisie"
+
+            carnet = CarnetDevis()
+            for devis in tous_devis:
+                carnet.changer_statut(devis.donnees['num_commande'], 'accepte')
+            debut = time.perf_counter()
+            chemins = convertir_acceptes(processus, deterministe=True)
+            duree_lot = time.perf_counter() - debut
+            assert len(chemins) == n and not carnet.acceptes()
+            assert all(statut == 'converti' for *_, statut, _ in carnet.liste())
+            carnet.fermer()
+        finally:
+            os.chdir(dossier_initial)
+    print(f"  ressaisie puis rendu   : {duree_ressaisie / n * 1e3:6.1f} ms par facture ({articles} articles)")
+    print(f"  conversion du devis    : {duree_conversion / n * 1e3:6.1f} ms par facture (PDF identique)")
+    processus = processus or os.cpu_count()
+    print(f"  lot des devis acceptés : {n / duree_lot:6.1f} factures/s ({processus} processus, avec fsync)")
+
+
+def bench_avoirs(n=200_000, avoirs=20_000, clients=20_000, requetes=2_000):
+    """Soldes avoirs déduits, par facture et par client, sur n factures"""
+    from facture_comptes import Comptes
+
+    with tempfile.TemporaryDirectory() as dossier:
+        comptes = Comptes(os.path.join(dossier, 'comptes.sqlite'))
+        with comptes.transaction():
+            comptes._cnx.executemany(
+                "INSERT INTO factures (num_commande, date, client, ttc, echeance) VALUES (?, ?, ?, ?, ?)",
+                ((f"SM-{i:08d}", '2026-01-01', f"Client {i % clients}", 120_000, '2026-01-31')
+                 for i in range(n)),
+            )
+        debut = time.perf_counter()
+        with comptes.transaction():
+            for i in range(avoirs):
+                comptes.inscrire_avoir(f"AV-{i:08d}", f"SM-{i * (n // avoirs):08d}", '01/02/2026', 12_000)
+        duree_inscription = time.perf_counter() - debut
+
+        debut = time.perf_counter()
+        for i in range(requetes):
+            solde = comptes.solde_facture(f"SM-{i * (n // requetes):08d}")
+            comptes.avoirs(f"SM-{i * (n // requetes):08d}")
+        duree_facture = (time.perf_counter() - debut) / requetes
+        debut = time.perf_counter()
+        for i in range(requetes):
+            solde = comptes.solde_client(f"Client {i % clients}")
+        duree_client = (time.perf_counter() - debut) / requetes
+        assert solde.factures == n // clients
+
+        # Sans index : somme des avoirs relue dans la table pour le client
+        debut = time.perf_counter()
+        for i in range(20):
+            comptes._cnx.execute(
+                "SELECT SUM(f.ttc), SUM(f.regle), (SELECT SUM(a.ttc) FROM avoirs a "
+                "JOIN factures g ON g.num_commande = a.num_commande WHERE +g.client = ?) "
+                "FROM factures f WHERE +f.client = ?", (f"Client {i}", f"Client {i}")
+            ).fetchone()
+        duree_parcours = (time.perf_counter() - debut) / 20
+        total = comptes.solde_client('Client 0')
+        comptes.fermer()
+    print(f"  {avoirs} avoirs imputés en {duree_inscription:.2f} s")
+    print(f"  solde d'une facture et ses avoirs : {duree_facture * 1e3:7.3f} ms")
+    print(f"  solde d'un client (index)         : {duree_client * 1e3:7.3f} ms")
+    print(f"  solde d'un client (parcours)      : {duree_parcours * 1e3:7.3f} ms ({n} factures)")
+    assert total.avoirs == 12_000 * sum(1 for i in range(avoirs) if i * (n // avoirs) % clients == 0)
+
+
+def bench_releves(n=240_000, clients=1_000, mois=24, inscriptions=2_000, rendus=20):
+    """Relevés mensuels de tous les clients : cumuls mensuels contre relecture
+    de l'historique"""
+    from facture_comptes import Comptes
+    from facture_releves import Releve
+
+    periodes = [f"{2024 + m // 12}-{1 + m % 12:02d}" for m in range(mois)]
+    with tempfile.TemporaryDirectory() as dossier:
+        comptes = Comptes(os.path.join(dossier, 'comptes.sqlite'))
+        with comptes.transaction():
+            comptes._cnx.executemany(
+                "INSERT INTO factures (num_commande, date, client, ttc, echeance) VALUES (?, ?, ?, ?, ?)",
+                ((f"SM-{i:08d}", f"{periodes[i * mois // n]}-{1 + i % 28:02d}",
+                  f"Client {i % clients}", 120_000, '') for i in range(n)),
+            )
+            # Une facture sur deux réglée le 28 du mois
+            comptes._cnx.executemany(
+                "INSERT INTO reglements (num_commande, montant, date) VALUES (?, ?, ?)",
+                ((f"SM-{i:08d}", 120_000, f"{periodes[i * mois // n]}-28") for i in range(0, n, 2)),
+            )
+            debut = time.perf_counter()
+            comptes.reconstruire_mouvements()
+            duree_reconstruction = time.perf_counter() - debut
+
+        # Tenue des cumuls au fil des factures et des règlements
+        debut = time.perf_counter()
+        with comptes.transaction():
+            for i in range(inscriptions):
+                comptes.inscrire(f"SM-X{i:07d}", f"01/{periodes[-1][5:]}/{periodes[-1][:4]}",
+                                 f"Client {i % clients}", 60_000)
+                comptes.regler(f"SM-X{i:07d}", 60_000, f"15/{periodes[-1][5:]}/{periodes[-1][:4]}")
+        duree_inscription = (time.perf_counter() - debut) / inscriptions
+
+        dernier = periodes[-1]
+        debut = time.perf_counter()
+        soldes = comptes.soldes_mensuels(dernier)
+        ecritures = comptes.ecritures(dernier)
+        duree_cumuls = time.perf_counter() - debut
+
+        # Sans cumuls : soldes d'ouverture recalculés sur tout l'historique
+        debut = time.perf_counter()
+        ouvertures = dict(comptes._cnx.execute(
+            "SELECT client, SUM(montant) FROM ("
+            "SELECT client, ttc AS montant FROM factures WHERE date < :debut "
+            "UNION ALL SELECT f.client, -a.ttc FROM avoirs a JOIN factures f USING (num_commande) "
+            "WHERE a.date < :debut "
+            "UNION ALL SELECT f.client, -r.montant FROM reglements r JOIN factures f USING (num_commande) "
+            "WHERE r.date < :debut) GROUP BY client", {'debut': f"{dernier}-01"}
+        ).fetchall())
+        comptes.ecritures(dernier)
+        duree_historique = time.perf_counter() - debut
+        assert all(ouvertures.get(client, 0) == ouverture for client, ouverture, _ in soldes)
+        comptes.fermer()
+
+    par_client = {}
+    for ligne in ecritures:
+        par_client.setdefault(ligne[0], []).append(ligne[1:])
+    debut = time.perf_counter()
+    for client, ouverture, _ in soldes[:rendus]:
+        Releve(client, dernier, ouverture, tuple(par_client.get(client, ()))).rendre_pdf()
+    duree_rendu = (time.perf_counter() - debut) / rendus
+
+    print(f"  reconstruction des cumuls   : {duree_reconstruction:7.2f} s ({n} factures, {mois} mois)")
+    print(f"  facture + règlement cumulés : {duree_inscription * 1e3:7.3f} ms")
+    print(f"  {len(soldes)} relevés, cumuls     : {duree_cumuls * 1e3:7.1f} ms ({len(ecritures)} écritures)")
+    print(f"  {len(soldes)} relevés, historique : {duree_historique * 1e3:7.1f} ms")
+    print(f"  mise en page d'un relevé    : {duree_rendu * 1e3:7.1f} ms")
+
+
+def bench_facturx(n=30, articles=10, processus=None, tours=3):
+    """Surcoût du XML Factur-X joint au PDF, en rendu seul et en lot"""
+    from facture_facturx import xml_facturx
+    from facture_lot import generer_lot
+    from facture_seiko import FactureMouvementAbsolu
+
+    def factures(facturx):
+        lot = []
+        for i in range(n):
+            facture = FactureMouvementAbsolu(dict(_facture_exemple(0).donnees,
+                                                  num_commande=f"SM-BENCH-{i:04d}"),
+                                             deterministe=True, facturx=facturx)
+            facture.articles = _articles_exemple(articles)
+            lot.append(facture)
+        return lot
+
+    # Rendus alternés, après un rendu de chauffe de chaque variante : la
+    # dérive de la machine touche les deux
+    durees = {False: 0.0, True: 0.0}
+    tailles = {}
+    for facturx in (False, True):
+        factures(facturx)[0].rendre_pdf()
+    for avec, sans in zip(factures(True), factures(False)):
+        for facture in (sans, avec):
+            debut = time.perf_counter()
+            tailles[facture.facturx] = len(facture.rendre_pdf())
+            durees[facture.facturx] += time.perf_counter() - debut
+    facture = factures(True)[0]
+    debut = time.perf_counter()
+    for _ in range(n):
+        xml = xml_facturx(facture)
+    duree_xml = time.perf_counter() - debut
+
+    dossier_initial = os.getcwd()
+    paires = {facturx: [(f.donnees, tuple(f.articles)) for f in factures(facturx)]
+              for facturx in (False, True)}
+    lots = dict.fromkeys(paires, float('inf'))
+    with tempfile.TemporaryDirectory() as dossier:
+        os.chdir(dossier)
+        try:
+            # Lot de chauffe de chaque variante (archives créées, caches du
+            # système remplis), puis meilleur de plusieurs tours alternés
+            for facturx, lot in paires.items():
+                generer_lot(lot, processus, deterministe=True, facturx=facturx)
+            for _ in range(tours):
+                for facturx, lot in paires.items():
+                    debut = time.perf_counter()
+                    generer_lot(lot, processus, deterministe=True, facturx=facturx)
+                    lots[facturx] = min(lots[facturx], time.perf_counter() - debut)
+        finally:
+            os.chdir(dossier_initial)
+    print(f"  XML seul               : {duree_xml / n * 1e3:6.2f} ms par facture "
+          f"({len(xml) / 1024:.1f} Ko, {articles} articles), "
+          f"{duree_xml / durees[False] * 100:.2f} % du rendu")
+    print(f"  rendu sans Factur-X    : {durees[False] / n * 1e3:6.1f} ms par facture ({tailles[False] / 1024:.1f} Ko)")
+    print(f"  rendu avec Factur-X    : {durees[True] / n * 1e3:6.1f} ms par facture "
+          f"({tailles[True] / 1024:.1f} Ko) : {(durees[True] / durees[False] - 1) * 100:+.1f} %")
+    processus = processus or os.cpu_count()
+    print(f"  lot sans / avec        : {n / lots[False]:6.1f} / {n / lots[True]:6.1f} factures/s "
+          f"({processus} processus) : {(lots[True] / lots[False] - 1) * 100:+.1f} %")
+
+
+def bench_identite(n=100_000, rendus=20):
+    """Identité de l'entreprise : compilation, accès par document et rechargement"""
+    import facture_identite
+    from facture_identite import CHEMIN_IDENTITE, charger, identite_courante
+
+    debut = time.perf_counter()
+    for _ in range(100):
+        charger(CHEMIN_IDENTITE)
+    duree_chargement = (time.perf_counter() - debut) / 100
+
+    identite_courante()
+    debut = time.perf_counter()
+    for _ in range(n):
+        identite_courante()
+    duree_acces = (time.perf_counter() - debut) / n
+
+    # Contrôle du fichier à chaque appel : borne haute du démon
+    delai = facture_identite.DELAI_RECHARGEMENT
+    facture_identite.DELAI_RECHARGEMENT = 0
+    try:
+        debut = time.perf_counter()
+        for _ in range(n):
+            identite_courante()
+        duree_controle = (time.perf_counter() - debut) / n
+
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'identite.json')
+            with open(CHEMIN_IDENTITE, 'rb') as source, open(chemin, 'wb') as copie:
+                copie.write(source.read())
+            identite_courante(chemin=chemin)
+            with open(chemin, encoding='utf-8') as f:
+                config = json.load(f)
+            config['entreprise']['enseigne'] = 'ATELIER TEST'
+            with open(chemin, 'w', encoding='utf-8') as f:
+                json.dump(config, f, ensure_ascii=False)
+            debut = time.perf_counter()
+            recharge = identite_courante(chemin=chemin).bandeau == 'ATELIER TEST'
+            duree_rechargement = time.perf_counter() - debut
+    finally:
+        facture_identite.DELAI_RECHARGEMENT = delai
+
+    facture = _facture_exemple(10)
+    facture.deterministe = True
+    debut = time.perf_counter()
+    for _ in range(rendus):
+        facture.rendre_pdf()
+    duree_rendu = (time.perf_counter() - debut) / rendus
+    print(f"  analyse + validation + compilation : {duree_chargement * 1e3:7.3f} ms (une fois par processus)")
+    print(f"  identité par document (en cache)   : {duree_acces * 1e9:7.0f} ns")
+    print(f"  avec contrôle du fichier (stat)    : {duree_controle * 1e6:7.2f} µs, "
+          f"{duree_controle / duree_rendu * 100:.4f} % d'un rendu ({duree_rendu * 1e3:.0f} ms)")
+    print(f"  rechargement après modification    : {duree_rechargement * 1e3:7.3f} ms "
+          f"({'appliqué' if recharge else 'NON appliqué'})")
+
+
+def bench_ateliers(n=12, articles=10):
+    """Lot mêlant deux ateliers : identités et polices en cache, contre
+    un rechargement à chaque facture"""
+    import facture_identite
+    from facture_identite import (CHEMIN_IDENTITE, VARIABLE_ATELIERS, charger, chemin_identite,
+                                  identite_courante)
+    from facture_polices import chemin_police, oublier_polices
+    from facture_seiko import FactureMouvementAbsolu
+
+    def factures(ateliers):
+        lot = []
+        for i in range(n):
+            donnees = dict(_facture_exemple(0).donnees, num_commande=f"SM-BENCH-{i:04d}")
+            if ateliers[i % len(ateliers)]:
+                donnees['atelier'] = ateliers[i % len(ateliers)]
+            facture = FactureMouvementAbsolu(donnees, deterministe=True)
+            facture.articles = _articles_exemple(articles)
+            lot.append(facture)
+        return lot
+
+    def rendre(lot, recharger=False):
+        debut = time.perf_counter()
+        for facture in lot:
+            if recharger:
+                # Sans cache : identité relue et polices analysées à chaque facture
+                facture.identite = charger(chemin_identite(facture.donnees.get('atelier')))
+                oublier_polices(chemin for _, chemin in facture.identite.polices)
+            facture.rendre_pdf()
+        return (time.perf_counter() - debut) / len(lot)
+
+    variable = os.environ.get(VARIABLE_ATELIERS)
+    with tempfile.TemporaryDirectory() as dossier:
+        with open(CHEMIN_IDENTITE, encoding='utf-8') as f:
+            config = json.load(f)
+        config['entreprise'].update(nom='Atelier B', enseigne='ATELIER B')
+        config['couleurs']['bandeau'] = '#7a1f1f'
+        # Même police sous un autre chemin : analysée et mise en cache à part
+        with open(chemin_police('DejaVuSans.ttf'), 'rb') as source, \
+                open(os.path.join(dossier, 'police_b.ttf'), 'wb') as copie:
+            copie.write(source.read())
+        config['polices'] = {'normal': 'police_b.ttf'}
+        config['numerotation'] = {'factures': 'AB', 'devis': 'ABD', 'avoirs': 'ABA'}
+        with open(os.path.join(dossier, 'b.json'), 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False)
+        os.environ[VARIABLE_ATELIERS] = dossier
+        try:
+            rendre(factures(['', 'b']))  # polices des deux ateliers analysées
+            # Meilleur de trois tours alternés : la dérive de la machine
+            # touche toutes les variantes
+            durees = {'seul': [], 'mele': [], 'recharge': []}
+            for _ in range(3):
+                durees['seul'].append(rendre(factures([''])))
+                durees['mele'].append(rendre(factures(['', 'b'])))
+                durees['recharge'].append(rendre(factures(['', 'b']), recharger=True))
+            seul, mele, recharge = (min(durees[cle]) for cle in ('seul', 'mele', 'recharge'))
+            debut = time.perf_counter()
+            for i in range(10_000):
+                identite_courante('b' if i % 2 else None)
+            acces = (time.perf_counter() - debut) / 10_000
+        finally:
+            if variable is None:
+                del os.environ[VARIABLE_ATELIERS]
+            else:
+                os.environ[VARIABLE_ATELIERS] = variable
+            facture_identite._identites.pop('b', None)
+    print(f"  un seul atelier          : {seul * 1e3:6.1f} ms par facture")
+    print(f"  deux ateliers alternés   : {mele * 1e3:6.1f} ms par facture ({(mele / seul - 1) * 100:+.1f} %)")
+    print(f"  rechargés à chaque fois  : {recharge * 1e3:6.1f} ms par facture ({(recharge / seul - 1) * 100:+.1f} %)")
+    print(f"  identité d'atelier (LRU) : {acces * 1e9:6.0f} ns")
+
+
+def bench_qr_logo(n=200, rendus=10, articles=10, pages_logo=10):
+    """QR code de paiement et logo : encodage, mémorisation, décodage de
+    l'image une fois par processus et XObject partagé par les pages"""
+    import facture_qr
+    import facture_seiko
+    from PIL import Image, ImageDraw
+    from facture_identite import CHEMIN_IDENTITE, charger
+    from facture_qr import charge_epc, qr_code
+
+    charges = [charge_epc('Atelier S-MOD', 'FR7630006000011234567890189', f"{1000 + i}.00",
+                          f"Facture SM-202601-{i:04d}", 'AGRIFRPP') for i in range(n)]
+    facture_qr._gabarit.cache_clear()
+    facture_qr._masques.cache_clear()
+    qr_code.cache_clear()
+    debut = time.perf_counter()
+    qr_code(charges[0])
+    duree_premier = time.perf_counter() - debut
+    debut = time.perf_counter()
+    for charge in charges[1:]:
+        qr_code(charge)
+    duree_encodage = (time.perf_counter() - debut) / (n - 1)
+    debut = time.perf_counter()
+    for _ in range(10):
+        for charge in charges:
+            qr_code(charge)
+    duree_memoire = (time.perf_counter() - debut) / (10 * n)
+    version = (qr_code(charges[0]).cote - 17) // 4
+
+    def meilleure(operation, preparation=lambda: None):
+        # Meilleure de plusieurs mesures : la dérive de la machine ne
+        # touche pas les écarts
+        durees = []
+        for _ in range(rendus):
+            argument = preparation()
+            debut = time.perf_counter()
+            operation(argument)
+            durees.append(time.perf_counter() - debut)
+        return min(durees)
+
+    def facture(identite, nombre=articles):
+        facture = _facture_exemple(nombre)
+        facture.identite = identite
+        facture.rendre_pdf()
+        return facture
+
+    with tempfile.TemporaryDirectory() as dossier:
+        # Logo de 600 x 240 en dégradé, comme un logo photographique
+        logo = Image.linear_gradient('L').resize((600, 240)).convert('RGB')
+        ImageDraw.Draw(logo).ellipse((20, 20, 220, 220), fill=(200, 30, 30))
+        logo.save(os.path.join(dossier, 'logo.png'))
+        with open(CHEMIN_IDENTITE, encoding='utf-8') as f:
+            config = json.load(f)
+        sans = charger(CHEMIN_IDENTITE)
+        config['images'] = {'logo': 'logo.png'}
+        config['paiement'] = {'iban': 'FR76 3000 6000 0112 3456 7890 189', 'bic': 'AGRIFRPP'}
+        chemin = os.path.join(dossier, 'identite.json')
+        with open(chemin, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False)
+        avec = charger(chemin)
+
+        duree_sans, duree_avec = (meilleure(lambda _: f.rendre_pdf())
+                                  for f in (facture(sans), facture(avec)))
+        pdf = facture(avec, pages_logo * 8).rendre_pdf()  # environ huit articles par page
+
+        # Chargement du logo par un document : décodé, comme le ferait fpdf
+        # seul, ou repris du cache du processus
+        def document(vider=False):
+            if vider:
+                facture_seiko._image_decodee.cache_clear()
+            return facture_seiko.PDF(identite=sans)
+        duree_decodage = meilleure(lambda pdf: pdf.preload_image(avec.logo),
+                                   lambda: document(vider=True))
+        duree_cache = meilleure(lambda pdf: pdf.preload_image(avec.logo), document)
+        _, _, image = document().preload_image(avec.logo)
+    pages = pdf.count(b'/Type /Page') - pdf.count(b'/Type /Pages')
+    logo_octets = len(image['data']) + len(image.get('smask') or b'')
+    print(f"  QR code EPC (version {version})       : {duree_premier * 1e3:6.2f} ms le premier, "
+          f"{duree_encodage * 1e3:.2f} ms les suivants, {duree_memoire * 1e6:.2f} µs mémorisé")
+    print(f"  facture de {articles} articles        : {duree_sans * 1e3:6.1f} ms, "
+          f"{duree_avec * 1e3:.1f} ms avec logo et QR code ({(duree_avec / duree_sans - 1) * 100:+.1f} %)")
+    print(f"  logo par document             : {duree_decodage * 1e3:6.2f} ms décodé, "
+          f"{duree_cache * 1e3:.3f} ms en cache")
+    print(f"  {pages} pages avec logo            : {pdf.count(b'/Subtype /Image')} XObject image de "
+          f"{logo_octets / 1024:.1f} Ko (un par page : {pages * logo_octets / 1024:.0f} Ko)")
+
+
+def bench_schema(n=20_000, articles=5):
+    """Validation des commandes : schéma compilé une fois, lot entier
+    contrôlé avant tout numéro"""
+    from dataclasses import asdict
+    from facture_schema import (SCHEMA_COMMANDE, CommandesInvalides, compiler, lire_commandes,
+                                valider_commande)
+
+    ligne = json.dumps(dict(_facture_exemple(0).donnees,
+                            articles=[asdict(a) for a in _articles_exemple(articles)]),
+                       ensure_ascii=False)
+    commande = json.loads(ligne)  # listes JSON, et non les tuples d'asdict
+    assert not valider_commande(commande)
+
+    debut = time.perf_counter()
+    for _ in range(100):
+        compiler(SCHEMA_COMMANDE)
+    duree_compilation = (time.perf_counter() - debut) / 100
+    debut = time.perf_counter()
+    for _ in range(n):
+        valider_commande(commande)
+    duree_validation = (time.perf_counter() - debut) / n
+    debut = time.perf_counter()
+    for _ in range(n):
+        json.loads(ligne)
+    duree_json = (time.perf_counter() - debut) / n
+
+    facture = _facture_exemple(articles)
+    debut = time.perf_counter()
+    for _ in range(5):
+        facture.rendre_pdf()
+    duree_rendu = (time.perf_counter() - debut) / 5
+
+    # Lot dont une commande sur mille est invalide, la dernière comprise
+    invalide = dict(commande, client_nom='', articles=[dict(commande['articles'][0], quantite=0)])
+    with tempfile.TemporaryDirectory() as dossier:
+        chemin = os.path.join(dossier, 'lot.jsonl')
+        with open(chemin, 'w', encoding='utf-8') as f:
+            for i in range(1, n + 1):
+                f.write((json.dumps(invalide) if i % 1000 == 0 else ligne) + '\n')
+        debut = time.perf_counter()
+        try:
+            lire_commandes(chemin)
+            refus = None
+        except CommandesInvalides as erreur:
+            refus = erreur
+        duree_lot = time.perf_counter() - debut
+    print(f"  compilation du schéma       : {duree_compilation * 1e6:7.1f} µs (une fois par processus ; "
+          f"recompilé à chaque commande : x{(duree_compilation + duree_validation) / duree_validation:.1f})")
+    print(f"  validation d'une commande   : {duree_validation * 1e6:7.1f} µs ({articles} articles ; "
+          f"json.loads : {duree_json * 1e6:.1f} µs), {duree_validation / duree_rendu * 100:.3f} % d'un rendu")
+    print(f"  lot de {n} commandes      : refusé en {duree_lot * 1e3:.0f} ms, "
+          f"{len(refus.erreurs) if refus else 0} commandes en erreur rapportées, aucun numéro attribué")
+
+
+def bench_signature(n=200, rendus=10, lot=20, processus=None):
+    """Signature des factures : certificat lu une fois par processus, mise à
+    jour incrémentale, signature en masse de PDF existants"""
+    import facture_signature
+    from facture_lot import generer_lot
+    from facture_signature import charger_signataire, signataire, signer_fichiers, signer_pdf
+
+    if facture_signature.x509 is None:
+        print(f"  {Color.GRAY}paquet cryptography absent : scénario ignoré{Color.RESET}")
+        return
+    from datetime import datetime as dt
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.primitives.serialization import pkcs12
+
+    cle = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    nom = x509.Name([x509.NameAttribute(x509.NameOID.COMMON_NAME, 'Atelier S-MOD')])
+    certificat = (x509.CertificateBuilder().subject_name(nom).issuer_name(nom)
+                  .public_key(cle.public_key()).serial_number(x509.random_serial_number())
+                  .not_valid_before(dt(2025, 1, 1)).not_valid_after(dt(2035, 1, 1))
+                  .sign(cle, hashes.SHA256()))
+    facture = _facture_exemple(10)
+    debut = time.perf_counter()
+    for _ in range(rendus):
+        pdf = facture.rendre_pdf()
+    duree_rendu = (time.perf_counter() - debut) / rendus
+
+    dossier_initial = os.getcwd()
+    with tempfile.TemporaryDirectory() as dossier:
+        chemin = os.path.join(dossier, 'signature.p12')
+        with open(chemin, 'wb') as f:
+            f.write(pkcs12.serialize_key_and_certificates(
+                b'atelier', cle, certificat, None, serialization.NoEncryption()))
+
+        debut = time.perf_counter()
+        for _ in range(rendus):
+            charger_signataire(chemin)
+        duree_chargement = (time.perf_counter() - debut) / rendus
+        signataire(chemin)
+        debut = time.perf_counter()
+        for _ in range(n):
+            signe = signer_pdf(pdf, signataire(chemin))
+        duree_signature = (time.perf_counter() - debut) / n
+
+        # Signature en masse de PDF déjà écrits : seule la mise à jour est
+        # ajoutée à chaque fichier
+        chemins = []
+        for i in range(n):
+            chemins.append(os.path.join(dossier, f"SM-BENCH-{i:04d}.pdf"))
+            with open(chemins[-1], 'wb') as f:
+                f.write(pdf)
+        debut = time.perf_counter()
+        signes = signer_fichiers(chemins, chemin, processus)
+        duree_masse = time.perf_counter() - debut
+        assert signes == n and signer_fichiers(chemins[:10], chemin, 1) == 0
+
+        # Lot rendu et signé dans les mêmes processus ; mesures alternées,
+        # la meilleure de chaque
+        factures = []
+        for i in range(lot):
+            facture = _facture_exemple(10)
+            facture.donnees['num_commande'] = f"SM-BENCH-{i:04d}"
+            factures.append(facture)
+        lot_signe = [(f.donnees, tuple(f.articles)) for f in factures]
+        os.chdir(dossier)
+        try:
+            durees = [float('inf'), float('inf')]
+            for _ in range(2):
+                for rang, certificat_lot in enumerate((None, chemin)):
+                    debut = time.perf_counter()
+                    generer_lot(lot_signe, processus=processus, deterministe=True,
+                                certificat=certificat_lot)
+                    durees[rang] = min(durees[rang], time.perf_counter() - debut)
+        finally:
+            os.chdir(dossier_initial)
+    processus = processus or os.cpu_count()
+    print(f"  lecture du certificat (.p12)  : {duree_chargement * 1e3:6.2f} ms (une fois par processus)")
+    print(f"  signature d'une facture       : {duree_signature * 1e3:6.2f} ms "
+          f"({duree_signature / duree_rendu * 100:.1f} % d'un rendu de {duree_rendu * 1e3:.1f} ms), "
+          f"{len(signe) - len(pdf)} octets ajoutés à {len(pdf) / 1024:.0f} Ko ; "
+          f"x{(duree_chargement + duree_signature) / duree_signature:.1f} en relisant la clé")
+    print(f"  {n} PDF existants, {processus} processus : {n / duree_masse:6.1f} signés/s")
+    print(f"  lot de {lot} factures            : {lot / durees[0]:6.1f} factures/s, "
+          f"{lot / durees[1]:.1f} signées ({(durees[1] / durees[0] - 1) * 100:+.1f} %)")
+
+
+SCENARIOS = {
+    'memoire_articles': bench_memoire_articles,
+    'registre': bench_registre,
+    'polices': bench_polices,
+    'lignes': bench_lignes,
+    'memoire_flux': bench_memoire_flux,
+    'lot': bench_lot,
+    'surveillance': bench_surveillance,
+    'catalogue': bench_catalogue,
+    'clients': bench_clients,
+    'recherche': bench_recherche,
+    'rapprochement': bench_rapprochement,
+    'echeances': bench_echeances,
+    'devis': bench_devis,
+    'avoirs': bench_avoirs,
+    'releves': bench_releves,
+    'facturx': bench_facturx,
+    'identite': bench_identite,
+    'ateliers': bench_ateliers,
+    'qr_logo': bench_qr_logo,
+    'schema': bench_schema,
+    'signature': bench_signature,
+}
+
+
+def main(noms):
+    for nom in noms or SCENARIOS:
+        print(f"{Color.BOLD}{nom}{Color.RESET}")
+        debut = time.perf_counter()
+        SCENARIOS[nom]()
+        print(f"  {Color.GRAY}({time.perf_counter() - debut:.2f} s){Color.RESET}\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,154 @@
+"""Aperçu PNG de la première page d'une facture
+
+Le rendu (mise en page puis rastérisation) s'exécute dans un pool de
+processus en arrière-plan. Les vignettes sont mises en cache sur disque,
+indexées par le contenu de la facture et par le fichier d'identité de
+l'atelier (chemin, date, taille) : une facture inchangée n'est ni remise en
+page ni rastérisée à nouveau, une identité modifiée refait les vignettes.
+Seules les CAPACITE_APERCUS vignettes les plus récemment utilisées sont
+gardées.
+
+Rastérisation locale, sans service externe : pypdfium2 s'il est installé
+(pip install pypdfium2), sinon l'outil pdftoppm de Poppler s'il est
+présent dans le PATH.
+"""
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+DOSSIER_APERCUS = os.path.join('factures', 'apercus')
+LARGEUR_APERCU = 300  # pixels
+CAPACITE_APERCUS = 200  # vignettes gardées sur disque
+
+
+def _rasteriser_pdfium(donnees_pdf, largeur):
+    import pypdfium2 as pdfium
+
+    document = pdfium.PdfDocument(donnees_pdf)
+    page = document[0]
+    image = page.render(scale=largeur / page.get_width()).to_pil()
+    sortie = io.BytesIO()
+    image.save(sortie, format='PNG', optimize=True)
+    return sortie.getvalue()
+
+
+def _rasteriser_pdftoppm(donnees_pdf, largeur):
+    with tempfile.TemporaryDirectory() as dossier:
+        source = os.path.join(dossier, 'facture.pdf')
+        with open(source, 'wb') as f:
+            f.write(donnees_pdf)
+        racine = os.path.join(dossier, 'apercu')
+        subprocess.run(
+            ['pdftoppm', '-png', '-singlefile', '-f', '1', '-l', '1',
+             '-scale-to-x', str(largeur), '-scale-to-y', '-1', source, racine],
+            check=True, capture_output=True,
+        )
+        with open(racine + '.png', 'rb') as f:
+            return f.read()
+
+
+def rasteriser_premiere_page(donnees_pdf, largeur=LARGEUR_APERCU):
+    """Convertit la première page d'un PDF en PNG (octets)
+
+    Raises:
+        RuntimeError: si aucun moteur de rendu local n'est disponible
+    """
+    try:
+        import pypdfium2  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        return _rasteriser_pdfium(donnees_pdf, largeur)
+    if shutil.which('pdftoppm'):
+        return _rasteriser_pdftoppm(donnees_pdf, largeur)
+    raise RuntimeError("Aucun moteur d'aperçu : installez pypdfium2 ou poppler (pdftoppm)")
+
+
+def cle_apercu(donnees, articles, largeur=LARGEUR_APERCU):
+    """Empreinte du contenu d'une facture et de son identité, utilisée comme clé de cache
+
+    Raises:
+        ValueError: atelier inconnu
+    """
+    from facture_identite import chemin_identite, signature_fichier
+
+    identite = chemin_identite(donnees.get('atelier'))
+    contenu = repr((sorted(donnees.items()), tuple(articles), largeur,
+                    os.path.abspath(identite), signature_fichier(identite)))
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()[:32]
+
+
+def elaguer_apercus(dossier=DOSSIER_APERCUS, capacite=CAPACITE_APERCUS):
+    """Supprime les vignettes les moins récemment utilisées au-delà de la capacité"""
+    try:
+        entrees = [e for e in os.scandir(dossier) if e.name.endswith('.png')]
+    except FileNotFoundError:
+        return
+    if len(entrees) <= capacite:
+        return
+    entrees.sort(key=lambda e: e.stat().st_mtime_ns)
+    for entree in entrees[:len(entrees) - capacite]:
+        try:
+            os.remove(entree.path)
+        except FileNotFoundError:  # déjà supprimée par un autre processus
+            pass
+
+
+def apercu_facture(donnees, articles, largeur=LARGEUR_APERCU, dossier=DOSSIER_APERCUS):
+    """Retourne le chemin de la vignette PNG d'une facture, en la créant si besoin
+
+    Exécuté dans les processus du pool : les arguments sont des données
+    simples (dict et articles) plutôt qu'une facture déjà construite.
+    """
+    from facture_seiko import FactureMouvementAbsolu
+
+    chemin = os.path.join(dossier, f"{cle_apercu(donnees, articles, largeur)}.png")
+    try:
+        os.utime(chemin)  # récemment utilisée : gardée par l'élagage
+        return chemin
+    except FileNotFoundError:
+        pass
+
+    facture = FactureMouvementAbsolu(dict(donnees))
+    facture.articles = list(articles)
+    png = rasteriser_premiere_page(facture.rendre_pdf(), largeur)
+
+    # Écriture atomique : un autre processus ne lit jamais une vignette partielle
+    os.makedirs(dossier, exist_ok=True)
+    temporaire = f"{chemin}.{os.getpid()}.tmp"
+    with open(temporaire, 'wb') as f:
+        f.write(png)
+    os.replace(temporaire, chemin)
+    elaguer_apercus(dossier)
+    return chemin
+
+
+class ServiceApercu:
+    """Pool de processus produisant les aperçus en arrière-plan
+
+    Seule la dernière demande compte : une demande encore en attente est
+    annulée lorsqu'une nouvelle arrive (saisie d'articles en cours).
+    """
+
+    def __init__(self, largeur=LARGEUR_APERCU, dossier=DOSSIER_APERCUS, processus=None):
+        self.largeur = largeur
+        self.dossier = dossier
+        self._pool = ProcessPoolExecutor(max_workers=processus)
+        self._en_cours = None
+
+    def demander(self, donnees, articles):
+        """Planifie l'aperçu d'une facture et retourne un Future (chemin PNG)"""
+        if self._en_cours is not None:
+            self._en_cours.cancel()
+        self._en_cours = self._pool.submit(
+            apercu_facture, dict(donnees), tuple(articles), self.largeur, self.dossier
+        )
+        return self._en_cours
+
+    def fermer(self):
+        """Arrête le pool sans attendre les demandes en attente"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
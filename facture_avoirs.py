@@ -0,0 +1,130 @@
+"""Avoirs : corrections et annulations de factures émises
+
+Une facture émise n'est pas modifiée : elle est corrigée par un avoir qui
+cite son numéro ('num_facture') et en crédite tout ou partie. L'avoir est
+mis en page par le moteur des factures (titre AVOIR) et numéroté dans sa
+propre série, AV-AAAAMM-NNNN.
+
+Un avoir porte soit les articles repris (retour, annulation), soit un
+montant HT (geste commercial, erreur de prix), imprimé comme une ligne
+unique. À l'archivage, ses lignes sont déduites du registre des ventes et
+son montant est imputé à la facture dans les comptes clients : soldes par
+facture et par client se lisent par index, avoirs déduits.
+
+Les montants sont contrôlés avant l'attribution des numéros : un avoir
+supérieur à ce qu'il reste à créditer sur sa facture est refusé sans
+consommer de numéro ni produire de PDF.
+"""
+from datetime import datetime
+
+from facture_clients import Annuaire
+from facture_comptes import CHEMIN_COMPTES, Comptes, inscrire_avoir, montant_ttc
+from facture_modeles import Article, Composant
+from facture_registre import journaliser
+from facture_schema import lire_commandes, valider_avoir
+from facture_seiko import FactureMouvementAbsolu, get_next_credit_note_number
+
+
+class AvoirMouvementAbsolu(FactureMouvementAbsolu):
+    """Avoir, mis en page comme une facture ; donnees['num_commande'] porte
+    le numéro de l'avoir et donnees['num_facture'] celui de la facture corrigée"""
+    TITRE = 'AVOIR'
+    DESTINATAIRE = 'CLIENT'
+    PREFIXE_FICHIER = 'avoir'
+    TYPE_FACTURX = '381'
+    QR_PAIEMENT = False  # rien à régler : l'avoir est dû au client
+
+    def _ligne_echeance(self):
+        return f"Facture: {self.donnees['num_facture']}"
+
+    def _mention_paiement(self):
+        return f"Montant à déduire du règlement de la facture {self.donnees['num_facture']}"
+
+    def _archiver(self, nom_fichier):
+        """Déduit l'avoir du registre des ventes et l'impute à sa facture"""
+        journaliser(self, signe=-1)
+        inscrire_avoir(self)
+
+
+def article_avoir(montant_ht, motif=''):
+    """Ligne unique d'un avoir sur montant (geste commercial, erreur de prix)"""
+    return Article(motif or "Avoir", 'AVOIR', (Composant('Montant crédité', '', float(montant_ht)),))
+
+
+def _completer_client(donnees):
+    """Reprend de l'annuaire l'adresse d'un client désigné par son seul nom"""
+    if donnees.get('client_adresse'):
+        return
+    annuaire = Annuaire()
+    try:
+        for client in annuaire.rechercher(donnees['client_nom'], limite=50):
+            if client.nom == donnees['client_nom']:
+                donnees.update(client_adresse=client.adresse, client_cp=client.cp,
+                               client_ville=client.ville)
+                return
+    finally:
+        annuaire.fermer()
+
+
+def preparer_avoirs(commandes, horloge=datetime.now, chemin=CHEMIN_COMPTES):
+    """Construit et numérote des avoirs après avoir contrôlé tous les montants
+
+    Args:
+        commandes (iterable): Dictionnaires avec 'num_facture', les champs
+            client et soit 'articles' (format de Article.depuis_dict), soit
+            'montant_ht' et 'motif'
+        horloge (callable, optional): Date des avoirs et de leur numéro
+
+    Returns:
+        list: AvoirMouvementAbsolu prêts à être générés
+
+    Raises:
+        KeyError: facture inconnue des comptes clients
+        ValueError: avoir sans montant, ou supérieur au montant restant à
+            créditer (plusieurs avoirs d'une même facture sont cumulés) ;
+            aucun numéro n'est alors attribué
+    """
+    avoirs = []
+    comptes = Comptes(chemin)
+    try:
+        disponible = {}
+        for commande in commandes:
+            commande = dict(commande)
+            montant_ht = commande.pop('montant_ht', None)
+            motif = commande.pop('motif', '')
+            avoir = AvoirMouvementAbsolu.depuis_commande(commande, horloge=horloge)
+            if montant_ht is not None:
+                avoir.articles.append(article_avoir(montant_ht, motif))
+            num_facture = avoir.donnees.get('num_facture')
+            if not num_facture:
+                raise ValueError("Avoir sans numéro de facture ('num_facture')")
+            if num_facture not in disponible:
+                disponible[num_facture] = comptes.credit_disponible(num_facture)
+            if not avoir.donnees.get('client_nom'):
+                avoir.donnees['client_nom'] = comptes.facture(num_facture)['client']
+                _completer_client(avoir.donnees)
+            ttc = montant_ttc(avoir)
+            if ttc <= 0:
+                raise ValueError(f"Avoir sur {num_facture} sans montant")
+            if ttc > disponible[num_facture]:
+                raise ValueError(f"Avoir de {ttc / 100:.2f} EUR TTC sur {num_facture} : "
+                                 f"{disponible[num_facture] / 100:.2f} EUR restent à créditer")
+            disponible[num_facture] -= ttc
+            avoirs.append(avoir)
+    finally:
+        comptes.fermer()
+    for avoir in avoirs:
+        if not avoir.donnees.get('num_commande'):
+            avoir.donnees['num_commande'] = get_next_credit_note_number(
+                horloge, avoir.donnees.get('atelier'))
+        avoir.donnees.setdefault('date_facture', horloge().strftime('%d/%m/%Y'))
+    return avoirs
+
+
+def charger_avoirs(chemin_commandes, horloge=datetime.now):
+    """Lit un fichier JSON Lines d'avoirs (voir preparer_avoirs)
+
+    Raises:
+        CommandesInvalides: fichier refusé, avant toute attribution de numéro
+    """
+    return preparer_avoirs(lire_commandes(chemin_commandes, valider_avoir), horloge)
@@ -0,0 +1,221 @@
+"""Catalogue local des composants
+
+Mouvements, cadrans, boîtiers... déjà facturés sont conservés avec leur
+catégorie et leur dernier prix, pour être proposés au fil de la frappe dans
+la saisie en console comme dans l'interface graphique.
+
+La recherche est une recherche par préfixe sur des index B-tree SQLite :
+une saisie est un intervalle de clés [préfixe, préfixe + U+10FFFF[, lu dans
+l'ordre de l'index et interrompu dès que assez de résultats sont trouvés.
+Son coût dépend du nombre de propositions affichées, pas de la taille du
+catalogue. Deux index sont interrogés : la référence complète ('valj' →
+Valjoux 7750), puis chacun de ses mots ('7750' → Valjoux 7750). Les clés
+sont sans accents ni casse ('boit' → Boîtier).
+"""
+import csv
+import os
+import re
+import sqlite3
+import unicodedata
+from contextlib import contextmanager
+
+from facture_modeles import Composant
+from facture_seiko import assurer_dossier
+
+try:
+    import readline
+except ImportError:  # Windows : pas de complétion en console
+    readline = None
+
+CHEMIN_CATALOGUE = os.path.join('factures', 'catalogue.sqlite')
+LIMITE_PROPOSITIONS = 10
+
+# Catégories des composants saisis (console et interface graphique)
+CATEGORIES = ('Mouvement', 'Cadran', 'Boîtier', 'Bracelet', "Main d'œuvre")
+
+# Borne supérieure des clés commençant par un préfixe
+_FIN_PREFIXE = '\U0010ffff'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS composants (
+    id INTEGER PRIMARY KEY,
+    categorie TEXT NOT NULL,
+    reference TEXT NOT NULL,
+    prix REAL NOT NULL,
+    cle TEXT NOT NULL,
+    UNIQUE (categorie, reference)
+);
+CREATE INDEX IF NOT EXISTS composants_cle ON composants (cle);
+CREATE INDEX IF NOT EXISTS composants_categorie_cle ON composants (categorie, cle);
+CREATE TABLE IF NOT EXISTS mots (
+    mot TEXT NOT NULL,
+    composant INTEGER NOT NULL REFERENCES composants (id) ON DELETE CASCADE,
+    PRIMARY KEY (mot, composant)
+) WITHOUT ROWID;
+"""
+
+
+def normaliser(texte):
+    """Clé de recherche : minuscules, sans accents ni espaces superflus"""
+    decompose = unicodedata.normalize('NFKD', texte.casefold())
+    sans_accents = ''.join(c for c in decompose if not unicodedata.combining(c))
+    return ' '.join(sans_accents.split())
+
+
+def _mots(cle):
+    return set(re.findall(r'\w+', cle))
+
+
+class Catalogue:
+    """Catalogue des composants, stocké dans une base SQLite"""
+
+    def __init__(self, chemin=CHEMIN_CATALOGUE):
+        assurer_dossier(os.path.dirname(chemin) or '.')
+        self._cnx = sqlite3.connect(chemin)
+        self._cnx.execute("PRAGMA foreign_keys = ON")
+        self._cnx.executescript(SCHEMA)
+
+    def fermer(self):
+        self._cnx.close()
+
+    def __len__(self):
+        return self._cnx.execute("SELECT COUNT(*) FROM composants").fetchone()[0]
+
+    def _enregistrer(self, categorie, reference, prix):
+        cle = normaliser(reference)
+        ligne = self._cnx.execute(
+            "SELECT id FROM composants WHERE categorie = ? AND reference = ?",
+            (categorie, reference),
+        ).fetchone()
+        if ligne is not None:
+            self._cnx.execute("UPDATE composants SET prix = ? WHERE id = ?", (prix, ligne[0]))
+            return
+        curseur = self._cnx.execute(
+            "INSERT INTO composants (categorie, reference, prix, cle) VALUES (?, ?, ?, ?)",
+            (categorie, reference, prix, cle),
+        )
+        self._cnx.executemany(
+            "INSERT INTO mots (mot, composant) VALUES (?, ?)",
+            ((mot, curseur.lastrowid) for mot in _mots(cle)),
+        )
+
+    def enregistrer(self, categorie, reference, prix):
+        """Ajoute un composant, ou met à jour son prix par défaut"""
+        reference = reference.strip()
+        if not reference:
+            return
+        with self._cnx:
+            self._enregistrer(categorie, reference, float(prix))
+
+    def importer_csv(self, chemin):
+        """Importe un fichier CSV (colonnes categorie, reference, prix)
+
+        Le séparateur (virgule ou point-virgule) est détecté ; les prix
+        peuvent utiliser la virgule décimale. Une seule transaction.
+
+        Returns:
+            int: Nombre de lignes importées
+        """
+        with open(chemin, encoding='utf-8-sig', newline='') as f:
+            dialecte = csv.Sniffer().sniff(f.read(4096), delimiters=',;')
+            f.seek(0)
+            nombre = 0
+            with self._cnx:
+                for ligne in csv.DictReader(f, dialect=dialecte):
+                    reference = ligne['reference'].strip()
+                    if not reference:
+                        continue
+                    prix = float(ligne['prix'].replace(',', '.'))
+                    self._enregistrer(ligne['categorie'].strip(), reference, prix)
+                    nombre += 1
+        return nombre
+
+    def trouver(self, categorie, reference):
+        """Composant du catalogue de cette catégorie et référence, ou None"""
+        ligne = self._cnx.execute(
+            "SELECT categorie, reference, prix FROM composants "
+            "WHERE categorie = ? AND reference = ?",
+            (categorie, reference.strip()),
+        ).fetchone()
+        return Composant(*ligne) if ligne else None
+
+    def rechercher(self, saisie, categorie=None, limite=LIMITE_PROPOSITIONS):
+        """Composants dont la référence, ou chacun des mots, commence par la saisie
+
+        Args:
+            saisie (str): Début de la référence ou de l'un de ses mots
+            categorie (str, optional): Restreint à une catégorie ('Mouvement'...)
+            limite (int, optional): Nombre maximal de propositions
+
+        Returns:
+            list: Composant, références complètes d'abord, puis par mot
+        """
+        cle = normaliser(saisie)
+        if not cle:
+            return []
+        filtre, parametres = '', ()
+        if categorie is not None:
+            filtre, parametres = ' AND c.categorie = ?', (categorie,)
+
+        resultats = {}
+        curseur = self._cnx.execute(
+            "SELECT c.id, c.categorie, c.reference, c.prix FROM composants c "
+            f"WHERE c.cle >= ? AND c.cle < ?{filtre} ORDER BY c.cle",
+            (cle, cle + _FIN_PREFIXE) + parametres,
+        )
+        self._completer(resultats, curseur, limite)
+        if len(resultats) < limite:
+            # Chaque mot saisi doit commencer un mot de la référence ; le
+            # plus long, le plus sélectif, borne le parcours de l'index
+            saisis = sorted(_mots(cle), key=len, reverse=True)
+            if saisis:
+                curseur = self._cnx.execute(
+                    "SELECT c.id, c.categorie, c.reference, c.prix, c.cle "
+                    "FROM mots m JOIN composants c ON c.id = m.composant "
+                    f"WHERE m.mot >= ? AND m.mot < ?{filtre} ORDER BY m.mot",
+                    (saisis[0], saisis[0] + _FIN_PREFIXE) + parametres,
+                )
+                lignes = (ligne[:4] for ligne in curseur
+                          if all(any(mot.startswith(s) for mot in _mots(ligne[4]))
+                                 for s in saisis[1:]))
+                self._completer(resultats, lignes, limite)
+        return list(resultats.values())
+
+    @staticmethod
+    def _completer(resultats, lignes, limite):
+        for id_composant, categorie, reference, prix in lignes:
+            if len(resultats) >= limite:
+                break
+            resultats.setdefault(id_composant, Composant(categorie, reference, prix))
+
+
+@contextmanager
+def completion_console(catalogue, categorie=None):
+    """Complète les références du catalogue avec Tab pendant un input()
+
+    Sans module readline (Windows), la saisie reste simplement manuelle.
+    """
+    if readline is None:
+        yield
+        return
+    propositions = []
+
+    def completer(texte, etat):
+        if etat == 0:
+            propositions[:] = [c.reference for c in catalogue.rechercher(texte, categorie)]
+        return propositions[etat] if etat < len(propositions) else None
+
+    ancien_completer = readline.get_completer()
+    anciens_delimiteurs = readline.get_completer_delims()
+    # Toute la ligne est complétée : les références contiennent des espaces
+    readline.set_completer_delims('')
+    readline.set_completer(completer)
+    if 'libedit' in (readline.__doc__ or ''):
+        readline.parse_and_bind('bind ^I rl_complete')  # macOS
+    else:
+        readline.parse_and_bind('tab: complete')
+    try:
+        yield
+    finally:
+        readline.set_completer(ancien_completer)
+        readline.set_completer_delims(anciens_delimiteurs)
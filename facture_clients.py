@@ -0,0 +1,200 @@
+"""Annuaire des clients déjà facturés
+
+Chaque facture générée enregistre (ou met à jour) son client : nom,
+adresse, code postal et ville. L'interface graphique interroge l'annuaire
+au fil de la frappe et remplit les quatre champs du client choisi.
+
+L'index plein texte SQLite FTS5 porte sur le nom et la ville, sans accents
+ni casse, avec des index de préfixes de 1 à 3 lettres : 'dup ly' trouve
+« Dupont, Lyon » en quelques millisecondes sur 100 000 clients. Si SQLite
+est compilé sans FTS5, une recherche LIKE sur toute la table prend le
+relais (plus lente, et sensible aux accents de la ville).
+"""
+import csv
+import os
+import re
+import sqlite3
+from dataclasses import dataclass
+
+from facture_catalogue import normaliser
+from facture_comptes import date_iso
+from facture_seiko import assurer_dossier
+
+CHEMIN_ANNUAIRE = os.path.join('factures', 'clients.sqlite')
+LIMITE_PROPOSITIONS = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clients (
+    id INTEGER PRIMARY KEY,
+    nom TEXT NOT NULL,
+    adresse TEXT NOT NULL,
+    cp TEXT NOT NULL,
+    ville TEXT NOT NULL,
+    cle TEXT NOT NULL UNIQUE,
+    factures INTEGER NOT NULL DEFAULT 0,
+    derniere TEXT  -- date ISO de la dernière facture
+);
+CREATE INDEX IF NOT EXISTS clients_nom ON clients (nom);
+"""
+
+# Index externe : le texte reste dans clients, des déclencheurs tiennent
+# l'index à jour à chaque écriture
+SCHEMA_FTS = """
+CREATE VIRTUAL TABLE IF NOT EXISTS clients_fts USING fts5 (
+    nom, ville, content='clients', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+);
+CREATE TRIGGER IF NOT EXISTS clients_ai AFTER INSERT ON clients BEGIN
+    INSERT INTO clients_fts (rowid, nom, ville) VALUES (new.id, new.nom, new.ville);
+END;
+CREATE TRIGGER IF NOT EXISTS clients_ad AFTER DELETE ON clients BEGIN
+    INSERT INTO clients_fts (clients_fts, rowid, nom, ville)
+    VALUES ('delete', old.id, old.nom, old.ville);
+END;
+CREATE TRIGGER IF NOT EXISTS clients_au AFTER UPDATE OF nom, ville ON clients BEGIN
+    INSERT INTO clients_fts (clients_fts, rowid, nom, ville)
+    VALUES ('delete', old.id, old.nom, old.ville);
+    INSERT INTO clients_fts (rowid, nom, ville) VALUES (new.id, new.nom, new.ville);
+END;
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class Client:
+    """Coordonnées d'un client de l'annuaire"""
+    nom: str
+    adresse: str
+    cp: str
+    ville: str
+
+
+def cle_client(nom, cp):
+    """Identité d'un client : nom normalisé et code postal"""
+    return f"{normaliser(nom)}|{cp.strip()}"
+
+
+class Annuaire:
+    """Annuaire des clients, stocké dans une base SQLite"""
+
+    def __init__(self, chemin=CHEMIN_ANNUAIRE):
+        assurer_dossier(os.path.dirname(chemin) or '.')
+        # Plusieurs processus de rendu peuvent archiver en même temps
+        self._cnx = sqlite3.connect(chemin, timeout=30)
+        self._cnx.executescript(SCHEMA)
+        if self._cnx.execute("PRAGMA user_version").fetchone()[0] < 1:
+            # Base antérieure aux dates ISO : 'JJ/MM/AAAA' ne se trie pas
+            with self._cnx:
+                self._cnx.execute(
+                    "UPDATE clients SET derniere = substr(derniere, 7, 4) || '-' || "
+                    "substr(derniere, 4, 2) || '-' || substr(derniere, 1, 2) "
+                    "WHERE derniere LIKE '__/__/____'"
+                )
+                self._cnx.execute("PRAGMA user_version = 1")
+        try:
+            self._cnx.executescript(SCHEMA_FTS)
+            self.plein_texte = True
+        except sqlite3.OperationalError:  # SQLite sans FTS5
+            self.plein_texte = False
+
+    def fermer(self):
+        self._cnx.close()
+
+    def __len__(self):
+        return self._cnx.execute("SELECT COUNT(*) FROM clients").fetchone()[0]
+
+    def _enregistrer(self, client, date_facture=None):
+        self._cnx.execute(
+            "INSERT INTO clients (nom, adresse, cp, ville, cle, factures, derniere) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (cle) DO UPDATE SET nom = excluded.nom, adresse = excluded.adresse, "
+            "ville = excluded.ville, factures = factures + excluded.factures, "
+            # Une facture antidatée ne recule pas la date de la dernière
+            "derniere = coalesce(max(excluded.derniere, derniere), excluded.derniere, derniere)",
+            (client.nom, client.adresse, client.cp, client.ville,
+             cle_client(client.nom, client.cp), 1 if date_facture else 0,
+             date_iso(date_facture) or None),
+        )
+
+    def enregistrer(self, client, date_facture=None):
+        """Ajoute un client, ou met à jour ses coordonnées
+
+        Args:
+            client (Client): Coordonnées (nom et code postal identifient le client)
+            date_facture (str, optional): Facture à l'origine de l'enregistrement
+        """
+        if not client.nom.strip():
+            return
+        with self._cnx:
+            self._enregistrer(client, date_facture)
+
+    def importer_csv(self, chemin):
+        """Importe un fichier CSV (colonnes nom, adresse, cp, ville)
+
+        Returns:
+            int: Nombre de clients importés
+        """
+        with open(chemin, encoding='utf-8-sig', newline='') as f:
+            dialecte = csv.Sniffer().sniff(f.read(4096), delimiters=',;')
+            f.seek(0)
+            nombre = 0
+            with self._cnx:
+                for ligne in csv.DictReader(f, dialect=dialecte):
+                    client = Client(*(ligne[champ].strip() for champ in Client.__slots__))
+                    if client.nom:
+                        self._enregistrer(client)
+                        nombre += 1
+        return nombre
+
+    def rechercher(self, saisie, limite=LIMITE_PROPOSITIONS):
+        """Clients dont le nom ou la ville contiennent des mots commençant par la saisie
+
+        Args:
+            saisie (str): Débuts de mots, dans n'importe quel ordre ('dup lyon')
+            limite (int, optional): Nombre maximal de propositions
+
+        Returns:
+            list: Client, les plus récemment ajoutés d'abord
+        """
+        mots = re.findall(r'\w+', normaliser(saisie))
+        if not mots:
+            return []
+        if self.plein_texte:
+            requete = ' '.join(f'"{mot}"*' for mot in mots)
+            # Ordre de l'index (clients récents d'abord) : le parcours
+            # s'arrête à la limite, là où un tri par pertinence évaluerait
+            # toutes les correspondances d'un préfixe d'une lettre
+            curseur = self._cnx.execute(
+                "SELECT c.nom, c.adresse, c.cp, c.ville FROM clients_fts "
+                "JOIN clients c ON c.id = clients_fts.rowid "
+                "WHERE clients_fts MATCH ? ORDER BY clients_fts.rowid DESC LIMIT ?",
+                (requete, limite),
+            )
+        else:
+            # Sous-chaînes plutôt que débuts de mots : plus large, jamais moins
+            conditions = ' AND '.join(["(cle || ' ' || lower(ville)) LIKE ?"] * len(mots))
+            curseur = self._cnx.execute(
+                f"SELECT nom, adresse, cp, ville FROM clients WHERE {conditions} "
+                "ORDER BY id DESC LIMIT ?",
+                tuple(f"%{mot}%" for mot in mots) + (limite,),
+            )
+        return [Client(*ligne) for ligne in curseur]
+
+    def coordonnees(self, nom):
+        """Client portant exactement ce nom (le plus récemment facturé), ou None"""
+        ligne = self._cnx.execute(
+            "SELECT nom, adresse, cp, ville FROM clients WHERE nom = ? "
+            "ORDER BY derniere DESC, id DESC LIMIT 1", (nom,)
+        ).fetchone()
+        return Client(*ligne) if ligne else None
+
+
+def enregistrer_client(donnees, chemin=CHEMIN_ANNUAIRE):
+    """Ajoute à l'annuaire le client d'une facture générée"""
+    client = Client(*(donnees.get(f"client_{champ}", '') for champ in Client.__slots__))
+    if not client.nom.strip():
+        return
+    annuaire = Annuaire(chemin)
+    try:
+        annuaire.enregistrer(client, donnees.get('date_facture'))
+    finally:
+        annuaire.fermer()
@@ -0,0 +1,560 @@
+"""Comptes clients : factures émises et règlements reçus
+
+Chaque facture générée est inscrite avec son montant TTC ; les règlements
+(rapprochement bancaire, saisie manuelle) lui sont imputés jusqu'à son
+solde. Les montants sont tenus en centimes entiers : une comparaison de
+montants est exacte, sans arrondi flottant.
+
+Les avoirs émis sur une facture sont inscrits dans leur propre table,
+indexée par facture, et leur total est reporté sur la facture : le reste
+dû est ttc - regle - avoir, lu sur une seule ligne.
+
+Statuts d'une facture : 'ouverte' (rien de reçu), 'partielle', 'payee'
+(soldée par règlements et avoirs). L'index (statut, échéance) sert la
+balance âgée et la liste des retards, l'index par client les soldes.
+
+Les mouvements de chaque client sont cumulés par mois (facturé, avoirs,
+réglé) au fil des inscriptions et des règlements, dans la même
+transaction : le solde d'ouverture d'un relevé mensuel se lit dans ces
+cumuls, sans relire l'historique des factures.
+"""
+import os
+import sqlite3
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from facture_seiko import assurer_dossier
+
+CHEMIN_COMPTES = os.path.join('factures', 'comptes.sqlite')
+
+STATUTS = ('ouverte', 'partielle', 'payee')
+
+# Version du schéma (PRAGMA user_version) : à augmenter avec toute nouvelle
+# table, colonne ou index, pour que les bases existantes soient migrées
+VERSION_SCHEMA = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS factures (
+    num_commande TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    client TEXT NOT NULL,
+    ttc INTEGER NOT NULL,
+    regle INTEGER NOT NULL DEFAULT 0,
+    statut TEXT NOT NULL DEFAULT 'ouverte',
+    echeance TEXT NOT NULL DEFAULT '',
+    avoir INTEGER NOT NULL DEFAULT 0,
+    atelier TEXT NOT NULL DEFAULT ''
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS operations (
+    id INTEGER PRIMARY KEY,
+    empreinte TEXT NOT NULL UNIQUE,
+    date TEXT NOT NULL,
+    montant INTEGER NOT NULL,
+    libelle TEXT NOT NULL,
+    non_impute INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reglements (
+    operation INTEGER REFERENCES operations (id),
+    num_commande TEXT NOT NULL REFERENCES factures (num_commande),
+    montant INTEGER NOT NULL,
+    date TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS reglements_facture ON reglements (num_commande);
+CREATE TABLE IF NOT EXISTS avoirs (
+    num_avoir TEXT PRIMARY KEY,
+    num_commande TEXT NOT NULL REFERENCES factures (num_commande),
+    date TEXT NOT NULL,
+    ttc INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS avoirs_facture ON avoirs (num_commande);
+CREATE TABLE IF NOT EXISTS mouvements (
+    client TEXT NOT NULL,
+    mois TEXT NOT NULL,
+    factures INTEGER NOT NULL DEFAULT 0,
+    ttc INTEGER NOT NULL DEFAULT 0,
+    avoirs INTEGER NOT NULL DEFAULT 0,
+    regle INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (client, mois)
+) WITHOUT ROWID;
+"""
+
+# Index couvrants : les montants sont lus dans l'index, sans accès à la
+# table, pour chaque intervalle d'échéances et pour chaque client
+INDEX_MONTANTS = """
+CREATE INDEX IF NOT EXISTS factures_creances ON factures (statut, echeance, ttc, regle, avoir);
+CREATE INDEX IF NOT EXISTS factures_client ON factures (client, ttc, regle, avoir);
+"""
+
+# Écritures d'une période (relevés mensuels), lues par intervalle de dates
+INDEX_PERIODES = """
+CREATE INDEX IF NOT EXISTS factures_date ON factures (date);
+CREATE INDEX IF NOT EXISTS reglements_date ON reglements (date);
+CREATE INDEX IF NOT EXISTS avoirs_date ON avoirs (date);
+"""
+
+# Cumuls mensuels recalculés depuis le détail (base antérieure aux relevés)
+RECONSTRUCTION_MOUVEMENTS = """
+INSERT INTO mouvements (client, mois, factures, ttc, avoirs, regle)
+SELECT client, mois, SUM(factures), SUM(ttc), SUM(avoirs), SUM(regle) FROM (
+    SELECT client, substr(date, 1, 7) AS mois, 1 AS factures, ttc, 0 AS avoirs, 0 AS regle
+    FROM factures
+    UNION ALL
+    SELECT f.client, substr(a.date, 1, 7), 0, 0, a.ttc, 0
+    FROM avoirs a JOIN factures f USING (num_commande)
+    UNION ALL
+    SELECT f.client, substr(r.date, 1, 7), 0, 0, 0, r.montant
+    FROM reglements r JOIN factures f USING (num_commande)
+) GROUP BY client, mois
+"""
+
+# Statut d'une facture d'après ses règlements et avoirs
+STATUT = ("CASE WHEN regle + avoir >= ttc THEN 'payee' "
+          "WHEN regle + avoir > 0 THEN 'partielle' ELSE 'ouverte' END")
+
+# Tranches de retard de la balance âgée : (libellé, jours min, jours max)
+TRANCHES = (
+    ('0-30', 1, 30),
+    ('31-60', 31, 60),
+    ('61-90', 61, 90),
+    ('90+', 91, None),
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Solde:
+    """Montants cumulés d'une facture ou d'un client, en centimes"""
+    factures: int
+    ttc: int
+    avoirs: int
+    regle: int
+
+    @property
+    def reste(self):
+        """Reste dû (négatif : trop-perçu à rembourser ou à reporter)"""
+        return self.ttc - self.avoirs - self.regle
+
+
+def centimes(montant):
+    """Montant en euros (nombre ou texte '1 234,56') -> centimes entiers"""
+    if isinstance(montant, str):
+        for separateur in (' ', '\u00a0', '\u202f', '€'):
+            montant = montant.replace(separateur, '')
+        montant = montant.replace(',', '.')
+    return round(float(montant) * 100)
+
+
+def date_iso(date_facture):
+    """'JJ/MM/AAAA' -> 'AAAA-MM-JJ' (tri chronologique) ; inchangée sinon"""
+    if len(date_facture or '') == 10 and date_facture[2] == '/':
+        return f"{date_facture[6:10]}-{date_facture[3:5]}-{date_facture[0:2]}"
+    return date_facture or ''
+
+
+class Comptes:
+    """Factures émises et règlements, stockés dans une base SQLite"""
+
+    def __init__(self, chemin=CHEMIN_COMPTES):
+        assurer_dossier(os.path.dirname(chemin) or '.')
+        # Plusieurs processus de rendu peuvent archiver en même temps
+        self._cnx = sqlite3.connect(chemin, timeout=30)
+        self._cnx.row_factory = sqlite3.Row
+        # Schéma et migrations une seule fois par base, et non à chaque
+        # connexion
+        if self._cnx.execute("PRAGMA user_version").fetchone()[0] < VERSION_SCHEMA:
+            self._migrer()
+
+    def _migrer(self):
+        """Crée les tables et index manquants et met à jour une base ancienne"""
+        mouvements = self._cnx.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'mouvements'"
+        ).fetchone()
+        self._cnx.executescript(SCHEMA)
+        colonnes = {ligne['name'] for ligne in self._cnx.execute("PRAGMA table_info(factures)")}
+        if 'echeance' not in colonnes:
+            # Base antérieure aux échéances : factures payables à réception
+            with self._cnx:
+                self._cnx.execute("ALTER TABLE factures ADD COLUMN echeance TEXT NOT NULL DEFAULT ''")
+                self._cnx.execute("UPDATE factures SET echeance = date")
+                self._cnx.execute("DROP INDEX IF EXISTS factures_statut")
+        if 'avoir' not in colonnes:
+            # Base antérieure aux avoirs : l'index des échéances ne couvrait
+            # pas la colonne avoir
+            with self._cnx:
+                self._cnx.execute("ALTER TABLE factures ADD COLUMN avoir INTEGER NOT NULL DEFAULT 0")
+                self._cnx.execute("DROP INDEX IF EXISTS factures_echeances")
+        if 'atelier' not in colonnes:
+            # Base antérieure aux ateliers : factures de l'installation
+            with self._cnx:
+                self._cnx.execute("ALTER TABLE factures ADD COLUMN atelier TEXT NOT NULL DEFAULT ''")
+        colonnes = {ligne['name'] for ligne in self._cnx.execute("PRAGMA table_info(reglements)")}
+        if 'date' not in colonnes:
+            # Base antérieure aux relevés : date de l'opération bancaire
+            with self._cnx:
+                self._cnx.execute("ALTER TABLE reglements ADD COLUMN date TEXT NOT NULL DEFAULT ''")
+                self._cnx.execute("UPDATE reglements SET date = (SELECT date FROM operations "
+                                  "WHERE id = reglements.operation) WHERE operation IS NOT NULL")
+        self._cnx.executescript(INDEX_MONTANTS)
+        self._cnx.executescript(INDEX_PERIODES)
+        with self._cnx:
+            if mouvements is None:
+                self.reconstruire_mouvements()
+            self._cnx.execute(f"PRAGMA user_version = {VERSION_SCHEMA}")
+
+    def fermer(self):
+        self._cnx.close()
+
+    @contextmanager
+    def transaction(self):
+        """Regroupe plusieurs écritures (validées ensemble, ou annulées)"""
+        with self._cnx:
+            yield self
+
+    def inscrire(self, num_commande, date_facture, client, ttc, echeance=None, atelier=None):
+        """Inscrit une facture émise ; une facture régénérée garde ses règlements
+
+        Args:
+            ttc (int): Montant TTC en centimes
+            echeance (str, optional): JJ/MM/AAAA (défaut : date de facture)
+            atelier (str, optional): Atelier émetteur (défaut : l'installation)
+        """
+        ancienne = self.facture(num_commande)
+        if ancienne is not None:
+            self._cumuler(ancienne['client'], ancienne['date'], factures=-1, ttc=-ancienne['ttc'])
+        self._cumuler(client, date_iso(date_facture), factures=1, ttc=ttc)
+        self._cnx.execute(
+            "INSERT INTO factures (num_commande, date, client, ttc, echeance, atelier) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (num_commande) DO UPDATE SET date = excluded.date, "
+            "client = excluded.client, ttc = excluded.ttc, echeance = excluded.echeance, "
+            "atelier = excluded.atelier",
+            (num_commande, date_iso(date_facture), client, ttc,
+             date_iso(echeance or date_facture), atelier or ''),
+        )
+        self._cnx.execute(
+            f"UPDATE factures SET statut = {STATUT} WHERE num_commande = ?", (num_commande,)
+        )
+
+    def factures_ouvertes(self):
+        """Factures non soldées : (num_commande, client, ttc, reste) en centimes"""
+        return [tuple(ligne) for ligne in self._cnx.execute(
+            "SELECT num_commande, client, ttc, ttc - regle - avoir FROM factures "
+            "WHERE statut IN ('ouverte', 'partielle')"
+        )]
+
+    def facture(self, num_commande):
+        """Ligne d'une facture (num_commande, date, client, ttc, regle, statut,
+        echeance, avoir, atelier) ou None"""
+        return self._cnx.execute(
+            "SELECT * FROM factures WHERE num_commande = ?", (num_commande,)
+        ).fetchone()
+
+    def operation_connue(self, empreinte):
+        """True si l'opération bancaire a déjà été rapprochée"""
+        return self._cnx.execute(
+            "SELECT 1 FROM operations WHERE empreinte = ?", (empreinte,)
+        ).fetchone() is not None
+
+    def enregistrer_operation(self, empreinte, date, montant, libelle, imputations):
+        """Enregistre une opération bancaire et ses imputations
+
+        Args:
+            empreinte (str): Identifiant stable de l'opération (réimport sans doublon)
+            montant (int): Montant reçu en centimes
+            imputations (list): (num_commande, centimes) imputés aux factures
+
+        Returns:
+            bool: False si l'opération était déjà enregistrée
+        """
+        impute = sum(part for _, part in imputations)
+        curseur = self._cnx.execute(
+            "INSERT OR IGNORE INTO operations (empreinte, date, montant, libelle, non_impute) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (empreinte, date_iso(date), montant, libelle, montant - impute),
+        )
+        if curseur.rowcount == 0:
+            return False
+        for num_commande, part in imputations:
+            self._regler(curseur.lastrowid, num_commande, part, date_iso(date))
+        return True
+
+    def regler(self, num_commande, montant, date_reglement=None):
+        """Règlement saisi à la main (centimes), sans opération bancaire
+
+        Args:
+            date_reglement (str, optional): JJ/MM/AAAA (défaut : aujourd'hui)
+        """
+        self._regler(None, num_commande, montant,
+                     date_iso(date_reglement) if date_reglement else date.today().isoformat())
+
+    def _regler(self, operation, num_commande, montant, date_reglement):
+        self._cnx.execute(
+            "INSERT INTO reglements (operation, num_commande, montant, date) VALUES (?, ?, ?, ?)",
+            (operation, num_commande, montant, date_reglement),
+        )
+        client = self._cnx.execute(
+            "SELECT client FROM factures WHERE num_commande = ?", (num_commande,)
+        ).fetchone()
+        if client is not None:
+            self._cumuler(client[0], date_reglement, regle=montant)
+        self._cnx.execute(
+            "UPDATE factures SET regle = regle + ?, statut = CASE "
+            "WHEN regle + ? + avoir >= ttc THEN 'payee' ELSE 'partielle' END WHERE num_commande = ?",
+            (montant, montant, num_commande),
+        )
+
+    def etat(self):
+        """Nombre de factures et reste à encaisser (centimes) par statut"""
+        comptes = {s: (0, 0) for s in STATUTS}
+        for ligne in self._cnx.execute(
+            "SELECT statut, COUNT(*) AS n, SUM(ttc - regle - avoir) AS reste FROM factures GROUP BY statut"
+        ):
+            comptes[ligne['statut']] = (ligne['n'], ligne['reste'])
+        return comptes
+
+    def inscrire_avoir(self, num_avoir, num_commande, date_avoir, ttc):
+        """Impute un avoir à sa facture ; un avoir régénéré remplace le précédent
+
+        Args:
+            ttc (int): Montant TTC de l'avoir en centimes
+
+        Raises:
+            KeyError: si la facture n'est pas dans les comptes
+            ValueError: si les avoirs dépasseraient le montant de la facture
+        """
+        precedent = self._cnx.execute(
+            "SELECT a.date, a.ttc, f.client FROM avoirs a JOIN factures f USING (num_commande) "
+            "WHERE num_avoir = ?", (num_avoir,)
+        ).fetchone()
+        ancien = precedent['ttc'] if precedent else 0
+        if ttc > self.credit_disponible(num_commande) + ancien:
+            raise ValueError(f"Avoir {num_avoir} : {ttc / 100:.2f} EUR dépasse le montant "
+                             f"restant à créditer sur {num_commande}")
+        if precedent is not None:
+            self._cumuler(precedent['client'], precedent['date'], avoirs=-ancien)
+        self._cumuler(self.facture(num_commande)['client'], date_iso(date_avoir), avoirs=ttc)
+        self._cnx.execute(
+            "INSERT INTO avoirs (num_avoir, num_commande, date, ttc) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (num_avoir) DO UPDATE SET num_commande = excluded.num_commande, "
+            "date = excluded.date, ttc = excluded.ttc",
+            (num_avoir, num_commande, date_iso(date_avoir), ttc),
+        )
+        self._cnx.execute(
+            "UPDATE factures SET avoir = avoir + ? WHERE num_commande = ?",
+            (ttc - ancien, num_commande),
+        )
+        self._cnx.execute(
+            f"UPDATE factures SET statut = {STATUT} WHERE num_commande = ?", (num_commande,)
+        )
+
+    def credit_disponible(self, num_commande):
+        """Montant TTC (centimes) que de nouveaux avoirs peuvent encore créditer
+
+        Raises:
+            KeyError: si la facture n'est pas dans les comptes
+        """
+        ligne = self._cnx.execute(
+            "SELECT ttc - avoir FROM factures WHERE num_commande = ?", (num_commande,)
+        ).fetchone()
+        if ligne is None:
+            raise KeyError(f"Facture inconnue des comptes : {num_commande}")
+        return ligne[0]
+
+    def avoirs(self, num_commande):
+        """Avoirs émis sur une facture : (num_avoir, date AAAA-MM-JJ, ttc en centimes)"""
+        return [tuple(ligne) for ligne in self._cnx.execute(
+            "SELECT num_avoir, date, ttc FROM avoirs WHERE num_commande = ? ORDER BY date, num_avoir",
+            (num_commande,),
+        )]
+
+    def solde_facture(self, num_commande):
+        """Solde d'une facture, avoirs déduits (Solde, ou None si inconnue)"""
+        ligne = self._cnx.execute(
+            "SELECT ttc, avoir, regle FROM factures WHERE num_commande = ?", (num_commande,)
+        ).fetchone()
+        return Solde(1, *ligne) if ligne else None
+
+    def solde_client(self, client):
+        """Solde de toutes les factures d'un client, lu dans l'index par client"""
+        nombre, ttc, avoirs, regle = self._cnx.execute(
+            "SELECT COUNT(*), COALESCE(SUM(ttc), 0), COALESCE(SUM(avoir), 0), "
+            "COALESCE(SUM(regle), 0) FROM factures WHERE client = ?", (client,)
+        ).fetchone()
+        return Solde(nombre, ttc, avoirs, regle)
+
+    def _cumuler(self, client, date_mouvement, factures=0, ttc=0, avoirs=0, regle=0):
+        """Reporte un mouvement dans les cumuls du client pour son mois"""
+        self._cnx.execute(
+            "INSERT INTO mouvements (client, mois, factures, ttc, avoirs, regle) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (client, mois) DO UPDATE SET "
+            "factures = factures + excluded.factures, ttc = ttc + excluded.ttc, "
+            "avoirs = avoirs + excluded.avoirs, regle = regle + excluded.regle",
+            (client, date_mouvement[:7], factures, ttc, avoirs, regle),
+        )
+
+    def reconstruire_mouvements(self):
+        """Recalcule les cumuls mensuels depuis les factures, avoirs et règlements"""
+        self._cnx.execute("DELETE FROM mouvements")
+        self._cnx.execute(RECONSTRUCTION_MOUVEMENTS)
+
+    def soldes_mensuels(self, mois, client=None):
+        """Solde d'ouverture et mouvements du mois de chaque client, lus dans
+        les cumuls mensuels
+
+        Les clients sans mouvement dans le mois et au solde nul sont omis.
+
+        Args:
+            mois (str): AAAA-MM
+            client (str, optional): Un seul client
+
+        Returns:
+            list: (client, solde d'ouverture en centimes, Solde du mois),
+                par ordre de client
+        """
+        filtre = "AND client = :client " if client is not None else ''
+        return [
+            (ligne[0], ligne[1], Solde(*ligne[2:]))
+            for ligne in self._cnx.execute(
+                "SELECT client, SUM(CASE WHEN mois < :mois THEN ttc - avoirs - regle ELSE 0 END), "
+                "SUM(CASE WHEN mois = :mois THEN factures ELSE 0 END), "
+                "SUM(CASE WHEN mois = :mois THEN ttc ELSE 0 END), "
+                "SUM(CASE WHEN mois = :mois THEN avoirs ELSE 0 END), "
+                "SUM(CASE WHEN mois = :mois THEN regle ELSE 0 END) "
+                f"FROM mouvements WHERE mois <= :mois {filtre}GROUP BY client "
+                "HAVING SUM(ttc - avoirs - regle) != 0 OR MAX(mois) = :mois "
+                "ORDER BY client",
+                {'mois': mois, 'client': client},
+            )
+        ]
+
+    def ecritures(self, mois, client=None):
+        """Factures, avoirs et règlements d'un mois, lus par intervalle de dates
+
+        Returns:
+            list: (client, date AAAA-MM-JJ, genre ('facture', 'avoir' ou
+                'reglement'), pièce, facture concernée, montant en centimes),
+                par client puis par date
+        """
+        debut, fin = f"{mois}-01", f"{mois}-31"
+        filtre, parametres = '', (debut, fin) * 3
+        if client is not None:
+            filtre = " AND client = ?"
+            parametres = (debut, fin, client) * 3
+        return [tuple(ligne) for ligne in self._cnx.execute(
+            "SELECT * FROM ("
+            "SELECT client, date, 'facture' AS genre, num_commande AS piece, "
+            "num_commande AS facture, ttc AS montant FROM factures "
+            "WHERE date BETWEEN ? AND ?" + filtre + " "
+            "UNION ALL SELECT f.client, a.date, 'avoir', a.num_avoir, a.num_commande, a.ttc "
+            "FROM avoirs a JOIN factures f USING (num_commande) "
+            "WHERE a.date BETWEEN ? AND ?" + filtre + " "
+            "UNION ALL SELECT f.client, r.date, 'reglement', '', r.num_commande, r.montant "
+            "FROM reglements r JOIN factures f USING (num_commande) "
+            "WHERE r.date BETWEEN ? AND ?" + filtre + ") "
+            "ORDER BY client, date, CASE genre WHEN 'facture' THEN 0 WHEN 'avoir' THEN 1 ELSE 2 END, piece",
+            parametres,
+        )]
+
+    def clients(self):
+        """Noms de tous les clients ayant des mouvements, quel que soit le mois"""
+        return [ligne['client'] for ligne in
+                self._cnx.execute("SELECT DISTINCT client FROM mouvements")]
+
+    def ateliers(self, mois, client=None):
+        """Atelier de la dernière facture de chaque client émise au plus tard ce mois
+
+        Returns:
+            dict: client -> atelier ('' : l'installation)
+        """
+        filtre, parametres = '', (f"{mois}-31",)
+        if client is not None:
+            filtre, parametres = " AND client = ?", parametres + (client,)
+        # max() : SQLite lit les autres colonnes sur la ligne retenue
+        return {ligne['client']: ligne['atelier'] for ligne in self._cnx.execute(
+            "SELECT client, atelier, max(date) FROM factures WHERE date <= ?" + filtre
+            + " GROUP BY client", parametres,
+        )}
+
+    def balance_agee(self, date_reference):
+        """Reste dû des factures non soldées, par tranche de retard
+
+        Une lecture d'intervalle de l'index des échéances par tranche : le
+        coût dépend des factures ouvertes de la tranche, pas de l'historique.
+
+        Args:
+            date_reference (date): Jour de calcul des retards
+
+        Returns:
+            dict: libellé -> (nombre de factures, reste dû en centimes), avec
+                'non echu' pour les factures dont l'échéance n'est pas passée
+        """
+        intervalles = [('non echu', date_reference.isoformat(), None)]
+        for libelle, jours_min, jours_max in TRANCHES:
+            debut = None if jours_max is None else (date_reference - timedelta(days=jours_max)).isoformat()
+            fin = (date_reference - timedelta(days=jours_min - 1)).isoformat()
+            intervalles.append((libelle, debut, fin))
+
+        balance = {}
+        for libelle, debut, fin in intervalles:
+            conditions, parametres = [], []
+            if debut is not None:
+                conditions.append("echeance >= ?")
+                parametres.append(debut)
+            if fin is not None:
+                conditions.append("echeance < ?")
+                parametres.append(fin)
+            nombre, reste = self._cnx.execute(
+                "SELECT COUNT(*), COALESCE(SUM(ttc - regle - avoir), 0) FROM factures "
+                "WHERE statut IN ('ouverte', 'partielle') AND echeance != '' AND "
+                + ' AND '.join(conditions),
+                parametres,
+            ).fetchone()
+            balance[libelle] = (nombre, reste)
+        return balance
+
+    def en_retard(self, date_reference, limite=None):
+        """Factures échues non soldées, de la plus ancienne échéance à la plus récente
+
+        Returns:
+            list: (num_commande, client, échéance AAAA-MM-JJ, reste dû en centimes)
+        """
+        return [tuple(ligne) for ligne in self._cnx.execute(
+            "SELECT num_commande, client, echeance, ttc - regle - avoir FROM factures "
+            "WHERE statut IN ('ouverte', 'partielle') AND echeance != '' AND echeance < ? "
+            "ORDER BY echeance LIMIT ?",
+            (date_reference.isoformat(), -1 if limite is None else limite),
+        )]
+
+
+def montant_ttc(facture):
+    """TTC d'une facture ou d'un avoir en centimes, arrondi comme sur le PDF
+    (c'est le montant que le client vire)"""
+    total_ht = sum(article.total_ligne for article in facture.articles)
+    return centimes(f"{total_ht * (1 + facture.tva):.2f}")
+
+
+def inscrire_facture(facture, chemin=CHEMIN_COMPTES):
+    """Inscrit une facture générée dans les comptes clients"""
+    donnees = facture.donnees
+    if not donnees.get('num_commande'):
+        return
+    comptes = Comptes(chemin)
+    try:
+        with comptes.transaction():
+            comptes.inscrire(donnees['num_commande'], donnees.get('date_facture', ''),
+                             donnees.get('client_nom', ''), montant_ttc(facture), facture.echeance,
+                             donnees.get('atelier'))
+    finally:
+        comptes.fermer()
+
+
+def inscrire_avoir(avoir, chemin=CHEMIN_COMPTES):
+    """Impute un avoir généré à la facture qu'il corrige"""
+    donnees = avoir.donnees
+    comptes = Comptes(chemin)
+    try:
+        with comptes.transaction():
+            comptes.inscrire_avoir(donnees['num_commande'], donnees['num_facture'],
+                                   donnees.get('date_facture', ''), montant_ttc(avoir))
+    finally:
+        comptes.fermer()
@@ -0,0 +1,324 @@
+"""Devis : propositions chiffrées, converties en factures une fois acceptées
+
+Un devis est mis en page par le même moteur que la facture (titre DEVIS,
+date de validité à la place de l'échéance) et numéroté dans sa propre
+série, DV-AAAAMM-NNNN. Chaque devis généré est conservé dans une base
+SQLite avec ses articles chiffrés et son total HT : l'accepter puis le
+facturer ne demande aucune ressaisie.
+
+Statuts : 'emis' -> 'accepte' ou 'refuse' ; 'accepte' -> 'converti' dès
+que le PDF de la facture est sur le disque.
+
+La facture reprend les articles du devis tels quels (objets immuables) et,
+dans le même processus, la disposition du tableau et les textes des lignes
+déjà calculés pour le devis. Les devis acceptés se convertissent en lot par
+le pipeline de facture_lot ; leurs numéros de facture sont réservés avant
+le rendu : une conversion interrompue puis relancée reprend les mêmes
+numéros, sans trou ni doublon dans la série des factures.
+"""
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from dataclasses import asdict
+from datetime import datetime, timedelta
+
+from facture_comptes import centimes, date_iso
+from facture_schema import lire_commandes
+from facture_seiko import (FactureMouvementAbsolu, assurer_dossier, get_next_order_number,
+                           get_next_quote_number)
+
+CHEMIN_DEVIS = os.path.join('factures', 'devis.sqlite')
+DUREE_VALIDITE = 30  # jours
+
+STATUTS = ('emis', 'accepte', 'refuse', 'converti')
+
+# Champs propres au devis, non repris sur la facture
+CHAMPS_DEVIS = ('date_validite', 'date_echeance')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devis (
+    num_devis TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    client TEXT NOT NULL,
+    total_ht INTEGER NOT NULL,
+    statut TEXT NOT NULL DEFAULT 'emis',
+    num_commande TEXT,
+    donnees TEXT NOT NULL,
+    articles TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS devis_statut ON devis (statut, date);
+"""
+
+
+class DevisMouvementAbsolu(FactureMouvementAbsolu):
+    """Devis, mis en page comme une facture ; donnees['num_commande'] porte
+    le numéro du devis"""
+    TITRE = 'DEVIS'
+    DESTINATAIRE = 'ÉTABLI POUR'
+    PREFIXE_FICHIER = 'devis'
+    TYPE_FACTURX = None  # un devis n'est pas une facture
+    QR_PAIEMENT = False  # rien à régler avant acceptation
+
+    @property
+    def validite(self):
+        """Date limite d'acceptation JJ/MM/AAAA : 'date_validite' si fournie,
+        sinon DUREE_VALIDITE jours après la date du devis"""
+        if self.donnees.get('date_validite'):
+            return self.donnees['date_validite']
+        date_devis = self.donnees.get('date_facture')
+        if not date_devis:
+            return ''
+        validite = datetime.strptime(date_devis, '%d/%m/%Y') + timedelta(days=DUREE_VALIDITE)
+        return validite.strftime('%d/%m/%Y')
+
+    def _ligne_echeance(self):
+        return f"Valable jusqu'au: {self.validite}"
+
+    def _archiver(self, nom_fichier):
+        """Conserve le devis généré dans le carnet des devis (il n'entre ni
+        au registre des ventes ni aux comptes clients)"""
+        enregistrer_devis(self)
+
+    def convertir(self, num_commande=None, date_facture=None):
+        """Facture reprenant les articles et la mise en page du devis
+
+        Args:
+            num_commande (str, optional): Numéro de facture (défaut : suivant
+                de la série des factures)
+            date_facture (str, optional): JJ/MM/AAAA (défaut : aujourd'hui)
+
+        Returns:
+            FactureMouvementAbsolu: Facture prête à être générée
+        """
+        donnees = {cle: valeur for cle, valeur in self.donnees.items() if cle not in CHAMPS_DEVIS}
+        donnees['num_devis'] = self.donnees['num_commande']
+        donnees['num_commande'] = num_commande or get_next_order_number(
+            self.horloge, donnees.get('atelier'))
+        donnees['date_facture'] = date_facture or self.horloge().strftime('%d/%m/%Y')
+        facture = FactureMouvementAbsolu(donnees, deterministe=self.deterministe,
+                                         horloge=self.horloge, flux=self.flux,
+                                         facturx=self.facturx, identite=self.identite)
+        facture.articles = list(self.articles)
+        # Même tableau au même endroit : rien n'est recalculé si le devis
+        # vient d'être mis en page
+        facture._disposition = self._disposition
+        facture._textes = self._textes
+        return facture
+
+
+class CarnetDevis:
+    """Devis émis et leur suivi, stockés dans une base SQLite"""
+
+    def __init__(self, chemin=CHEMIN_DEVIS):
+        assurer_dossier(os.path.dirname(chemin) or '.')
+        # Les conversions en lot marquent les devis depuis le thread d'écriture
+        self._cnx = sqlite3.connect(chemin, timeout=30)
+        self._cnx.row_factory = sqlite3.Row
+        self._cnx.executescript(SCHEMA)
+
+    def fermer(self):
+        self._cnx.close()
+
+    def __len__(self):
+        return self._cnx.execute("SELECT COUNT(*) FROM devis").fetchone()[0]
+
+    @contextmanager
+    def transaction(self):
+        """Regroupe plusieurs écritures (validées ensemble, ou annulées)"""
+        with self._cnx:
+            yield self
+
+    def enregistrer(self, devis):
+        """Enregistre un devis généré ; un devis régénéré garde son statut"""
+        donnees = devis.donnees
+        total_ht = sum(article.total_ligne for article in devis.articles)
+        self._cnx.execute(
+            "INSERT INTO devis (num_devis, date, client, total_ht, donnees, articles) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (num_devis) DO UPDATE SET date = excluded.date, "
+            "client = excluded.client, total_ht = excluded.total_ht, "
+            "donnees = excluded.donnees, articles = excluded.articles",
+            (donnees['num_commande'], date_iso(donnees.get('date_facture', '')),
+             donnees.get('client_nom', ''), centimes(f"{total_ht:.2f}"),
+             json.dumps(donnees, ensure_ascii=False),
+             json.dumps([asdict(article) for article in devis.articles], ensure_ascii=False)),
+        )
+
+    def _ligne(self, num_devis):
+        ligne = self._cnx.execute(
+            "SELECT * FROM devis WHERE num_devis = ?", (num_devis,)
+        ).fetchone()
+        if ligne is None:
+            raise KeyError(f"Devis inconnu : {num_devis}")
+        return ligne
+
+    def devis(self, num_devis, **options):
+        """Devis enregistré, reconstruit avec ses articles
+
+        Args:
+            **options: Transmis au constructeur (deterministe, flux...)
+
+        Raises:
+            KeyError: si le devis n'est pas dans le carnet
+        """
+        ligne = self._ligne(num_devis)
+        commande = dict(json.loads(ligne['donnees']), articles=json.loads(ligne['articles']))
+        return DevisMouvementAbsolu.depuis_commande(commande, **options)
+
+    def statut(self, num_devis):
+        """Statut d'un devis et numéro de la facture qui en est issue (ou None)"""
+        ligne = self._ligne(num_devis)
+        return ligne['statut'], ligne['num_commande']
+
+    def changer_statut(self, num_devis, statut):
+        """Accepte ou refuse un devis
+
+        Raises:
+            KeyError: si le devis n'est pas dans le carnet
+            ValueError: statut inconnu, ou devis déjà converti en facture
+        """
+        if statut not in ('emis', 'accepte', 'refuse'):
+            raise ValueError(f"Statut de devis invalide : {statut!r}")
+        actuel, num_commande = self.statut(num_devis)
+        if actuel == 'converti':
+            raise ValueError(f"Devis {num_devis} déjà facturé ({num_commande})")
+        with self._cnx:
+            self._cnx.execute(
+                "UPDATE devis SET statut = ? WHERE num_devis = ?", (statut, num_devis)
+            )
+
+    def liste(self, statut=None):
+        """Devis du plus récent au plus ancien, sans relire leurs articles
+
+        Returns:
+            list: (num_devis, date AAAA-MM-JJ, client, total HT en centimes,
+                statut, num_commande de la facture ou None)
+        """
+        filtre, parametres = '', ()
+        if statut is not None:
+            filtre, parametres = "WHERE statut = ? ", (statut,)
+        return [tuple(ligne) for ligne in self._cnx.execute(
+            "SELECT num_devis, date, client, total_ht, statut, num_commande FROM devis "
+            f"{filtre}ORDER BY date DESC, num_devis DESC", parametres
+        )]
+
+    def reserver_facture(self, num_devis, horloge=datetime.now):
+        """Numéro de facture d'un devis à convertir, attribué une seule fois
+
+        Raises:
+            ValueError: devis refusé ou déjà converti
+        """
+        with self._cnx:
+            statut, num_commande = self.statut(num_devis)
+            if statut in ('refuse', 'converti'):
+                raise ValueError(f"Devis {num_devis} {'refusé' if statut == 'refuse' else 'déjà facturé'}")
+            if num_commande is None:
+                atelier = json.loads(self._ligne(num_devis)['donnees']).get('atelier')
+                num_commande = get_next_order_number(horloge, atelier)
+                self._cnx.execute(
+                    "UPDATE devis SET num_commande = ? WHERE num_devis = ?",
+                    (num_commande, num_devis),
+                )
+        return num_commande
+
+    def acceptes(self):
+        """Numéros des devis acceptés, du plus ancien au plus récent"""
+        return [ligne[0] for ligne in self._cnx.execute(
+            "SELECT num_devis FROM devis WHERE statut = 'accepte' ORDER BY date, num_devis"
+        )]
+
+    def marquer_converti(self, num_devis, num_commande):
+        """Note qu'un devis est facturé"""
+        with self._cnx:
+            self._cnx.execute(
+                "UPDATE devis SET statut = 'converti', num_commande = ? WHERE num_devis = ?",
+                (num_commande, num_devis),
+            )
+
+
+def enregistrer_devis(devis, chemin=CHEMIN_DEVIS):
+    """Ajoute un devis généré au carnet"""
+    if not devis.donnees.get('num_commande'):
+        return
+    carnet = CarnetDevis(chemin)
+    try:
+        with carnet.transaction():
+            carnet.enregistrer(devis)
+    finally:
+        carnet.fermer()
+
+
+def marquer_converti(num_devis, num_commande, chemin=CHEMIN_DEVIS):
+    """Note qu'un devis est facturé (appelé à l'archivage de la facture)"""
+    carnet = CarnetDevis(chemin)
+    try:
+        carnet.marquer_converti(num_devis, num_commande)
+    finally:
+        carnet.fermer()
+
+
+def charger_devis(chemin_commandes, horloge=datetime.now):
+    """Lit un fichier JSON Lines de commandes et retourne les devis à générer
+
+    Sans num_commande, un numéro de la série des devis est attribué ; sans
+    date_facture, le devis est daté du jour.
+
+    Raises:
+        CommandesInvalides: fichier refusé, avant toute attribution de numéro
+    """
+    devis = []
+    for commande in lire_commandes(chemin_commandes):
+        document = DevisMouvementAbsolu.depuis_commande(commande, horloge=horloge)
+        if not document.donnees.get('num_commande'):
+            document.donnees['num_commande'] = get_next_quote_number(
+                horloge, document.donnees.get('atelier'))
+        document.donnees.setdefault('date_facture', horloge().strftime('%d/%m/%Y'))
+        devis.append(document)
+    return devis
+
+
+def convertir_devis(num_devis, horloge=datetime.now, chemin=CHEMIN_DEVIS):
+    """Génère la facture d'un devis émis ou accepté
+
+    Returns:
+        str: Chemin du PDF de la facture
+    """
+    carnet = CarnetDevis(chemin)
+    try:
+        num_commande = carnet.reserver_facture(num_devis, horloge)
+        devis = carnet.devis(num_devis, horloge=horloge)
+    finally:
+        carnet.fermer()
+    return devis.convertir(num_commande).generer_facture()
+
+
+def convertir_acceptes(processus=None, deterministe=False, horloge=datetime.now,
+                       chemin=CHEMIN_DEVIS):
+    """Génère en lot les factures de tous les devis acceptés
+
+    Args:
+        processus (int, optional): Nombre de processus de rendu
+        deterministe (bool, optional): Rendu reproductible
+
+    Returns:
+        list: Chemins des PDF générés, dans l'ordre des devis
+
+    Raises:
+        LotIncomplet: factures en échec, les autres étant générées
+    """
+    from facture_lot import generer_lot
+
+    carnet = CarnetDevis(chemin)
+    try:
+        factures = []
+        date_facture = horloge().strftime('%d/%m/%Y')
+        for num_devis in carnet.acceptes():
+            num_commande = carnet.reserver_facture(num_devis, horloge)
+            facture = carnet.devis(num_devis, horloge=horloge).convertir(num_commande, date_facture)
+            factures.append((facture.donnees, tuple(facture.articles)))
+    finally:
+        carnet.fermer()
+    if not factures:
+        return []
+    return generer_lot(factures, processus, deterministe)
@@ -0,0 +1,317 @@
+"""Factur-X : données structurées (XML CII) jointes au PDF de la facture
+
+Le fichier factur-x.xml (Cross Industry Invoice, profil EN 16931) est
+produit à partir des mêmes donnees et articles que la mise en page, au
+moment où le PDF est terminé, puis joint au document comme fichier associé
+(/AF du catalogue, relation Data) avec les métadonnées XMP Factur-X.
+
+Le gabarit XML est découpé une fois, à l'import, en morceaux fixes et en
+noms de champs : une facture ne coûte que l'échappement de ses valeurs et
+la concaténation des morceaux, sans arbre DOM ni analyse de gabarit.
+
+Les montants sont calculés en centimes entiers : la somme des lignes, la
+base de TVA et le total TTC du XML sont cohérents au centime près.
+"""
+import functools
+from decimal import ROUND_HALF_UP, Decimal
+from string import Formatter
+from xml.sax.saxutils import escape
+
+from fpdf.annotations import PDFEmbeddedFile
+from fpdf.output import OutputProducer
+from fpdf.syntax import Name, PDFObject, PDFString
+from fpdf.syntax import create_dictionary_string as pdf_dict
+from fpdf.syntax import create_list_string as pdf_list
+from fpdf.syntax import iobj_ref as pdf_ref
+
+NOM_FICHIER = 'factur-x.xml'
+PROFIL = 'EN 16931'
+GUIDELINE = 'urn:cen.eu:en16931:2017'
+DEVISE = 'EUR'
+
+GABARIT = """<?xml version="1.0" encoding="UTF-8"?>
+<rsm:CrossIndustryInvoice xmlns:rsm="urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100" \
+xmlns:ram="urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100" \
+xmlns:udt="urn:un:unece:uncefact:data:standard:UnqualifiedDataType:100">
+<rsm:ExchangedDocumentContext>
+<ram:GuidelineSpecifiedDocumentContextParameter><ram:ID>{guideline}</ram:ID></ram:GuidelineSpecifiedDocumentContextParameter>
+</rsm:ExchangedDocumentContext>
+<rsm:ExchangedDocument>
+<ram:ID>{numero}</ram:ID>
+<ram:TypeCode>{type_document}</ram:TypeCode>
+<ram:IssueDateTime><udt:DateTimeString format="102">{date}</udt:DateTimeString></ram:IssueDateTime>
+</rsm:ExchangedDocument>
+<rsm:SupplyChainTradeTransaction>
+{lignes}<ram:ApplicableHeaderTradeAgreement>
+<ram:SellerTradeParty>
+<ram:Name>{vendeur_nom}</ram:Name>
+<ram:SpecifiedLegalOrganization><ram:ID schemeID="0002">{vendeur_siret}</ram:ID></ram:SpecifiedLegalOrganization>
+<ram:PostalTradeAddress><ram:PostcodeCode>{vendeur_cp}</ram:PostcodeCode><ram:LineOne>{vendeur_adresse}</ram:LineOne>\
+<ram:CityName>{vendeur_ville}</ram:CityName><ram:CountryID>{vendeur_pays}</ram:CountryID></ram:PostalTradeAddress>
+<ram:SpecifiedTaxRegistration><ram:ID schemeID="VA">{vendeur_tva}</ram:ID></ram:SpecifiedTaxRegistration>
+</ram:SellerTradeParty>
+<ram:BuyerTradeParty>
+<ram:Name>{client_nom}</ram:Name>
+<ram:PostalTradeAddress><ram:PostcodeCode>{client_cp}</ram:PostcodeCode><ram:LineOne>{client_adresse}</ram:LineOne>\
+<ram:CityName>{client_ville}</ram:CityName><ram:CountryID>{client_pays}</ram:CountryID></ram:PostalTradeAddress>
+</ram:BuyerTradeParty>
+</ram:ApplicableHeaderTradeAgreement>
+<ram:ApplicableHeaderTradeDelivery/>
+<ram:ApplicableHeaderTradeSettlement>
+<ram:InvoiceCurrencyCode>{devise}</ram:InvoiceCurrencyCode>
+<ram:ApplicableTradeTax>
+<ram:CalculatedAmount>{montant_tva}</ram:CalculatedAmount><ram:TypeCode>VAT</ram:TypeCode>\
+<ram:BasisAmount>{total_ht}</ram:BasisAmount><ram:CategoryCode>S</ram:CategoryCode>\
+<ram:RateApplicablePercent>{taux}</ram:RateApplicablePercent>
+</ram:ApplicableTradeTax>
+<ram:SpecifiedTradePaymentTerms><ram:Description>{conditions}</ram:Description>{echeance}</ram:SpecifiedTradePaymentTerms>
+<ram:SpecifiedTradeSettlementHeaderMonetarySummation>
+<ram:LineTotalAmount>{total_ht}</ram:LineTotalAmount>
+<ram:TaxBasisTotalAmount>{total_ht}</ram:TaxBasisTotalAmount>
+<ram:TaxTotalAmount currencyID="{devise}">{montant_tva}</ram:TaxTotalAmount>
+<ram:GrandTotalAmount>{total_ttc}</ram:GrandTotalAmount>
+<ram:DuePayableAmount>{total_ttc}</ram:DuePayableAmount>
+</ram:SpecifiedTradeSettlementHeaderMonetarySummation>
+{facture_origine}</ram:ApplicableHeaderTradeSettlement>
+</rsm:SupplyChainTradeTransaction>
+</rsm:CrossIndustryInvoice>
+"""
+
+GABARIT_LIGNE = """<ram:IncludedSupplyChainTradeLineItem>
+<ram:AssociatedDocumentLineDocument><ram:LineID>{numero}</ram:LineID></ram:AssociatedDocumentLineDocument>
+<ram:SpecifiedTradeProduct><ram:SellerAssignedID>{reference}</ram:SellerAssignedID><ram:Name>{modele}</ram:Name>\
+<ram:Description>{description}</ram:Description></ram:SpecifiedTradeProduct>
+<ram:SpecifiedLineTradeAgreement><ram:NetPriceProductTradePrice><ram:ChargeAmount>{prix}</ram:ChargeAmount>\
+</ram:NetPriceProductTradePrice></ram:SpecifiedLineTradeAgreement>
+<ram:SpecifiedLineTradeDelivery><ram:BilledQuantity unitCode="C62">{quantite}</ram:BilledQuantity></ram:SpecifiedLineTradeDelivery>
+<ram:SpecifiedLineTradeSettlement>
+<ram:ApplicableTradeTax><ram:TypeCode>VAT</ram:TypeCode><ram:CategoryCode>S</ram:CategoryCode>\
+<ram:RateApplicablePercent>{taux}</ram:RateApplicablePercent></ram:ApplicableTradeTax>
+<ram:SpecifiedTradeSettlementLineMonetarySummation><ram:LineTotalAmount>{montant}</ram:LineTotalAmount>\
+</ram:SpecifiedTradeSettlementLineMonetarySummation>
+</ram:SpecifiedLineTradeSettlement>
+</ram:IncludedSupplyChainTradeLineItem>
+"""
+
+ECHEANCE = ('<ram:DueDateDateTime><udt:DateTimeString format="102">{date}</udt:DateTimeString>'
+            '</ram:DueDateDateTime>')
+FACTURE_ORIGINE = ('<ram:InvoiceReferencedDocument><ram:IssuerAssignedID>{numero}</ram:IssuerAssignedID>'
+                   '</ram:InvoiceReferencedDocument>\n')
+
+# Métadonnées XMP exigées par Factur-X (schéma d'extension compris)
+XMP = f"""<x:xmpmeta xmlns:x="adobe:ns:meta/">
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+<rdf:Description rdf:about="" xmlns:fx="urn:factur-x:pdfa:CrossIndustryDocument:invoice:1p0#">
+<fx:DocumentType>INVOICE</fx:DocumentType>
+<fx:DocumentFileName>{NOM_FICHIER}</fx:DocumentFileName>
+<fx:Version>1.0</fx:Version>
+<fx:ConformanceLevel>{PROFIL}</fx:ConformanceLevel>
+</rdf:Description>
+<rdf:Description rdf:about="" xmlns:pdfaExtension="http://www.aiim.org/pdfa/ns/extension/" \
+xmlns:pdfaSchema="http://www.aiim.org/pdfa/ns/schema#" xmlns:pdfaProperty="http://www.aiim.org/pdfa/ns/property#">
+<pdfaExtension:schemas><rdf:Bag><rdf:li rdf:parseType="Resource">
+<pdfaSchema:schema>Factur-X PDFA Extension Schema</pdfaSchema:schema>
+<pdfaSchema:namespaceURI>urn:factur-x:pdfa:CrossIndustryDocument:invoice:1p0#</pdfaSchema:namespaceURI>
+<pdfaSchema:prefix>fx</pdfaSchema:prefix>
+<pdfaSchema:property><rdf:Seq>
+<rdf:li rdf:parseType="Resource"><pdfaProperty:name>DocumentFileName</pdfaProperty:name>\
+<pdfaProperty:valueType>Text</pdfaProperty:valueType><pdfaProperty:category>external</pdfaProperty:category>\
+<pdfaProperty:description>Name of the embedded XML invoice file</pdfaProperty:description></rdf:li>
+<rdf:li rdf:parseType="Resource"><pdfaProperty:name>DocumentType</pdfaProperty:name>\
+<pdfaProperty:valueType>Text</pdfaProperty:valueType><pdfaProperty:category>external</pdfaProperty:category>\
+<pdfaProperty:description>INVOICE</pdfaProperty:description></rdf:li>
+<rdf:li rdf:parseType="Resource"><pdfaProperty:name>Version</pdfaProperty:name>\
+<pdfaProperty:valueType>Text</pdfaProperty:valueType><pdfaProperty:category>external</pdfaProperty:category>\
+<pdfaProperty:description>Version of the Factur-X XML schema</pdfaProperty:description></rdf:li>
+<rdf:li rdf:parseType="Resource"><pdfaProperty:name>ConformanceLevel</pdfaProperty:name>\
+<pdfaProperty:valueType>Text</pdfaProperty:valueType><pdfaProperty:category>external</pdfaProperty:category>\
+<pdfaProperty:description>Conformance level of the embedded XML invoice</pdfaProperty:description></rdf:li>
+</rdf:Seq></pdfaSchema:property>
+</rdf:li></rdf:Bag></pdfaExtension:schemas>
+</rdf:Description>
+</rdf:RDF>
+</x:xmpmeta>"""
+
+
+def compiler(gabarit):
+    """Découpe un gabarit en morceaux fixes et noms de champs
+
+    Returns:
+        tuple: (texte fixe, nom du champ ou None), dans l'ordre du gabarit
+    """
+    return tuple((texte, champ) for texte, champ, _, _ in Formatter().parse(gabarit))
+
+
+DOCUMENT = compiler(GABARIT)
+LIGNE = compiler(GABARIT_LIGNE)
+
+
+@functools.lru_cache(maxsize=16)
+def vendeur(identite):
+    """Champs du vendeur, échappés une fois par identité (voir facture_identite)"""
+    return {
+        'vendeur_nom': escape(identite.nom),
+        'vendeur_siret': escape(identite.siret.replace(' ', '')),
+        'vendeur_tva': escape(identite.tva.replace(' ', '')),
+        'vendeur_adresse': escape(identite.adresse),
+        'vendeur_cp': escape(identite.code_postal),
+        'vendeur_ville': escape(identite.ville),
+        'vendeur_pays': escape(identite.code_pays),
+    }
+
+
+def serialiser(morceaux, valeurs):
+    """Morceaux d'un gabarit compilé, champs remplacés par leurs valeurs
+
+    Yields:
+        str
+    """
+    for texte, champ in morceaux:
+        yield texte
+        if champ is not None:
+            yield valeurs[champ]
+
+
+def _montant(centimes):
+    """Centimes entiers -> '1234.56'"""
+    signe = '-' if centimes < 0 else ''
+    return f"{signe}{abs(centimes) // 100}.{abs(centimes) % 100:02d}"
+
+
+def _date(date_facture):
+    """'JJ/MM/AAAA' -> 'AAAAMMJJ' (format 102)"""
+    return f"{date_facture[6:10]}{date_facture[3:5]}{date_facture[0:2]}"
+
+
+def _lignes(articles, taux):
+    """Lignes d'articles sérialisées et total HT en centimes"""
+    morceaux, total_ht = [], 0
+    for numero, article in enumerate(articles, 1):
+        prix = int((Decimal(str(article.prix_total)) * 100).quantize(Decimal(1), ROUND_HALF_UP))
+        montant = prix * article.quantite
+        total_ht += montant
+        morceaux.extend(serialiser(LIGNE, {
+            'numero': str(numero),
+            'reference': escape(article.reference),
+            'modele': escape(article.modele),
+            'description': escape(', '.join(f"{c.nom} {c.reference}".strip()
+                                            for c in article.composants)),
+            'prix': _montant(prix),
+            'quantite': str(article.quantite),
+            'taux': taux,
+            'montant': _montant(montant),
+        }))
+    return morceaux, total_ht
+
+
+def xml_facturx(facture):
+    """XML CII d'une facture ou d'un avoir, à partir de ses donnees et articles
+
+    Args:
+        facture (FactureMouvementAbsolu): Document dont TYPE_FACTURX est
+            '380' (facture) ou '381' (avoir) ; le vendeur est l'identité de
+            son PDF
+
+    Returns:
+        bytes: Contenu de factur-x.xml (UTF-8)
+    """
+    donnees = facture.donnees
+    taux = Decimal(str(facture.tva)) * 100
+    taux_texte = f"{taux.normalize():f}"
+    lignes, total_ht = _lignes(facture.articles, taux_texte)
+    montant_tva = int((total_ht * taux / 100).quantize(Decimal(1), ROUND_HALF_UP))
+    echeance = ''
+    if facture.TYPE_FACTURX == '380' and facture.echeance:
+        echeance = ECHEANCE.format(date=_date(facture.echeance))
+    facture_origine = ''
+    if donnees.get('num_facture'):
+        facture_origine = FACTURE_ORIGINE.format(numero=escape(donnees['num_facture']))
+    valeurs = dict(
+        vendeur(facture.pdf.identite),
+        guideline=GUIDELINE,
+        numero=escape(donnees['num_commande']),
+        type_document=facture.TYPE_FACTURX,
+        date=_date(donnees['date_facture']),
+        lignes=''.join(lignes),
+        client_nom=escape(donnees.get('client_nom', '')),
+        client_adresse=escape(donnees.get('client_adresse', '')),
+        client_cp=escape(donnees.get('client_cp', '')),
+        client_ville=escape(donnees.get('client_ville', '')),
+        client_pays=escape(donnees.get('client_pays', 'FR')),
+        devise=DEVISE,
+        montant_tva=_montant(montant_tva),
+        total_ht=_montant(total_ht),
+        taux=taux_texte,
+        total_ttc=_montant(total_ht + montant_tva),
+        conditions=escape(facture._mention_paiement()),
+        echeance=echeance,
+        facture_origine=facture_origine,
+    )
+    return ''.join(serialiser(DOCUMENT, valeurs)).encode('utf-8')
+
+
+class FichierAssocie(PDFObject):
+    """Spécification de fichier associé au document (PDF/A-3, /AF)"""
+
+    def __init__(self, fichier, nom, description, relation):
+        super().__init__()
+        self.type = Name('Filespec')
+        self.f = PDFString(nom)
+        self.u_f = PDFString(nom)
+        self.desc = PDFString(description) if description else None
+        self.a_f_relationship = Name(relation)
+        self._fichier = fichier
+        self._nom = nom
+
+    @property
+    def e_f(self):
+        return pdf_dict({'/F': pdf_ref(self._fichier.id)})
+
+
+def joindre(pdf, nom, contenu, description='', sous_type='text/xml', relation='Data'):
+    """Joint un fichier au PDF, référencé par le catalogue (/AF) et listé
+    dans ses pièces jointes
+
+    Args:
+        pdf (PDF): Document en cours ; sa date de création date le fichier
+        nom (str): Nom de la pièce jointe
+        contenu (bytes): Contenu, compressé à l'écriture
+        relation (str, optional): Relation au document (/AFRelationship)
+    """
+    fichier = PDFEmbeddedFile(nom, contenu, desc=description, compress=True,
+                              modification_date=pdf.creation_date)
+    fichier.subtype = Name(sous_type)
+    # Listé par ProducteurAssocie, avec sa spécification partagée par /AF
+    fichier.set_globally_enclosed(False)
+    pdf.embedded_files.append(fichier)
+    pdf.fichiers_associes.append(FichierAssocie(fichier, nom, description, relation))
+
+
+def joindre_facturx(pdf, facture):
+    """Joint factur-x.xml au PDF d'une facture et déclare les métadonnées
+    XMP Factur-X"""
+    joindre(pdf, NOM_FICHIER, xml_facturx(facture), 'Factur-X', relation='Data')
+    pdf.set_xmp_metadata(XMP)
+
+
+class ProducteurAssocie(OutputProducer):
+    """Producteur fpdf ajoutant les fichiers associés au catalogue
+
+    Sans fichier associé, le document produit est celui de fpdf.
+    """
+
+    def _add_catalog(self):
+        catalog_obj = super()._add_catalog()
+        for associe in getattr(self.fpdf, 'fichiers_associes', ()):
+            self._add_pdf_obj(associe, 'embedded_files')
+        return catalog_obj
+
+    def _finalize_catalog(self, catalog_obj, **objets):
+        super()._finalize_catalog(catalog_obj, **objets)
+        associes = getattr(self.fpdf, 'fichiers_associes', ())
+        if not associes:
+            return
+        noms = [f"{PDFString(associe._nom).serialize()} {pdf_ref(associe.id)}"
+                for associe in sorted(associes, key=lambda associe: associe._nom)]
+        catalog_obj.names = pdf_dict({'/EmbeddedFiles': pdf_dict({'/Names': pdf_list(noms)})})
+        catalog_obj.a_f = pdf_list([pdf_ref(associe.id) for associe in associes])
@@ -0,0 +1,147 @@
+"""Écriture d'un PDF au fil des pages
+
+En mode flux, chaque page terminée est compressée et écrite aussitôt dans
+le fichier de destination, puis son contenu est libéré : la mémoire reste
+à peu près constante quel que soit le nombre de pages. Les objets de fin
+de document (polices, arbre des pages, catalogue) sont produits par fpdf
+à la fermeture, suivis de la table xref qui couvre l'ensemble du fichier.
+"""
+import hashlib
+
+from fpdf.output import PDFHeader, _dimensions_to_mediabox
+from fpdf.syntax import PDFContentStream, PDFObject
+from fpdf.syntax import create_dictionary_string as pdf_dict
+
+from facture_facturx import ProducteurAssocie
+
+
+class _ContenuEcrit(PDFObject):
+    """Référence au flux de contenu d'une page déjà écrit dans le fichier"""
+
+    def __init__(self, id_objet):
+        super().__init__()
+        self.id = id_objet
+
+
+class _Positions(dict):
+    """Positions des objets produits par fpdf à la fermeture
+
+    La table xref de fpdf lit aussi les positions des flux de pages déjà
+    écrits : elle est remplacée par celle de SortieFlux, la valeur lue
+    pour ces objets est donc sans importance.
+    """
+
+    def __missing__(self, id_objet):
+        return 0
+
+
+class SortieFlux:
+    """Fichier de destination d'un PDF écrit au fil des pages
+
+    Tient le compte des octets écrits, des positions des objets (pour la
+    table xref) et de l'empreinte MD5 du fichier, dont fpdf dérive
+    l'identifiant /ID du document.
+    """
+
+    def __init__(self, chemin, version_pdf):
+        self._fichier = open(chemin, 'wb')
+        self._empreinte = hashlib.md5(usedforsecurity=False)
+        self.position = 0
+        self.positions = {}  # numéro d'objet -> position dans le fichier
+        self.ecrire(PDFHeader(version_pdf).serialize())
+
+    def ecrire(self, donnees):
+        """Écrit des données suivies d'un saut de ligne, comme fpdf"""
+        if isinstance(donnees, str):
+            donnees = donnees.encode('latin1')
+        self.ecrire_brut(bytes(donnees) + b'\n')
+
+    def ecrire_brut(self, donnees):
+        self._fichier.write(donnees)
+        self._empreinte.update(donnees)
+        self.position += len(donnees)
+
+    def ecrire_page(self, contenu, compresser=True):
+        """Écrit le flux de contenu d'une page et retourne sa référence"""
+        objet = PDFContentStream(contents=contenu, compress=compresser)
+        objet.id = len(self.positions) + 1
+        self.positions[objet.id] = self.position
+        self.ecrire(objet.serialize())
+        return _ContenuEcrit(objet.id)
+
+    def terminer(self, id_catalogue, id_info, date_creation=None):
+        """Écrit la table xref et la fin de fichier, puis ferme le fichier"""
+        debut_xref = self.position
+        nb_objets = len(self.positions) + 1
+        # Identifiant calculé comme FPDF._default_file_id
+        if date_creation:
+            self._empreinte.update(date_creation.strftime("%Y%m%d%H%M%S").encode('utf8'))
+        identifiant = self._empreinte.hexdigest().upper()
+        lignes = ['xref', f"0 {nb_objets}", '0000000000 65535 f ']
+        lignes += [f"{self.positions[i]:010} 00000 n " for i in range(1, nb_objets)]
+        lignes += [
+            'trailer', '<<',
+            f"/Size {nb_objets}",
+            f"/Root {id_catalogue} 0 R",
+            f"/Info {id_info} 0 R",
+            f"/ID [<{identifiant}><{identifiant}>]",
+            '>>', 'startxref', str(debut_xref), '%%EOF',
+        ]
+        self.ecrire_brut(('\n'.join(lignes) + '\n').encode('latin1'))
+        self._fichier.close()
+
+    def abandonner(self):
+        """Ferme le fichier sans le terminer (document en erreur)"""
+        self._fichier.close()
+
+
+class ProducteurFlux(ProducteurAssocie):
+    """Produit la fin d'un document dont les pages sont déjà dans la sortie
+
+    Les flux de contenu des pages portent les premiers numéros d'objet ;
+    fpdf numérote les objets suivants et les sérialise en mémoire, puis le
+    tout est ajouté à la sortie.
+    """
+
+    def __init__(self, fpdf, sortie):
+        super().__init__(fpdf)
+        self.sortie = sortie
+        self.obj_id = len(sortie.positions)
+        self.offsets = _Positions()
+        self._debut_dernier = 0
+
+    def _add_pages_root(self):
+        # L'en-tête du fichier a été écrit à son ouverture
+        self.pdf_objs = [objet for objet in self.pdf_objs if not isinstance(objet, PDFHeader)]
+        return super()._add_pages_root()
+
+    def _add_pages(self, _slice=slice(0, None)):
+        # Comme OutputProducer._add_pages, sans créer les flux de contenu
+        fpdf = self.fpdf
+        page_objs = []
+        for page_obj in list(fpdf.pages.values())[_slice]:
+            if fpdf.pdf_version > "1.3":
+                page_obj.group = pdf_dict(
+                    {"/Type": "/Group", "/S": "/Transparency", "/CS": "/DeviceRGB"},
+                    field_join=" ",
+                )
+            if page_obj.dimensions() != fpdf.default_page_dimensions:
+                page_obj.media_box = _dimensions_to_mediabox(page_obj.dimensions())
+            self._add_pdf_obj(page_obj, "pages")
+            page_objs.append(page_obj)
+        return page_objs
+
+    def _out(self, data):
+        self._debut_dernier = len(self.buffer)
+        super()._out(data)
+
+    def ecrire(self):
+        """Ajoute les objets de fin de document à la sortie et la termine"""
+        # Le dernier objet sérialisé par fpdf est sa propre table xref
+        fin = self.bufferize()[:self._debut_dernier]
+        base = self.sortie.position
+        for id_objet, position in self.offsets.items():
+            self.sortie.positions[id_objet] = base + position
+        self.sortie.ecrire_brut(fin)
+        xref = self.pdf_objs[-1]
+        self.sortie.terminer(xref.catalog_obj.id, xref.info_obj.id, self.fpdf.creation_date)
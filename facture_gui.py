@@ -1,7 +1,13 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from datetime import datetime
-from facture_seiko import FactureMouvementAbsolu, get_next_order_number
+from facture_seiko import (CONDITIONS_PAIEMENT, FactureMouvementAbsolu, get_next_order_number,
+                           get_next_quote_number)
+from facture_modeles import Article, Composant
+from facture_apercu import ServiceApercu
+from facture_catalogue import CATEGORIES, Catalogue
+from facture_clients import Annuaire
+from facture_devis import DevisMouvementAbsolu
 import webbrowser
 import os
 
@@ -22,6 +28,17 @@ class FactureApp(tk.Tk):
         self.numero_commande = get_next_order_number()
         self.articles = []
         
+        # Aperçu de la facture, calculé en arrière-plan
+        self.apercu = ServiceApercu()
+        self.apercu_future = None
+        self.apercu_planifie = None
+        self.apercu_image = None
+        self.protocol("WM_DELETE_WINDOW", self.fermer)
+        
+        # Catalogue des composants et annuaire des clients pour la saisie
+        self.catalogue = Catalogue()
+        self.annuaire = Annuaire()
+        
         # Configuration de la grille
         self.columnconfigure(0, weight=1)
         self.rowconfigure(1, weight=1)
@@ -80,7 +97,10 @@ class FactureApp(tk.Tk):
         
         # Champs client
         ttk.Label(client_frame, text="Nom du client :").grid(row=0, column=0, sticky='w', pady=2)
-        self.nom_client = ttk.Entry(client_frame, width=30)
+        # Nom complété depuis l'annuaire (nom ou ville), qui remplit les quatre champs
+        self.nom_client = SaisieAutocompletion(
+            client_frame, self.proposer_clients, self.choisir_client, width=30
+        )
         self.nom_client.grid(row=0, column=1, sticky='ew', pady=2, padx=5)
         
         ttk.Label(client_frame, text="Adresse :").grid(row=1, column=0, sticky='w', pady=2)
@@ -95,6 +115,15 @@ class FactureApp(tk.Tk):
         self.ville = ttk.Entry(client_frame, width=30)
         self.ville.grid(row=3, column=1, sticky='ew', pady=2, padx=5)
         
+        ttk.Label(client_frame, text="Paiement :").grid(row=4, column=0, sticky='w', pady=2)
+        self.conditions = ttk.Combobox(
+            client_frame, state='readonly', width=30,
+            values=[libelle for libelle, _ in CONDITIONS_PAIEMENT.values()]
+        )
+        self.conditions.current(0)
+        self.conditions.grid(row=4, column=1, sticky='ew', pady=2, padx=5)
+        self.conditions.bind('<<ComboboxSelected>>', lambda event: self.planifier_apercu())
+        
         # Panneau de droite - Articles
         articles_frame = ttk.LabelFrame(main_frame, text="Articles", padding=10)
         articles_frame.grid(row=0, column=1, sticky='nsew', padx=5, pady=5)
@@ -117,6 +146,12 @@ class FactureApp(tk.Tk):
             style='Accent.TButton'
         ).pack(side='left', padx=5)
         
+        ttk.Button(
+            button_frame,
+            text="Générer le devis",
+            command=self.generer_devis
+        ).pack(side='left', padx=5)
+        
         # Tableau des articles
         self.tree = ttk.Treeview(
             main_frame,
@@ -146,6 +181,16 @@ class FactureApp(tk.Tk):
         scrollbar.grid(row=2, column=2, sticky='ns')
         self.tree.configure(yscrollcommand=scrollbar.set)
         
+        # Aperçu de la première page, à côté du tableau
+        apercu_frame = ttk.LabelFrame(main_frame, text="Aperçu", padding=5)
+        apercu_frame.grid(row=0, column=3, rowspan=3, sticky='nsew', padx=5, pady=5)
+        self.apercu_label = ttk.Label(apercu_frame, text="Aucun article", anchor='center')
+        self.apercu_label.pack(expand=True, fill='both')
+        
+        # Rafraîchir l'aperçu quand les informations client changent
+        for champ in (self.nom_client, self.adresse, self.code_postal, self.ville):
+            champ.bind('<KeyRelease>', lambda event: self.planifier_apercu(), add='+')
+        
         # Panneau de statut
         status_frame = ttk.Frame(self)
         status_frame.grid(row=2, column=0, sticky='ew', padx=10, pady=5)
@@ -156,6 +201,21 @@ class FactureApp(tk.Tk):
         # Configuration du redimensionnement
         self.rowconfigure(2, weight=1)
         
+    def proposer_clients(self, texte):
+        """Clients de l'annuaire dont le nom ou la ville commencent par la saisie"""
+        return [
+            (f"{c.nom} — {c.cp} {c.ville}", c)
+            for c in self.annuaire.rechercher(texte)
+        ]
+    
+    def choisir_client(self, client):
+        """Remplit les champs client avec un client de l'annuaire"""
+        for champ, valeur in ((self.nom_client, client.nom), (self.adresse, client.adresse),
+                              (self.code_postal, client.cp), (self.ville, client.ville)):
+            champ.delete(0, 'end')
+            champ.insert(0, valeur)
+        self.planifier_apercu()
+    
     def ajouter_article(self):
         """Ouvre une fenêtre pour ajouter un nouvel article"""
         dialog = AjoutArticleDialog(self)
@@ -173,14 +233,65 @@ class FactureApp(tk.Tk):
             
         # Ajouter les articles
         for article in self.articles:
-            total = article['quantite'] * article['prix_unitaire']
             self.tree.insert('', 'end', values=(
-                article['description'],
-                article['reference'],
-                article['quantite'],
-                f"{article['prix_unitaire']:.2f} €",
-                f"{total:.2f} €"
+                article.modele,
+                article.reference,
+                article.quantite,
+                f"{article.prix_total:.2f} €",
+                f"{article.total_ligne:.2f} €"
             ))
+        
+        self.planifier_apercu()
+    
+    def donnees_facture(self):
+        """Rassemble les données de la facture saisies dans le formulaire"""
+        return {
+            'num_commande': self.numero_commande,
+            'date_facture': datetime.now().strftime("%d/%m/%Y"),
+            'client_nom': self.nom_client.get(),
+            'client_adresse': self.adresse.get(),
+            'client_cp': self.code_postal.get(),
+            'client_ville': self.ville.get(),
+            'conditions_paiement': list(CONDITIONS_PAIEMENT)[self.conditions.current()],
+        }
+    
+    def planifier_apercu(self, delai=400):
+        """Demande un nouvel aperçu après un court délai sans modification"""
+        if self.apercu_planifie is not None:
+            self.after_cancel(self.apercu_planifie)
+        self.apercu_planifie = self.after(delai, self.demander_apercu)
+    
+    def demander_apercu(self):
+        """Lance le calcul de l'aperçu dans le pool d'arrière-plan"""
+        self.apercu_planifie = None
+        if not self.articles:
+            self.apercu_image = None
+            self.apercu_label.config(image='', text="Aucun article")
+            return
+        self.apercu_future = self.apercu.demander(self.donnees_facture(), self.articles)
+        self.apercu_label.config(text="Aperçu en cours…")
+        self.after(100, self.verifier_apercu, self.apercu_future)
+    
+    def verifier_apercu(self, future):
+        """Affiche l'aperçu dès qu'il est prêt (sans bloquer l'interface)"""
+        if future is not self.apercu_future or future.cancelled():
+            return  # Demande remplacée par une plus récente
+        if not future.done():
+            self.after(100, self.verifier_apercu, future)
+            return
+        try:
+            self.apercu_image = tk.PhotoImage(file=future.result())
+            self.apercu_label.config(image=self.apercu_image, text='')
+        except Exception as e:
+            self.apercu_image = None
+            self.apercu_label.config(image='', text=f"Aperçu indisponible :\n{e}")
+    
+    def fermer(self):
+        """Arrête le pool d'aperçu puis ferme l'application"""
+        self.apercu.fermer()
+        self.catalogue.fermer()
+        self.annuaire.fermer()
+        self.destroy()
     
     def generer_facture(self):
         """Génère la facture au format PDF"""
@@ -194,40 +305,15 @@ class FactureApp(tk.Tk):
             return
         
         # Préparer les données
-        donnees = {
-            'numero_commande': self.numero_commande,
-            'date_commande': datetime.now().strftime("%d/%m/%Y"),
-            'client': {
-                'nom': self.nom_client.get(),
-                'adresse': self.adresse.get(),
-                'code_postal': self.code_postal.get(),
-                'ville': self.ville.get()
-            },
-            'articles': self.articles
-        }
+        donnees = self.donnees_facture()
         
         try:
-            # Créer la facture
+            # Créer la facture avec les articles saisis
             facture = FactureMouvementAbsolu(donnees)
-            
-            # Ajouter les articles
-            for article in self.articles:
-                composants = [{
-                    'nom': article['description'],
-                    'reference': article['reference'],
-                    'prix': article['prix_unitaire']
-                }]
-                
-                facture.ajouter_article(
-                    modele=article['description'],
-                    reference=article['reference'],
-                    composants=composants,
-                    quantite=article['quantite']
-                )
+            facture.articles = list(self.articles)
             
             # Générer le PDF
-            nom_fichier = f"facture_{self.numero_commande}.pdf"
-            facture.generer_facture(nom_fichier)
+            nom_fichier = facture.generer_facture()
             
             # Afficher un message de succès
             messagebox.showinfo("Succès", f"La facture a été générée avec succès : {nom_fichier}")
@@ -238,8 +324,35 @@ class FactureApp(tk.Tk):
         except Exception as e:
             messagebox.showerror("Erreur", f"Une erreur est survenue : {str(e)}")
     
-    def reinitialiser_formulaire(self):
-        """Réinitialise le formulaire après génération de la facture"""
+    def generer_devis(self):
+        """Génère un devis au format PDF, numéroté dans la série des devis"""
+        if not self.articles:
+            messagebox.showerror("Erreur", "Veuillez ajouter au moins un article.")
+            return
+            
+        if not self.nom_client.get():
+            messagebox.showerror("Erreur", "Veuillez renseigner le nom du client.")
+            return
+        
+        # Le numéro de facture réservé reste disponible pour la prochaine facture
+        donnees = dict(self.donnees_facture(), num_commande=get_next_quote_number())
+        
+        try:
+            devis = DevisMouvementAbsolu(donnees)
+            devis.articles = list(self.articles)
+            nom_fichier = devis.generer_facture()
+            messagebox.showinfo("Succès", f"Le devis a été généré avec succès : {nom_fichier}")
+            self.reinitialiser_formulaire(nouveau_numero=False)
+        except Exception as e:
+            messagebox.showerror("Erreur", f"Une erreur est survenue : {str(e)}")
+    
+    def reinitialiser_formulaire(self, nouveau_numero=True):
+        """Réinitialise le formulaire après génération de la facture
+        
+        Args:
+            nouveau_numero (bool, optional): Réserve un nouveau numéro de
+                commande (le précédent a été utilisé par une facture)
+        """
         # Réinitialiser les champs
         self.nom_client.delete(0, 'end')
         self.adresse.delete(0, 'end')
@@ -251,12 +364,93 @@ class FactureApp(tk.Tk):
         self.maj_tableau_articles()
         
         # Générer un nouveau numéro de commande
-        self.numero_commande = get_next_order_number()
+        if nouveau_numero:
+            self.numero_commande = get_next_order_number()
         self.title(f"Facturation Seiko - Commande {self.numero_commande}")
         
         self.status_label.config(text="Nouvelle facture prête")
 
 
+class SaisieAutocompletion(ttk.Entry):
+    """Champ de saisie proposant des valeurs au fil de la frappe
+
+    Les propositions s'affichent dans une liste sous le champ : flèches
+    haut/bas pour se déplacer, Entrée ou double-clic pour choisir, Échap
+    pour fermer.
+    """
+
+    TOUCHES_IGNOREES = {'Up', 'Down', 'Return', 'KP_Enter', 'Escape', 'Tab'}
+
+    def __init__(self, parent, rechercher, choisir, lignes=8, **kwargs):
+        """
+        Args:
+            rechercher (callable): texte -> liste de (libellé, valeur)
+            choisir (callable): Appelé avec la valeur retenue
+            lignes (int, optional): Hauteur de la liste de propositions
+        """
+        super().__init__(parent, **kwargs)
+        self.rechercher = rechercher
+        self.choisir = choisir
+        self._valeurs = []
+        self._liste = tk.Listbox(self.winfo_toplevel(), height=lignes, activestyle='none')
+        self._liste.bind('<Double-Button-1>', lambda event: self._retenir())
+        self.bind('<KeyRelease>', self._proposer, add='+')
+        self.bind('<Down>', lambda event: self._deplacer(1))
+        self.bind('<Up>', lambda event: self._deplacer(-1))
+        self.bind('<Return>', self._valider, add='+')
+        self.bind('<Escape>', lambda event: self.masquer())
+        # Délai : laisse passer un clic dans la liste avant de la masquer
+        self.bind('<FocusOut>', lambda event: self.after(150, self._masquer_sans_focus), add='+')
+
+    def _proposer(self, event):
+        if event.keysym in self.TOUCHES_IGNOREES:
+            return
+        propositions = self.rechercher(self.get()) if self.get().strip() else []
+        if not propositions:
+            self.masquer()
+            return
+        self._valeurs = [valeur for _, valeur in propositions]
+        self._liste.delete(0, 'end')
+        for libelle, _ in propositions:
+            self._liste.insert('end', libelle)
+        self._liste.configure(height=min(len(propositions), 8))
+        self._liste.place(in_=self, x=0, rely=1.0, relwidth=1.6)
+        self._liste.lift()
+
+    def _deplacer(self, pas):
+        if not self._liste.winfo_ismapped():
+            return
+        selection = self._liste.curselection()
+        index = selection[0] + pas if selection else (0 if pas > 0 else self._liste.size() - 1)
+        index = max(0, min(index, self._liste.size() - 1))
+        self._liste.selection_clear(0, 'end')
+        self._liste.selection_set(index)
+        self._liste.see(index)
+        return 'break'
+
+    def _valider(self, event):
+        if self._liste.winfo_ismapped() and self._liste.curselection():
+            self._retenir()
+            return 'break'
+
+    def _retenir(self):
+        selection = self._liste.curselection()
+        if selection:
+            valeur = self._valeurs[selection[0]]
+            self.masquer()
+            self.choisir(valeur)
+            self.icursor('end')
+            self.focus_set()
+
+    def _masquer_sans_focus(self):
+        if self.focus_get() is not self._liste:
+            self.masquer()
+
+    def masquer(self):
+        self._liste.place_forget()
+        self._valeurs = []
+
+
 class AjoutArticleDialog(tk.Toplevel):
     """Fenêtre de dialogue pour ajouter un nouvel article"""
     
@@ -271,6 +465,7 @@ class AjoutArticleDialog(tk.Toplevel):
         
         # Variables
         self.description = tk.StringVar()
+        self.categorie = tk.StringVar(value=CATEGORIES[0])
         self.reference = tk.StringVar()
         self.quantite = tk.StringVar(value="1")
         self.prix_unitaire = tk.StringVar()
@@ -283,18 +478,26 @@ class AjoutArticleDialog(tk.Toplevel):
         ttk.Label(self, text="Description :").grid(row=0, column=0, sticky='e', padx=5, pady=5)
         ttk.Entry(self, textvariable=self.description, width=40).grid(row=0, column=1, sticky='w', padx=5, pady=5)
         
-        ttk.Label(self, text="Référence :").grid(row=1, column=0, sticky='e', padx=5, pady=5)
-        ttk.Entry(self, textvariable=self.reference, width=20).grid(row=1, column=1, sticky='w', padx=5, pady=5)
+        ttk.Label(self, text="Catégorie :").grid(row=1, column=0, sticky='e', padx=5, pady=5)
+        ttk.Combobox(self, textvariable=self.categorie, values=CATEGORIES, state='readonly',
+                     width=18).grid(row=1, column=1, sticky='w', padx=5, pady=5)
         
-        ttk.Label(self, text="Quantité :").grid(row=2, column=0, sticky='e', padx=5, pady=5)
-        ttk.Spinbox(self, from_=1, to=100, textvariable=self.quantite, width=5).grid(row=2, column=1, sticky='w', padx=5, pady=5)
+        ttk.Label(self, text="Référence :").grid(row=2, column=0, sticky='e', padx=5, pady=5)
+        # Référence complétée depuis le catalogue, dans la catégorie choisie
+        SaisieAutocompletion(
+            self, self.proposer_composants, self.choisir_composant,
+            textvariable=self.reference, width=20,
+        ).grid(row=2, column=1, sticky='w', padx=5, pady=5)
         
-        ttk.Label(self, text="Prix unitaire (€) :").grid(row=3, column=0, sticky='e', padx=5, pady=5)
-        ttk.Entry(self, textvariable=self.prix_unitaire, width=10).grid(row=3, column=1, sticky='w', padx=5, pady=5)
+        ttk.Label(self, text="Quantité :").grid(row=3, column=0, sticky='e', padx=5, pady=5)
+        ttk.Spinbox(self, from_=1, to=100, textvariable=self.quantite, width=5).grid(row=3, column=1, sticky='w', padx=5, pady=5)
+        
+        ttk.Label(self, text="Prix unitaire (€) :").grid(row=4, column=0, sticky='e', padx=5, pady=5)
+        ttk.Entry(self, textvariable=self.prix_unitaire, width=10).grid(row=4, column=1, sticky='w', padx=5, pady=5)
         
         # Boutons
         button_frame = ttk.Frame(self)
-        button_frame.grid(row=4, column=0, columnspan=2, pady=20)
+        button_frame.grid(row=5, column=0, columnspan=2, pady=20)
         
         ttk.Button(
             button_frame, 
@@ -322,6 +525,18 @@ class AjoutArticleDialog(tk.Toplevel):
         self.grab_set()
         self.description.focus_set()
     
+    def proposer_composants(self, texte):
+        """Composants du catalogue correspondant au début de la saisie"""
+        return [
+            (f"{c.reference} — {c.nom} — {c.prix:.2f} €", c)
+            for c in self.parent.catalogue.rechercher(texte, categorie=self.categorie.get())
+        ]
+    
+    def choisir_composant(self, composant):
+        """Remplit la référence et le prix"""
+        self.reference.set(composant.reference)
+        self.prix_unitaire.set(f"{composant.prix:.2f}")
+    
     def valider_article(self):
         """Valide l'ajout de l'article"""
         try:
@@ -349,12 +564,14 @@ class AjoutArticleDialog(tk.Toplevel):
                 return
                 
             # Enregistrer les données de l'article
-            self.article_data = {
-                'description': self.description.get(),
-                'reference': self.reference.get(),
-                'quantite': quantite,
-                'prix_unitaire': prix
-            }
+            self.article_data = Article(
+                modele=self.description.get(),
+                reference=self.reference.get(),
+                composants=(Composant(self.categorie.get(), self.reference.get(), prix),),
+                quantite=quantite
+            )
+            # Catégorie du composant, comme en console : jamais le modèle
+            self.parent.catalogue.enregistrer(self.categorie.get(), self.reference.get(), prix)
             
             # Fermer la fenêtre
             self.destroy()
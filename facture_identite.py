@@ -0,0 +1,467 @@
+"""Identité de l'entreprise et charte graphique des documents
+
+Raison sociale, coordonnées, numéros légaux, textes imprimés (bandeau,
+pied de page, mentions), couleurs et marges sont lus dans un fichier de
+configuration JSON ou TOML : identite.json, livré à côté des modules, ou le
+fichier désigné par la variable d'environnement FACTURE_IDENTITE.
+
+Le fichier est analysé et validé une fois, puis compilé en une Identite
+figée : les gabarits de texte sont remplis, les couleurs converties en
+triplets RVB. Tous les rendus d'un processus partagent le même objet.
+
+Une même installation peut facturer pour plusieurs ateliers : une commande
+qui porte 'atelier' est imprimée avec l'identité ateliers/<atelier>.json
+(ou .toml ; dossier FACTURE_ATELIERS), ses polices et ses séries de
+numérotation. Les identités compilées sont gardées dans un cache LRU de
+CAPACITE_CACHE entrées : un lot mêlant les ateliers ne relit rien entre
+deux factures.
+
+Dans les processus de longue durée (démon de surveillance, pool de rendu),
+la signature du fichier est relue au plus une fois par DELAI_RECHARGEMENT
+secondes : une identité modifiée s'applique au document suivant, sans
+redémarrer les processus. Un fichier devenu invalide est signalé et
+l'identité précédente reste en vigueur.
+
+Sections facultatives : [images] (logo du bandeau) et [paiement]
+(coordonnées bancaires du QR code de virement imprimé sur les factures,
+voir facture_qr).
+"""
+import json
+import os
+import re
+import time
+import warnings
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from string import Formatter
+
+from facture_polices import POLICES_DEJAVU, REPERTOIRE_POLICES, oublier_polices
+from facture_qr import iban_valide
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+REPERTOIRE = os.path.dirname(os.path.abspath(__file__))
+CHEMIN_IDENTITE = os.path.join(REPERTOIRE, 'identite.json')
+DOSSIER_ATELIERS = os.path.join(REPERTOIRE, 'ateliers')
+VARIABLE_IDENTITE = 'FACTURE_IDENTITE'
+VARIABLE_ATELIERS = 'FACTURE_ATELIERS'
+DELAI_RECHARGEMENT = 1.0  # secondes entre deux contrôles du fichier
+CAPACITE_CACHE = 8        # identités compilées gardées par processus
+
+# Séries de numérotation par défaut et fichiers de compteur historiques ;
+# une autre série a son propre fichier, last_number_<PREFIXE>.txt
+SERIES = {'factures': 'SM', 'devis': 'DV', 'avoirs': 'AV'}
+COMPTEURS = {'SM': 'last_order_number.txt', 'DV': 'last_quote_number.txt',
+             'AV': 'last_credit_note_number.txt'}
+# Styles fpdf des polices de la mise en page
+STYLES = {'normal': '', 'gras': 'B', 'italique': 'I', 'gras_italique': 'BI'}
+IMAGES = ('logo',)
+PAIEMENT = ('titulaire', 'iban', 'bic')
+
+
+@dataclass(frozen=True, slots=True)
+class Couleurs:
+    """Couleurs de la charte (R, V, B)"""
+    bandeau: tuple      # fond du bandeau en haut de page
+    principale: tuple   # titres, total TTC
+    claire: tuple       # fonds des cadres et des en-têtes de tableau
+    secondaire: tuple   # texte secondaire
+    separateur: tuple   # filets et bordures
+    texte: tuple        # texte principal
+    fond: tuple         # fond des lignes, texte sur le bandeau
+
+
+@dataclass(frozen=True, slots=True)
+class Marges:
+    """Marges et espacements de la page (mm)"""
+    gauche: float
+    droite: float
+    haut: float
+    bas: float
+    interligne: float
+    espacement: float
+
+
+@dataclass(frozen=True, slots=True)
+class Serie:
+    """Série de numérotation : PREFIXE-AAAAMM-NNNN"""
+    prefixe: str
+    compteur: str       # fichier du compteur (dossier courant)
+
+
+@dataclass(frozen=True, slots=True)
+class Numerotation:
+    factures: Serie
+    devis: Serie
+    avoirs: Serie
+
+
+@dataclass(frozen=True, slots=True)
+class Identite:
+    """Identité compilée : champs de l'entreprise et textes prêts à imprimer"""
+    # Entreprise
+    nom: str
+    enseigne: str
+    slogan: str
+    adresse: str
+    code_postal: str
+    ville: str
+    pays: str
+    code_pays: str
+    telephone: str
+    email: str
+    siret: str
+    tva: str
+    rcs: str
+    # Textes imprimés
+    bandeau: str
+    sous_titre: str
+    coordonnees: tuple
+    contact: tuple
+    mention_tva: str
+    mention_bas: str
+    mentions_legales: str
+    pied_de_page: tuple
+    # Charte
+    couleurs: Couleurs
+    marges: Marges
+    # Polices ((style fpdf, chemin absolu), ...) et séries de numérotation
+    polices: tuple
+    numerotation: Numerotation
+    # Logo du bandeau (chemin absolu, '' : aucun) et coordonnées du QR code
+    # de paiement ('' : pas de QR code)
+    logo: str = ''
+    titulaire: str = ''
+    iban: str = ''
+    bic: str = ''
+
+
+CHAMPS_ENTREPRISE = tuple(f.name for f in fields(Identite)[:13])
+TEXTES = {'bandeau': str, 'sous_titre': str, 'coordonnees': list, 'contact': list,
+          'mention_tva': str, 'mention_bas': str, 'mentions_legales': list,
+          'pied_de_page': list}
+_HEXA = re.compile(r'#([0-9a-fA-F]{2})([0-9a-fA-F]{2})([0-9a-fA-F]{2})')
+_PREFIXE = re.compile(r'[A-Z0-9]{1,8}')
+_ATELIER = re.compile(r'[A-Za-z0-9_-]+')
+_BIC = re.compile(r'[A-Z]{6}[A-Z0-9]{2}(?:[A-Z0-9]{3})?')
+
+
+def _section(config, nom, attendus, erreurs):
+    """Dictionnaire d'une section ; clés manquantes ou inconnues signalées"""
+    section = config.get(nom)
+    if not isinstance(section, dict):
+        erreurs.append(f"section [{nom}] manquante")
+        return {}
+    for cle in attendus:
+        if cle not in section:
+            erreurs.append(f"{nom}.{cle} manquant")
+    for cle in section.keys() - set(attendus):
+        erreurs.append(f"{nom}.{cle} inconnu")
+    return section
+
+
+def _remplir(gabarit, entreprise, chemin, erreurs):
+    """Remplit un gabarit de texte avec les champs de l'entreprise"""
+    if not isinstance(gabarit, str):
+        erreurs.append(f"{chemin} : texte attendu")
+        return ''
+    try:
+        inconnus = {champ for _, champ, _, _ in Formatter().parse(gabarit)
+                    if champ is not None and champ not in CHAMPS_ENTREPRISE}
+    except ValueError as erreur:
+        erreurs.append(f"{chemin} : {erreur}")
+        return ''
+    if inconnus:
+        erreurs.append(f"{chemin} : champ(s) inconnu(s) {', '.join(sorted(inconnus))}")
+        return ''
+    return gabarit.format_map(entreprise)
+
+
+def _couleur(valeur, chemin, erreurs):
+    """'#RRVVBB' ou [R, V, B] -> (R, V, B)"""
+    if isinstance(valeur, str) and _HEXA.fullmatch(valeur):
+        return tuple(int(composante, 16) for composante in _HEXA.fullmatch(valeur).groups())
+    if (isinstance(valeur, list) and len(valeur) == 3
+            and all(type(c) is int and 0 <= c <= 255 for c in valeur)):
+        return tuple(valeur)
+    erreurs.append(f"{chemin} : couleur attendue ('#RRVVBB' ou [R, V, B] de 0 à 255)")
+    return (0, 0, 0)
+
+
+def _polices(section, repertoire, erreurs):
+    """Chemins absolus des polices ; défaut : DejaVu livrée avec le projet
+
+    Un chemin relatif est cherché dans le dossier du fichier d'identité,
+    puis dans celui du projet.
+    """
+    polices = []
+    for cle, style in STYLES.items():
+        if cle not in section:
+            polices.append((style, os.path.join(REPERTOIRE_POLICES, POLICES_DEJAVU[style])))
+            continue
+        nom = section[cle]
+        if not isinstance(nom, str):
+            erreurs.append(f"polices.{cle} : chemin attendu")
+            continue
+        chemin = _fichier(nom, (repertoire, REPERTOIRE_POLICES))
+        if chemin is None:
+            erreurs.append(f"polices.{cle} : fichier introuvable ({nom})")
+            continue
+        polices.append((style, chemin))
+    return tuple(polices)
+
+
+def _fichier(nom, dossiers):
+    """Chemin absolu d'un fichier, relatif au premier dossier qui le contient"""
+    candidats = [nom] if os.path.isabs(nom) else [os.path.join(d, nom) for d in dossiers]
+    chemin = next((c for c in candidats if os.path.isfile(c)), None)
+    return chemin and os.path.abspath(chemin)
+
+
+def _images(section, repertoire, erreurs):
+    """Chemins absolus des images (dossier du fichier d'identité, puis du projet)"""
+    images = {}
+    for cle in IMAGES:
+        nom = section.get(cle, '')
+        if not isinstance(nom, str):
+            erreurs.append(f"images.{cle} : chemin attendu")
+        elif nom:
+            images[cle] = _fichier(nom, (repertoire, REPERTOIRE)) or ''
+            if not images[cle]:
+                erreurs.append(f"images.{cle} : fichier introuvable ({nom})")
+    return images
+
+
+def _paiement(section, entreprise, erreurs):
+    """Coordonnées bancaires ; le titulaire est par défaut la raison sociale"""
+    for cle in PAIEMENT:
+        if not isinstance(section.get(cle, ''), str):
+            erreurs.append(f"paiement.{cle} : texte attendu")
+            return {}
+    if not section:
+        return {}
+    iban = section.get('iban', '').replace(' ', '').upper()
+    bic = section.get('bic', '').replace(' ', '').upper()
+    if not iban_valide(iban):
+        erreurs.append(f"paiement.iban : IBAN invalide ({section.get('iban', '')})")
+    if bic and not _BIC.fullmatch(bic):
+        erreurs.append(f"paiement.bic : BIC invalide ({bic})")
+    titulaire = section.get('titulaire') or entreprise['nom']
+    if len(titulaire) > 70:
+        erreurs.append("paiement.titulaire : 70 caractères au plus")
+    return {'titulaire': titulaire, 'iban': iban, 'bic': bic}
+
+
+def _numerotation(section, erreurs):
+    """Séries de numérotation ; une série absente garde son préfixe par défaut"""
+    series = {}
+    for cle, defaut in SERIES.items():
+        prefixe = section.get(cle, defaut)
+        if not isinstance(prefixe, str) or not _PREFIXE.fullmatch(prefixe):
+            erreurs.append(f"numerotation.{cle} : préfixe attendu (A-Z, 0-9, 8 caractères au plus)")
+            prefixe = defaut
+        series[cle] = Serie(prefixe, COMPTEURS.get(prefixe, f"last_number_{prefixe}.txt"))
+    if len({serie.prefixe for serie in series.values()}) < len(series):
+        erreurs.append("numerotation : factures, devis et avoirs doivent avoir des préfixes distincts")
+    return Numerotation(**series)
+
+
+def _section_facultative(config, nom, attendus, erreurs):
+    """Section facultative : clés inconnues signalées"""
+    section = config.get(nom, {})
+    if not isinstance(section, dict):
+        erreurs.append(f"section [{nom}] : table attendue")
+        return {}
+    for cle in section.keys() - set(attendus):
+        erreurs.append(f"{nom}.{cle} inconnu")
+    return section
+
+
+def compiler(config, repertoire=REPERTOIRE):
+    """Valide une configuration et la compile en Identite
+
+    Args:
+        config (dict): Sections entreprise, textes, couleurs et marges ;
+            polices, numerotation, images et paiement facultatives
+        repertoire (str, optional): Dossier où chercher les polices et les images
+
+    Returns:
+        Identite
+
+    Raises:
+        ValueError: configuration invalide ; le message liste toutes les
+            erreurs
+    """
+    erreurs = []
+    if not isinstance(config, dict):
+        raise ValueError("configuration attendue sous forme de table")
+    for nom in config.keys() - {'entreprise', 'textes', 'couleurs', 'marges', 'polices',
+                                'numerotation', 'images', 'paiement'}:
+        erreurs.append(f"section [{nom}] inconnue")
+
+    entreprise = _section(config, 'entreprise', CHAMPS_ENTREPRISE, erreurs)
+    for cle in CHAMPS_ENTREPRISE:
+        if not isinstance(entreprise.get(cle, ''), str):
+            erreurs.append(f"entreprise.{cle} : texte attendu")
+    entreprise = {cle: str(entreprise.get(cle, '')) for cle in CHAMPS_ENTREPRISE}
+
+    section = _section(config, 'textes', TEXTES, erreurs)
+    textes = {}
+    for cle, genre in TEXTES.items():
+        gabarit = section.get(cle, genre())
+        if genre is list:
+            if not isinstance(gabarit, list):
+                erreurs.append(f"textes.{cle} : liste de lignes attendue")
+                gabarit = []
+            textes[cle] = tuple(_remplir(ligne, entreprise, f"textes.{cle}[{rang}]", erreurs)
+                                for rang, ligne in enumerate(gabarit))
+        else:
+            textes[cle] = _remplir(gabarit, entreprise, f"textes.{cle}", erreurs)
+    textes['mentions_legales'] = '\n'.join(textes['mentions_legales'])
+
+    section = _section(config, 'couleurs', [f.name for f in fields(Couleurs)], erreurs)
+    couleurs = Couleurs(**{f.name: _couleur(section.get(f.name, '#000000'), f"couleurs.{f.name}", erreurs)
+                           for f in fields(Couleurs)})
+
+    section = _section(config, 'marges', [f.name for f in fields(Marges)], erreurs)
+    marges = {}
+    for f in fields(Marges):
+        valeur = section.get(f.name, 0)
+        if type(valeur) not in (int, float) or valeur < 0:
+            erreurs.append(f"marges.{f.name} : nombre positif attendu")
+            valeur = 0
+        marges[f.name] = valeur
+
+    polices = _polices(_section_facultative(config, 'polices', STYLES, erreurs),
+                       repertoire, erreurs)
+    numerotation = _numerotation(_section_facultative(config, 'numerotation', SERIES, erreurs),
+                                 erreurs)
+    images = _images(_section_facultative(config, 'images', IMAGES, erreurs), repertoire, erreurs)
+    paiement = _paiement(_section_facultative(config, 'paiement', PAIEMENT, erreurs),
+                         entreprise, erreurs)
+
+    if erreurs:
+        raise ValueError("identité invalide : " + " ; ".join(erreurs))
+    return Identite(**entreprise, **textes, couleurs=couleurs, marges=Marges(**marges),
+                    polices=polices, numerotation=numerotation, **images, **paiement)
+
+
+def charger(chemin):
+    """Lit, valide et compile un fichier d'identité (.json ou .toml)
+
+    Raises:
+        OSError: fichier illisible
+        ValueError: syntaxe ou contenu invalide
+    """
+    with open(chemin, 'rb') as f:
+        contenu = f.read()
+    try:
+        if chemin.endswith('.toml'):
+            if tomllib is None:
+                raise ValueError("lecture du TOML : Python 3.11 ou le paquet tomli requis")
+            config = tomllib.loads(contenu.decode('utf-8'))
+        else:
+            config = json.loads(contenu)
+        return compiler(config, os.path.dirname(os.path.abspath(chemin)))
+    except (ValueError, UnicodeDecodeError) as erreur:
+        raise ValueError(f"{chemin} : {erreur}") from None
+
+
+def chemin_identite(atelier=None):
+    """Fichier d'identité d'un atelier, ou de l'installation :
+    FACTURE_IDENTITE, sinon identite.json
+
+    Raises:
+        ValueError: nom d'atelier invalide ou atelier inconnu
+    """
+    if not atelier:
+        return os.environ.get(VARIABLE_IDENTITE) or CHEMIN_IDENTITE
+    if not _ATELIER.fullmatch(atelier):
+        raise ValueError(f"Nom d'atelier invalide : {atelier!r}")
+    dossier = os.environ.get(VARIABLE_ATELIERS) or DOSSIER_ATELIERS
+    for extension in ('.json', '.toml'):
+        chemin = os.path.join(dossier, atelier + extension)
+        if os.path.isfile(chemin):
+            return chemin
+    raise ValueError(f"Atelier inconnu : {atelier} (aucun {atelier}.json ni .toml dans {dossier})")
+
+
+@dataclass(slots=True)
+class _Chargee:
+    chemin: str
+    signature: tuple
+    identite: Identite
+    controle: float     # instant (monotone) du dernier contrôle du fichier
+
+
+# Identités compilées du processus, de la moins à la plus récemment
+# utilisée : atelier ('' : installation) ou chemin -> _Chargee
+_identites = OrderedDict()
+
+
+def signature_fichier(chemin):
+    """Date et taille du fichier (None s'il est inaccessible)"""
+    try:
+        info = os.stat(chemin)
+    except OSError:
+        return None
+    return info.st_mtime_ns, info.st_size
+
+
+def identite_courante(atelier=None, chemin=None):
+    """Identité compilée en vigueur, rechargée si son fichier a changé
+
+    Le fichier n'est contrôlé qu'une fois par DELAI_RECHARGEMENT secondes,
+    et relu seulement si sa date ou sa taille ont changé. Au-delà de
+    CAPACITE_CACHE identités, la moins récemment utilisée est oubliée.
+
+    Args:
+        atelier (str, optional): Atelier émetteur (défaut : l'installation)
+        chemin (str, optional): Fichier d'identité explicite
+
+    Returns:
+        Identite
+
+    Raises:
+        OSError, ValueError: premier chargement impossible ; ensuite, un
+            fichier invalide ou supprimé est signalé par un avertissement et
+            l'identité précédente est conservée
+    """
+    cle = chemin or atelier or ''
+    chargee = _identites.get(cle)
+    maintenant = time.monotonic()
+    if chargee is not None:
+        _identites.move_to_end(cle)
+        if maintenant - chargee.controle < DELAI_RECHARGEMENT:
+            return chargee.identite
+        chemin = chargee.chemin
+    else:
+        chemin = chemin or chemin_identite(atelier)
+    signature = signature_fichier(chemin)
+    if chargee is not None and signature == chargee.signature:
+        chargee.controle = maintenant
+        return chargee.identite
+    try:
+        identite = charger(chemin)
+    except (OSError, ValueError) as erreur:
+        if chargee is None:
+            raise
+        # Signalé une fois par version du fichier
+        warnings.warn(f"Identité non rechargée, la précédente reste en vigueur : {erreur}")
+        chargee.signature, chargee.controle = signature, maintenant
+        return chargee.identite
+    _identites[cle] = _Chargee(chemin, signature, identite, maintenant)
+    _identites.move_to_end(cle)
+    if len(_identites) > CAPACITE_CACHE:
+        _, oubliee = _identites.popitem(last=False)
+        # Polices propres à l'identité oubliée : analysées de nouveau si
+        # l'atelier revient
+        utilisees = {chemin for autre in _identites.values() for _, chemin in autre.identite.polices}
+        oublier_polices(chemin for _, chemin in oubliee.identite.polices if chemin not in utilisees)
+    return identite
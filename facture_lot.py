@@ -0,0 +1,257 @@
+"""Génération de factures par lot
+
+Le rendu (CPU) et l'écriture sur disque (E/S) sont deux étages d'un même
+pipeline : des processus de rendu produisent les PDF en mémoire, un thread
+unique les écrit. Une file bornée entre les deux étages limite la mémoire
+et ralentit le rendu si le disque ne suit pas ; le débit est celui de
+l'étage le plus lent, et non la somme des deux.
+
+Les fichiers sont écrits sous un nom temporaire puis rendus durables par
+groupes : un fsync par fichier et un seul par dossier à chaque groupe,
+avant d'être renommés. Une facture n'est ajoutée au registre qu'une fois
+son PDF sur le disque.
+
+Format d'entrée (JSON Lines) : une facture par ligne, avec les champs de
+`donnees` (client_nom, client_adresse...) et une liste `articles` au
+format de Article.depuis_dict. Sans num_commande, un numéro est attribué,
+au fil du rendu. Tout le fichier est contrôlé avant l'attribution du
+premier numéro (voir facture_schema). Chaque facture circule sous la forme
+(donnees, articles) : l'objet facture n'est construit que dans le processus
+qui la rend, puis pour son archivage.
+
+Avec un certificat, chaque PDF est signé dans le processus qui l'a rendu,
+avant d'être confié au thread d'écriture (voir facture_signature) : le
+certificat n'est lu qu'une fois par processus.
+
+Une facture dont le rendu ou l'archivage échoue n'interrompt pas le lot :
+son numéro est déjà attribué, les suivantes sont produites, et les échecs
+sont rapportés ensemble à la fin (LotIncomplet).
+"""
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+from functools import partial
+
+from facture_modeles import Article
+from facture_schema import lire_commandes
+from facture_seiko import FactureMouvementAbsolu, assurer_dossier, get_next_order_number
+from facture_signature import signataire, signer_pdf
+
+TAILLE_FILE = 16   # PDF rendus en attente d'écriture
+LOT_FSYNC = 32     # fichiers rendus durables ensemble
+
+
+class LotIncomplet(RuntimeError):
+    """Lot produit en partie ; echecs : [(numéro de facture, message), ...]"""
+
+    def __init__(self, chemins, echecs):
+        self.chemins = chemins
+        self.echecs = echecs
+        super().__init__(
+            f"{len(echecs)} facture(s) en échec, les autres ont été générées :\n"
+            + '\n'.join(f"  {numero} : {message}" for numero, message in echecs)
+        )
+
+
+def charger_lot(chemin):
+    """Lit un fichier JSON Lines et retourne les factures à générer
+
+    Le fichier est contrôlé en entier dès l'appel ; les numéros sont
+    attribués au fil de l'itération.
+
+    Returns:
+        iterator: (donnees, articles) de chaque facture, dans l'ordre du fichier
+
+    Raises:
+        CommandesInvalides: lot refusé, avant toute attribution de numéro
+    """
+    return _numeroter(lire_commandes(chemin))
+
+
+def _numeroter(commandes):
+    for commande in commandes:
+        donnees = dict(commande)
+        articles = tuple(Article.depuis_dict(a) for a in donnees.pop('articles', ()))
+        if not donnees.get('num_commande'):
+            donnees['num_commande'] = get_next_order_number(atelier=donnees.get('atelier'))
+        yield donnees, articles
+
+
+def _archiver(donnees, articles, chemin):
+    """Archive une facture du lot une fois son PDF durable (thread d'écriture)"""
+    facture = FactureMouvementAbsolu(donnees)
+    facture.articles = list(articles)
+    facture._archiver(chemin)
+
+
+def _rendre(donnees, articles, deterministe, facturx=False, certificat=None):
+    """Rendu d'une facture dans un processus du pool : retourne le PDF,
+    signé si un certificat est donné"""
+    facture = FactureMouvementAbsolu(donnees, deterministe=deterministe, facturx=facturx)
+    facture.articles = list(articles)
+    pdf = facture.rendre_pdf()
+    if certificat:
+        pdf = signer_pdf(pdf, signataire(certificat), facture._date_creation)
+    return pdf
+
+
+def _fsync_dossier(dossier):
+    """Rend durables les créations et renommages d'un dossier (POSIX)"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return  # Windows : les métadonnées suivent le fsync des fichiers
+    fd = os.open(dossier or '.', os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class EcrivainFactures(threading.Thread):
+    """Thread d'écriture des PDF rendus, alimenté par une file bornée"""
+
+    def __init__(self, taille_file=TAILLE_FILE, lot_fsync=LOT_FSYNC):
+        super().__init__(name='ecrivain-factures', daemon=True)
+        self.file = queue.Queue(maxsize=taille_file)
+        self.lot_fsync = lot_fsync
+        self.erreur = None
+        self.echecs = []   # [(chemin, exception d'apres_ecriture), ...]
+        self.ecrits = 0
+        self._en_attente = []
+
+    def deposer(self, chemin, contenu, apres_ecriture=None):
+        """Confie un PDF au thread d'écriture (bloque si la file est pleine)
+
+        Args:
+            chemin (str): Chemin final du fichier
+            contenu (bytes): PDF rendu
+            apres_ecriture (callable, optional): Appelé avec le chemin une
+                fois le fichier durable
+        """
+        self.file.put((chemin, contenu, apres_ecriture))
+
+    def fermer(self):
+        """Attend l'écriture des fichiers déposés ; relance l'erreur éventuelle"""
+        self.file.put(None)
+        self.join()
+        if self.erreur is not None:
+            raise self.erreur
+
+    def run(self):
+        while True:
+            element = self.file.get()
+            if element is None:
+                break
+            if self.erreur is not None:
+                continue  # Vide la file pour ne pas bloquer le rendu
+            try:
+                self._ecrire(*element)
+            except Exception as e:
+                self.erreur = e
+        if self.erreur is None:
+            try:
+                self._valider()
+            except Exception as e:
+                self.erreur = e
+
+    def _ecrire(self, chemin, contenu, apres_ecriture):
+        assurer_dossier(os.path.dirname(chemin) or '.')
+        temporaire = f"{chemin}.tmp"
+        fichier = open(temporaire, 'wb')
+        fichier.write(contenu)
+        self._en_attente.append((fichier, temporaire, chemin, apres_ecriture))
+        if len(self._en_attente) >= self.lot_fsync:
+            self._valider()
+
+    def _valider(self):
+        """Rend durables les fichiers en attente, puis les renomme"""
+        dossiers = set()
+        for fichier, temporaire, chemin, _ in self._en_attente:
+            fichier.flush()
+            os.fsync(fichier.fileno())
+            fichier.close()
+            os.replace(temporaire, chemin)
+            dossiers.add(os.path.dirname(chemin))
+        for dossier in dossiers:
+            _fsync_dossier(dossier)
+        for _, _, chemin, apres_ecriture in self._en_attente:
+            self.ecrits += 1
+            if apres_ecriture is None:
+                continue
+            # Un archivage en échec n'empêche pas celui des fichiers suivants
+            try:
+                apres_ecriture(chemin)
+            except Exception as e:
+                self.echecs.append((chemin, e))
+        self._en_attente.clear()
+
+
+def generer_lot(factures, processus=None, deterministe=False,
+                taille_file=TAILLE_FILE, lot_fsync=LOT_FSYNC, facturx=False,
+                certificat=None):
+    """Génère un lot de factures : rendu en parallèle, écriture en continu
+
+    Args:
+        factures (iterable): (donnees, articles) de chaque facture, voir
+            charger_lot
+        processus (int, optional): Nombre de processus de rendu
+        deterministe (bool, optional): Rendu reproductible
+        taille_file (int, optional): PDF rendus en attente d'écriture
+        lot_fsync (int, optional): Fichiers rendus durables ensemble
+        facturx (bool, optional): Joint à chaque PDF ses données Factur-X
+        certificat (str, optional): Certificat de signature des PDF
+
+    Returns:
+        list: Chemins des PDF générés, dans l'ordre des factures
+
+    Raises:
+        LotIncomplet: rendu ou archivage en échec pour certaines factures,
+            une fois toutes les autres générées et archivées
+    """
+    processus = processus or os.cpu_count() or 1
+    if certificat:
+        signataire(certificat)  # certificat invalide : refusé avant tout rendu
+    ecrivain = EcrivainFactures(taille_file, lot_fsync)
+    ecrivain.start()
+    chemins, echecs, numeros = [], [], {}
+    try:
+        with ProcessPoolExecutor(max_workers=processus) as pool:
+            # Rendus en cours limités : la file d'écriture pleine bloque
+            # deposer(), ce qui suspend les nouvelles soumissions
+            en_cours = deque()
+            limite = 2 * processus
+
+            def deposer_premier():
+                donnees, articles, futur = en_cours.popleft()
+                num_commande = donnees['num_commande']
+                try:
+                    pdf = futur.result()
+                except Exception as e:
+                    echecs.append((num_commande, f"rendu : {type(e).__name__}: {e}"))
+                    return
+                chemin = FactureMouvementAbsolu.chemin_pdf(num_commande)
+                ecrivain.deposer(chemin, pdf, partial(_archiver, donnees, articles))
+                chemins.append(chemin)
+                numeros[chemin] = num_commande
+
+            for donnees, articles in factures:
+                futur = pool.submit(_rendre, donnees, articles, deterministe, facturx, certificat)
+                en_cours.append((donnees, articles, futur))
+                if len(en_cours) >= limite:
+                    deposer_premier()
+            while en_cours:
+                deposer_premier()
+    except BaseException:
+        # Les PDF déposés sont tout de même écrits ; une erreur d'écriture ne
+        # masque pas celle qui interrompt le lot
+        with suppress(Exception):
+            ecrivain.fermer()
+        raise
+    ecrivain.fermer()
+    for chemin, e in ecrivain.echecs:
+        echecs.append((numeros[chemin], f"PDF écrit, non archivé : {type(e).__name__}: {e}"))
+    if echecs:
+        raise LotIncomplet(chemins, echecs)
+    return chemins
@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class Composant:
+    """Composant d'une montre (mouvement, cadran, boîtier...)"""
+    nom: str
+    reference: str
+    prix: float
+
+    @classmethod
+    def depuis_dict(cls, donnees):
+        """Construit un composant à partir de l'ancien format dictionnaire
+
+        Accepte indifféremment la clé 'reference' ou 'description'.
+        """
+        reference = donnees.get('reference', donnees.get('description', ''))
+        return cls(donnees['nom'], reference, float(donnees['prix']))
+
+
+@dataclass(frozen=True, slots=True)
+class Article:
+    """Montre facturée avec ses composants détaillés
+
+    Les composants sont stockés dans un tuple : l'article est immuable et ne
+    porte pas de dictionnaire d'attributs, ce qui réduit fortement l'empreinte
+    mémoire des traitements par lots.
+    """
+    modele: str
+    reference: str
+    composants: tuple
+    quantite: int = 1
+
+    def __post_init__(self):
+        # Normalisation des composants (liste de dicts ou de Composant)
+        composants = tuple(
+            c if isinstance(c, Composant) else Composant.depuis_dict(c)
+            for c in self.composants
+        )
+        object.__setattr__(self, 'composants', composants)
+        object.__setattr__(self, 'quantite', int(self.quantite))
+
+    @property
+    def prix_total(self):
+        """Prix unitaire de la montre (somme des composants)"""
+        return sum(c.prix for c in self.composants)
+
+    @property
+    def total_ligne(self):
+        """Montant HT de la ligne (prix unitaire × quantité)"""
+        return self.prix_total * self.quantite
+
+    @classmethod
+    def depuis_dict(cls, donnees):
+        """Construit un article à partir de l'ancien format dictionnaire"""
+        return cls(
+            donnees['modele'],
+            donnees['reference'],
+            donnees.get('composants', ()),
+            donnees.get('quantite', 1),
+        )
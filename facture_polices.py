@@ -0,0 +1,245 @@
+"""Chargement des polices DejaVu livrées avec le projet
+
+Les fichiers TTF sont résolus par rapport au dossier du module (et non au
+dossier courant), projetés en mémoire une seule fois par processus avec
+mmap : plusieurs processus de rendu partagent ainsi les mêmes pages
+physiques. Les métriques (largeurs, glyphes) ne sont analysées qu'à la
+première utilisation d'un glyphe, puis réutilisées par tous les documents,
+de même que les tables (cmap, hmtx, post) que le sous-ensemble de chaque
+document relirait sinon à l'export.
+"""
+import copy
+import mmap
+import os
+
+from fontTools import ttLib
+from fpdf.fonts import Glyph, TTFFont, SubsetMap
+from fpdf.enums import TextEmphasis
+
+REPERTOIRE_POLICES = os.path.dirname(os.path.abspath(__file__))
+
+# Style fpdf -> fichier de la famille DejaVu
+POLICES_DEJAVU = {
+    '': 'DejaVuSans.ttf',
+    'B': 'DejaVuSans-Bold.ttf',
+    'I': 'DejaVuSans-Oblique.ttf',
+    'BI': 'DejaVuSans-BoldOblique.ttf',
+}
+
+# Projections mémoire et métriques partagées par tous les documents
+_cartes = {}
+_metriques = {}
+
+# Tables décodées une fois par police et copiées dans le TTFont de chaque
+# document : le sous-ensemble de fontTools remplace leurs attributs sans
+# modifier les objets partagés
+TABLES_PARTAGEES = ('cmap', 'hmtx', 'post')
+
+
+def chemin_police(nom_fichier):
+    """Retourne le chemin absolu d'une police livrée avec le projet"""
+    chemin = os.path.join(REPERTOIRE_POLICES, nom_fichier)
+    if not os.path.exists(chemin):
+        raise FileNotFoundError(f"Police introuvable : {chemin}")
+    return chemin
+
+
+def carte_police(chemin):
+    """Projette un fichier de police en mémoire (une fois par processus)"""
+    carte = _cartes.get(chemin)
+    if carte is None:
+        with open(chemin, 'rb') as f:
+            carte = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _cartes[chemin] = carte
+    return carte
+
+
+class _LecteurCarte:
+    """Fichier en lecture seule sur une projection mémoire partagée
+
+    Chaque lecteur a sa propre position : plusieurs TTFont peuvent lire la
+    même projection sans se gêner. Seules les tables effectivement lues
+    sont copiées.
+    """
+
+    def __init__(self, chemin):
+        self.name = chemin
+        self._vue = memoryview(carte_police(chemin))
+        self._pos = 0
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self._pos
+        elif whence == 2:
+            pos += len(self._vue)
+        self._pos = pos
+        return pos
+
+    def tell(self):
+        return self._pos
+
+    def read(self, n=-1):
+        fin = len(self._vue) if n is None or n < 0 else self._pos + n
+        donnees = bytes(self._vue[self._pos:fin])
+        self._pos += len(donnees)
+        return donnees
+
+    def close(self):
+        # La projection reste ouverte pour les autres documents
+        self._vue = memoryview(b'')
+
+
+def _ouvrir_ttfont(chemin):
+    """TTFont paresseux lisant la projection mémoire de la police"""
+    return ttLib.TTFont(_LecteurCarte(chemin), recalcTimestamp=False,
+                        fontNumber=0, lazy=True)
+
+
+def _analyser(chemin):
+    """Calcule (une fois par processus) les métriques d'une police
+
+    Reprend le calcul de fpdf.fonts.TTFFont.__init__.
+    """
+    metriques = _metriques.get(chemin)
+    if metriques is not None:
+        return metriques
+
+    # Exécute le constructeur d'origine, sur la projection mémoire et pour
+    # un document factice, afin d'obtenir exactement les métriques de fpdf
+    faux_fpdf = type('FauxFPDF', (), {'fonts': {}, 'str_alias_nb_pages': ''})()
+    modele = TTFFont(faux_fpdf, _LecteurCarte(chemin), '', '')
+    metriques = {
+        'scale': modele.scale,
+        'desc': modele.desc,
+        'cw': modele.cw,
+        'cmap': modele.cmap,
+        'glyph_ids': modele.glyph_ids,
+        'name': modele.name,
+        'up': modele.up,
+        'ut': modele.ut,
+        # Nom de glyphe de chaque caractère, ordre des glyphes et tables
+        # décodées une fois, et non pour chaque document
+        'noms': dict(modele.ttfont.getBestCmap()),
+        'ordre': modele.ttfont.getGlyphOrder(),
+        'tables': {tag: modele.ttfont[tag] for tag in TABLES_PARTAGEES},
+    }
+    for sous_table in metriques['tables']['cmap'].tables:
+        sous_table.ensureDecompiled()
+    modele.close()
+    _metriques[chemin] = metriques
+    return metriques
+
+
+def _copier_table(table):
+    """Copie d'une table partagée pour le TTFont d'un document (les
+    sous-tables de cmap sont elles aussi modifiées par le sous-ensemble)"""
+    copie = copy.copy(table)
+    if table.tableTag == 'cmap':
+        copie.tables = [copy.copy(sous_table) for sous_table in table.tables]
+    return copie
+
+
+class _SousEnsemble(SubsetMap):
+    """SubsetMap lisant les noms de glyphes dans la cmap partagée
+
+    fpdf les demande au TTFont du document, dont la table cmap serait
+    décodée à nouveau pour chaque document.
+    """
+
+    def __init__(self, font, identities, noms):
+        self._noms = noms
+        super().__init__(font, identities)
+
+    def get_glyph(self, glyph=None, unicode=None, glyph_name=None, glyph_width=None):
+        if not glyph and isinstance(unicode, int) and unicode in self.font.glyph_ids:
+            return Glyph(self.font.glyph_ids[unicode], (unicode,), self._noms[unicode],
+                         self.font.cw[unicode])
+        return super().get_glyph(glyph, unicode, glyph_name, glyph_width)
+
+
+class PoliceParesseuse(TTFFont):
+    """TTFFont dont l'analyse est différée jusqu'au premier glyphe utilisé
+
+    Les métriques sont partagées entre documents ; seuls le TTFont (modifié
+    par le sous-ensemble lors de l'export) et la table de sous-ensemble
+    sont propres à chaque document.
+    """
+
+    _DIFFERES = frozenset(('desc', 'cw', 'cmap', 'glyph_ids', 'name', 'up',
+                           'ut', 'scale', 'subset', 'ttfont', 'missing_glyphs'))
+
+    def __init__(self, fpdf, font_file_path, fontkey, style):
+        self.i = len(fpdf.fonts) + 1
+        self.type = "TTF"
+        self.ttffile = font_file_path
+        self.fontkey = fontkey
+        self.emphasis = TextEmphasis.coerce(style)
+        self._alias_nb_pages = fpdf.str_alias_nb_pages
+
+    def __getattr__(self, nom):
+        # Appelé uniquement pour un attribut encore absent
+        if nom not in self._DIFFERES:
+            raise AttributeError(nom)
+        self._charger()
+        return object.__getattribute__(self, nom)
+
+    def _charger(self):
+        metriques = _analyser(self.ttffile)
+        self.ttfont = _ouvrir_ttfont(self.ttffile)
+        self.ttfont.setGlyphOrder(list(metriques['ordre']))
+        for tag, table in metriques['tables'].items():
+            self.ttfont[tag] = _copier_table(table)
+        self.scale = metriques['scale']
+        # Le descripteur est complété lors de l'export : copie par document
+        self.desc = copy.copy(metriques['desc'])
+        self.cw = metriques['cw']
+        self.cmap = metriques['cmap']
+        self.glyph_ids = metriques['glyph_ids']
+        self.name = metriques['name']
+        self.up = metriques['up']
+        self.ut = metriques['ut']
+        self.missing_glyphs = []
+
+        sbarr = "\x00 \r\n"
+        if self._alias_nb_pages:
+            sbarr += "0123456789"
+            sbarr += self._alias_nb_pages
+        self.subset = _SousEnsemble(self, [ord(char) for char in sbarr], metriques['noms'])
+
+
+def precharger_polices(polices=None):
+    """Analyse d'avance des polices (processus de rendu gardés chauds)
+
+    Args:
+        polices (iterable, optional): (style, chemin) ; défaut : DejaVu
+    """
+    if polices is None:
+        polices = ((style, chemin_police(nom)) for style, nom in POLICES_DEJAVU.items())
+    for _, chemin in polices:
+        _analyser(chemin)
+
+
+def oublier_polices(chemins):
+    """Libère les métriques et projections de polices qui ne servent plus
+    (les documents en cours gardent les leurs)"""
+    for chemin in chemins:
+        _metriques.pop(chemin, None)
+        _cartes.pop(chemin, None)
+
+
+def ajouter_polices(pdf, polices, famille='DejaVu'):
+    """Enregistre une famille de polices sur un document FPDF
+
+    Args:
+        polices (iterable): (style fpdf, chemin du fichier TTF)
+        famille (str, optional): Nom de famille utilisé par la mise en page
+    """
+    for style, chemin in polices:
+        fontkey = f"{famille.lower()}{style}"
+        pdf.fonts[fontkey] = PoliceParesseuse(pdf, chemin, fontkey, style)
+
+
+def ajouter_polices_dejavu(pdf, famille='DejaVu'):
+    """Enregistre la famille DejaVu sur un document FPDF"""
+    ajouter_polices(pdf, ((style, chemin_police(nom)) for style, nom in POLICES_DEJAVU.items()),
+                    famille)
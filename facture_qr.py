@@ -0,0 +1,366 @@
+"""QR codes de paiement EPC (virement SEPA), sans dépendance externe
+
+Le QR code EPC (EPC069-12, « QR code Girocode ») porte le bénéficiaire,
+l'IBAN, le montant et la référence d'un virement : l'application bancaire
+du client préremplit le virement en le scannant.
+
+L'encodeur couvre ce dont le format EPC a besoin : mode octet, correction
+d'erreur M, versions 1 à 40. Les motifs fixes d'une version (repères,
+alignements, cadencement), l'ordre de placement des modules et les
+masques sont calculés une fois par version ; un code ne coûte que le
+Reed-Solomon de ses données et l'évaluation des huit masques, sur des
+lignes représentées par des entiers. Les codes sont mémorisés : une même
+facture mise en page plusieurs fois (aperçu, réimpression, lot rejoué)
+ne réencode rien.
+"""
+import functools
+import re
+
+# Correction d'erreur M : codes de correction par bloc et nombre de blocs,
+# par version (index 0 inutilisé)
+ECC_PAR_BLOC = (None, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28,
+                26, 26, 26, 26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28,
+                28, 28, 28, 28, 28)
+BLOCS = (None, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16, 17, 17,
+         18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49)
+NIVEAU_M = 0  # bits du niveau de correction dans le format
+
+# Corps de Galois GF(256), polynôme 0x11D
+_EXP = [0] * 512
+_LOG = [0] * 256
+_valeur = 1
+for _i in range(255):
+    _EXP[_i] = _valeur
+    _LOG[_valeur] = _i
+    _valeur <<= 1
+    if _valeur & 0x100:
+        _valeur ^= 0x11D
+for _i in range(255, 512):
+    _EXP[_i] = _EXP[_i - 255]
+
+
+class Matrice:
+    """QR code : côté en modules et lignes (bit de poids fort à gauche)"""
+    __slots__ = ('cote', 'lignes')
+
+    def __init__(self, cote, lignes):
+        self.cote = cote
+        self.lignes = lignes
+
+    def sombre(self, x, y):
+        return bool(self.lignes[y] >> (self.cote - 1 - x) & 1)
+
+
+def _modules_donnees(version):
+    """Nombre de modules disponibles pour les données et la correction"""
+    nombre = (16 * version + 128) * version + 64
+    if version >= 2:
+        alignements = version // 7 + 2
+        nombre -= (25 * alignements - 10) * alignements - 55
+        if version >= 7:
+            nombre -= 36
+    return nombre
+
+
+def _capacite(version):
+    """Octets de données (hors correction) d'une version, niveau M"""
+    return _modules_donnees(version) // 8 - ECC_PAR_BLOC[version] * BLOCS[version]
+
+
+def _positions_alignement(version):
+    if version == 1:
+        return []
+    nombre = version // 7 + 2
+    pas = (version * 8 + nombre * 3 + 5) // (nombre * 4 - 4) * 2
+    cote = version * 4 + 17
+    return [6] + sorted(cote - 7 - i * pas for i in range(nombre - 1))
+
+
+@functools.lru_cache(maxsize=None)
+def _diviseur(degre):
+    """Polynôme générateur Reed-Solomon de degré donné"""
+    resultat = [0] * (degre - 1) + [1]
+    racine = 1
+    for _ in range(degre):
+        for j in range(degre):
+            resultat[j] = _EXP[_LOG[resultat[j]] + _LOG[racine]] if resultat[j] else 0
+            if j + 1 < degre:
+                resultat[j] ^= resultat[j + 1]
+        racine = _EXP[_LOG[racine] + 1]
+    return tuple(_LOG[c] if c else None for c in resultat)
+
+
+def _correction(donnees, diviseur):
+    """Codes de correction Reed-Solomon d'un bloc"""
+    reste = [0] * len(diviseur)
+    for octet in donnees:
+        facteur = octet ^ reste.pop(0)
+        reste.append(0)
+        if facteur:
+            log_facteur = _LOG[facteur]
+            for i, log_coef in enumerate(diviseur):
+                if log_coef is not None:
+                    reste[i] ^= _EXP[log_coef + log_facteur]
+    return reste
+
+
+@functools.lru_cache(maxsize=None)
+def _gabarit(version):
+    """Motifs fixes d'une version, calculés une fois
+
+    Returns:
+        tuple: (lignes des motifs, lignes des modules réservés, ordre de
+            placement des modules de données [(x, y), ...])
+    """
+    cote = version * 4 + 17
+    sombre = [[False] * cote for _ in range(cote)]
+    reserve = [[False] * cote for _ in range(cote)]
+
+    def poser(x, y, valeur):
+        sombre[y][x] = valeur
+        reserve[y][x] = True
+
+    for i in range(cote):
+        poser(6, i, i % 2 == 0)
+        poser(i, 6, i % 2 == 0)
+    # Repères de position et leurs séparateurs
+    for cx, cy in ((3, 3), (cote - 4, 3), (3, cote - 4)):
+        for dy in range(-4, 5):
+            for dx in range(-4, 5):
+                x, y = cx + dx, cy + dy
+                if 0 <= x < cote and 0 <= y < cote:
+                    poser(x, y, max(abs(dx), abs(dy)) not in (2, 4))
+    # Motifs d'alignement (sauf sous les repères)
+    positions = _positions_alignement(version)
+    dernier = len(positions) - 1
+    for i, cy in enumerate(positions):
+        for j, cx in enumerate(positions):
+            if (i, j) in ((0, 0), (0, dernier), (dernier, 0)):
+                continue
+            for dy in range(-2, 3):
+                for dx in range(-2, 3):
+                    poser(cx + dx, cy + dy, max(abs(dx), abs(dy)) != 1)
+    # Zones du format (écrites avec le masque) et module sombre
+    for i in range(9):
+        if i != 6:  # ligne et colonne de cadencement
+            poser(8, i, False)
+            poser(i, 8, False)
+    for i in range(8):
+        poser(cote - 1 - i, 8, False)
+        poser(8, cote - 1 - i, False)
+    poser(8, cote - 8, True)
+    # Information de version (7 et plus)
+    if version >= 7:
+        reste = version
+        for _ in range(12):
+            reste = (reste << 1) ^ ((reste >> 11) * 0x1F25)
+        bits = version << 12 | reste
+        for i in range(18):
+            bit = bool(bits >> i & 1)
+            a, b = cote - 11 + i % 3, i // 3
+            poser(a, b, bit)
+            poser(b, a, bit)
+
+    # Ordre de placement : colonnes de deux modules, en zigzag depuis la droite
+    ordre = []
+    droite = cote - 1
+    while droite >= 1:
+        if droite == 6:
+            droite = 5
+        montee = (droite + 1) & 2 == 0
+        for vertical in range(cote):
+            y = cote - 1 - vertical if montee else vertical
+            for x in (droite, droite - 1):
+                if not reserve[y][x]:
+                    ordre.append((x, y))
+        droite -= 2
+
+    def en_lignes(grille):
+        return tuple(int(''.join('1' if m else '0' for m in ligne), 2) for ligne in grille)
+
+    return en_lignes(sombre), en_lignes(reserve), tuple(ordre)
+
+
+_MASQUES = (
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _masques(version):
+    """Lignes de chaque masque, limitées aux modules de données"""
+    cote = version * 4 + 17
+    _, reserve, _ = _gabarit(version)
+    masques = []
+    for masque in _MASQUES:
+        lignes = []
+        for y in range(cote):
+            ligne = 0
+            for x in range(cote):
+                ligne = ligne << 1 | (masque(x, y) and not reserve[y] >> (cote - 1 - x) & 1)
+            lignes.append(ligne)
+        masques.append(tuple(lignes))
+    return tuple(masques)
+
+
+def _format(lignes, cote, masque):
+    """Écrit les deux copies de l'information de format"""
+    donnees = NIVEAU_M << 3 | masque
+    reste = donnees
+    for _ in range(10):
+        reste = (reste << 1) ^ ((reste >> 9) * 0x537)
+    bits = (donnees << 10 | reste) ^ 0x5412
+
+    def poser(x, y, i):
+        position = cote - 1 - x
+        if bits >> i & 1:
+            lignes[y] |= 1 << position
+        else:
+            lignes[y] &= ~(1 << position)
+
+    for i in range(6):
+        poser(8, i, i)
+    poser(8, 7, 6)
+    poser(8, 8, 7)
+    poser(7, 8, 8)
+    for i in range(9, 15):
+        poser(14 - i, 8, i)
+    for i in range(8):
+        poser(cote - 1 - i, 8, i)
+    for i in range(8, 15):
+        poser(8, cote - 15 + i, i)
+
+
+_SUITE = re.compile(r'0{5,}|1{5,}')
+_MOTIF = re.compile(r'(?=10111010000|00001011101)')
+
+
+def _penalite(lignes, cote):
+    """Pénalité d'un masque (règles de la norme ISO/IEC 18004)"""
+    texte = [format(ligne, f'0{cote}b') for ligne in lignes]
+    colonnes = [''.join(colonne) for colonne in zip(*texte)]
+    penalite = 0
+    for suite in (texte, colonnes):
+        for ligne in suite:
+            penalite += sum(len(s) - 2 for s in _SUITE.findall(ligne))
+            penalite += 40 * len(_MOTIF.findall(ligne))
+    plein = (1 << cote) - 1
+    for haut, bas in zip(lignes, lignes[1:]):
+        sombres = haut & bas & haut >> 1 & bas >> 1
+        clairs = ~haut & ~bas & ~haut >> 1 & ~bas >> 1 & plein >> 1
+        penalite += 3 * (bin(sombres).count('1') + bin(clairs).count('1'))
+    sombres = sum(bin(ligne).count('1') for ligne in lignes)
+    total = cote * cote
+    penalite += 10 * ((abs(sombres * 20 - total * 10) + total - 1) // total - 1)
+    return penalite
+
+
+@functools.lru_cache(maxsize=1024)
+def qr_code(texte):
+    """Encode un texte (UTF-8, mode octet, correction M)
+
+    Returns:
+        Matrice
+
+    Raises:
+        ValueError: texte trop long pour un QR code
+    """
+    donnees = texte.encode('utf-8')
+    for version in range(1, 41):
+        bits_longueur = 8 if version < 10 else 16
+        if 4 + bits_longueur + 8 * len(donnees) <= 8 * _capacite(version):
+            break
+    else:
+        raise ValueError(f"Texte trop long pour un QR code ({len(donnees)} octets)")
+    capacite = _capacite(version)
+
+    # Flux de bits : mode octet, longueur, données, terminateur, bourrage
+    bits = (0b0100 << bits_longueur | len(donnees)) << 8 * len(donnees) | int.from_bytes(donnees, 'big')
+    longueur = 4 + bits_longueur + 8 * len(donnees)
+    terminateur = min(4, 8 * capacite - longueur)
+    bits <<= terminateur
+    longueur += terminateur
+    bits <<= -longueur % 8
+    octets = list(bits.to_bytes((longueur + 7) // 8, 'big'))
+    octets += [0xEC, 0x11] * ((capacite - len(octets)) // 2) + [0xEC] * ((capacite - len(octets)) % 2)
+
+    # Blocs, correction d'erreur et entrelacement
+    nombre, ecc = BLOCS[version], ECC_PAR_BLOC[version]
+    total = _modules_donnees(version) // 8
+    courts = nombre - total % nombre
+    longueur_courte = total // nombre
+    diviseur = _diviseur(ecc)
+    blocs, debut = [], 0
+    for i in range(nombre):
+        fin = debut + longueur_courte - ecc + (0 if i < courts else 1)
+        bloc = octets[debut:fin]
+        debut = fin
+        correction = _correction(bloc, diviseur)
+        if i < courts:
+            bloc.append(0)
+        blocs.append(bloc + correction)
+    flux = [bloc[i] for i in range(len(blocs[0])) for j, bloc in enumerate(blocs)
+            if i != longueur_courte - ecc or j >= courts]
+
+    # Placement des données sur le gabarit de la version
+    motifs, _, ordre = _gabarit(version)
+    cote = version * 4 + 17
+    lignes = list(motifs)
+    for rang, (x, y) in enumerate(ordre[:8 * len(flux)]):
+        if flux[rang >> 3] >> (7 - (rang & 7)) & 1:
+            lignes[y] |= 1 << (cote - 1 - x)
+
+    # Masque de moindre pénalité
+    meilleur = None
+    for masque, lignes_masque in enumerate(_masques(version)):
+        candidat = [ligne ^ m for ligne, m in zip(lignes, lignes_masque)]
+        _format(candidat, cote, masque)
+        penalite = _penalite(candidat, cote)
+        if meilleur is None or penalite < meilleur[0]:
+            meilleur = (penalite, candidat)
+    return Matrice(cote, tuple(meilleur[1]))
+
+
+@functools.lru_cache(maxsize=1024)
+def trace_qr(texte):
+    """Tracé PDF d'un QR code en unités de module, origine en haut à gauche
+    (un rectangle par suite de modules sombres d'une ligne)
+
+    Returns:
+        tuple: (côté en modules, opérateurs 're' suivis de 'f')
+    """
+    matrice = qr_code(texte)
+    rectangles = []
+    for y, ligne in enumerate(matrice.lignes):
+        for suite in re.finditer('1+', format(ligne, f'0{matrice.cote}b')):
+            rectangles.append(f"{suite.start()} {y} {len(suite.group())} 1 re")
+    return matrice.cote, ' '.join(rectangles) + ' f'
+
+
+def iban_valide(iban):
+    """Contrôle la clé d'un IBAN (sans espaces, en majuscules)"""
+    if not re.fullmatch(r'[A-Z]{2}[0-9]{2}[A-Z0-9]{11,30}', iban):
+        return False
+    chiffres = ''.join(str(int(c, 36)) for c in iban[4:] + iban[:4])
+    return int(chiffres) % 97 == 1
+
+
+def charge_epc(titulaire, iban, montant, reference='', bic=''):
+    """Texte d'un QR code EPC (virement SEPA, version 002, UTF-8)
+
+    Args:
+        titulaire (str): Bénéficiaire (70 caractères au plus)
+        iban (str): IBAN du bénéficiaire
+        montant (str): Montant en euros, '1234.56'
+        reference (str, optional): Texte de remise (140 caractères au plus)
+        bic (str, optional): Facultatif dans l'espace SEPA
+    """
+    return '\n'.join(('BCD', '002', '1', 'SCT', bic, titulaire[:70], iban,
+                      f"EUR{montant}", '', '', reference[:140]))
@@ -0,0 +1,244 @@
+"""Rapprochement des virements reçus avec les factures ouvertes
+
+Le relevé bancaire (export CSV) est lu ligne à ligne. Chaque crédit est
+imputé :
+- aux factures ouvertes dont le numéro figure dans le libellé
+  ('SM-202601-0012', 'SM2026010012', 'F1 202601 0012'...), quel que soit
+  le préfixe de la série ou de l'atelier, dans l'ordre, chacune jusqu'à son solde : un
+  virement groupé règle plusieurs factures, un acompte en règle une
+  partiellement ;
+- sinon, à la facture ouverte dont le reste dû est exactement le montant
+  reçu ; si plusieurs factures ont ce montant, le nom du client dans le
+  libellé les départage, sinon le virement reste à rapprocher à la main.
+Le trop-perçu d'un virement qui solde les factures de son libellé est
+imputé de la même façon à une facture ouverte de ce montant ; ce qui
+reste alors non imputé est signalé dans le bilan.
+
+Les factures ouvertes sont chargées une fois dans deux dictionnaires (par
+numéro, par reste dû) tenus à jour au fil des imputations : chaque ligne
+du relevé coûte quelques accès, quel que soit le nombre de factures.
+Relire un relevé déjà traité ne règle rien deux fois.
+"""
+import csv
+import hashlib
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field, replace
+
+from facture_catalogue import normaliser
+from facture_comptes import CHEMIN_COMPTES, Comptes, centimes, date_iso
+
+# Préfixe de série (1 à 8 caractères, cf. facture_identite), AAAAMM, NNNN ;
+# un numéro écrit sans séparateur est découpé en partant de sa fin
+MOTIF_NUMERO = re.compile(r'([A-Z0-9]{1,8}?)[\s._-]*(\d{6})[\s._-]*(\d{4})(?!\d)', re.IGNORECASE)
+
+# En-têtes reconnus (sans accents ni casse) pour chaque colonne
+COLONNES = {
+    'date': ('date operation', 'date', 'date valeur'),
+    'libelle': ('libelle', 'libelle operation', 'label', 'intitule', 'description'),
+    'montant': ('montant', 'montant eur', 'amount'),
+    'credit': ('credit', 'credit eur'),
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Operation:
+    """Crédit lu dans un relevé bancaire"""
+    date: str
+    libelle: str
+    montant: int  # centimes
+    empreinte: str
+
+
+@dataclass(slots=True)
+class Bilan:
+    """Résultat d'un rapprochement"""
+    lues: int = 0
+    deja_traitees: int = 0
+    rapprochees: int = 0
+    factures_soldees: int = 0
+    non_rapprochees: list = field(default_factory=list)
+    excedents: list = field(default_factory=list)  # (Operation, centimes non imputés)
+
+
+def _colonnes(entete):
+    """Index des colonnes date, libellé, montant/crédit d'une ligne d'en-tête"""
+    noms = [' '.join(re.findall(r'\w+', normaliser(nom))) for nom in entete]
+    index = {}
+    for colonne, variantes in COLONNES.items():
+        for variante in variantes:
+            if variante in noms:
+                index[colonne] = noms.index(variante)
+                break
+    if 'date' in index and 'libelle' in index and ('montant' in index or 'credit' in index):
+        return index
+    return None
+
+
+def lire_releve(chemin):
+    """Crédits d'un relevé CSV, lus au fil du fichier
+
+    Le séparateur est détecté ; les lignes précédant l'en-tête (titre,
+    numéro de compte) sont ignorées, ainsi que les débits.
+
+    Yields:
+        Operation
+    """
+    vues = Counter()
+    with open(chemin, encoding='utf-8-sig', newline='') as f:
+        dialecte = csv.Sniffer().sniff(f.read(4096), delimiters=',;\t')
+        f.seek(0)
+        lignes = csv.reader(f, dialecte)
+        index = None
+        for ligne in lignes:
+            index = _colonnes(ligne)
+            if index is not None:
+                break
+        if index is None:
+            raise ValueError(f"{chemin} : en-tête date/libellé/montant introuvable")
+        colonne_montant = index.get('credit', index.get('montant'))
+        for ligne in lignes:
+            if len(ligne) <= max(index.values()):
+                continue
+            brut = ligne[colonne_montant].strip()
+            if not brut:
+                continue
+            montant = centimes(brut)
+            if montant <= 0:
+                continue
+            date, libelle = ligne[index['date']].strip(), ' '.join(ligne[index['libelle']].split())
+            # Deux virements identiques le même jour restent distincts
+            signature = f"{date_iso(date)}|{montant}|{libelle}"
+            vues[signature] += 1
+            empreinte = hashlib.sha1(f"{signature}|{vues[signature]}".encode('utf-8')).hexdigest()
+            yield Operation(date, libelle, montant, empreinte)
+
+
+def numeros_libelle(libelle, connus=None):
+    """Numéros de facture cités dans un libellé, au format PREFIXE-AAAAMM-NNNN
+
+    Args:
+        libelle (str): Libellé de l'opération
+        connus (container, optional): Numéros recherchés ; un préfixe collé
+            à un autre mot ('REFSM2026010012') est alors réduit au plus long
+            préfixe connu
+
+    Returns:
+        list: Numéros, dans l'ordre du libellé et sans doublon
+    """
+    numeros = []
+    for prefixe, mois, numero in MOTIF_NUMERO.findall(libelle):
+        prefixe = prefixe.upper()
+        candidats = [f"{prefixe[debut:]}-{mois}-{numero}" for debut in range(len(prefixe))]
+        if connus is not None:
+            candidats = [num for num in candidats if num in connus][:1]
+        for num_commande in candidats[:1]:
+            if num_commande not in numeros:
+                numeros.append(num_commande)
+    return numeros
+
+
+class Rapprochement:
+    """Index des factures ouvertes pour imputer des virements"""
+
+    def __init__(self, factures_ouvertes):
+        """
+        Args:
+            factures_ouvertes (iterable): (num_commande, client, ttc, reste)
+        """
+        self.reste = {}                      # num_commande -> reste dû
+        self.client = {}                     # num_commande -> nom normalisé
+        self.par_montant = defaultdict(set)  # reste dû -> {num_commande}
+        for num_commande, client, _, reste in factures_ouvertes:
+            self.reste[num_commande] = reste
+            self.client[num_commande] = normaliser(client)
+            self.par_montant[reste].add(num_commande)
+
+    def _imputer(self, num_commande, montant):
+        reste = self.reste[num_commande]
+        self.par_montant[reste].discard(num_commande)
+        reste -= montant
+        if reste > 0:
+            self.reste[num_commande] = reste
+            self.par_montant[reste].add(num_commande)
+        else:
+            del self.reste[num_commande]
+
+    def _par_montant(self, operation):
+        candidats = self.par_montant.get(operation.montant)
+        if not candidats:
+            return None
+        if len(candidats) == 1:
+            return next(iter(candidats))
+        libelle = normaliser(operation.libelle)
+        retenus = [num for num in candidats if self.client[num] and self.client[num] in libelle]
+        return retenus[0] if len(retenus) == 1 else None
+
+    def imputations(self, operation):
+        """Répartit un crédit entre les factures qu'il règle
+
+        Returns:
+            list: (num_commande, centimes) ; vide si rien ne correspond
+        """
+        numeros = numeros_libelle(operation.libelle, self.reste)
+        if not numeros:
+            trouve = self._par_montant(operation)
+            numeros = [trouve] if trouve else []
+        imputations = []
+        disponible = operation.montant
+        for num_commande in numeros:
+            if disponible <= 0:
+                break
+            part = min(disponible, self.reste[num_commande])
+            self._imputer(num_commande, part)
+            imputations.append((num_commande, part))
+            disponible -= part
+        if imputations and disponible > 0:
+            # Trop-perçu : une autre facture ouverte de ce montant exact
+            trouve = self._par_montant(replace(operation, montant=disponible))
+            if trouve:
+                self._imputer(trouve, disponible)
+                imputations.append((trouve, disponible))
+        return imputations
+
+    def soldee(self, num_commande):
+        """True si la facture n'a plus de reste dû"""
+        return num_commande not in self.reste
+
+
+def rapprocher(releves, chemin=CHEMIN_COMPTES):
+    """Rapproche un ou plusieurs relevés CSV et enregistre les règlements
+
+    Args:
+        releves (list): Chemins des relevés, dans l'ordre chronologique
+        chemin (str, optional): Base des comptes clients
+
+    Returns:
+        Bilan
+    """
+    comptes = Comptes(chemin)
+    bilan = Bilan()
+    try:
+        with comptes.transaction():
+            index = Rapprochement(comptes.factures_ouvertes())
+            for releve in releves:
+                for operation in lire_releve(releve):
+                    bilan.lues += 1
+                    if comptes.operation_connue(operation.empreinte):
+                        bilan.deja_traitees += 1
+                        continue
+                    imputations = index.imputations(operation)
+                    comptes.enregistrer_operation(operation.empreinte, operation.date,
+                                                  operation.montant, operation.libelle,
+                                                  imputations)
+                    if imputations:
+                        bilan.rapprochees += 1
+                        bilan.factures_soldees += sum(index.soldee(num) for num, _ in imputations)
+                        excedent = operation.montant - sum(part for _, part in imputations)
+                        if excedent:
+                            bilan.excedents.append((operation, excedent))
+                    else:
+                        bilan.non_rapprochees.append(operation)
+    finally:
+        comptes.fermer()
+    return bilan
@@ -0,0 +1,191 @@
+"""Recherche plein texte dans les factures émises
+
+Chaque facture générée est indexée à partir de ses données structurées
+(client, modèles, références, composants), sans relire le PDF. La base
+SQLite FTS5 renvoie les numéros de commande correspondant à une recherche,
+classés par pertinence (BM25, les références et composants pesant plus que
+l'adresse), page par page.
+
+Le classement par pertinence évalue chaque facture trouvée : pour un terme
+présent dans des milliers de factures ('cadran'), il coûterait autant que
+l'archive entière sans rien apprendre. Au-delà de SEUIL_PERTINENCE
+résultats, les factures sont donc données de la plus récente à la plus
+ancienne, dans l'ordre de l'index, et seule la page demandée est lue.
+
+Syntaxe : les mots sont cherchés ensemble, chacun en début de mot ;
+une référence à tirets ou plusieurs mots entre guillemets sont cherchés
+comme une suite exacte ('CC-2024-01', '"valjoux 7750"').
+"""
+import os
+import re
+import sqlite3
+from dataclasses import dataclass
+
+from facture_comptes import date_iso
+from facture_seiko import assurer_dossier
+
+CHEMIN_INDEX = os.path.join('factures', 'recherche.sqlite')
+PAR_PAGE = 20
+# Au-delà, les résultats sont classés du plus récent au plus ancien
+SEUIL_PERTINENCE = 1_000
+
+# Colonnes indexées et leur poids dans le classement
+COLONNES = ('client', 'adresse', 'modeles', 'refs', 'composants')
+POIDS = (4.0, 1.0, 3.0, 5.0, 3.0)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS factures (
+    id INTEGER PRIMARY KEY,
+    num_commande TEXT NOT NULL UNIQUE,
+    date TEXT NOT NULL,
+    client TEXT NOT NULL,
+    total_ttc REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS factures_fts USING fts5 (
+    {', '.join(COLONNES)}, tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class Correspondance:
+    """Facture trouvée par une recherche"""
+    num_commande: str
+    date: str
+    client: str
+    total_ttc: float
+    extrait: str
+
+
+@dataclass(frozen=True, slots=True)
+class Resultats:
+    """Page de résultats d'une recherche"""
+    total: int
+    page: int
+    par_page: int
+    factures: list
+
+    @property
+    def pages(self):
+        return max(1, -(-self.total // self.par_page))
+
+
+def requete_fts(texte):
+    """Traduit une recherche saisie en requête FTS5
+
+    Chaque terme est un préfixe ; un terme de plusieurs mots (référence à
+    tirets, texte entre guillemets) est une suite de mots consécutifs.
+    """
+    termes = []
+    for groupe, mot in re.findall(r'"([^"]*)"|(\S+)', texte):
+        mots = re.findall(r'\w+', groupe or mot)
+        if mots:
+            termes.append(f'"{" ".join(mots)}"*')
+    return ' AND '.join(termes)
+
+
+class IndexFactures:
+    """Index plein texte des factures émises"""
+
+    def __init__(self, chemin=CHEMIN_INDEX):
+        assurer_dossier(os.path.dirname(chemin) or '.')
+        self._cnx = sqlite3.connect(chemin, timeout=30)
+        self._cnx.executescript(SCHEMA)
+
+    def fermer(self):
+        self._cnx.close()
+
+    def __len__(self):
+        return self._cnx.execute("SELECT COUNT(*) FROM factures").fetchone()[0]
+
+    def indexer(self, facture):
+        """Indexe une facture ; une facture régénérée remplace la précédente"""
+        with self._cnx:
+            self._indexer(facture)
+
+    def indexer_lot(self, factures):
+        """Indexe plusieurs factures en une seule transaction"""
+        with self._cnx:
+            for facture in factures:
+                self._indexer(facture)
+
+    def _indexer(self, facture):
+        donnees = facture.donnees
+        num_commande = donnees.get('num_commande')
+        if not num_commande:
+            return
+        articles = facture.articles
+        total_ht = sum(article.total_ligne for article in articles)
+        textes = (
+            donnees.get('client_nom', ''),
+            ' '.join(donnees.get(cle, '') for cle in ('client_adresse', 'client_cp', 'client_ville')),
+            ' '.join(article.modele for article in articles),
+            ' '.join([article.reference for article in articles]
+                     + [c.reference for article in articles for c in article.composants]),
+            ' '.join(f"{c.nom} {c.reference}" for article in articles for c in article.composants),
+        )
+        ligne = self._cnx.execute(
+            "SELECT id FROM factures WHERE num_commande = ?", (num_commande,)
+        ).fetchone()
+        if ligne is not None:
+            self._cnx.execute("DELETE FROM factures_fts WHERE rowid = ?", ligne)
+            self._cnx.execute("DELETE FROM factures WHERE id = ?", ligne)
+        curseur = self._cnx.execute(
+            "INSERT INTO factures (num_commande, date, client, total_ttc) VALUES (?, ?, ?, ?)",
+            (num_commande, date_iso(donnees.get('date_facture')),
+             donnees.get('client_nom', ''), round(total_ht * (1 + facture.tva), 2)),
+        )
+        self._cnx.execute(
+            f"INSERT INTO factures_fts (rowid, {', '.join(COLONNES)}) "
+            f"VALUES (?{', ?' * len(COLONNES)})",
+            (curseur.lastrowid,) + textes,
+        )
+
+    def rechercher(self, texte, page=1, par_page=PAR_PAGE):
+        """Factures correspondant à une recherche, les plus pertinentes d'abord
+
+        Args:
+            texte (str): Mots recherchés (voir requete_fts)
+            page (int, optional): Numéro de page, à partir de 1
+            par_page (int, optional): Factures par page
+
+        Returns:
+            Resultats: Nombre total de factures trouvées et page demandée
+                (les plus récentes d'abord au-delà de SEUIL_PERTINENCE)
+        """
+        requete = requete_fts(texte)
+        if not requete:
+            return Resultats(0, page, par_page, [])
+        total = self._cnx.execute(
+            "SELECT COUNT(*) FROM factures_fts WHERE factures_fts MATCH ?", (requete,)
+        ).fetchone()[0]
+        if total <= SEUIL_PERTINENCE:
+            ordre = f"bm25(factures_fts, {', '.join(str(p) for p in POIDS)}), f.date DESC"
+        else:
+            ordre = "factures_fts.rowid DESC"
+        lignes = self._cnx.execute(
+            "SELECT f.num_commande, f.date, f.client, f.total_ttc, "
+            "snippet(factures_fts, -1, '[', ']', '…', 8) "
+            "FROM factures_fts JOIN factures f ON f.id = factures_fts.rowid "
+            f"WHERE factures_fts MATCH ? ORDER BY {ordre} LIMIT ? OFFSET ?",
+            (requete, par_page, (page - 1) * par_page),
+        )
+        return Resultats(total, page, par_page, [Correspondance(*ligne) for ligne in lignes])
+
+
+def indexer_facture(facture, chemin=CHEMIN_INDEX):
+    """Ajoute une facture générée à l'index de recherche"""
+    index = IndexFactures(chemin)
+    try:
+        index.indexer(facture)
+    finally:
+        index.fermer()
+
+
+def rechercher_factures(texte, page=1, par_page=PAR_PAGE, chemin=CHEMIN_INDEX):
+    """Recherche dans les factures émises (voir IndexFactures.rechercher)"""
+    index = IndexFactures(chemin)
+    try:
+        return index.rechercher(texte, page, par_page)
+    finally:
+        index.fermer()
@@ -0,0 +1,416 @@
+"""Registre en colonnes des lignes de facture pour les rapports agrégés
+
+Chaque appel à FactureMouvementAbsolu.generer_facture ajoute ses lignes au
+journal CSV, et aux mêmes lignes en colonnes binaires (`array.tofile`,
+chaînes encodées par dictionnaire) dans le dossier registre.colonnes.
+Un rapport relit les colonnes avec `array.fromfile`, sans analyser le CSV.
+Le CSV reste la référence : des colonnes absentes ou en retard sur lui
+sont reconstruites, ou complétées par ses dernières lignes.
+
+Une facture régénérée sous le même numéro est journalisée à nouveau : au
+chargement, ses nouvelles lignes remplacent les anciennes. NumPy est
+utilisé s'il est installé, sinon une boucle Python sur les colonnes prend
+le relais.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+from array import array
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:  # NumPy est optionnel
+    np = None
+
+CHEMIN_REGISTRE = os.path.join('factures', 'registre.csv')
+
+ENTETE = ('date', 'num_commande', 'client', 'modele', 'quantite',
+          'nb_composants', 'ht', 'tva')
+
+COLONNES = ('mois', 'client', 'modele', 'quantite', 'nb_composants', 'ht', 'tva')
+# Colonnes des factures : empreinte du numéro et première ligne
+FACTURES = ('blocs', 'debuts')
+
+# Axes d'agrégation disponibles
+AXES = ('mois', 'client', 'modele')
+
+
+def _mois(date_facture):
+    """Convertit 'JJ/MM/AAAA' en entier AAAAMM (0 si la date est absente)"""
+    if not date_facture:
+        return 0
+    return int(date_facture[6:10]) * 100 + int(date_facture[3:5])
+
+
+def _empreinte(num_commande):
+    """Entier non nul sur 64 bits identifiant un numéro (0 : facture sans numéro)"""
+    if not num_commande:
+        return 0
+    condensat = hashlib.blake2b(num_commande.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(condensat, 'little', signed=True) or 1
+
+
+def _dossier_colonnes(chemin):
+    """Dossier des colonnes binaires d'un journal ('registre.csv' -> 'registre.colonnes')"""
+    return os.path.splitext(chemin)[0] + '.colonnes'
+
+
+def _lire_etat(dossier):
+    """État des colonnes : octets du CSV couverts, nombres de lignes et de
+    factures, libellés des clients et modèles ; None s'il est illisible"""
+    try:
+        with open(os.path.join(dossier, 'etat.json'), encoding='utf-8') as f:
+            etat = json.load(f)
+    except (OSError, ValueError):
+        return None
+    cles = ('taille', 'lignes', 'factures', 'client', 'modele')
+    if not isinstance(etat, dict) or etat.get('version') != 1 or any(c not in etat for c in cles):
+        return None
+    return etat
+
+
+def _ecrire_etat(dossier, etat):
+    temporaire = os.path.join(dossier, f"etat.json.{os.getpid()}.tmp")
+    with open(temporaire, 'w', encoding='utf-8') as f:
+        json.dump(dict(etat, version=1), f, ensure_ascii=False)
+    os.replace(temporaire, os.path.join(dossier, 'etat.json'))
+
+
+def _somme_par(codes, valeurs, n):
+    """Somme des valeurs regroupées par code (0 <= code < n)"""
+    if np is not None:
+        if not isinstance(codes, np.ndarray):
+            codes = np.frombuffer(codes, dtype=np.int32)
+        poids = np.frombuffer(valeurs, dtype=np.float64 if valeurs.typecode == 'd' else np.int32)
+        return np.bincount(codes, weights=poids, minlength=n).tolist()
+    sommes = [0] * n
+    for code, valeur in zip(codes, valeurs):
+        sommes[code] += valeur
+    return sommes
+
+
+def journaliser(facture, chemin=CHEMIN_REGISTRE, signe=1):
+    """Ajoute les lignes d'une facture au journal CSV et à ses colonnes
+
+    L'ajout se fait sous le verrou du journal : l'en-tête n'est écrit
+    qu'une fois, et les lignes de processus qui archivent en même temps ne
+    s'entremêlent pas.
+
+    Args:
+        signe (int, optional): -1 pour un avoir : ses lignes sont déduites
+            des quantités et des totaux
+    """
+    from facture_seiko import verrou_fichier  # facture_seiko importe ce module
+
+    donnees = facture.donnees
+    lignes = []
+    for article in facture.articles:
+        ht = signe * article.total_ligne
+        lignes.append((
+            donnees.get('date_facture', ''),
+            donnees.get('num_commande', ''),
+            donnees.get('client_nom', ''),
+            article.modele,
+            signe * article.quantite,
+            len(article.composants),
+            f"{ht:.2f}",
+            f"{ht * facture.tva:.2f}",
+        ))
+    os.makedirs(os.path.dirname(chemin) or '.', exist_ok=True)
+    with verrou_fichier(chemin):
+        taille = os.path.getsize(chemin) if os.path.exists(chemin) else 0
+        tampon = io.StringIO()
+        writer = csv.writer(tampon)
+        if not taille:
+            writer.writerow(ENTETE)
+        writer.writerows(lignes)
+        contenu = tampon.getvalue().encode('utf-8')
+        with open(chemin, 'ab') as f:
+            f.write(contenu)
+        _prolonger_colonnes(chemin, taille, taille + len(contenu),
+                            donnees.get('num_commande', ''), lignes)
+
+
+def _prolonger_colonnes(chemin, avant, apres, num_commande, lignes):
+    """Ajoute aux colonnes les lignes écrites dans le CSV entre avant et apres
+
+    Des colonnes en retard sur le CSV (ou absentes) ne sont pas touchées :
+    le prochain chargement les complète depuis le CSV.
+    """
+    dossier = _dossier_colonnes(chemin)
+    if avant:
+        etat = _lire_etat(dossier)
+        if etat is None or etat['taille'] != avant:
+            return
+    else:
+        os.makedirs(dossier, exist_ok=True)
+        etat = {'taille': 0, 'lignes': 0, 'factures': 0, 'client': [], 'modele': []}
+    ajout = Registre()
+    ajout._adopter_libelles(etat['client'], etat['modele'])
+    ajout.blocs.append(_empreinte(num_commande))
+    ajout.debuts.append(etat['lignes'])
+    for date, _num, client, modele, qte, nb, ht, tva in lignes:
+        ajout.ajouter(date, client, modele, qte, nb, ht, tva)
+    try:
+        for noms, existants in ((COLONNES, etat['lignes']), (FACTURES, etat['factures'])):
+            for nom in noms:
+                valeurs = getattr(ajout, nom)
+                fichier = os.path.join(dossier, f"{nom}.bin")
+                with open(fichier, 'r+b' if existants else 'wb') as f:
+                    # Une écriture interrompue a pu laisser des octets en trop
+                    f.truncate(existants * valeurs.itemsize)
+                    f.seek(0, os.SEEK_END)
+                    valeurs.tofile(f)
+    except OSError:
+        # Colonne manquante : elles seront reconstruites depuis le CSV
+        try:
+            os.remove(os.path.join(dossier, 'etat.json'))
+        except OSError:
+            pass
+        return
+    _ecrire_etat(dossier, {
+        'taille': apres,
+        'lignes': etat['lignes'] + len(ajout),
+        'factures': etat['factures'] + 1,
+        'client': ajout._libelles['client'],
+        'modele': ajout._libelles['modele'],
+    })
+
+
+class Registre:
+    """Lignes de facture stockées en colonnes"""
+
+    def __init__(self):
+        self.mois = array('i')
+        self.client = array('i')
+        self.modele = array('i')
+        self.quantite = array('i')
+        self.nb_composants = array('i')
+        self.ht = array('d')
+        self.tva = array('d')
+        # Une entrée par facture écrite : empreinte du numéro, première ligne
+        self.blocs = array('q')
+        self.debuts = array('i')
+        # Dictionnaires d'encodage : libellé -> code, et code -> libellé
+        self._codes = {'client': {}, 'modele': {}}
+        self._libelles = {'client': [], 'modele': []}
+
+    def __len__(self):
+        return len(self.ht)
+
+    def _adopter_libelles(self, clients, modeles):
+        self._libelles = {'client': list(clients), 'modele': list(modeles)}
+        self._codes = {axe: {libelle: code for code, libelle in enumerate(libelles)}
+                       for axe, libelles in self._libelles.items()}
+
+    def _ouvrir_facture(self, num_commande):
+        """Les lignes ajoutées ensuite appartiennent à cette facture"""
+        self.blocs.append(_empreinte(num_commande))
+        self.debuts.append(len(self))
+
+    def _encoder(self, axe, libelle):
+        codes = self._codes[axe]
+        code = codes.get(libelle)
+        if code is None:
+            code = codes[libelle] = len(codes)
+            self._libelles[axe].append(libelle)
+        return code
+
+    def ajouter(self, date_facture, client, modele, quantite, nb_composants, ht, tva):
+        """Ajoute une ligne au registre"""
+        self.mois.append(_mois(date_facture))
+        self.client.append(self._encoder('client', client))
+        self.modele.append(self._encoder('modele', modele))
+        self.quantite.append(int(quantite))
+        self.nb_composants.append(int(nb_composants))
+        self.ht.append(float(ht))
+        self.tva.append(float(tva))
+
+    def ajouter_facture(self, facture):
+        """Ajoute toutes les lignes d'une facture au registre"""
+        self._ouvrir_facture(facture.donnees.get('num_commande', ''))
+        for article in facture.articles:
+            ht = article.total_ligne
+            self.ajouter(
+                facture.donnees.get('date_facture', ''),
+                facture.donnees.get('client_nom', ''),
+                article.modele,
+                article.quantite,
+                len(article.composants),
+                ht,
+                ht * facture.tva,
+            )
+
+    def _retirer(self, plages):
+        """Retire des lignes (plages [début, fin[) et les libellés devenus inutiles
+
+        Le registre obtenu n'est plus découpé en factures : il n'est pas
+        enregistré en colonnes.
+        """
+        plages = sorted(plages)
+        for colonne in COLONNES:
+            valeurs = getattr(self, colonne)
+            gardees = array(valeurs.typecode)
+            suite = 0
+            for debut, fin in plages:
+                gardees.extend(valeurs[suite:debut])
+                suite = fin
+            gardees.extend(valeurs[suite:])
+            setattr(self, colonne, gardees)
+        self.blocs, self.debuts = array('q'), array('i')
+        for axe in self._codes:
+            utilises = set(getattr(self, axe))
+            if len(utilises) == len(self._libelles[axe]):
+                continue
+            utilises = sorted(utilises)
+            recodage = {ancien: code for code, ancien in enumerate(utilises)}
+            setattr(self, axe, array('i', (recodage[c] for c in getattr(self, axe))))
+            self._libelles[axe] = [self._libelles[axe][c] for c in utilises]
+            self._codes[axe] = {libelle: code for code, libelle in enumerate(self._libelles[axe])}
+
+    def _remplacees(self):
+        """Plages de lignes des écritures remplacées par une écriture plus récente
+        du même numéro"""
+        numerotees = len(self.blocs) - self.blocs.count(0)
+        if len(set(self.blocs) - {0}) == numerotees:
+            return []
+        doublons = {cle for cle, nombre in Counter(self.blocs).items() if cle and nombre > 1}
+        dernieres = {}
+        remplacees = []
+        for i, cle in enumerate(self.blocs):
+            if cle in doublons:
+                fin = self.debuts[i + 1] if i + 1 < len(self.debuts) else len(self)
+                if cle in dernieres:
+                    remplacees.append(dernieres[cle])
+                dernieres[cle] = (self.debuts[i], fin)
+        return remplacees
+
+    def _lire_csv(self, f, entete):
+        """Ajoute les lignes d'un morceau du journal CSV
+
+        Les lignes d'une facture sont contiguës : un changement de numéro
+        ouvre une nouvelle facture.
+        """
+        reader = csv.reader(f)
+        if entete:
+            next(reader, None)
+        precedent = None
+        for date, num, client, modele, qte, nb, ht, tva in reader:
+            if num != precedent:
+                precedent = num
+                self._ouvrir_facture(num)
+            self.ajouter(date, client, modele, qte, nb, ht, tva)
+
+    def _charger_colonnes(self, dossier, etat):
+        """Lit les colonnes binaires ; False si l'une manque ou est trop courte"""
+        try:
+            for noms, nombre in ((COLONNES, etat['lignes']), (FACTURES, etat['factures'])):
+                for nom in noms:
+                    with open(os.path.join(dossier, f"{nom}.bin"), 'rb') as f:
+                        getattr(self, nom).fromfile(f, nombre)
+        except (OSError, EOFError):
+            return False
+        self._adopter_libelles(etat['client'], etat['modele'])
+        return True
+
+    def _enregistrer_colonnes(self, dossier, taille):
+        """Réécrit toutes les colonnes, pour un CSV de taille octets"""
+        os.makedirs(dossier, exist_ok=True)
+        for nom in COLONNES + FACTURES:
+            temporaire = os.path.join(dossier, f"{nom}.bin.{os.getpid()}.tmp")
+            with open(temporaire, 'wb') as f:
+                getattr(self, nom).tofile(f)
+            os.replace(temporaire, os.path.join(dossier, f"{nom}.bin"))
+        _ecrire_etat(dossier, {
+            'taille': taille,
+            'lignes': len(self),
+            'factures': len(self.blocs),
+            'client': self._libelles['client'],
+            'modele': self._libelles['modele'],
+        })
+
+    @classmethod
+    def charger(cls, chemin=CHEMIN_REGISTRE):
+        """Charge le registre depuis ses colonnes binaires
+
+        Les colonnes absentes ou illisibles sont reconstruites depuis le CSV ;
+        des colonnes en retard sont complétées par les dernières lignes du
+        CSV. Si un numéro de facture réapparaît (facture régénérée), seule
+        sa dernière écriture compte.
+        """
+        from facture_seiko import verrou_fichier  # facture_seiko importe ce module
+
+        registre = cls()
+        if not os.path.exists(chemin):
+            return registre
+        dossier = _dossier_colonnes(chemin)
+        etat = _lire_etat(dossier)
+        debut = 0
+        if etat is not None and etat['taille'] <= os.path.getsize(chemin):
+            if registre._charger_colonnes(dossier, etat):
+                debut = etat['taille']
+            else:
+                registre = cls()
+        if debut < os.path.getsize(chemin):
+            # Sous le verrou : aucune ligne n'est en cours d'écriture
+            with verrou_fichier(chemin):
+                with open(chemin, 'rb') as f:
+                    f.seek(debut)
+                    contenu = f.read()
+                registre._lire_csv(io.StringIO(contenu.decode('utf-8'), newline=''),
+                                   entete=not debut)
+                registre._enregistrer_colonnes(dossier, debut + len(contenu))
+        remplacees = registre._remplacees()
+        if remplacees:
+            registre._retirer(remplacees)
+        return registre
+
+    def _cles(self, axe):
+        """Retourne (codes par ligne, libellés par code) pour un axe"""
+        if axe == 'mois':
+            if np is not None:
+                mois, codes = np.unique(np.frombuffer(self.mois, dtype=np.int32),
+                                        return_inverse=True)
+                return codes, [f"{m // 100}-{m % 100:02d}" for m in mois.tolist()]
+            libelles = sorted(set(self.mois))
+            index = {m: i for i, m in enumerate(libelles)}
+            codes = array('i', (index[m] for m in self.mois))
+            return codes, [f"{m // 100}-{m % 100:02d}" for m in libelles]
+        if axe not in self._codes:
+            raise ValueError(f"Axe inconnu : {axe} (attendu : {', '.join(AXES)})")
+        return getattr(self, axe), self._libelles[axe]
+
+    def totaux_par(self, axe):
+        """Somme HT, TVA et TTC par mois, client ou modèle
+
+        Returns:
+            dict: libellé -> (total HT, TVA, TTC)
+        """
+        codes, libelles = self._cles(axe)
+        n = len(libelles)
+        ht = _somme_par(codes, self.ht, n)
+        tva = _somme_par(codes, self.tva, n)
+        return {libelles[i]: (ht[i], tva[i], ht[i] + tva[i]) for i in range(n)}
+
+    def top_modeles(self, n=10):
+        """Modèles les plus vendus : liste de (modèle, quantité, total HT)"""
+        libelles = self._libelles['modele']
+        quantites = _somme_par(self.modele, self.quantite, len(libelles))
+        ht = _somme_par(self.modele, self.ht, len(libelles))
+        classement = sorted(range(len(libelles)), key=lambda i: -quantites[i])[:n]
+        return [(libelles[i], int(quantites[i]), ht[i]) for i in classement]
+
+    def cout_moyen_composant(self):
+        """Coût moyen HT d'un composant sur l'ensemble des lignes"""
+        if np is not None:
+            nb = np.frombuffer(self.nb_composants, dtype=np.int32)
+            qte = np.frombuffer(self.quantite, dtype=np.int32)
+            total_composants = int(np.dot(nb.astype(np.int64), qte))
+            total_ht = float(np.frombuffer(self.ht).sum())
+        else:
+            total_composants = sum(n * q for n, q in zip(self.nb_composants, self.quantite))
+            total_ht = sum(self.ht)
+        return total_ht / total_composants if total_composants else 0.0
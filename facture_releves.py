@@ -0,0 +1,252 @@
+"""Relevés de compte mensuels par client
+
+Un relevé liste les factures, avoirs et règlements d'un client sur un mois,
+entre son solde d'ouverture et son solde de fin de mois. Il est destiné aux
+clients qui reçoivent de nombreuses factures et règlent sur relevé.
+
+Les relevés de tous les clients d'un mois sont produits en une passe : les
+soldes d'ouverture sont lus dans les cumuls mensuels tenus à jour par les
+comptes clients (voir facture_comptes), et les écritures du mois par une
+lecture d'intervalle de dates. L'historique des factures n'est pas relu.
+
+Un relevé porte l'identité de l'atelier qui a émis la dernière facture du
+client (l'installation si elle n'a pas d'atelier).
+
+Le nom du PDF reprend le nom du client sans accents, casse ni ponctuation ;
+si d'autres clients ('DUPONT', 'Dupont & Fils' pour 'Dupont', 'Dupont
+Fils') donnent le même nom, une empreinte du nom exact le complète.
+"""
+import calendar
+import hashlib
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import groupby
+
+from facture_catalogue import normaliser
+from facture_clients import CHEMIN_ANNUAIRE, Annuaire
+from facture_comptes import CHEMIN_COMPTES, Comptes
+from facture_identite import identite_courante
+from facture_seiko import PDF, Colonne, assurer_dossier
+
+DOSSIER_RELEVES = os.path.join('factures', 'releves')
+
+MOIS = ('janvier', 'février', 'mars', 'avril', 'mai', 'juin', 'juillet',
+        'août', 'septembre', 'octobre', 'novembre', 'décembre')
+
+# Tableau des écritures : (titre, x, largeur, alignement)
+COLONNES = (
+    ('DATE', 15, 22, 'L'),
+    ('PIÈCE', 37, 32, 'L'),
+    ('LIBELLÉ', 69, 54, 'L'),
+    ('DÉBIT', 123, 24, 'R'),
+    ('CRÉDIT', 147, 24, 'R'),
+    ('SOLDE', 171, 24, 'R'),
+)
+HAUTEUR_LIGNE = 6
+BAS_DE_PAGE = 262  # au-delà, le tableau continue sur une nouvelle page
+
+
+def _date(date_iso):
+    """'AAAA-MM-JJ' -> 'JJ/MM/AAAA'"""
+    return f"{date_iso[8:10]}/{date_iso[5:7]}/{date_iso[0:4]}" if len(date_iso) == 10 else date_iso
+
+
+def _montant(centimes):
+    """Centimes -> '1 234,56' (vide si nul)"""
+    if not centimes:
+        return ''
+    return f"{centimes / 100:,.2f}".replace(',', ' ').replace('.', ',')
+
+
+def _libelle(genre, facture):
+    if genre == 'facture':
+        return 'Facture'
+    if genre == 'avoir':
+        return f"Avoir sur {facture}"
+    return f"Règlement {facture}"
+
+
+def _cle_fichier(client):
+    """Nom du client réduit pour un nom de fichier"""
+    return re.sub(r'[^a-z0-9]+', '-', normaliser(client)).strip('-') or 'client'
+
+
+@dataclass(frozen=True, slots=True)
+class Releve:
+    """Relevé de compte d'un client pour un mois (montants en centimes)"""
+    client: str
+    mois: str            # AAAA-MM
+    ouverture: int       # solde dû au premier jour du mois
+    ecritures: tuple     # (date AAAA-MM-JJ, genre, pièce, facture, montant)
+    coordonnees: object = None  # facture_clients.Client, si connu
+    atelier: str = ''           # atelier émetteur ('' : l'installation)
+    homonymes: bool = False     # autre client réduit au même nom de fichier
+
+    @property
+    def dernier_jour(self):
+        annee, mois = map(int, self.mois.split('-'))
+        return datetime(annee, mois, calendar.monthrange(annee, mois)[1], tzinfo=timezone.utc)
+
+    @property
+    def solde(self):
+        """Solde dû en fin de mois (négatif : en faveur du client)"""
+        return self.ouverture + sum(montant if genre == 'facture' else -montant
+                                    for _, genre, _, _, montant in self.ecritures)
+
+    @property
+    def nom_fichier(self):
+        cle = _cle_fichier(self.client)
+        if self.homonymes:
+            cle += '-' + hashlib.sha256(self.client.encode('utf-8')).hexdigest()[:8]
+        return os.path.join(DOSSIER_RELEVES, f"releve_{self.mois}_{cle}.pdf")
+
+    def rendre_pdf(self):
+        """Met en page le relevé et retourne le PDF en mémoire
+
+        Le document ne dépend que du relevé (date de création : dernier
+        jour du mois) : le même relevé donne les mêmes octets.
+        """
+        pdf = PDF(date_creation=self.dernier_jour,
+                  identite=identite_courante(self.atelier or None))
+        pdf.set_auto_page_break(False, margin=0)
+        y = self._entete(pdf)
+        metriques = pdf.preparer_colonnes(
+            Colonne(x, 0, largeur, HAUTEUR_LIGNE, alignement, '', 8)
+            for _, x, largeur, alignement in COLONNES
+        )
+        y = self._entete_tableau(pdf, y)
+        debut = f"01/{self.mois[5:7]}/{self.mois[0:4]}"
+        y = self._ligne(pdf, metriques, y, ('', '', f"Solde au {debut}", '', '',
+                                             _montant(self.ouverture) or '0,00'), 0)
+        solde, debit, credit = self.ouverture, 0, 0
+        for rang, (date, genre, piece, facture, montant) in enumerate(self.ecritures, 1):
+            if y + HAUTEUR_LIGNE > BAS_DE_PAGE:
+                pdf.add_page()
+                y = self._entete_tableau(pdf, 35)
+            if genre == 'facture':
+                solde += montant
+                debit += montant
+                mouvement = (_montant(montant), '')
+            else:
+                solde -= montant
+                credit += montant
+                mouvement = ('', _montant(montant))
+            y = self._ligne(pdf, metriques, y, (_date(date), piece, _libelle(genre, facture),
+                                                *mouvement, _montant(solde) or '0,00'), rang)
+        if y + 20 > BAS_DE_PAGE:
+            pdf.add_page()
+            y = 35
+        self._totaux(pdf, y + 4, debit, credit, solde)
+        return bytes(pdf.output())
+
+    def generer(self):
+        """Écrit le PDF du relevé et retourne son chemin"""
+        assurer_dossier(DOSSIER_RELEVES)
+        nom_fichier = self.nom_fichier
+        with open(nom_fichier, 'wb') as f:
+            f.write(self.rendre_pdf())
+        return nom_fichier
+
+    def _entete(self, pdf):
+        couleurs = pdf.identite.couleurs
+        annee, mois = map(int, self.mois.split('-'))
+        pdf.set_xy(15, 35)
+        pdf.set_font('DejaVu', 'B', 18)
+        pdf.set_text_color(*couleurs.principale)
+        pdf.cell(0, 10, 'RELEVÉ DE COMPTE', 0, 1, 'L')
+        pdf.set_font('DejaVu', '', 9)
+        pdf.set_text_color(*couleurs.secondaire)
+        pdf.set_x(15)
+        pdf.cell(0, 5, f"Période : {MOIS[mois - 1]} {annee}", 0, 1, 'L')
+
+        pdf.set_draw_color(*couleurs.separateur)
+        pdf.set_fill_color(*couleurs.claire)
+        pdf.rect(115, 35, 80, 22, 'DF')
+        pdf.set_xy(120, 38)
+        pdf.set_font('DejaVu', 'B', 9)
+        pdf.set_text_color(*couleurs.texte)
+        pdf.cell(0, 5, self.client, 0, 1, 'L')
+        if self.coordonnees is not None:
+            pdf.set_font('DejaVu', '', 8)
+            for ligne in (self.coordonnees.adresse,
+                          f"{self.coordonnees.cp} {self.coordonnees.ville}".strip()):
+                pdf.set_x(120)
+                pdf.cell(0, 4, ligne, 0, 1, 'L')
+        return 75
+
+    def _entete_tableau(self, pdf, y):
+        couleurs = pdf.identite.couleurs
+        pdf.set_fill_color(*couleurs.principale)
+        pdf.rect(15, y, 180, 8, 'F')
+        pdf.set_font('DejaVu', 'B', 8)
+        pdf.set_text_color(*couleurs.fond)
+        for titre, x, largeur, alignement in COLONNES:
+            pdf.set_xy(x, y + 1)
+            pdf.cell(largeur, 6, titre, 0, 0, alignement)
+        return y + 8
+
+    def _ligne(self, pdf, metriques, y, textes, rang):
+        couleurs = pdf.identite.couleurs
+        fond = couleurs.claire if rang % 2 else couleurs.fond
+        pdf.ligne_tableau(15, y, 180, HAUTEUR_LIGNE, zip(metriques, textes), fond,
+                          couleurs.separateur)
+        return y + HAUTEUR_LIGNE
+
+    def _totaux(self, pdf, y, debit, credit, solde):
+        couleurs = pdf.identite.couleurs
+        fin = self.dernier_jour.strftime('%d/%m/%Y')
+        pdf.set_font('DejaVu', '', 9)
+        pdf.set_text_color(*couleurs.texte)
+        pdf.set_xy(69, y)
+        pdf.cell(54, 6, 'Mouvements du mois', 0, 0, 'L')
+        pdf.cell(24, 6, _montant(debit), 0, 0, 'R')
+        pdf.cell(24, 6, _montant(credit), 0, 1, 'R')
+        pdf.set_font('DejaVu', 'B', 10)
+        pdf.set_text_color(*couleurs.principale)
+        pdf.set_xy(69, y + 7)
+        mention = 'reste dû' if solde > 0 else 'en votre faveur' if solde < 0 else 'soldé'
+        pdf.cell(78, 7, f"Solde au {fin} ({mention})", 0, 0, 'L')
+        pdf.cell(48, 7, f"{_montant(abs(solde)) or '0,00'} €", 0, 1, 'R')
+
+
+def releves_du_mois(mois, client=None, chemin=CHEMIN_COMPTES, chemin_annuaire=CHEMIN_ANNUAIRE):
+    """Relevés d'un mois : tous les clients ayant un solde ou des mouvements
+
+    Args:
+        mois (str): AAAA-MM
+        client (str, optional): Un seul client
+
+    Returns:
+        list: Releve, par ordre de client
+    """
+    comptes = Comptes(chemin)
+    try:
+        soldes = comptes.soldes_mensuels(mois, client)
+        ecritures = {nom: tuple(ligne[1:] for ligne in lignes)
+                     for nom, lignes in groupby(comptes.ecritures(mois, client),
+                                                key=lambda ligne: ligne[0])}
+        ateliers = comptes.ateliers(mois, client)
+        # Sur tous les clients, et non ceux du mois : un client garde le même
+        # nom de fichier d'un mois et d'une commande à l'autre
+        cles = Counter(_cle_fichier(nom) for nom in comptes.clients())
+    finally:
+        comptes.fermer()
+    annuaire = Annuaire(chemin_annuaire)
+    try:
+        return [Releve(nom, mois, ouverture, ecritures.get(nom, ()), annuaire.coordonnees(nom),
+                       ateliers.get(nom, ''), homonymes=cles[_cle_fichier(nom)] > 1)
+                for nom, ouverture, _ in soldes]
+    finally:
+        annuaire.fermer()
+
+
+def generer_releves(mois, client=None, chemin=CHEMIN_COMPTES):
+    """Écrit les relevés d'un mois
+
+    Returns:
+        list: Chemins des PDF
+    """
+    return [releve.generer() for releve in releves_du_mois(mois, client, chemin)]
@@ -0,0 +1,356 @@
+"""Validation des commandes avant tout rendu
+
+Une commande mal formée (client_nom absent, prix non numérique, quantité
+nulle) échouait au milieu de la mise en page, après l'attribution de son
+numéro, voire après celle des commandes précédentes du lot. Les commandes
+sont désormais contrôlées en amont, toutes ensemble : un lot qui contient
+une commande invalide est refusé en entier, avec toutes les erreurs de
+chaque commande, sans qu'aucun numéro soit consommé ni aucun PDF produit.
+
+Les schémas sont déclaratifs, dans un sous-ensemble de JSON Schema (type,
+required, properties, items, minItems, minLength, minimum,
+exclusiveMinimum, pattern, enum, format), plus deux types propres :
+'decimal' (nombre, ou texte qui en est un) et 'entier' (entier, ou texte
+qui en est un), acceptés comme par Article.depuis_dict. Chaque schéma est
+compilé une fois par processus en fonctions imbriquées : valider une
+commande ne relit pas le schéma et ne construit les chemins des champs
+(articles[2].composants[0].prix) qu'en cas d'erreur.
+"""
+import functools
+import json
+import math
+import re
+from datetime import datetime
+
+from facture_identite import identite_courante
+from facture_seiko import CONDITIONS_PAIEMENT
+
+
+def _decimal(valeur):
+    if isinstance(valeur, str):
+        try:
+            valeur = float(valeur)
+        except ValueError:
+            return False
+    elif type(valeur) not in (int, float):
+        return False
+    return math.isfinite(valeur)
+
+
+def _entier(valeur):
+    if isinstance(valeur, str):
+        return re.fullmatch(r'\s*[+-]?\d+\s*', valeur) is not None
+    return type(valeur) is int
+
+
+# Type -> (classe, ou fonction de test, et libellé de l'erreur)
+TYPES = {
+    'object': (dict, "objet"),
+    'array': (list, "liste"),
+    'string': (str, "texte"),
+    'null': (type(None), "null"),
+    'integer': (lambda v: type(v) is int, "entier"),
+    'number': (lambda v: type(v) in (int, float), "nombre"),
+    'decimal': (_decimal, "nombre"),
+    'entier': (_entier, "entier"),
+}
+
+
+@functools.lru_cache(maxsize=1024)
+def _date(valeur):
+    """Date JJ/MM/AAAA existante"""
+    try:
+        datetime.strptime(valeur, '%d/%m/%Y')
+    except ValueError:
+        return "date JJ/MM/AAAA attendue"
+    return None
+
+
+def _atelier(valeur):
+    """Atelier dont l'identité se charge (voir facture_identite)"""
+    try:
+        identite_courante(valeur)
+    except (OSError, ValueError) as erreur:
+        return str(erreur)
+    return None
+
+
+# Formats de texte : nom -> fonction retournant le message d'erreur ou None
+FORMATS = {'date': _date, 'atelier': _atelier}
+
+SCHEMA_COMPOSANT = {
+    'type': 'object',
+    'required': ['nom', 'prix'],
+    'properties': {
+        'nom': {'type': 'string', 'minLength': 1},
+        'reference': {'type': 'string'},
+        'description': {'type': 'string'},
+        'prix': {'type': 'decimal'},
+    },
+}
+
+SCHEMA_ARTICLE = {
+    'type': 'object',
+    'required': ['modele', 'reference'],
+    'properties': {
+        'modele': {'type': 'string', 'minLength': 1},
+        'reference': {'type': 'string'},
+        'quantite': {'type': 'entier', 'minimum': 1},
+        'composants': {'type': 'array', 'items': SCHEMA_COMPOSANT},
+    },
+}
+
+_TEXTE_FACULTATIF = {'type': ['string', 'null']}
+_DATE = {'type': 'string', 'format': 'date'}
+_NUMERO = {'type': 'string', 'pattern': r'[A-Za-z0-9_-]+'}
+_CLIENT = {
+    'client_nom': {'type': 'string', 'minLength': 1},
+    'client_adresse': _TEXTE_FACULTATIF,
+    'client_cp': _TEXTE_FACULTATIF,
+    'client_ville': _TEXTE_FACULTATIF,
+    'client_complement': _TEXTE_FACULTATIF,
+    'client_pays': {'type': 'string', 'pattern': r'[A-Z]{2}'},
+}
+
+# Facture ou devis (lot, file de travaux, dossier surveillé)
+SCHEMA_COMMANDE = {
+    'type': 'object',
+    'required': ['client_nom', 'articles'],
+    'properties': {
+        **_CLIENT,
+        'num_commande': _NUMERO,
+        'date_facture': _DATE,
+        'date_echeance': _DATE,
+        'date_validite': _DATE,
+        'conditions_paiement': {'enum': list(CONDITIONS_PAIEMENT)},
+        'atelier': {'type': 'string', 'format': 'atelier'},
+        'articles': {'type': 'array', 'minItems': 1, 'items': SCHEMA_ARTICLE},
+    },
+}
+
+# Avoir : articles repris ou montant HT (voir facture_avoirs) ; le client
+# est repris de la facture s'il est omis
+SCHEMA_AVOIR = {
+    'type': 'object',
+    'required': ['num_facture'],
+    'properties': {
+        **_CLIENT,
+        'num_facture': _NUMERO,
+        'num_commande': _NUMERO,
+        'date_facture': _DATE,
+        'atelier': {'type': 'string', 'format': 'atelier'},
+        'montant_ht': {'type': 'decimal', 'exclusiveMinimum': 0},
+        'motif': {'type': 'string'},
+        'articles': {'type': 'array', 'items': SCHEMA_ARTICLE},
+    },
+}
+
+
+class CommandesInvalides(ValueError):
+    """Lot refusé ; erreurs : [(repère de la commande, [messages]), ...]"""
+
+    def __init__(self, erreurs):
+        self.erreurs = erreurs
+        super().__init__(
+            f"{len(erreurs)} commande(s) invalide(s), aucune n'a été traitée :\n"
+            + '\n'.join(f"  {repere} : {' ; '.join(messages)}" for repere, messages in erreurs)
+        )
+
+
+def _chemin(chemin):
+    """Texte d'un chemin chaîné (parent, clé) : articles[2].prix"""
+    parties = []
+    while chemin is not None:
+        chemin, cle = chemin
+        parties.append(f"[{cle}]" if isinstance(cle, int) else f".{cle}")
+    return ''.join(reversed(parties)).lstrip('.')
+
+
+def _compiler(schema):
+    """Fonction (valeur, chemin, erreurs) qui contrôle une valeur"""
+    controles = []
+
+    if 'enum' in schema:
+        valeurs = tuple(schema['enum'])
+        message = f"valeur inconnue (attendu : {', '.join(map(str, valeurs))})"
+
+        def enum(valeur, chemin, erreurs):
+            if valeur not in valeurs:
+                erreurs.append((chemin, message))
+        controles.append(enum)
+
+    if 'properties' in schema or 'required' in schema:
+        requis = tuple(schema.get('required', ()))
+        proprietes = {cle: _compiler(sous_schema)
+                      for cle, sous_schema in schema.get('properties', {}).items()}
+
+        def objet(valeur, chemin, erreurs):
+            if not isinstance(valeur, dict):
+                return
+            for cle in requis:
+                if cle not in valeur:
+                    erreurs.append(((chemin, cle), "champ obligatoire manquant"))
+            # Seuls les champs présents sont parcourus
+            for cle, sous_valeur in valeur.items():
+                controle = proprietes.get(cle)
+                if controle is not None:
+                    controle(sous_valeur, (chemin, cle), erreurs)
+        controles.append(objet)
+
+    if 'items' in schema or 'minItems' in schema:
+        minimum = schema.get('minItems', 0)
+        element = _compiler(schema['items']) if 'items' in schema else None
+
+        def liste(valeur, chemin, erreurs):
+            if not isinstance(valeur, list):
+                return
+            if len(valeur) < minimum:
+                erreurs.append((chemin, f"au moins {minimum} élément(s) attendu(s)"))
+            if element is not None:
+                for rang, sous_valeur in enumerate(valeur):
+                    element(sous_valeur, (chemin, rang), erreurs)
+        controles.append(liste)
+
+    if 'minLength' in schema or 'pattern' in schema or 'format' in schema:
+        longueur = schema.get('minLength', 0)
+        motif = re.compile(schema['pattern']) if 'pattern' in schema else None
+        forme = FORMATS[schema['format']] if 'format' in schema else None
+
+        def texte(valeur, chemin, erreurs):
+            if not isinstance(valeur, str):
+                return
+            if len(valeur.strip()) < longueur:
+                erreurs.append((chemin, "texte vide"))
+            elif motif is not None and not motif.fullmatch(valeur):
+                erreurs.append((chemin, f"format invalide ({valeur!r})"))
+            elif forme is not None:
+                message = forme(valeur)
+                if message:
+                    erreurs.append((chemin, message))
+        controles.append(texte)
+
+    if 'minimum' in schema or 'exclusiveMinimum' in schema:
+        if 'minimum' in schema:
+            borne, strict, message = schema['minimum'], False, f">= {schema['minimum']} attendu"
+        else:
+            borne, strict, message = (schema['exclusiveMinimum'], True,
+                                      f"> {schema['exclusiveMinimum']} attendu")
+
+        def nombre(valeur, chemin, erreurs):
+            if isinstance(valeur, bool) or not _decimal(valeur):
+                return
+            valeur = float(valeur)
+            if valeur < borne or (strict and valeur == borne):
+                erreurs.append((chemin, message))
+        controles.append(nombre)
+
+    if len(controles) == 1:
+        suite = controles[0]
+    elif controles:
+        def suite(valeur, chemin, erreurs):
+            for controle in controles:
+                controle(valeur, chemin, erreurs)
+    else:
+        suite = None
+
+    genres = schema.get('type')
+    if genres is None:
+        return suite or (lambda valeur, chemin, erreurs: None)
+    genres = [genres] if isinstance(genres, str) else genres
+    attendu = ' ou '.join(TYPES[genre][1] for genre in genres) + " attendu"
+    classes = tuple(TYPES[genre][0] for genre in genres if isinstance(TYPES[genre][0], type))
+    tests = tuple(TYPES[genre][0] for genre in genres if not isinstance(TYPES[genre][0], type))
+
+    # Cas courants spécialisés : un seul isinstance, sans appel intermédiaire
+    if not tests and suite is None:
+        def controler(valeur, chemin, erreurs):
+            if not isinstance(valeur, classes):
+                erreurs.append((chemin, attendu))
+    elif not tests:
+        def controler(valeur, chemin, erreurs):
+            if not isinstance(valeur, classes):
+                erreurs.append((chemin, attendu))
+            else:
+                suite(valeur, chemin, erreurs)
+    else:
+        if not classes and len(tests) == 1:
+            bon_type = tests[0]
+        else:
+            def bon_type(valeur):
+                return isinstance(valeur, classes) or any(test(valeur) for test in tests)
+
+        def controler(valeur, chemin, erreurs):
+            if not bon_type(valeur):
+                erreurs.append((chemin, attendu))
+            elif suite is not None:
+                suite(valeur, chemin, erreurs)
+    return controler
+
+
+def compiler(schema):
+    """Compile un schéma en fonction de validation
+
+    Returns:
+        callable: valider(valeur) -> liste des messages d'erreur (vide si
+            la valeur est valide), chacun précédé du chemin du champ
+    """
+    controle = _compiler(schema)
+
+    def valider(valeur):
+        erreurs = []
+        controle(valeur, None, erreurs)
+        return [f"{_chemin(chemin)} : {message}" if chemin else message
+                for chemin, message in erreurs]
+    return valider
+
+
+# Compilés une fois, à l'import
+valider_commande = compiler(SCHEMA_COMMANDE)
+valider_avoir = compiler(SCHEMA_AVOIR)
+
+
+def verifier_commande(commande, repere, valider=valider_commande):
+    """Contrôle une commande isolée (fichier déposé dans un dossier surveillé)
+
+    Raises:
+        CommandesInvalides: commande invalide
+    """
+    messages = valider(commande)
+    if messages:
+        raise CommandesInvalides([(repere, messages)])
+    return commande
+
+
+def lire_commandes(chemin, valider=valider_commande):
+    """Lit un fichier JSON Lines et contrôle toutes ses commandes avant d'en
+    traiter une seule
+
+    Args:
+        chemin (str): Une commande par ligne
+        valider (callable, optional): valider_commande ou valider_avoir
+
+    Returns:
+        list: Commandes (dictionnaires), dans l'ordre du fichier
+
+    Raises:
+        CommandesInvalides: au moins une ligne illisible ou invalide ; les
+            erreurs de toutes les lignes sont rapportées
+    """
+    commandes, erreurs = [], []
+    with open(chemin, encoding='utf-8') as f:
+        for numero, ligne in enumerate(f, 1):
+            if not ligne.strip():
+                continue
+            try:
+                commande = json.loads(ligne)
+            except ValueError as erreur:
+                erreurs.append((f"ligne {numero}", [f"JSON invalide : {erreur}"]))
+                continue
+            messages = valider(commande)
+            if messages:
+                erreurs.append((f"ligne {numero}", messages))
+            else:
+                commandes.append(commande)
+    if erreurs:
+        raise CommandesInvalides(erreurs)
+    return commandes
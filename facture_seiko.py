@@ -1,10 +1,26 @@
 from fpdf import FPDF, XPos, YPos
-from datetime import datetime
+from fpdf.fpdf import ImageInfo
+from fpdf.image_parsing import get_img_info
+from fpdf.util import escape_parens
+from collections import namedtuple
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import argparse
+import functools
 import os
 import platform
 import math
+import re
 from dateutil.relativedelta import relativedelta
 from colorama import init, Fore, Style
+from facture_facturx import ProducteurAssocie, joindre_facturx
+from facture_flux import ProducteurFlux, SortieFlux
+from facture_identite import identite_courante
+from facture_modeles import Article, Composant
+from facture_polices import ajouter_polices
+from facture_qr import charge_epc, trace_qr
+from facture_registre import AXES, CHEMIN_REGISTRE, Registre, journaliser
 
 # Initialisation de colorama
 init()
@@ -118,17 +134,90 @@ def print_item(description, value, indent=0):
     print(f"{indent_str}{Color.GRAY}•{Color.RESET} {Color.BOLD}{description}:{Color.RESET} {value}")
 
 
-def get_next_order_number():
-    """Génère un numéro de commande au format SM-AAAANN-NNNN"""
-    COUNTER_FILE = 'last_order_number.txt'
-    current_date = datetime.now()
+@contextmanager
+def verrou_fichier(chemin):
+    """Verrou exclusif entre processus, posé sur un fichier annexe (.lock)"""
+    with open(f"{chemin}.lock", 'a+b') as verrou:
+        if platform.system() == 'Windows':
+            import msvcrt
+            verrou.seek(0)
+            msvcrt.locking(verrou.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                verrou.seek(0)
+                msvcrt.locking(verrou.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(verrou, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(verrou, fcntl.LOCK_UN)
+
+
+def get_next_order_number(horloge=datetime.now, atelier=None, jeton=None):
+    """Génère un numéro de commande au format SM-AAAANN-NNNN
+
+    Le compteur est protégé par un verrou : plusieurs processus (lots,
+    file de travaux) ne reçoivent jamais le même numéro.
+
+    Args:
+        horloge (callable, optional): Fonction retournant la date courante
+        atelier (str, optional): Atelier émetteur, qui peut avoir sa propre
+            série (voir facture_identite)
+        jeton (str, optional): Identifiant du demandeur ; redemandé avant
+            toute autre attribution, le même numéro est rendu (demandeur
+            interrompu avant d'avoir enregistré son numéro)
+    """
+    return _numero_suivant(identite_courante(atelier).numerotation.factures, horloge, jeton)
+
+
+def get_next_quote_number(horloge=datetime.now, atelier=None):
+    """Génère un numéro de devis au format DV-AAAAMM-NNNN
+
+    Série distincte de celle des factures : un devis refusé ne laisse pas
+    de trou dans la numérotation des factures.
+
+    Args:
+        horloge (callable, optional): Fonction retournant la date courante
+        atelier (str, optional): Atelier émetteur
+    """
+    return _numero_suivant(identite_courante(atelier).numerotation.devis, horloge)
+
+
+def get_next_credit_note_number(horloge=datetime.now, atelier=None):
+    """Génère un numéro d'avoir au format AV-AAAAMM-NNNN (série propre aux avoirs)
+
+    Args:
+        horloge (callable, optional): Fonction retournant la date courante
+        atelier (str, optional): Atelier émetteur
+    """
+    return _numero_suivant(identite_courante(atelier).numerotation.avoirs, horloge)
+
+
+def _numero_suivant(serie, horloge, jeton=None):
+    """Numéro suivant d'une série (facture_identite.Serie), sous verrou"""
+    with verrou_fichier(serie.compteur):
+        return _incrementer_compteur(serie.compteur, horloge(), prefixe=serie.prefixe,
+                                     jeton=jeton)
+
+
+def _incrementer_compteur(fichier, current_date, prefixe='SM', jeton=None):
+    """Lit, incrémente et enregistre le compteur (appelé sous verrou)
+
+    Le jeton du demandeur est noté sur la seconde ligne du fichier : s'il
+    est présenté de nouveau, le dernier numéro lui est rendu tel quel.
+    """
     year_month = current_date.strftime("%Y%m")
     
     try:
         # Lire le dernier numéro
-        with open(COUNTER_FILE, 'r') as f:
-            last_date, last_number = f.read().strip().split('-')
+        with open(fichier, 'r') as f:
+            last_date, last_number = f.readline().strip().split('-')
             last_number = int(last_number)
+            if jeton and f.readline().strip() == jeton:
+                return f"{prefixe}-{last_date}-{last_number:04d}"
             
             # Si c'est le même mois, on incrémente
             if last_date == year_month:
@@ -139,44 +228,323 @@ def get_next_order_number():
         # Fichier inexistant ou corrompu, on commence à 1
         new_number = 1
     
-    # Sauvegarder le nouveau numéro
-    with open(COUNTER_FILE, 'w') as f:
+    # Sauvegarder le nouveau numéro (remplacement atomique : un arrêt
+    # brutal ne laisse jamais un compteur vide)
+    temporaire = f"{fichier}.tmp"
+    with open(temporaire, 'w') as f:
         f.write(f"{year_month}-{new_number:04d}")
+        if jeton:
+            f.write(f"\n{jeton}")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporaire, fichier)
     
     # Retourner le numéro formaté
-    return f"SM-{year_month}-{new_number:04d}"
+    return f"{prefixe}-{year_month}-{new_number:04d}"
+
+
+# Conditions de paiement : mention imprimée et calcul de l'échéance
+# (décalages appliqués dans l'ordre à la date de facture)
+CONDITIONS_PAIEMENT = {
+    'reception': ("Paiement à réception de facture", (relativedelta(),)),
+    '30j': ("Paiement à 30 jours", (relativedelta(days=30),)),
+    '45jfdm': ("Paiement à 45 jours fin de mois", (relativedelta(days=45), relativedelta(day=31))),
+    '60j': ("Paiement à 60 jours", (relativedelta(days=60),)),
+}
+
+
+def calculer_echeance(date_facture, conditions='reception'):
+    """Date d'échéance d'une facture
+
+    Args:
+        date_facture (str): Date au format JJ/MM/AAAA
+        conditions (str, optional): Clé de CONDITIONS_PAIEMENT
+
+    Returns:
+        str: Échéance au format JJ/MM/AAAA ('' sans date de facture)
+    """
+    if conditions not in CONDITIONS_PAIEMENT:
+        raise ValueError(f"Conditions de paiement inconnues : {conditions!r} "
+                         f"(attendu : {', '.join(CONDITIONS_PAIEMENT)})")
+    if not date_facture:
+        return ''
+    echeance = datetime.strptime(date_facture, '%d/%m/%Y')
+    for decalage in CONDITIONS_PAIEMENT[conditions][1]:
+        echeance += decalage
+    return echeance.strftime('%d/%m/%Y')
+
+
+def assurer_dossier(chemin):
+    """Crée un dossier s'il n'existe pas
+
+    Vérifié à chaque appel : le dossier courant peut changer, et un dossier
+    supprimé pendant l'exécution (démon, interface graphique) est recréé.
+    """
+    os.makedirs(chemin or '.', exist_ok=True)
+
+
+@dataclass(frozen=True, slots=True)
+class Colonne:
+    """Cellule de texte d'une ligne de tableau, relative au haut de la ligne"""
+    x: float
+    dy: float
+    largeur: float      # 0 : jusqu'à la marge droite, comme cell()
+    hauteur: float
+    alignement: str     # 'L', 'C' ou 'R'
+    style: str
+    taille: float       # en points
+
+
+# Métriques d'une colonne précalculées par PDF.preparer_colonnes
+_Metrique = namedtuple('_Metrique', 'x largeur alignement base police taille selection')
+
+
+@functools.lru_cache(maxsize=32)
+def _image_decodee(chemin, filtre, signature):
+    """Image décodée et compressée par fpdf, une fois par processus
+
+    La signature (date, taille) du fichier fait partie de la clé : une
+    image remplacée est décodée de nouveau.
+    """
+    return get_img_info(chemin, image_filter=filtre)
 
 
 class PDF(FPDF):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, date_creation=None, flux=None, nb_pages=None, identite=None,
+                 **kwargs):
+        """
+        Args:
+            date_creation (datetime, optional): Date fixe des métadonnées
+            flux (str, optional): Mode flux : chemin du fichier où chaque page
+                terminée est écrite aussitôt (voir facture_flux)
+            nb_pages (int, optional): Nombre total de pages, remplaçant l'alias
+                {nb} ; requis en mode flux si l'alias est utilisé
+            identite (Identite, optional): Identité et charte du document
+                (défaut : celle en vigueur, voir facture_identite)
+        """
+        self.identite = identite or identite_courante()
+        self._sortie = None
+        self.nb_pages = nb_pages
+        # Textes déjà encodés pour ligne_tableau : (police, texte) -> (Tj, largeur)
+        self._textes_encodes = {}
+        # Fichiers joints référencés par le catalogue (Factur-X)
+        self.fichiers_associes = []
         super().__init__(*args, **kwargs)
-        # Ajout de la police DejaVu pour supporter les caractères Unicode
-        self.add_font('DejaVu', '', 'DejaVuSans.ttf', uni=True)
-        self.add_font('DejaVu', 'B', 'DejaVuSans-Bold.ttf', uni=True)
-        self.add_font('DejaVu', 'I', 'DejaVuSans-Oblique.ttf', uni=True)
-        self.add_font('DejaVu', 'BI', 'DejaVuSans-BoldOblique.ttf', uni=True)
+        # Date fixe des métadonnées : le même contenu donne les mêmes octets
+        if date_creation is not None:
+            self.set_creation_date(date_creation)
+        # Polices de l'identité (DejaVu par défaut, pour les caractères
+        # Unicode), projetées en mémoire et analysées à la première utilisation
+        ajouter_polices(self, self.identite.polices)
+        if flux is not None:
+            self._sortie = SortieFlux(flux, self.pdf_version)
         self.set_font('DejaVu', '', 10)
         self.set_auto_page_break(auto=True, margin=30)
         self.add_page()
     
+    def add_page(self, *args, **kwargs):
+        page_precedente = self.page
+        super().add_page(*args, **kwargs)
+        # La page précédente est terminée (pied de page compris)
+        if self._sortie is not None and page_precedente:
+            self._vider_page(page_precedente)
+    
+    def _vider_page(self, numero):
+        """Écrit une page terminée dans la sortie et libère son contenu"""
+        page = self.pages[numero]
+        contenu = bytes(page.contents)
+        # Remplacement de l'alias du nombre de pages, comme à la fermeture
+        # du document par fpdf (polices Unicode puis polices de base)
+        for encodage in ('utf-16-be', 'latin-1'):
+            alias = self.str_alias_nb_pages.encode(encodage)
+            if not alias or alias not in contenu:
+                continue
+            if self.nb_pages is None:
+                raise ValueError(
+                    f"Nombre de pages inconnu : impossible de remplacer "
+                    f"{self.str_alias_nb_pages} en mode flux"
+                )
+            contenu = contenu.replace(alias, str(self.nb_pages).encode(encodage))
+        page.contents = self._sortie.ecrire_page(contenu, self.compress)
+        # Les textes encodés ne servent qu'à la page en cours : la mémoire
+        # reste bornée même si chaque article a sa propre référence
+        self._textes_encodes.clear()
+    
+    def output(self, name="", *args, **kwargs):
+        """Termine le document ; en mode flux, il est écrit dans le fichier
+        donné à la création et name est ignoré"""
+        if self._sortie is None:
+            kwargs.setdefault('output_producer_class', ProducteurAssocie)
+            return super().output(name, *args, **kwargs)
+        if self.page == 0:
+            self.add_page()
+        self.in_footer = True
+        self.footer()
+        self.in_footer = False
+        self._vider_page(self.page)
+        if self.nb_pages is not None and self.nb_pages != self.pages_count:
+            self.abandonner()
+            raise RuntimeError(
+                f"{self.pages_count} pages écrites pour {self.nb_pages} annoncées"
+            )
+        ProducteurFlux(self, self._sortie).ecrire()
+        self._sortie = None
+        return None
+    
+    def abandonner(self):
+        """Ferme la sortie d'un document en flux inachevé"""
+        if self._sortie is not None:
+            self._sortie.abandonner()
+            self._sortie = None
+    
+    def preload_image(self, name, dims=None):
+        """Comme fpdf, mais une image désignée par son chemin (logo) n'est
+        décodée qu'une fois par processus ; dans un document, elle reste un
+        XObject unique, partagé par toutes les pages"""
+        if isinstance(name, str) and dims is None and name not in self.images:
+            try:
+                info = os.stat(name)
+            except OSError:
+                return super().preload_image(name, dims)
+            image = ImageInfo(_image_decodee(name, self.image_filter,
+                                             (info.st_mtime_ns, info.st_size)))
+            # Numérotation propre au document ; usages est compté par fpdf
+            image['i'], image['usages'], image['iccp_i'] = len(self.images) + 1, 0, None
+            if image.get('iccp'):
+                image['iccp_i'] = self.icc_profiles.setdefault(image['iccp'],
+                                                               len(self.icc_profiles))
+                image['iccp'] = None
+            self.images[name] = image
+        return super().preload_image(name, dims)
+    
+    def qr_code(self, texte, x, y, cote):
+        """Dessine un QR code vectoriel (voir facture_qr) dans la couleur de
+        fond courante
+        
+        Args:
+            texte (str): Contenu du QR code
+            x, y (float): Coin supérieur gauche (mm)
+            cote (float): Côté du QR code, hors zone de silence (mm)
+        """
+        modules, trace = trace_qr(texte)
+        echelle = cote / modules * self.k
+        self._out(f"q {echelle:.4f} 0 0 {-echelle:.4f} {x * self.k:.2f} "
+                  f"{(self.h - y) * self.k:.2f} cm {trace} Q")
+    
+    def preparer_colonnes(self, colonnes, famille='DejaVu'):
+        """Précalcule les métriques de colonnes utilisées par ligne_tableau
+        
+        Args:
+            colonnes (iterable): Colonnes d'une ligne de tableau
+            famille (str, optional): Famille de police des textes
+            
+        Returns:
+            list: Métriques dans le même ordre que les colonnes
+        """
+        metriques = []
+        for colonne in colonnes:
+            police = self.fonts[f"{famille.lower()}{colonne.style}"]
+            metriques.append(_Metrique(
+                colonne.x,
+                colonne.largeur or self.w - self.r_margin - colonne.x,
+                colonne.alignement,
+                # Ligne de base du texte, calculée comme dans cell()
+                colonne.dy + 0.5 * colonne.hauteur + 0.3 * colonne.taille / self.k,
+                police,
+                colonne.taille,
+                f"/F{police.i} {colonne.taille:.2f} Tf",
+            ))
+        return metriques
+    
+    def _encoder_texte(self, police, texte):
+        """Retourne l'opérateur Tj d'un texte et sa largeur pour une taille de 1 pt"""
+        cle = (police.i, texte)
+        encode = self._textes_encodes.get(cle)
+        if encode is None:
+            glyphes = ''.join(chr(g) for g in map(police.subset.pick, map(ord, texte)) if g)
+            chaine = escape_parens(glyphes.encode('utf-16-be').decode('latin-1'))
+            largeur = sum(police.cw[ord(c)] for c in texte) * 0.001
+            encode = self._textes_encodes[cle] = (f"({chaine}) Tj", largeur)
+        return encode
+    
+    def ligne_tableau(self, x, y, largeur, hauteur, cellules, fond, bordure,
+                      couleur_texte=(0, 0, 0)):
+        """Écrit une ligne complète de tableau directement dans le flux de contenu
+        
+        Produit le même rendu que rect(), line() puis set_xy() et cell() pour
+        chaque colonne, mais tous les textes sont écrits dans un seul bloc
+        BT ... ET à partir des métriques précalculées, sans passer par la
+        mécanique générique de cell().
+        
+        Args:
+            x, y, largeur, hauteur (float): Cadre de la ligne
+            cellules (iterable): Couples (métrique de preparer_colonnes, texte)
+            fond (tuple): Couleur de fond (R, G, B)
+            bordure (tuple): Couleur des filets en haut et en bas (à hauteur - 1)
+            couleur_texte (tuple, optional): Couleur des textes
+        """
+        self.set_fill_color(*fond)
+        self.rect(x, y, largeur, hauteur, 'F')
+        self.set_draw_color(*bordure)
+        self.line(x, y, x + largeur, y)
+        self.set_text_color(*couleur_texte)
+        
+        k, marge = self.k, self.c_margin
+        haut = self.h - y
+        operations = ['q', self.text_color.serialize().lower(), 'BT']
+        selection = None
+        x0 = y0 = 0
+        for metrique, texte in cellules:
+            if not texte:
+                continue
+            tj, largeur_texte = self._encoder_texte(metrique.police, texte)
+            largeur_texte *= metrique.taille / k
+            if metrique.alignement == 'R':
+                dx = metrique.largeur - marge - largeur_texte
+            elif metrique.alignement == 'C':
+                dx = (metrique.largeur - largeur_texte) / 2
+            else:
+                dx = marge
+            if metrique.selection != selection:
+                selection = metrique.selection
+                operations.append(selection)
+            # Positions arrondies comme celles de cell(), puis relatives
+            xt = round((metrique.x + dx) * k, 2)
+            yt = round((haut - metrique.base) * k, 2)
+            operations.append(f"{xt - x0:.2f} {yt - y0:.2f} Td")
+            operations.append(tj)
+            x0, y0 = xt, yt
+        operations += ['ET', 'Q']
+        self._out(' '.join(operations))
+        
+        self.line(x, y + hauteur - 1, x + largeur, y + hauteur - 1)
+    
     def header(self):
-        # En-tête avec dégradé de bleu
-        self.set_fill_color(0, 85, 150)  # Bleu foncé
+        # Bandeau aux couleurs de l'entreprise
+        couleurs = self.identite.couleurs
+        self.set_fill_color(*couleurs.bandeau)
         self.rect(0, 0, self.w, 25, 'F')
         
         # Logo et titre
         self.set_font('DejaVu', 'B', 24)
-        self.set_text_color(255, 255, 255)
-        self.cell(0, 15, 'ATELIER S-MOD', 0, 1, 'R')
+        self.set_text_color(*couleurs.fond)
+        if self.identite.logo:
+            # Logo à gauche de l'enseigne, sur toute la hauteur du bandeau
+            _, _, image = self.preload_image(self.identite.logo)
+            largeur = 19 * image['w'] / image['h']
+            x = (self.w - self.r_margin - self.c_margin
+                 - self.get_string_width(self.identite.bandeau) - largeur - 5)
+            self.image(self.identite.logo, x=x, y=3, w=largeur, h=19)
+        self.cell(0, 15, self.identite.bandeau, 0, 1, 'R')
         
         # Ligne de séparation
-        self.set_draw_color(255, 255, 255)
+        self.set_draw_color(*couleurs.fond)
         self.set_line_width(0.5)
         self.line(15, 25, self.w - 15, 25)
         
         # Sous-titre
         self.set_font('DejaVu', 'I', 10)
-        self.cell(0, 5, 'L\'excellence horlogère à son apogée', 0, 1, 'R')
+        self.cell(0, 5, self.identite.sous_titre, 0, 1, 'R')
     
     def rounded_rect(self, x, y, w, h, r, style='', corners='1234'):
         """Dessine un rectangle avec des coins arrondis
@@ -264,17 +632,16 @@ class PDF(FPDF):
     def footer(self):
         self.set_y(-20)
         self.set_font('DejaVu', 'I', 8)
-        self.set_text_color(100, 100, 100)
+        self.set_text_color(*self.identite.couleurs.secondaire)
         
         # Ligne de séparation
-        self.set_draw_color(200, 200, 200)
+        self.set_draw_color(*self.identite.couleurs.separateur)
         self.line(15, self.h - 25, self.w - 15, self.h - 25)
         
         # Contenu du pied de page
         self.set_y(-18)
-        self.cell(0, 4, "Atelier S-MOD - L'excellence horlogère à son apogée", 0, 1, 'C')
-        self.cell(0, 4, "SIRET: 123 456 789 00012 - TVA non applicable, art. 293 B du CGI", 0, 1, 'C')
-        self.cell(0, 4, "Contact: contact@atelier-s-mod.fr - Tél: +33 1 23 45 67 89", 0, 1, 'C')
+        for ligne in self.identite.pied_de_page:
+            self.cell(0, 4, ligne, 0, 1, 'C')
         
         # Numéro de page
         self.set_y(-10)
@@ -282,29 +649,83 @@ class PDF(FPDF):
 
 
 class FactureMouvementAbsolu:
-    # Marges et espacement optimisés pour une page
-    MARGIN_LEFT = 10
-    MARGIN_RIGHT = 10
-    MARGIN_TOP = 10
-    MARGIN_BOTTOM = 10
-    LINE_HEIGHT = 5  # Réduit de 6 à 5
-    SECTION_SPACING = 5  # Réduit de 10 à 5
+    # Lignes d'articles écrites directement dans le flux de contenu
+    # (désactivable pour les mesures de performance)
+    rendu_direct = True
     
-    # Couleurs (R, G, B)
-    BLEU_MAIN = (0, 51, 102)      # Bleu foncé
-    BLEU_CLAIR = (200, 220, 240)  # Bleu clair pour les fonds
-    GRIS_FONCE = (100, 100, 100)  # Gris pour le texte secondaire
-    GRIS_CLAIR = (200, 200, 200)  # Gris clair pour les séparateurs
-    NOIR = (0, 0, 0)              # Noir pour le texte principal
-    BLANC = (255, 255, 255)       # Blanc pour les fonds
+    # Type de document : titre imprimé, cadre du destinataire, nom du PDF
+    TITRE = 'FACTURE'
+    DESTINATAIRE = 'FACTURER À'
+    PREFIXE_FICHIER = 'facture'
+    # Code du document Factur-X (380 : facture) ; None : pas de XML joint
+    TYPE_FACTURX = '380'
+    # QR code de virement SEPA, si l'identité porte un IBAN
+    QR_PAIEMENT = True
     
-    def __init__(self, donnees):
+    def __init__(self, donnees, deterministe=False, horloge=datetime.now, flux=False,
+                 facturx=False, identite=None):
+        """
+        Args:
+            donnees (dict): Informations client et commande
+            deterministe (bool, optional): Rendu reproductible : la date de
+                création du PDF est dérivée de 'date_facture', de sorte que
+                les mêmes données produisent un fichier identique à l'octet
+            horloge (callable, optional): Fonction retournant la date courante
+                (injectable pour les tests et les rendus reproductibles)
+            flux (bool, optional): Écrit chaque page dans le fichier dès
+                qu'elle est terminée, à mémoire constante (grandes factures)
+            facturx (bool, optional): Joint au PDF les données de la facture
+                au format Factur-X (XML CII, voir facture_facturx)
+            identite (Identite, optional): Identité et charte imprimées ;
+                par défaut celle de l'atelier donnees['atelier'] (ou de
+                l'installation) en vigueur au moment de la mise en page
+                (voir facture_identite)
+        """
         self.donnees = donnees
+        self.deterministe = deterministe
+        self.horloge = horloge
+        self.flux = flux
+        self.facturx = facturx
+        self.identite = identite
         self.articles = []
-        self.pdf = PDF()
+        self.pdf = PDF(identite=self._identite())
         self.total_ht = 0
         self.tva = 0.20  # Taux de TVA à 20%
-        
+        # Disposition du tableau et textes des lignes, calculés une fois
+        # (repris par la facture issue d'un devis)
+        self._disposition = None
+        self._textes = {}
+        
+    def _identite(self):
+        """Identité fournie au constructeur, sinon celle de l'atelier de la
+        commande"""
+        return self.identite or identite_courante(self.donnees.get('atelier'))
+
+    @property
+    def couleurs(self):
+        """Couleurs de la charte du document en cours"""
+        return self.pdf.identite.couleurs
+
+    @property
+    def marges(self):
+        """Marges de la charte du document en cours"""
+        return self.pdf.identite.marges
+
+    @property
+    def echeance(self):
+        """Date d'échéance JJ/MM/AAAA : 'date_echeance' si fournie, sinon
+        calculée selon 'conditions_paiement' (à réception par défaut)"""
+        if self.donnees.get('date_echeance'):
+            return self.donnees['date_echeance']
+        return calculer_echeance(self.donnees.get('date_facture', ''),
+                                 self.donnees.get('conditions_paiement', 'reception'))
+
+    @property
+    def conditions_paiement(self):
+        """Mention des conditions de paiement imprimée sur la facture"""
+        conditions = self.donnees.get('conditions_paiement', 'reception')
+        return CONDITIONS_PAIEMENT[conditions][0]
+
     def _draw_info_field_compact(self, x, y, label, value):
         """Dessine un champ d'information plus compact"""
         self.pdf.set_xy(x, y)
@@ -340,6 +761,9 @@ class FactureMouvementAbsolu:
         print_section("Saisie des montres")
         print("Appuyez sur Entrée sans modèle pour terminer.\n")
 
+        from facture_catalogue import Catalogue, completion_console
+        catalogue = Catalogue()
+
         while True:
             modele = input_style("Modèle de la montre").strip()
             if not modele:
@@ -358,20 +782,21 @@ class FactureMouvementAbsolu:
             composants = []
 
             def ask_component(nom, ref_label):
-                ref = input_style(f"{ref_label}")
+                # Tab complète la référence ; un composant connu propose son prix
+                with completion_console(catalogue, nom):
+                    ref = input_style(f"{ref_label}")
+                connu = catalogue.trouver(nom, ref)
+                defaut = f"{connu.prix:.2f}" if connu else ""
                 prix = None
                 while prix is None:
-                    prix_str = input_style(f"Prix {nom} (EUR)")
+                    prix_str = input_style(f"Prix {nom} (EUR)", defaut)
                     prix = self.clean_price_input(prix_str)
                     if prix is None or prix <= 0:
                         print_error("Prix invalide.")
                         prix = None
                     else:
-                        composants.append({
-                            'nom': nom,
-                            'reference': ref,
-                            'prix': prix
-                        })
+                        composants.append(Composant(nom, ref, prix))
+                        catalogue.enregistrer(nom, ref, prix)
 
             ask_component("Mouvement", "Référence du mouvement (ex: NH35)")
             ask_component("Cadran", "Description du cadran (ex: Noir soleil)")
@@ -385,30 +810,32 @@ class FactureMouvementAbsolu:
             except ValueError:
                 quantite = 1
 
-            prix_total = sum(c['prix'] for c in composants)
-
-            self.articles.append({
-                'modele': modele,
-                'reference': reference,
-                'composants': composants,
-                'prix_total': prix_total,
-                'quantite': quantite
-            })
+            article = Article(modele, reference, composants, quantite)
+            self.articles.append(article)
 
             print_success("Montre ajoutée")
-            print(f"Total unitaire calculé : {prix_total:.2f} EUR")
+            print(f"Total unitaire calculé : {article.prix_total:.2f} EUR")
 
             if input("\nAjouter une autre montre ? (Entrée = oui / n = non) ").lower() in ('n', 'non'):
                 break
+        catalogue.fermer()
 
-            print_section("Informations client")
-            self.donnees['client_nom'] = input("Nom complet : ").strip()
-            self.donnees['client_adresse'] = input("Adresse : ").strip()
-            self.donnees['client_cp'] = input("Code postal : ").strip()
-            self.donnees['client_ville'] = input("Ville : ").strip()
+        print_section("Informations client")
+        self.donnees['client_nom'] = input("Nom complet : ").strip()
+        self.donnees['client_adresse'] = input("Adresse : ").strip()
+        self.donnees['client_cp'] = input("Code postal : ").strip()
+        self.donnees['client_ville'] = input("Ville : ").strip()
 
-            self.donnees['num_commande'] = get_next_order_number()
-            self.donnees['date_facture'] = datetime.now().strftime("%d/%m/%Y")
+        conditions = None
+        while conditions not in CONDITIONS_PAIEMENT:
+            conditions = input_style(
+                f"Conditions de paiement ({' / '.join(CONDITIONS_PAIEMENT)})", 'reception'
+            ).strip()
+        self.donnees['conditions_paiement'] = conditions
+
+        self.donnees['num_commande'] = get_next_order_number(self.horloge,
+                                                             self.donnees.get('atelier'))
+        self.donnees['date_facture'] = self.horloge().strftime("%d/%m/%Y")
 
     def ajouter_article(self, modele, reference, composants, quantite=1):
         """Ajoute une montre avec ses composants détaillés à la facture
@@ -416,7 +843,7 @@ class FactureMouvementAbsolu:
         Args:
             modele (str): Modèle de la montre (ex: 'Chronographe Classique')
             reference (str): Référence du modèle (ex: 'CC-2024-01')
-            composants (list): Liste des composants avec leur prix
+            composants (list): Liste de Composant (ou de dicts équivalents)
                 Exemple: [
                     {'nom': 'Mouvement', 'reference': 'Valjoux 7750', 'prix': 400.00},
                     {'nom': 'Cadran', 'description': 'Noir émaillé', 'prix': 150.00},
@@ -426,180 +853,23 @@ class FactureMouvementAbsolu:
                 ]
             quantite (int, optional): Quantité. Par défaut à 1.
         """
-        # Calcul du prix total
-        prix_total = sum(comp['prix'] for comp in composants)
-        
-        self.articles.append({
-            'modele': modele,
-            'reference': reference,
-            'composants': composants,
-            'prix_total': prix_total,
-            'quantite': int(quantite)
-        })
-
-    def ouvrir_facture(self, chemin_fichier):
-        """Ouvre le fichier PDF avec l'application par défaut du système"""
-        try:
-            if platform.system() == 'Darwin':  # macOS
-                os.system(f'open "{chemin_fichier}"')
-            elif platform.system() == 'Windows':
-                os.startfile(chemin_fichier)
-            else:  # Linux et autres
-                os.system(f'xdg-open "{chemin_fichier}"')
-        except Exception as e:
-            print_error(f"Impossible d'ouvrir le fichier : {e}")
+        self.articles.append(Article(modele, reference, composants, quantite))
 
-    def generer_facture(self):
-        """Génère le fichier PDF de la facture sur une seule page"""
-        # Palette de couleurs raffinée
-        self.NOIR = (30, 30, 30)           # Noir profond
-        self.GRIS_FONCE = (100, 100, 100)  # Gris foncé pour le texte secondaire
-        self.GRIS_CLAIR = (245, 245, 245)  # Gris très clair pour les fonds
-        self.BLEU_MAIN = (0, 85, 150)      # Bleu officiel Atelier S-MOD
-        self.BLEU_CLAIR = (200, 225, 245)  # Bleu clair pour les en-têtes
-        self.BLANC = (255, 255, 255)       # Blanc pur
-        
-        # Constantes de mise en page
-        self.MARGIN_LEFT = 15
-        self.MARGIN_RIGHT = 15
-        self.MARGIN_TOP = 15
-        self.MARGIN_BOTTOM = 20
-        self.LINE_HEIGHT = 5
-        self.SECTION_SPACING = 5
-        
-        # Création du PDF sans ajout de page automatique
-        self.pdf = PDF()
-        # Désactiver la création automatique de page
-        self.pdf.set_auto_page_break(False, margin=0)
-        
-        # Réinitialisation des totaux
-        self.total_ht = 0
+    @classmethod
+    def depuis_commande(cls, commande, **options):
+        """Construit une facture à partir d'une commande au format JSON
         
-        # Ajout des sections dans l'ordre
-        self._ajouter_entete()
-        self._ajouter_infos_client()
-        self._ajouter_tableau_articles()
-        self._ajouter_totaux()
-        
-        # Création du dossier de destination si nécessaire
-        if not os.path.exists('factures'):
-            os.makedirs('factures')
-            
-        # Sauvegarde du fichier
-        nom_fichier = f"factures/facture_{self.donnees.get('num_commande', '')}.pdf"
-        self.pdf.output(nom_fichier)
-        return nom_fichier
-            
-    def _ajouter_entete(self):
-        """Ajoute l'en-tête de la facture avec une hiérarchie visuelle améliorée"""
-        # Couleurs
-        BLEU_FONCE = (0, 51, 102)  # Bleu plus foncé pour le titre
-        
-        # Titre de la facture - Plus grand et plus visible
-        self.pdf.set_xy(15, 10)
-        self.pdf.set_font('DejaVu', 'B', 22)  # Taille augmentée
-        self.pdf.set_text_color(*BLEU_FONCE)
-        self.pdf.cell(0, 12, 'FACTURE', 0, 1, 'L')
-        
-        # Ligne de séparation sous le titre
-        self.pdf.set_line_width(0.5)
-        self.pdf.set_draw_color(*self.BLEU_MAIN)
-        self.pdf.line(15, 24, 100, 24)  # Ligne plus épaisse et plus longue
-        
-        # Bloc entreprise - Mise en valeur avec un fond légèrement coloré
-        self.pdf.set_fill_color(*self.BLEU_CLAIR)
-        self.pdf.rect(15, 30, 90, 25, 'F')  # Fond pour le bloc entreprise
-        
-        # Nom de l'entreprise
-        self.pdf.set_xy(20, 32)
-        self.pdf.set_font('DejaVu', 'B', 12)
-        self.pdf.set_text_color(*self.BLEU_MAIN)
-        self.pdf.cell(0, 6, 'Atelier S-MOD', 0, 1, 'L')
-        
-        # Coordonnées de l'entreprise
-        self.pdf.set_xy(20, 39)
-        self.pdf.set_font('DejaVu', '', 8)
-        self.pdf.set_text_color(*self.NOIR)
-        self.pdf.cell(0, 4, '123 Rue de l\'Horloge', 0, 1, 'L')
-        
-        self.pdf.set_xy(20, 43)
-        self.pdf.cell(0, 4, '75001 PARIS', 0, 1, 'L')
-        
-        self.pdf.set_xy(20, 49)
-        self.pdf.cell(0, 4, 'Tél: 01 23 45 67 89', 0, 1, 'L')
-        self.pdf.set_xy(20, 53)
-        self.pdf.cell(0, 4, 'contact@atelier-smod.com', 0, 1, 'L')
-        
-        # Bloc numéro de facture et date - Encadré pour le mettre en valeur
-        self.pdf.set_xy(-75, 32)
-        self.pdf.set_fill_color(250, 250, 250)  # Fond très légèrement grisé
-        self.pdf.rounded_rect(self.pdf.w - 80, 30, 65, 25, 3, 'DF', corners='1234')
-        
-        # Numéro de facture
-        self.pdf.set_xy(-75, 32)
-        self.pdf.set_font('DejaVu', 'B', 10)
-        self.pdf.set_text_color(*self.BLEU_MAIN)
-        self.pdf.cell(0, 6, 'FACTURE N°', 0, 1, 'L')
-        
-        self.pdf.set_xy(-75, 38)
-        self.pdf.set_font('DejaVu', 'B', 12)
-        self.pdf.cell(0, 6, self.donnees.get('num_commande', ''), 0, 1, 'L')
-        
-        # Date de facturation
-        self.pdf.set_xy(-75, 46)
-        self.pdf.set_font('DejaVu', '', 8)
-        self.pdf.cell(0, 4, f"Date: {self.donnees.get('date_facture', '')}", 0, 1, 'L')
-        
-        # Légère séparation avant la section suivante
-        self.pdf.set_draw_color(220, 220, 220)
-        self.pdf.line(15, 62, self.pdf.w - 15, 62)
-            
-    def _ajouter_infos_client(self):
-        """Ajoute les informations client avec une meilleure mise en forme"""
-        # Position après l'en-tête
-        y = 70  # Ajusté pour la nouvelle mise en page
-        
-        # En-tête de section avec icône
-        self.pdf.set_xy(15, y)
-        self.pdf.set_fill_color(*self.BLEU_MAIN)
-        self.pdf.set_text_color(255, 255, 255)  # Texte blanc
-        self.pdf.set_font('DejaVu', 'B', 10)
-        self.pdf.cell(0, 6, '  INFORMATIONS CLIENT', 0, 1, 'L', 1)
-        
-        # Icône utilisateur (simulée avec un caractère)
-        self.pdf.set_xy(18, y + 2)
-        self.pdf.set_font('DejaVu', 'B', 8)
-        self.pdf.cell(0, 0, '👤', 0, 0, 'L')
-        
-        # Cadre des informations client avec coins arrondis
-        self.pdf.set_fill_color(250, 250, 250)  # Fond légèrement grisé
-        self.pdf.rounded_rect(15, y + 8, self.pdf.w - 30, 28, 3, 'DF', corners='1234')
-        self.pdf.set_draw_color(220, 220, 220)
-        self.pdf.rounded_rect(15, y + 8, self.pdf.w - 30, 28, 3, 'D', corners='1234')
-        
-        # Nom du client en plus grand et en gras
-        self.pdf.set_xy(20, y + 12)
-        self.pdf.set_font('DejaVu', 'B', 10)
-        self.pdf.set_text_color(*self.BLEU_MAIN)
-        self.pdf.cell(0, 5, self.donnees.get('client_nom', '').upper(), 0, 1)
-            
-        # Adresse
-        self.pdf.set_xy(20, y + 18)
-        self.pdf.set_font('DejaVu', '', 9)
-        self.pdf.set_text_color(*self.NOIR)
-        self.pdf.cell(0, 4, self.donnees.get('client_adresse', ''), 0, 1)
-        
-        # Code postal et ville
-        self.pdf.set_xy(20, y + 24)
-        self.pdf.cell(0, 4, f"{self.donnees.get('client_cp', '')} {self.donnees.get('client_ville', '').upper()}", 0, 1)
-        
-        # Ligne de séparation avant la section suivante
-        self.pdf.set_draw_color(220, 220, 220)
-        self.pdf.line(15, y + 38, self.pdf.w - 15, y + 38)
-        
-        # Retourne la position Y pour la suite
-        return y + 40
-            
+        Args:
+            commande (dict): Champs de `donnees` et liste 'articles' au
+                format de Article.depuis_dict
+            **options: Transmis au constructeur (deterministe, flux...)
+        """
+        donnees = dict(commande)
+        articles = [Article.depuis_dict(a) for a in donnees.pop('articles', ())]
+        facture = cls(donnees, **options)
+        facture.articles = articles
+        return facture
+
     def _ajouter_tableau_articles(self, y, page_width):
         """Ajoute le tableau des articles avec les composants détaillés
         
@@ -614,36 +884,74 @@ class FactureMouvementAbsolu:
         self._dessiner_en_tete_tableau(y)
         y += 8  # Réduit l'espace après l'en-tête de 12 à 8
         
+        if self.rendu_direct:
+            self._colonnes = self._preparer_colonnes()
+            dessiner_article = self._dessiner_article_direct
+        else:
+            dessiner_article = self._dessiner_article_compact
+        
         # Réinitialisation du total HT
         self.total_ht = 0
         
+        # Nombre de pages connu d'avance : le pied de page peut être écrit
+        # dès qu'une page est terminée (mode flux)
+        disposition = self._disposer_articles(y)
+        self.pdf.nb_pages = self.pdf.page + sum(saut for _, _, _, saut in disposition)
+        
         # Pour chaque article
-        for i, article in enumerate(self.articles):
-            # Calculer la hauteur nécessaire pour cet article
-            hauteur_article = self._calculer_hauteur_article(article)
-            
-            # Vérifier l'espace restant avant d'ajouter un nouvel article
-            if hauteur_article is None or y + hauteur_article > 220:  # Vérification de None ajoutée
-                break
+        for i, (article, y, hauteur_article, saut) in enumerate(disposition):
+            # Saut de page avec rappel de l'en-tête du tableau sous le bandeau
+            if saut:
+                self.pdf.add_page()
+                self._dessiner_en_tete_tableau(y - 8)
                 
             # Dessiner l'article avec ses composants
-            total_ligne = self._dessiner_article_compact(
+            total_ligne = dessiner_article(
                 article, y, hauteur_article, i % 2 == 0
             )
             
             # Mettre à jour la position Y et le total
             y += hauteur_article + 3  # Petit espace entre les articles
             self.total_ht += total_ligne
+        
+        return y
+    
+    def _disposer_articles(self, y):
+        """Répartition des articles sur les pages, conservée tant que les
+        articles et la position du tableau sont inchangés
+        
+        Args:
+            y (float): Position Y du premier article
+            
+        Returns:
+            list: (article, position Y, hauteur, saut de page avant l'article)
+        """
+        cle = (y, tuple(self.articles))
+        if self._disposition is None or self._disposition[0] != cle:
+            self._disposition = (cle, list(self._repartir_articles(y)))
+        return self._disposition[1]
+    
+    def _repartir_articles(self, y):
+        """Répartit les articles sur les pages (voir _disposer_articles)"""
+        for article in self.articles:
+            # Calculer la hauteur nécessaire pour cet article
+            hauteur_article = self._calculer_hauteur_article(article)
+            # Saut de page si l'article ne tient plus dans l'espace restant
+            saut = y + hauteur_article > 220
+            if saut:
+                y = 35 + 8  # Sous le bandeau et l'en-tête du tableau
+            yield article, y, hauteur_article, saut
+            y += hauteur_article + 3
     
     def _calculer_hauteur_article(self, article):
         """Calcule la hauteur nécessaire pour afficher un article"""
-        if not article or not isinstance(article, dict):
+        if not isinstance(article, Article):
             return 15  # Hauteur minimale par défaut
             
         nb_lignes = 1  # Au moins une ligne pour le modèle
-        if 'composants' in article and article['composants']:
+        if article.composants:
             # Une ligne par composant, maximum 3 affichés
-            nb_lignes += min(3, len(article['composants']))
+            nb_lignes += min(3, len(article.composants))
         return max(15, nb_lignes * 5)  # Hauteur minimale de 15 unités
     
     def _dessiner_en_tete_tableau(self, y):
@@ -667,7 +975,7 @@ class FactureMouvementAbsolu:
         self.pdf.set_line_width(0.3)
         
         # Fond avec coins arrondis en haut
-        self.pdf.set_fill_color(*self.BLEU_MAIN)
+        self.pdf.set_fill_color(*self.couleurs.principale)
         self.pdf.rounded_rect(15, y, self.pdf.w - 30, HAUTEUR, 3, 'F', corners='12')
         
         # Bordure inférieure plus fine
@@ -716,6 +1024,67 @@ class FactureMouvementAbsolu:
         self.pdf.set_xy(15, y + HAUTEUR + 2)
         self.pdf.cell(0, 3, "* Les prix sont indiqués en euros (€) toutes taxes comprises", 0, 1, 'L')
         
+    def _preparer_colonnes(self):
+        """Métriques des cellules d'un article, calculées une fois par document
+        
+        Mêmes positions et polices que _dessiner_article_compact : la ligne
+        du modèle, puis les deux premiers composants (libellé et prix).
+        """
+        colonnes = [
+            Colonne(self.x_design, 4, self.col_design, 6, 'L', 'B', 8),
+            Colonne(self.x_ref, 4, self.col_ref, 6, 'L', '', 7),
+            Colonne(self.x_qte, 4, self.col_qte, 6, 'C', '', 8),
+            Colonne(self.x_prix, 4, self.col_prix, 6, 'R', '', 8),
+            Colonne(self.x_total, 4, 0, 6, 'R', 'B', 8),
+        ]
+        for i in range(2):
+            y_composant = 12 + i * 5
+            colonnes.append(Colonne(self.x_design + 5, y_composant, 0, 4, 'L', '', 7))
+            colonnes.append(Colonne(self.x_prix, y_composant, self.col_prix, 4, 'R', '', 7))
+        return self.pdf.preparer_colonnes(colonnes)
+    
+    def _textes_article(self, article):
+        """Textes affichés pour un article, dans l'ordre de _preparer_colonnes"""
+        textes = self._textes.get(article)
+        if textes is None:
+            textes = self._textes[article] = self._composer_textes(article)
+        return textes
+    
+    def _composer_textes(self, article):
+        # Tronquer les modèles et références trop longs
+        modele = article.modele
+        if len(modele) > 30:
+            modele = modele[:27] + '...'
+        ref = article.reference
+        if len(ref) > 10:
+            ref = ref[:7] + '...'
+        
+        textes = [
+            modele,
+            ref,
+            f"x{article.quantite}",
+            f"{article.prix_total:.2f} €",
+            f"{article.total_ligne:.2f} €",
+        ]
+        # Limiter à 2 composants max pour l'affichage
+        for composant in article.composants[:2]:
+            nom_composant = f"• {composant.nom}"
+            if len(nom_composant) > 30:
+                nom_composant = nom_composant[:27] + '...'
+            textes += [nom_composant, f"{composant.prix:.2f} €"]
+        return textes
+    
+    def _dessiner_article_direct(self, article, y, hauteur, pair):
+        """Dessine un article comme _dessiner_article_compact, d'un seul tenant"""
+        self.pdf.ligne_tableau(
+            15, y, self.pdf.w - 30, hauteur,
+            zip(self._colonnes, self._textes_article(article)),
+            fond=(245, 245, 245) if pair else self.couleurs.fond,
+            bordure=(220, 220, 220),
+            couleur_texte=self.couleurs.texte,
+        )
+        return article.total_ligne
+    
     def _dessiner_article_compact(self, article, y, hauteur, pair):
         """Dessine un article avec ses composants détaillés"""
         # Couleur de fond alternée pour une meilleure lisibilité
@@ -738,7 +1107,7 @@ class FactureMouvementAbsolu:
         hauteur_ligne = 6
         
         # Désignation du modèle (colonne 1) - avec troncature si trop longue
-        modele = article['modele']
+        modele = article.modele
         if len(modele) > 30:  # Tronquer les modèles trop longs
             modele = modele[:27] + '...'
         
@@ -747,7 +1116,7 @@ class FactureMouvementAbsolu:
         self.pdf.cell(self.col_design, hauteur_ligne, modele, 0, 0, 'L')
         
         # Référence (colonne 2)
-        ref = article['reference']
+        ref = article.reference
         if len(ref) > 10:  # Tronquer les références trop longues
             ref = ref[:7] + '...'
         
@@ -758,21 +1127,21 @@ class FactureMouvementAbsolu:
         # Quantité (colonne 3)
         self.pdf.set_font('DejaVu', '', 8)
         self.pdf.set_xy(self.x_qte, y + 4)
-        self.pdf.cell(self.col_qte, hauteur_ligne, f"x{article['quantite']}", 0, 0, 'C')
+        self.pdf.cell(self.col_qte, hauteur_ligne, f"x{article.quantite}", 0, 0, 'C')
         
         # Prix unitaire (colonne 4)
         self.pdf.set_xy(self.x_prix, y + 4)
-        self.pdf.cell(self.col_prix, hauteur_ligne, f"{article['prix_total']:.2f} €", 0, 0, 'R')
+        self.pdf.cell(self.col_prix, hauteur_ligne, f"{article.prix_total:.2f} €", 0, 0, 'R')
         
         # Total ligne (colonne 5)
-        total_ligne = article['prix_total'] * article['quantite']
+        total_ligne = article.total_ligne
         self.pdf.set_xy(self.x_total, y + 4)
         self.pdf.set_font('DejaVu', 'B', 8)  # Police réduite
         self.pdf.cell(0, hauteur_ligne, f"{total_ligne:.2f} €", 0, 0, 'R')
         
         # Affichage des composants sous la première ligne
         self.pdf.set_font('DejaVu', '', 7)  # Police réduite pour les composants
-        for i, composant in enumerate(article['composants']):
+        for i, composant in enumerate(article.composants):
             if i >= 2:  # Limiter à 2 composants max pour l'affichage
                 break
                 
@@ -780,14 +1149,14 @@ class FactureMouvementAbsolu:
             
             # Libellé du composant (décalé à droite)
             self.pdf.set_xy(self.x_design + 5, y_composant)
-            nom_composant = f"• {composant['nom']}"
+            nom_composant = f"• {composant.nom}"
             if len(nom_composant) > 30:  # Tronquer les noms trop longs
                 nom_composant = nom_composant[:27] + '...'
             self.pdf.cell(0, 4, nom_composant, 0, 1)
             
             # Prix du composant (aligné à droite)
             self.pdf.set_xy(self.x_prix, y_composant)
-            self.pdf.cell(self.col_prix, 4, f"{composant['prix']:.2f} €", 0, 0, 'R')
+            self.pdf.cell(self.col_prix, 4, f"{composant.prix:.2f} €", 0, 0, 'R')
         
         # Ligne de séparation sous l'article
         self.pdf.line(15, y + hauteur - 1, self.pdf.w - 15, y + hauteur - 1)
@@ -812,15 +1181,8 @@ class FactureMouvementAbsolu:
         self.pdf.set_text_color(120, 120, 120)  # Gris un peu plus clair
         
         # Texte des mentions légales
-        mentions = (
-            "SARL au capital de 10 000 € - RCS Paris 123 456 789 - TVA intracommunautaire FR 12 34567891234\n"
-            "Siège social : 123 Rue de l'Horlogerie, 75001 Paris - Tél : 01 23 45 67 89 - contact@atelier-s-mod.fr\n"
-            "En cas de litige, les tribunaux de Paris sont seuls compétents."
-        )
-        
-        # Affichage des mentions légales
         self.pdf.set_xy(15, y)
-        self.pdf.multi_cell(0, 3, mentions, 0, 'C')
+        self.pdf.multi_cell(0, 3, self.pdf.identite.mentions_legales, 0, 'C')
         
         return y + 20
         
@@ -850,7 +1212,7 @@ class FactureMouvementAbsolu:
         x_start = self.pdf.w - marge_droite - largeur_col1 - largeur_col2 - 5
         
         # Ligne de séparation
-        self.pdf.set_draw_color(200, 200, 200)
+        self.pdf.set_draw_color(*self.couleurs.separateur)
         self.pdf.line(x_start, y, self.pdf.w - marge_droite, y)
         y += 6  # Espacement réduit après la ligne
         
@@ -881,7 +1243,7 @@ class FactureMouvementAbsolu:
         
         # Total TTC
         self.pdf.set_font('DejaVu', 'B', 10)  # Taille légèrement réduite
-        self.pdf.set_text_color(*self.BLEU_MAIN)
+        self.pdf.set_text_color(*self.couleurs.principale)
         self.pdf.set_xy(x_start, y)
         self.pdf.cell(largeur_col1, 8, 'TOTAL TTC:', 0, 0, 'R')
         self.pdf.set_x(x_start + largeur_col1 + 5)
@@ -890,20 +1252,54 @@ class FactureMouvementAbsolu:
         
         # Mentions légales
         self.pdf.set_font('DejaVu', 'I', 6)
-        self.pdf.set_text_color(100, 100, 100)
+        self.pdf.set_text_color(*self.couleurs.secondaire)
         self.pdf.set_xy(15, 280)
-        self.pdf.cell(0, 3, "TVA non applicable, article 293 B du CGI", 0, 1, 'L')
+        self.pdf.cell(0, 3, self.pdf.identite.mention_tva, 0, 1, 'L')
         self.pdf.set_x(15)
-        self.pdf.cell(0, 3, "Paiement à réception de facture par virement bancaire", 0, 1, 'L')
+        self.pdf.cell(0, 3, self._mention_paiement(), 0, 1, 'L')
         
         # Mention légale en tout petit en bas
         self.pdf.set_xy(15, 285)
         self.pdf.set_font('DejaVu', 'I', 5)
         self.pdf.set_text_color(150, 150, 150)
-        self.pdf.cell(0, 3, 
-            "TVA non applicable, article 293 B du CGI - RCS Paris 123 456 789 - "
-            "N° TVA: FR00123456789 - SIRET: 123 456 789 00012",
-            0, 1, 'C')
+        self.pdf.cell(0, 3, self.pdf.identite.mention_bas, 0, 1, 'C')
+        
+        return y
+    
+    def _ajouter_qr_paiement(self, y):
+        """Ajoute le QR code EPC du virement (montant TTC et numéro de la
+        facture), à gauche des totaux ; omis s'il manque la place
+        
+        Args:
+            y (int): Position Y de départ des totaux
+        """
+        y = max(y, 180)  # Même hauteur que les totaux
+        cote = min(30, 262 - y)  # Au-dessus des mentions en bas de page
+        total_ttc = self.total_ht + self.total_ht * self.tva
+        if cote < 20 or round(total_ttc, 2) < 0.01:
+            return
+        identite = self.pdf.identite
+        charge = charge_epc(identite.titulaire, identite.iban, f"{total_ttc:.2f}",
+                            f"Facture {self.donnees['num_commande']}", identite.bic)
+        self.pdf.set_fill_color(*self.couleurs.texte)
+        self.pdf.qr_code(charge, 15, y, cote)
+        
+        # Légende à droite du QR code
+        x = 15 + cote + 4
+        self.pdf.set_font('DejaVu', 'B', 8)
+        self.pdf.set_text_color(*self.couleurs.principale)
+        self.pdf.set_xy(x, y)
+        self.pdf.cell(0, 4, 'Paiement par virement', 0, 1, 'L')
+        self.pdf.set_font('DejaVu', '', 7)
+        self.pdf.set_text_color(*self.couleurs.secondaire)
+        iban = ' '.join(identite.iban[i:i + 4] for i in range(0, len(identite.iban), 4))
+        lignes = ['Scannez ce code avec votre', 'application bancaire', '',
+                  identite.titulaire, f"IBAN {iban}"]
+        if identite.bic:
+            lignes.append(f"BIC {identite.bic}")
+        for ligne in lignes:
+            self.pdf.set_x(x)
+            self.pdf.cell(0, 3.5, ligne, 0, 1, 'L')
     
     def ouvrir_facture(self, nom_fichier):
         """Ouvre la facture avec le visualiseur par défaut"""
@@ -924,82 +1320,90 @@ class FactureMouvementAbsolu:
     def _ajouter_en_tete(self, y):
         """Ajoute l'en-tête de la facture avec le logo et les informations de l'entreprise"""
         # Titre de la facture
-        self.pdf.set_xy(self.MARGIN_LEFT, y)
+        self.pdf.set_xy(self.marges.gauche, y)
         self.pdf.set_font('DejaVu', 'B', 18)  # Réduit de 20 à 18
-        self.pdf.set_text_color(*self.BLEU_MAIN)
-        self.pdf.cell(0, 12, 'FACTURE', 0, 1, 'L')  # Réduit la hauteur de 15 à 12
+        self.pdf.set_text_color(*self.couleurs.principale)
+        self.pdf.cell(0, 12, self.TITRE, 0, 1, 'L')  # Réduit la hauteur de 15 à 12
         
         # Ligne de séparation
-        self.pdf.set_draw_color(*self.BLEU_MAIN)
+        self.pdf.set_draw_color(*self.couleurs.principale)
         self.pdf.set_line_width(0.8)
-        self.pdf.line(self.MARGIN_LEFT, y + 18, self.MARGIN_LEFT + 60, y + 18)
+        self.pdf.line(self.marges.gauche, y + 18, self.marges.gauche + 60, y + 18)
         
         # Informations de l'entreprise (taille de police réduite et espacement)
         self.pdf.set_font('DejaVu', 'B', 9)  # Réduit de 10 à 9
-        self.pdf.set_text_color(*self.NOIR)
-        self.pdf.set_xy(self.MARGIN_LEFT, y + 22)  # Ajusté de 25 à 22
-        self.pdf.cell(0, 4, 'Atelier S-MOD', 0, 1, 'L')  # Réduit de 5 à 4
-        self.pdf.set_x(self.MARGIN_LEFT)
-        self.pdf.cell(0, 4, '123 Rue de l\'Horlogerie', 0, 1, 'L')
-        self.pdf.set_x(self.MARGIN_LEFT)
-        self.pdf.cell(0, 4, '75001 Paris, France', 0, 1, 'L')
+        self.pdf.set_text_color(*self.couleurs.texte)
+        self.pdf.set_y(y + 22)  # Ajusté de 25 à 22
+        for ligne in self.pdf.identite.coordonnees:
+            self.pdf.set_x(self.marges.gauche)
+            self.pdf.cell(0, 4, ligne, 0, 1, 'L')  # Réduit de 5 à 4
         self.pdf.ln(3)  # Réduit de 5 à 3
         
         # Informations de contact (taille de police réduite et espacement)
         self.pdf.set_font('DejaVu', '', 8)  # Réduit de 9 à 8
-        self.pdf.set_text_color(*self.GRIS_FONCE)
-        self.pdf.set_x(self.MARGIN_LEFT)
-        self.pdf.cell(0, 3, 'Tél: +33 1 23 45 67 89', 0, 1, 'L')  # Réduit de 4 à 3
-        self.pdf.set_x(self.MARGIN_LEFT)
-        self.pdf.cell(0, 3, 'Email: contact@atelier-s-mod.fr', 0, 1, 'L')
-        self.pdf.set_x(self.MARGIN_LEFT)
-        self.pdf.cell(0, 3, 'SIRET: 123 456 789 00012', 0, 1, 'L')
+        self.pdf.set_text_color(*self.couleurs.secondaire)
+        for ligne in self.pdf.identite.contact:
+            self.pdf.set_x(self.marges.gauche)
+            self.pdf.cell(0, 3, ligne, 0, 1, 'L')  # Réduit de 4 à 3
         
         return y + 80  # Retourne la nouvelle position Y
     
     def _ajouter_infos_facture(self, x, y, largeur):
         """Ajoute les informations de facturation (n° de facture, date, etc.)"""
         # Cadre autour des informations (hauteur réduite)
-        self.pdf.set_draw_color(*self.GRIS_CLAIR)
-        self.pdf.set_fill_color(*self.BLEU_CLAIR)
+        self.pdf.set_draw_color(*self.couleurs.separateur)
+        self.pdf.set_fill_color(*self.couleurs.claire)
         self.pdf.rect(x, y, largeur, 35, 'DF')  # Hauteur réduite de 40 à 35
         
         # Titre de la section (taille de police réduite)
         self.pdf.set_font('DejaVu', 'B', 9)  # Réduit de 10 à 9
-        self.pdf.set_text_color(*self.BLEU_MAIN)
+        self.pdf.set_text_color(*self.couleurs.principale)
         self.pdf.set_xy(x + 5, y + 3)  # Ajustement vertical
-        self.pdf.cell(0, 4, 'FACTURE N°', 0, 1, 'L')  # Hauteur réduite de 5 à 4
+        self.pdf.cell(0, 4, f'{self.TITRE} N°', 0, 1, 'L')  # Hauteur réduite de 5 à 4
         
         # Numéro de facture (taille de police réduite)
         self.pdf.set_font('DejaVu', 'B', 11)  # Réduit de 12 à 11
-        self.pdf.set_text_color(*self.NOIR)
+        self.pdf.set_text_color(*self.couleurs.texte)
         self.pdf.set_xy(x + 5, y + 9)  # Ajustement vertical
         self.pdf.cell(0, 5, self.donnees['num_commande'], 0, 1, 'L')  # Hauteur réduite de 7 à 5
         
         # Date de facturation (taille de police réduite)
         self.pdf.set_font('DejaVu', '', 8)  # Réduit de 9 à 8
-        self.pdf.set_text_color(*self.GRIS_FONCE)
+        self.pdf.set_text_color(*self.couleurs.secondaire)
         self.pdf.set_xy(x + 5, y + 20)  # Ajustement vertical (25 -> 20)
         self.pdf.cell(0, 4, f'Date: {self.donnees["date_facture"]}', 0, 1, 'L')  # Hauteur réduite de 5 à 4
+        self.pdf.set_xy(x + 5, y + 25)
+        self.pdf.cell(0, 4, self._ligne_echeance(), 0, 1, 'L')
+        if self.donnees.get('num_devis'):
+            self.pdf.set_xy(x + 5, y + 30)
+            self.pdf.cell(0, 4, f"Devis: {self.donnees['num_devis']}", 0, 1, 'L')
         
         return y + 45  # Retourne la nouvelle position Y
     
+    def _ligne_echeance(self):
+        """Ligne d'échéance du cadre d'informations"""
+        return f'Échéance: {self.echeance}'
+    
+    def _mention_paiement(self):
+        """Conditions de règlement imprimées au bas de la page"""
+        return f"{self.conditions_paiement} par virement bancaire"
+    
     def _ajouter_infos_client(self, x, y, largeur):
         """Ajoute les informations du client"""
         # Cadre autour des informations client (hauteur réduite)
-        self.pdf.set_draw_color(*self.GRIS_CLAIR)
-        self.pdf.set_fill_color(*self.BLEU_CLAIR)
+        self.pdf.set_draw_color(*self.couleurs.separateur)
+        self.pdf.set_fill_color(*self.couleurs.claire)
         self.pdf.rect(x, y, largeur, 50, 'DF')  # Hauteur réduite de 60 à 50
         
         # Titre de la section (taille de police réduite)
         self.pdf.set_font('DejaVu', 'B', 9)  # Réduit de 10 à 9
-        self.pdf.set_text_color(*self.BLEU_MAIN)
+        self.pdf.set_text_color(*self.couleurs.principale)
         self.pdf.set_xy(x + 5, y + 3)  # Ajustement vertical
-        self.pdf.cell(0, 4, 'FACTURER À', 0, 1, 'L')  # Hauteur réduite de 5 à 4
+        self.pdf.cell(0, 4, self.DESTINATAIRE, 0, 1, 'L')  # Hauteur réduite de 5 à 4
         
         # Informations du client (taille de police réduite)
         self.pdf.set_font('DejaVu', 'B', 9)  # Réduit de 10 à 9
-        self.pdf.set_text_color(*self.NOIR)
+        self.pdf.set_text_color(*self.couleurs.texte)
         self.pdf.set_xy(x + 5, y + 12)  # Ajustement vertical
         self.pdf.cell(0, 4, self.donnees['client_nom'], 0, 1, 'L')  # Hauteur réduite
         
@@ -1027,22 +1431,67 @@ class FactureMouvementAbsolu:
         
         return y + 55  # Retourne la nouvelle position Y (65 -> 55)
     
+    @classmethod
+    def chemin_pdf(cls, num_commande):
+        """Chemin du PDF d'un document de ce type"""
+        return f"factures/{cls.PREFIXE_FICHIER}_{num_commande}.pdf"
+
+    @property
+    def nom_fichier(self):
+        """Chemin du PDF, basé sur la référence de commande"""
+        return self.chemin_pdf(self.donnees['num_commande'])
+    
     def generer_facture(self):
         """Génère la facture au format PDF"""
         # Création du dossier factures s'il n'existe pas
-        if not os.path.exists('factures'):
-            os.makedirs('factures')
+        nom_fichier = self.nom_fichier
+        assurer_dossier(os.path.dirname(nom_fichier))
         
-        # Nom du fichier basé sur la référence de commande
-        nom_fichier = f"factures/facture_{self.donnees['num_commande']}.pdf"
+        # Mise en page puis enregistrement du fichier (au fil des pages en
+        # mode flux)
+        if self.flux:
+            try:
+                self._mettre_en_page(flux=nom_fichier)
+                self.pdf.output()
+            except BaseException:
+                self.pdf.abandonner()
+                if os.path.exists(nom_fichier):
+                    os.remove(nom_fichier)
+                raise
+        else:
+            self._mettre_en_page()
+            self.pdf.output(nom_fichier)
+        self._archiver(nom_fichier)
+        return nom_fichier
+
+    def rendre_pdf(self):
+        """Met en page la facture et retourne le PDF en mémoire, sans
+        l'enregistrer ni l'ajouter au registre (aperçu, tests)"""
+        self._mettre_en_page()
+        return bytes(self.pdf.output())
+
+    def _date_creation(self):
+        """Date de création inscrite dans les métadonnées du PDF"""
+        if self.deterministe:
+            date_facture = self.donnees.get('date_facture') or '01/01/2000'
+            return datetime.strptime(date_facture, '%d/%m/%Y').replace(tzinfo=timezone.utc)
+        return self.horloge().astimezone(timezone.utc)
+
+    def _mettre_en_page(self, flux=None):
+        """Dessine toutes les sections de la facture dans self.pdf
         
-        # Initialisation du PDF
-        self.pdf = PDF()
-        self.pdf.add_page()
+        Args:
+            flux (str, optional): Fichier où écrire les pages au fil de l'eau
+        """
+        # Initialisation du PDF (PDF() ajoute déjà la première page)
+        self.pdf = PDF(date_creation=self._date_creation(), flux=flux, identite=self._identite())
+        # Les sauts de page sont gérés par le tableau des articles : les
+        # mentions en bas de page ne doivent pas en provoquer
+        self.pdf.set_auto_page_break(False, margin=0)
         
         # Définition des marges et largeur de page
-        page_width = self.pdf.w - self.MARGIN_LEFT - self.MARGIN_RIGHT
-        y = self.MARGIN_TOP
+        page_width = self.pdf.w - self.marges.gauche - self.marges.droite
+        y = self.marges.haut
         
         # En-tête de la facture
         y = self._ajouter_en_tete(y)
@@ -1052,74 +1501,526 @@ class FactureMouvementAbsolu:
         
         # Section informations de facturation (à gauche)
         y = max(y, self._ajouter_infos_facture(
-            self.MARGIN_LEFT, y, largeur_col
+            self.marges.gauche, y, largeur_col
         ))
         
         # Section client (à droite)
         y = max(y, self._ajouter_infos_client(
-            self.MARGIN_LEFT + largeur_col + 20, 
-            self.MARGIN_TOP + 20, 
+            self.marges.gauche + largeur_col + 20, 
+            self.marges.haut + 20, 
             largeur_col
         ))
         
         # Ajout du tableau des articles
         y = self._ajouter_tableau_articles(y, page_width)
         
-        # Ajout des totaux
+        # Ajout des totaux, et du QR code de paiement à leur gauche
+        if self.QR_PAIEMENT and self.pdf.identite.iban:
+            self._ajouter_qr_paiement(y)
         y = self._ajouter_totaux(y, page_width)
         
         # Ajout des mentions légales
         self._ajouter_mentions_legales(y, page_width)
         
-        # Enregistrement du fichier
-        self.pdf.output(nom_fichier)
-        return nom_fichier
+        # Données structurées, tirées des mêmes donnees et articles
+        if self.facturx and self.TYPE_FACTURX:
+            joindre_facturx(self.pdf, self)
 
-    def main():
-        print_header()
-        print(f"  {Color.BLUE}Créez des factures professionnelles pour vos montres{Color.RESET}\n")
-        print(f"  {Color.GRAY}Ce programme vous guide pas à pas pour créer une facture détaillée.{Color.RESET}\n")
+    def _archiver(self, nom_fichier):
+        """Enregistre la facture générée : registre des ventes, comptes clients,
+        annuaire, recherche, et devis d'origine"""
+        from facture_clients import enregistrer_client
+        from facture_comptes import inscrire_facture
+        from facture_recherche import indexer_facture
+        journaliser(self)
+        inscrire_facture(self)
+        enregistrer_client(self.donnees)
+        indexer_facture(self)
+        if self.donnees.get('num_devis'):
+            from facture_devis import marquer_converti
+            marquer_converti(self.donnees['num_devis'], self.donnees['num_commande'])
+
+
+def saisie_interactive():
+    """Saisie guidée d'une facture dans le terminal"""
+    print_header()
+    print(f"  {Color.BLUE}Créez des factures professionnelles pour vos montres{Color.RESET}\n")
+    print(f"  {Color.GRAY}Ce programme vous guide pas à pas pour créer une facture détaillée.{Color.RESET}\n")
+    
+    # Délai d'attente pour l'effet de démarrage
+    import time
+    print(f"  {Color.GRAY}Chargement...{Color.RESET}", end="\r")
+    time.sleep(0.5)
         
-        # Délai d'attente pour l'effet de démarrage
-        import time
-        print(f"  {Color.GRAY}Chargement...{Color.RESET}", end="\r")
-        time.sleep(0.5)
+    facture = FactureMouvementAbsolu({})
+    
+    # Démarrer la saisie des articles
+    facture.demander_articles()
+    
+    # Vérifier si des articles ont été ajoutés
+    if not facture.articles:
+        print_error("Aucun article n'a été ajouté. La facture n'a pas été créée.")
+        return
+    
+    # Générer le PDF
+    try:
+        print_section("Génération de la facture")
+        
+        # Animation de chargement
+        print(f"  {Color.GRAY}Génération en cours ", end="", flush=True)
+        for _ in range(3):
+            time.sleep(0.3)
+            print(f"{Color.GRAY}.{Color.RESET}", end="", flush=True)
+        print("\r", end="")
+        
+        # Génération de la facture
+        nom_fichier = facture.generer_facture()
+        
+        # Affichage du succès
+        print(f"  {Color.GREEN}✓ Facture générée avec succès{Color.RESET}\n")
+        print(f"  {Color.BOLD}Emplacement :{Color.RESET}")
+        print(f"  {Color.CYAN}→{Color.RESET} {os.path.abspath(nom_fichier)}\n")
+        
+        # Demander si on veut ouvrir le PDF
+        if input_style("\nOuvrir la facture ? (o/n)").lower() in ('o', 'oui'):
+            facture.ouvrir_facture(nom_fichier)
             
-        facture = FactureMouvementAbsolu()
-        
-        # Démarrer la saisie des articles
-        facture.demander_articles()
-        
-        # Vérifier si des articles ont été ajoutés
-        if not facture.articles:
-            print_error("Aucun article n'a été ajouté. La facture n'a pas été créée.")
+    except Exception as e:
+        print_error(f"Une erreur est survenue : {str(e)}")
+
+
+def afficher_rapport(par='mois', top=0, chemin=CHEMIN_REGISTRE):
+    """Affiche les totaux agrégés du registre des factures"""
+    registre = Registre.charger(chemin)
+    if not len(registre):
+        print_warning("Aucune facture dans le registre.")
+        return
+
+    print_section(f"Totaux par {par}")
+    print(f"  {Color.BOLD}{'':30} {'HT':>12} {'TVA':>12} {'TTC':>12}{Color.RESET}")
+    for libelle, (ht, tva, ttc) in sorted(registre.totaux_par(par).items()):
+        print(f"  {libelle[:30]:30} {ht:12.2f} {tva:12.2f} {ttc:12.2f}")
+
+    if top:
+        print_section("Modèles les plus vendus")
+        for modele, quantite, ht in registre.top_modeles(top):
+            print_item(modele, f"{quantite} vendus, {ht:.2f} € HT", indent=2)
+
+    print_item("Coût moyen d'un composant", f"{registre.cout_moyen_composant():.2f} €")
+
+
+def executer_travaux(args):
+    """Actions de la sous-commande travaux"""
+    import facture_travaux
+    from facture_schema import CommandesInvalides
+
+    base = args.base or facture_travaux.CHEMIN_TRAVAUX
+    if args.action == 'ajouter':
+        try:
+            nouveaux, deja = facture_travaux.enregistrer_lot(args.fichier, base)
+        except CommandesInvalides as e:
+            print_error(e.args[0])
             return
-        
-        # Générer le PDF
+        print_success(f"{nouveaux} travaux enregistrés ({deja} déjà présents)")
+    elif args.action == 'executer':
+        facture_travaux.lancer_travailleurs(args.processus, base, args.attendre)
+    file = facture_travaux.FileTravaux(base)
+    try:
+        if args.action == 'rejouer':
+            print_success(f"{file.rejouer()} travaux remis en attente")
+        print_section("File de travaux")
+        for etat, nombre in file.etat().items():
+            print_item(etat, str(nombre))
+        for num_commande, essais, erreur in file.lettres_mortes():
+            print_warning(f"{num_commande} ({essais} essais) : {erreur}")
+    finally:
+        file.fermer()
+
+
+def executer_catalogue(args):
+    """Actions de la sous-commande catalogue"""
+    from facture_catalogue import CHEMIN_CATALOGUE, Catalogue
+
+    catalogue = Catalogue(args.base or CHEMIN_CATALOGUE)
+    try:
+        if args.action == 'importer':
+            nombre = catalogue.importer_csv(args.fichier)
+            print_success(f"{nombre} composants importés ({len(catalogue)} au catalogue)")
+        else:
+            for composant in catalogue.rechercher(args.texte, args.categorie, args.limite):
+                print_item(f"{composant.nom} · {composant.reference}", f"{composant.prix:.2f} EUR")
+    finally:
+        catalogue.fermer()
+
+
+def executer_clients(args):
+    """Actions de la sous-commande clients"""
+    from facture_clients import CHEMIN_ANNUAIRE, Annuaire
+
+    annuaire = Annuaire(args.base or CHEMIN_ANNUAIRE)
+    try:
+        if args.action == 'importer':
+            nombre = annuaire.importer_csv(args.fichier)
+            print_success(f"{nombre} clients importés ({len(annuaire)} dans l'annuaire)")
+        else:
+            for client in annuaire.rechercher(args.texte, args.limite):
+                print_item(client.nom, f"{client.adresse}, {client.cp} {client.ville}")
+    finally:
+        annuaire.fermer()
+
+
+def afficher_recherche(texte, page=1, par_page=20):
+    """Affiche une page de résultats de la recherche dans les factures"""
+    from facture_recherche import rechercher_factures
+
+    resultats = rechercher_factures(texte, page, par_page)
+    print_section(f"{resultats.total} factures trouvées (page {page}/{resultats.pages})")
+    for facture in resultats.factures:
+        print_item(facture.num_commande,
+                   f"{facture.date}  {facture.client}  {facture.total_ttc:.2f} EUR")
+        print(f"    {Color.GRAY}{facture.extrait}{Color.RESET}")
+
+
+def executer_rapprochement(releves):
+    """Rapproche des relevés bancaires et affiche le bilan"""
+    from facture_comptes import Comptes
+    from facture_rapprochement import rapprocher
+
+    bilan = rapprocher(releves)
+    print_section("Rapprochement bancaire")
+    print_item("Crédits lus", str(bilan.lues))
+    print_item("Déjà traités", str(bilan.deja_traitees))
+    print_item("Rapprochés", str(bilan.rapprochees))
+    print_item("Factures soldées", str(bilan.factures_soldees))
+    for operation in bilan.non_rapprochees:
+        print_warning(f"{operation.date} {operation.montant / 100:.2f} EUR : {operation.libelle}")
+    for operation, excedent in bilan.excedents:
+        print_warning(f"{operation.date} trop-perçu de {excedent / 100:.2f} EUR non imputé "
+                      f"(sur {operation.montant / 100:.2f} EUR) : {operation.libelle}")
+    comptes = Comptes()
+    try:
+        print_section("Factures")
+        for statut, (nombre, reste) in comptes.etat().items():
+            print_item(statut, f"{nombre} ({(reste or 0) / 100:.2f} EUR restant dus)")
+    finally:
+        comptes.fermer()
+
+
+def afficher_echeances(date_reference=None, retards=20):
+    """Affiche la balance âgée des créances et les plus anciens retards"""
+    from facture_comptes import Comptes
+
+    jour = (datetime.strptime(date_reference, '%d/%m/%Y') if date_reference else datetime.now()).date()
+    comptes = Comptes()
+    try:
+        print_section(f"Balance âgée au {jour.strftime('%d/%m/%Y')}")
+        for tranche, (nombre, reste) in comptes.balance_agee(jour).items():
+            libelle = 'non échu' if tranche == 'non echu' else f"{tranche} jours"
+            print_item(libelle, f"{nombre} factures, {reste / 100:.2f} EUR")
+        if retards:
+            print_section("Retards de paiement")
+            for num_commande, client, echeance, reste in comptes.en_retard(jour, retards):
+                jours = (jour - datetime.strptime(echeance, '%Y-%m-%d').date()).days
+                print_item(num_commande, f"{client} - {reste / 100:.2f} EUR, {jours} jours de retard")
+    finally:
+        comptes.fermer()
+
+
+def generer_releves_mois(mois=None, client=None):
+    """Génère les relevés de compte d'un mois (tous les clients par défaut)"""
+    from facture_releves import generer_releves
+
+    mois = mois or datetime.now().strftime('%Y-%m')
+    chemins = generer_releves(mois, client)
+    for chemin in chemins:
+        print_item(os.path.basename(chemin), chemin)
+    print_success(f"{len(chemins)} relevés générés pour {mois}")
+
+
+def executer_devis(args):
+    """Actions de la sous-commande devis"""
+    import facture_devis
+    from facture_schema import CommandesInvalides
+
+    if args.action == 'creer':
         try:
-            print_section("Génération de la facture")
-            
-            # Animation de chargement
-            print(f"  {Color.GRAY}Génération en cours ", end="", flush=True)
-            for _ in range(3):
-                time.sleep(0.3)
-                print(f"{Color.GRAY}.{Color.RESET}", end="", flush=True)
-            print("\r", end="")
-            
-            # Génération de la facture
-            nom_fichier = facture.generer_facture()
-            
-            # Affichage du succès
-            print(f"  {Color.GREEN}✓ Facture générée avec succès{Color.RESET}\n")
-            print(f"  {Color.BOLD}Emplacement :{Color.RESET}")
-            print(f"  {Color.CYAN}→{Color.RESET} {os.path.abspath(nom_fichier)}\n")
-            
-            # Demander si on veut ouvrir le PDF
-            if input_style("\nOuvrir la facture ? (o/n)").lower() in ('o', 'oui'):
-                facture.ouvrir_facture(nom_fichier)
-                
-        except Exception as e:
-            print_error(f"Une erreur est survenue : {str(e)}")
+            lot = facture_devis.charger_devis(args.fichier)
+        except CommandesInvalides as e:
+            print_error(e.args[0])
+            return
+        for devis in lot:
+            nom_fichier = devis.generer_facture()
+            print_item(devis.donnees['num_commande'], nom_fichier)
+        return
+    if args.action == 'convertir':
+        chemins = []
+        for num_devis in args.numeros:
+            try:
+                chemins.append(facture_devis.convertir_devis(num_devis))
+            except (KeyError, ValueError) as e:
+                print_error(e.args[0])
+        if args.acceptes:
+            from facture_lot import LotIncomplet
+            try:
+                chemins += facture_devis.convertir_acceptes(args.processus)
+            except LotIncomplet as e:
+                print_error(e.args[0])
+                chemins += e.chemins
+        print_success(f"{len(chemins)} factures générées dans le dossier factures")
+        return
+    carnet = facture_devis.CarnetDevis()
+    try:
+        if args.action in ('accepter', 'refuser'):
+            statut = 'accepte' if args.action == 'accepter' else 'refuse'
+            nombre = 0
+            for num_devis in args.numeros:
+                try:
+                    carnet.changer_statut(num_devis, statut)
+                    nombre += 1
+                except (KeyError, ValueError) as e:
+                    print_error(e.args[0])
+            print_success(f"{nombre} devis {'acceptés' if statut == 'accepte' else 'refusés'}")
+        else:
+            print_section("Devis")
+            for num_devis, date, client, total_ht, statut, num_commande in carnet.liste(args.statut):
+                facture = f" -> {num_commande}" if statut == 'converti' else ''
+                print_item(num_devis, f"{date}  {client}  {total_ht / 100:.2f} EUR HT  {statut}{facture}")
+    finally:
+        carnet.fermer()
+
+
+def executer_avoirs(args):
+    """Actions de la sous-commande avoirs"""
+    from facture_comptes import Comptes
+
+    if args.action in ('creer', 'emettre'):
+        import facture_avoirs
+        try:
+            if args.action == 'creer':
+                avoirs = facture_avoirs.charger_avoirs(args.fichier)
+            else:
+                avoirs = facture_avoirs.preparer_avoirs([{
+                    'num_facture': args.facture, 'montant_ht': args.montant, 'motif': args.motif,
+                }])
+        except (KeyError, ValueError) as e:
+            print_error(e.args[0])
+            return
+        for avoir in avoirs:
+            print_item(f"{avoir.donnees['num_commande']} ({avoir.donnees['num_facture']})",
+                       avoir.generer_facture())
+        return
+    comptes = Comptes()
+    try:
+        if args.facture:
+            solde = comptes.solde_facture(args.facture)
+            if solde is None:
+                print_error(f"Facture inconnue des comptes : {args.facture}")
+                return
+            print_section(f"Facture {args.facture}")
+            for num_avoir, date, ttc in comptes.avoirs(args.facture):
+                print_item(num_avoir, f"{date}  {ttc / 100:.2f} EUR TTC")
+        else:
+            solde = comptes.solde_client(args.client)
+            print_section(f"{args.client} : {solde.factures} factures")
+        print_item("Facturé TTC", f"{solde.ttc / 100:.2f} EUR")
+        print_item("Avoirs", f"{solde.avoirs / 100:.2f} EUR")
+        print_item("Réglé", f"{solde.regle / 100:.2f} EUR")
+        print_item("Reste dû", f"{solde.reste / 100:.2f} EUR")
+    finally:
+        comptes.fermer()
+
+
+def mois_argument(valeur):
+    """Valide un mois AAAA-MM passé en option (--mois)"""
+    try:
+        return datetime.strptime(valeur, '%Y-%m').strftime('%Y-%m')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"mois invalide : {valeur!r} (attendu : AAAA-MM)") from None
+
+
+def main(argv=None):
+    """Point d'entrée de la ligne de commande"""
+    parser = argparse.ArgumentParser(description="Générateur de factures Seiko Mod")
+    commandes = parser.add_subparsers(dest='commande')
+
+    rapport = commandes.add_parser('rapport', help="Totaux HT/TVA/TTC agrégés")
+    rapport.add_argument('--par', choices=AXES, default='mois',
+                         help="Axe d'agrégation (défaut : mois)")
+    rapport.add_argument('--top', type=int, default=0, metavar='N',
+                         help="Affiche aussi les N modèles les plus vendus")
+    rapport.add_argument('--registre', default=CHEMIN_REGISTRE,
+                         help="Chemin du journal des factures")
+
+    lot = commandes.add_parser('lot', help="Génère les factures d'un fichier JSON Lines")
+    lot.add_argument('fichier', help="Une facture par ligne (données client et articles)")
+    lot.add_argument('--facturx', action='store_true',
+                     help="Joint à chaque PDF ses données Factur-X (XML CII)")
+    lot.add_argument('--processus', type=int, default=None, metavar='N',
+                     help="Nombre de processus de rendu (défaut : un par cœur)")
+    lot.add_argument('--signer', metavar='CERTIFICAT', default=None,
+                     help="Signe chaque PDF (fichier .p12 ou PEM ; mot de passe : "
+                          "variable FACTURE_SIGNATURE_MOT_DE_PASSE)")
+
+    signer = commandes.add_parser('signer', help="Signe des factures PDF existantes")
+    signer.add_argument('fichiers', nargs='+', help="PDF à signer (ceux déjà signés sont ignorés)")
+    signer.add_argument('--certificat', default=None,
+                        help="Fichier .p12 ou PEM (défaut : variable FACTURE_SIGNATURE)")
+    signer.add_argument('--processus', type=int, default=None, metavar='N',
+                        help="Nombre de processus de signature (défaut : un par cœur)")
+
+    surveiller = commandes.add_parser('surveiller',
+                                      help="Génère les factures des commandes déposées dans un dossier")
+    surveiller.add_argument('dossier', help="Dossier d'entrée des fichiers de commande JSON")
+    surveiller.add_argument('--processus', type=int, default=None, metavar='N',
+                            help="Nombre de processus de rendu (défaut : un par cœur)")
+    surveiller.add_argument('--delai', type=float, default=0.5,
+                            help="Secondes sans modification avant de traiter un fichier")
+    surveiller.add_argument('--sondage', action='store_true',
+                            help="Lit le dossier périodiquement au lieu d'utiliser inotify")
+
+    travaux = commandes.add_parser('travaux', help="File de travaux durable")
+    travaux.add_argument('--base', default=None, help="Chemin de la base de la file")
+    actions = travaux.add_subparsers(dest='action', required=True)
+    ajouter = actions.add_parser('ajouter', help="Enregistre les factures d'un fichier JSON Lines")
+    ajouter.add_argument('fichier')
+    executer = actions.add_parser('executer', help="Produit les factures en attente")
+    executer.add_argument('--processus', type=int, default=None, metavar='N',
+                          help="Nombre de processus de rendu (défaut : un par cœur)")
+    executer.add_argument('--attendre', action='store_true',
+                          help="Attend les nouveaux travaux au lieu de s'arrêter")
+    actions.add_parser('etat', help="Nombre de travaux par état et lettres mortes")
+    actions.add_parser('rejouer', help="Remet en attente les travaux en lettre morte")
+
+    catalogue = commandes.add_parser('catalogue', help="Catalogue des composants")
+    catalogue.add_argument('--base', default=None, help="Chemin de la base du catalogue")
+    actions = catalogue.add_subparsers(dest='action', required=True)
+    importer = actions.add_parser('importer', help="Importe un CSV (categorie, reference, prix)")
+    importer.add_argument('fichier')
+    chercher = actions.add_parser('chercher', help="Composants commençant par un texte")
+    chercher.add_argument('texte')
+    chercher.add_argument('--categorie', default=None, help="Mouvement, Cadran, Boîtier...")
+    chercher.add_argument('--limite', type=int, default=10, metavar='N')
+
+    clients = commandes.add_parser('clients', help="Annuaire des clients")
+    clients.add_argument('--base', default=None, help="Chemin de la base de l'annuaire")
+    actions = clients.add_subparsers(dest='action', required=True)
+    importer = actions.add_parser('importer', help="Importe un CSV (nom, adresse, cp, ville)")
+    importer.add_argument('fichier')
+    chercher = actions.add_parser('chercher', help="Clients dont le nom ou la ville commencent par un texte")
+    chercher.add_argument('texte')
+    chercher.add_argument('--limite', type=int, default=10, metavar='N')
+
+    recherche = commandes.add_parser('rechercher', aliases=['search'],
+                                     help="Recherche dans les factures émises")
+    recherche.add_argument('texte', help="Client, modèle, référence, composant...")
+    recherche.add_argument('--page', type=int, default=1)
+    recherche.add_argument('--par-page', type=int, default=20, metavar='N')
+
+    rapprochement = commandes.add_parser('rapprocher',
+                                         help="Impute les virements d'un relevé CSV aux factures")
+    rapprochement.add_argument('releves', nargs='+', help="Relevés CSV, du plus ancien au plus récent")
+
+    echeances = commandes.add_parser('echeances', help="Balance âgée et retards de paiement")
+    echeances.add_argument('--date', default=None, metavar='JJ/MM/AAAA',
+                           help="Date de calcul des retards (défaut : aujourd'hui)")
+    echeances.add_argument('--retards', type=int, default=20, metavar='N',
+                           help="Nombre de factures en retard listées")
+
+    releves = commandes.add_parser('releves', help="Relevés de compte mensuels des clients")
+    releves.add_argument('--mois', type=mois_argument, default=None, metavar='AAAA-MM',
+                         help="Mois du relevé (défaut : mois en cours)")
+    releves.add_argument('--client', default=None, metavar='NOM',
+                         help="Un seul client (défaut : tous les clients)")
+
+    devis = commandes.add_parser('devis', help="Devis : création, acceptation, conversion en factures")
+    actions = devis.add_subparsers(dest='action', required=True)
+    creer = actions.add_parser('creer', help="Génère les devis d'un fichier JSON Lines")
+    creer.add_argument('fichier', help="Un devis par ligne (données client et articles)")
+    liste = actions.add_parser('liste', help="Devis enregistrés, les plus récents d'abord")
+    liste.add_argument('--statut', choices=('emis', 'accepte', 'refuse', 'converti'), default=None)
+    for action, aide in (('accepter', "Marque des devis comme acceptés"),
+                         ('refuser', "Marque des devis comme refusés")):
+        actions.add_parser(action, help=aide).add_argument('numeros', nargs='+', metavar='DV-AAAAMM-NNNN')
+    convertir = actions.add_parser('convertir', help="Génère les factures de devis")
+    convertir.add_argument('numeros', nargs='*', metavar='DV-AAAAMM-NNNN')
+    convertir.add_argument('--acceptes', action='store_true',
+                           help="Convertit en lot tous les devis acceptés")
+    convertir.add_argument('--processus', type=int, default=None, metavar='N',
+                           help="Nombre de processus de rendu (défaut : un par cœur)")
+
+    avoirs = commandes.add_parser('avoirs', help="Avoirs : corrections de factures émises")
+    actions = avoirs.add_subparsers(dest='action', required=True)
+    creer = actions.add_parser('creer', help="Génère les avoirs d'un fichier JSON Lines")
+    creer.add_argument('fichier', help="Un avoir par ligne (num_facture, articles ou montant_ht)")
+    emettre = actions.add_parser('emettre', help="Avoir d'un montant HT sur une facture")
+    emettre.add_argument('facture', metavar='SM-AAAAMM-NNNN')
+    emettre.add_argument('--montant', type=float, required=True, help="Montant HT crédité")
+    emettre.add_argument('--motif', default='', help="Libellé imprimé sur l'avoir")
+    solde = actions.add_parser('solde', help="Solde d'une facture ou d'un client, avoirs déduits")
+    cible = solde.add_mutually_exclusive_group(required=True)
+    cible.add_argument('--facture', metavar='SM-AAAAMM-NNNN')
+    cible.add_argument('--client', metavar='NOM')
+
+    args = parser.parse_args(argv)
+    if args.commande == 'rapport':
+        afficher_rapport(args.par, args.top, args.registre)
+    elif args.commande == 'lot':
+        from facture_lot import LotIncomplet, charger_lot, generer_lot
+        from facture_schema import CommandesInvalides
+        from facture_signature import signataire
+        if args.signer:
+            try:
+                signataire(args.signer)  # avant l'attribution des numéros
+            except (OSError, RuntimeError, ValueError) as e:
+                print_error(f"Certificat de signature : {e}")
+                return
+        try:
+            factures = charger_lot(args.fichier)
+        except CommandesInvalides as e:
+            print_error(e.args[0])
+            return
+        try:
+            chemins = generer_lot(factures, args.processus, facturx=args.facturx,
+                                  certificat=args.signer)
+        except LotIncomplet as e:
+            print_error(e.args[0])
+            chemins = e.chemins
+        print_success(f"{len(chemins)} factures générées dans le dossier factures"
+                      + (" et signées" if args.signer else ""))
+    elif args.commande == 'signer':
+        from facture_signature import signer_fichiers
+        try:
+            signes = signer_fichiers(args.fichiers, args.certificat, args.processus)
+        except (OSError, RuntimeError, ValueError) as e:
+            print_error(f"Signature : {e}")
+            return
+        print_success(f"{signes} factures signées, {len(args.fichiers) - signes} déjà signées")
+    elif args.commande == 'surveiller':
+        from facture_surveillance import surveiller
+        print_success(f"Surveillance de {args.dossier} (Ctrl+C pour arrêter)")
+        surveillance = surveiller(args.dossier, args.processus, args.delai, args.sondage)
+        print_success(f"{surveillance.traitees} factures générées, {surveillance.echecs} échecs")
+    elif args.commande == 'travaux':
+        executer_travaux(args)
+    elif args.commande == 'catalogue':
+        executer_catalogue(args)
+    elif args.commande == 'clients':
+        executer_clients(args)
+    elif args.commande in ('rechercher', 'search'):
+        afficher_recherche(args.texte, args.page, args.par_page)
+    elif args.commande == 'rapprocher':
+        executer_rapprochement(args.releves)
+    elif args.commande == 'echeances':
+        afficher_echeances(args.date, args.retards)
+    elif args.commande == 'releves':
+        generer_releves_mois(args.mois, args.client)
+    elif args.commande == 'devis':
+        executer_devis(args)
+    elif args.commande == 'avoirs':
+        executer_avoirs(args)
+    else:
+        saisie_interactive()
+
 
-    if __name__ == "__main__":
-        main()
+if __name__ == "__main__":
+    main()
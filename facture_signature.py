@@ -0,0 +1,373 @@
+"""Signature électronique des factures (PAdES, niveau B-B)
+
+Chaque PDF reçoit une signature CAdES détachée (ETSI.CAdES.detached) dans
+un champ de signature invisible, à partir d'un certificat local : fichier
+PKCS#12 (.p12, .pfx) ou PEM contenant la clé privée et le certificat, et
+éventuellement la chaîne de certification. Le mot de passe éventuel est lu
+dans la variable d'environnement FACTURE_SIGNATURE_MOT_DE_PASSE.
+
+La signature est ajoutée par mise à jour incrémentale : les octets du PDF
+produit par fpdf sont conservés tels quels, et seuls le catalogue, la
+première page (annotation du champ), le champ, la signature, une table de
+références et un trailer sont écrits à la suite. Signer une facture coûte
+une empreinte SHA-256 du fichier et une opération de clé privée.
+
+La clé est lue et analysée une fois par processus (signataire()) ; la
+structure CMS est écrite directement en DER, à partir de parties
+précalculées (certificats, identifiant du signataire, attribut
+signingCertificateV2). Le paquet cryptography est requis.
+"""
+import functools
+import hashlib
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+    from cryptography.hazmat.primitives.serialization import pkcs12
+except ImportError:  # cryptography n'est requis que pour signer
+    x509 = None
+
+VARIABLE_SIGNATURE = 'FACTURE_SIGNATURE'
+VARIABLE_MOT_DE_PASSE = 'FACTURE_SIGNATURE_MOT_DE_PASSE'
+NOM_CHAMP = 'Signature'
+
+# Identifiants d'objets (OID)
+OID_DATA = '1.2.840.113549.1.7.1'
+OID_SIGNED_DATA = '1.2.840.113549.1.7.2'
+OID_CONTENT_TYPE = '1.2.840.113549.1.9.3'
+OID_MESSAGE_DIGEST = '1.2.840.113549.1.9.4'
+OID_SIGNING_CERTIFICATE_V2 = '1.2.840.113549.1.9.16.2.47'
+OID_SHA256 = '2.16.840.1.101.3.4.2.1'
+OID_SHA256_RSA = '1.2.840.113549.1.1.11'
+OID_SHA256_ECDSA = '1.2.840.10045.4.3.2'
+
+# Emplacement de /ByteRange, complété une fois la taille du fichier connue
+_PLAGES = b'[0 0000000000 0000000000 0000000000]'
+
+
+# --- Encodage DER -----------------------------------------------------------
+
+def _der(etiquette, contenu):
+    """Élément DER : étiquette, longueur, contenu"""
+    longueur = len(contenu)
+    if longueur < 0x80:
+        return bytes((etiquette, longueur)) + contenu
+    octets = longueur.to_bytes((longueur.bit_length() + 7) // 8, 'big')
+    return bytes((etiquette, 0x80 | len(octets))) + octets + contenu
+
+
+def _sequence(*elements):
+    return _der(0x30, b''.join(elements))
+
+
+def _ensemble(*elements):
+    """SET OF : éléments triés selon leur encodage (DER)"""
+    return _der(0x31, b''.join(sorted(elements)))
+
+
+def _entier(valeur):
+    return _der(0x02, valeur.to_bytes(valeur.bit_length() // 8 + 1, 'big', signed=True))
+
+
+def _octets(valeur):
+    return _der(0x04, valeur)
+
+
+def _oid(texte):
+    nombres = [int(n) for n in texte.split('.')]
+    contenu = bytearray((40 * nombres[0] + nombres[1],))
+    for nombre in nombres[2:]:
+        groupes = [nombre & 0x7F]
+        nombre >>= 7
+        while nombre:
+            groupes.append(0x80 | (nombre & 0x7F))
+            nombre >>= 7
+        contenu += bytes(reversed(groupes))
+    return _der(0x06, bytes(contenu))
+
+
+_ALGO_SHA256 = _sequence(_oid(OID_SHA256))
+
+
+# --- Signataire -------------------------------------------------------------
+
+class Signataire:
+    """Clé privée et certificats, avec les parties fixes de la signature CMS"""
+
+    def __init__(self, cle, certificat, chaine=()):
+        """
+        Args:
+            cle: Clé privée RSA ou EC (cryptography)
+            certificat (x509.Certificate): Certificat du signataire
+            chaine (iterable, optional): Certificats intermédiaires
+        """
+        if isinstance(cle, rsa.RSAPrivateKey):
+            self._algorithme = _sequence(_oid(OID_SHA256_RSA), b'\x05\x00')
+            self._signer = lambda donnees: cle.sign(donnees, padding.PKCS1v15(), hashes.SHA256())
+        elif isinstance(cle, ec.EllipticCurvePrivateKey):
+            self._algorithme = _sequence(_oid(OID_SHA256_ECDSA))
+            self._signer = lambda donnees: cle.sign(donnees, ec.ECDSA(hashes.SHA256()))
+        else:
+            raise ValueError(f"Clé de signature non prise en charge : {type(cle).__name__}")
+        self.certificat = certificat
+        noms = certificat.subject.get_attributes_for_oid(x509.NameOID.COMMON_NAME)
+        self.nom = noms[0].value if noms else certificat.subject.rfc4514_string()
+
+        certificat_der = certificat.public_bytes(serialization.Encoding.DER)
+        emetteur = certificat.issuer.public_bytes()
+        numero = _entier(certificat.serial_number)
+        self._certificats = _der(0xA0, certificat_der + b''.join(
+            autre.public_bytes(serialization.Encoding.DER) for autre in chaine))
+        self._identifiant = _sequence(emetteur, numero)
+        # ESSCertIDv2 : empreinte SHA-256 (algorithme par défaut) et
+        # émetteur du certificat
+        self._attribut_certificat = _sequence(
+            _oid(OID_SIGNING_CERTIFICATE_V2),
+            _ensemble(_sequence(_sequence(_sequence(
+                _octets(hashlib.sha256(certificat_der).digest()),
+                _sequence(_sequence(_der(0xA4, emetteur)), numero),
+            )))),
+        )
+        self._attribut_type = _sequence(_oid(OID_CONTENT_TYPE), _ensemble(_oid(OID_DATA)))
+        # Place réservée dans le PDF (la taille d'une signature ECDSA varie
+        # de quelques octets)
+        self.taille = len(self.signer(bytes(32))) + 16
+
+    def signer(self, empreinte):
+        """Signature CMS détachée (DER) d'une empreinte SHA-256"""
+        attributs = b''.join(sorted((
+            self._attribut_type,
+            _sequence(_oid(OID_MESSAGE_DIGEST), _ensemble(_octets(empreinte))),
+            self._attribut_certificat,
+        )))
+        # Les attributs signés sont encodés en SET pour la signature, et
+        # en [0] IMPLICIT dans la structure
+        signature = self._signer(_der(0x31, attributs))
+        signer_info = _sequence(
+            _entier(1), self._identifiant, _ALGO_SHA256, _der(0xA0, attributs),
+            self._algorithme, _octets(signature),
+        )
+        signed_data = _sequence(
+            _entier(1), _ensemble(_ALGO_SHA256), _sequence(_oid(OID_DATA)),
+            self._certificats, _ensemble(signer_info),
+        )
+        return _sequence(_oid(OID_SIGNED_DATA), _der(0xA0, signed_data))
+
+
+def charger_signataire(chemin, mot_de_passe=None):
+    """Lit un certificat de signature : PKCS#12 (.p12, .pfx) ou PEM
+
+    Raises:
+        RuntimeError: paquet cryptography absent
+        OSError: fichier illisible
+        ValueError: fichier, mot de passe ou clé invalides
+    """
+    if x509 is None:
+        raise RuntimeError("le paquet cryptography est requis pour signer les factures "
+                           "(pip install cryptography)")
+    with open(chemin, 'rb') as f:
+        contenu = f.read()
+    mot_de_passe = mot_de_passe.encode('utf-8') if mot_de_passe else None
+    try:
+        if chemin.lower().endswith(('.p12', '.pfx')):
+            cle, certificat, chaine = pkcs12.load_key_and_certificates(contenu, mot_de_passe)
+        else:
+            cle = serialization.load_pem_private_key(contenu, mot_de_passe)
+            certificats = x509.load_pem_x509_certificates(contenu)
+            publique = cle.public_key().public_bytes(serialization.Encoding.DER,
+                                                     serialization.PublicFormat.SubjectPublicKeyInfo)
+            certificat = next((c for c in certificats if c.public_key().public_bytes(
+                serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+                == publique), None)
+            chaine = [c for c in certificats if c is not certificat]
+    except (ValueError, TypeError) as erreur:
+        raise ValueError(f"{chemin} : {erreur}") from None
+    if cle is None or certificat is None:
+        raise ValueError(f"{chemin} : clé privée et certificat attendus")
+    return Signataire(cle, certificat, chaine or ())
+
+
+@functools.lru_cache(maxsize=4)
+def _signataire(chemin, signature, mot_de_passe):
+    return charger_signataire(chemin, mot_de_passe)
+
+
+def signataire(chemin=None):
+    """Signataire du processus : le certificat n'est lu et analysé qu'une
+    fois par processus (de nouveau s'il est remplacé)
+
+    Args:
+        chemin (str, optional): Certificat (défaut : FACTURE_SIGNATURE)
+    """
+    chemin = chemin or os.environ.get(VARIABLE_SIGNATURE)
+    if not chemin:
+        raise ValueError(f"Aucun certificat de signature (option ou variable {VARIABLE_SIGNATURE})")
+    info = os.stat(chemin)
+    return _signataire(os.path.abspath(chemin), (info.st_mtime_ns, info.st_size),
+                       os.environ.get(VARIABLE_MOT_DE_PASSE))
+
+
+# --- Mise à jour incrémentale -----------------------------------------------
+
+def _references(pdf, debut):
+    """Positions des objets d'une table de références classique"""
+    if not pdf.startswith(b'xref', debut):
+        raise ValueError("Table de références compressée non prise en charge")
+    positions = {}
+    lignes = iter(pdf[debut:pdf.index(b'trailer', debut)].split(b'\n')[1:])
+    for ligne in lignes:
+        if not ligne.strip():
+            continue
+        premier, nombre = map(int, ligne.split())
+        for numero in range(premier, premier + nombre):
+            entree = next(lignes).split()
+            if entree[2] == b'n':
+                positions[numero] = int(entree[0])
+    return positions
+
+
+def _objet(pdf, positions, numero):
+    """Dictionnaire d'un objet (sans flux) : << ... >>"""
+    debut = pdf.index(b'obj', positions[numero]) + 3
+    return pdf[debut:pdf.index(b'endobj', debut)].strip()
+
+
+def _completer(dictionnaire, entree):
+    """Ajoute une entrée à la fin d'un dictionnaire << ... >>"""
+    fin = dictionnaire.rindex(b'>>')
+    return dictionnaire[:fin] + entree.encode('latin-1') + b'\n' + dictionnaire[fin:]
+
+
+def signer_pdf(pdf, signataire, horloge=datetime.now):
+    """Signe un PDF par mise à jour incrémentale
+
+    Args:
+        pdf (bytes): PDF produit par fpdf (table de références classique)
+        signataire (Signataire): Voir signataire()
+        horloge (callable, optional): Date de signature (/M)
+
+    Returns:
+        bytes: PDF signé : le PDF d'origine suivi de la mise à jour
+
+    Raises:
+        ValueError: PDF déjà signé ou de structure non prise en charge
+    """
+    fin = pdf.rindex(b'startxref')
+    if b'/ByteRange' in pdf:
+        raise ValueError("PDF déjà signé")
+    debut_references = int(pdf[fin + 9:].split()[0])
+    trailer = pdf[pdf.rindex(b'trailer', 0, fin):fin]
+    racine = int(re.search(rb'/Root (\d+) 0 R', trailer)[1])
+    taille = int(re.search(rb'/Size (\d+)', trailer)[1])
+    positions = _references(pdf, debut_references)
+
+    catalogue = _objet(pdf, positions, racine)
+    if b'/AcroForm' in catalogue:
+        raise ValueError("PDF avec formulaire : non pris en charge")
+    pages = int(re.search(rb'/Pages (\d+) 0 R', catalogue)[1])
+    page = int(re.search(rb'/Kids\s*\[\s*(\d+) 0 R', _objet(pdf, positions, pages))[1])
+    premiere_page = _objet(pdf, positions, page)
+    champ, valeur = taille, taille + 1
+
+    annotations = re.search(rb'/Annots\s*\[', premiere_page)
+    if annotations:
+        premiere_page = (premiere_page[:annotations.end()] + f"{champ} 0 R ".encode()
+                         + premiere_page[annotations.end():])
+    else:
+        premiere_page = _completer(premiere_page, f"/Annots [{champ} 0 R]")
+    date = horloge().astimezone(timezone.utc)
+    nom = ('\ufeff' + signataire.nom).encode('utf-16-be').hex().upper()
+    objets = {
+        racine: _completer(catalogue, f"/AcroForm << /Fields [{champ} 0 R] /SigFlags 3 >>"),
+        page: premiere_page,
+        champ: (f"<<\n/Type /Annot\n/Subtype /Widget\n/FT /Sig\n/T ({NOM_CHAMP})\n/V {valeur} 0 R\n"
+                f"/F 132\n/Rect [0 0 0 0]\n/P {page} 0 R\n>>").encode(),
+        valeur: (b"<<\n/Type /Sig\n/Filter /Adobe.PPKLite\n/SubFilter /ETSI.CAdES.detached\n"
+                 b"/ByteRange " + _PLAGES + b"\n/Contents <" + b'0' * (2 * signataire.taille)
+                 + f">\n/M (D:{date:%Y%m%d%H%M%S}Z)\n/Name <{nom}>\n>>".encode()),
+    }
+
+    document = bytearray(pdf)
+    if not document.endswith(b'\n'):
+        document += b'\n'
+    references = [b'xref\n']
+    for numero in sorted(objets):
+        references.append(f"{numero} 1\n{len(document):010d} 00000 n \n".encode())
+        document += f"{numero} 0 obj\n".encode() + objets[numero] + b"\nendobj\n"
+    position = len(document)
+    document += b''.join(references)
+    entrees = [f"/Size {taille + 2}", f"/Root {racine} 0 R"]
+    for cle in (rb'/Info \d+ 0 R', rb'/ID\s*\[[^\]]*\]'):
+        trouve = re.search(cle, trailer)
+        if trouve:
+            entrees.append(trouve[0].decode('latin-1'))
+    document += (f"trailer\n<<\n{chr(10).join(entrees)}\n/Prev {debut_references}\n>>\n"
+                 f"startxref\n{position}\n%%EOF\n").encode('latin-1')
+
+    # Plages signées : tout le fichier sauf la valeur de /Contents
+    debut_contenu = document.index(b'/Contents <', len(pdf)) + 10
+    fin_contenu = debut_contenu + 2 * signataire.taille + 2
+    plages = f"[0 {debut_contenu} {fin_contenu} {len(document) - fin_contenu}]".encode()
+    debut_plages = document.index(_PLAGES, len(pdf))
+    document[debut_plages:debut_plages + len(_PLAGES)] = plages.ljust(len(_PLAGES))
+    empreinte = hashlib.sha256()
+    vue = memoryview(document)
+    empreinte.update(vue[:debut_contenu])
+    empreinte.update(vue[fin_contenu:])
+    vue.release()
+    signature = signataire.signer(empreinte.digest()).hex().upper().encode()
+    if len(signature) > 2 * signataire.taille:
+        raise ValueError("Signature plus longue que la place réservée")
+    document[debut_contenu + 1:debut_contenu + 1 + len(signature)] = signature
+    return bytes(document)
+
+
+def signer_fichier(chemin, signataire, horloge=datetime.now):
+    """Signe un PDF existant ; seule la mise à jour est écrite, à la suite
+
+    Returns:
+        bool: False si le PDF était déjà signé
+    """
+    with open(chemin, 'rb') as f:
+        pdf = f.read()
+    if b'/ByteRange' in pdf:
+        return False
+    signe = signer_pdf(pdf, signataire, horloge)
+    with open(chemin, 'ab') as f:
+        f.write(signe[len(pdf):])
+        f.flush()
+        os.fsync(f.fileno())
+    return True
+
+
+def _signer_fichier(chemin, certificat):
+    """Signature dans un processus du pool : le certificat y est chargé une fois"""
+    return signer_fichier(chemin, signataire(certificat))
+
+
+def signer_fichiers(chemins, certificat=None, processus=None):
+    """Signe des PDF existants en parallèle
+
+    Args:
+        chemins (iterable): PDF à signer ; ceux déjà signés sont laissés tels quels
+        certificat (str, optional): Certificat (défaut : FACTURE_SIGNATURE)
+        processus (int, optional): Nombre de processus
+
+    Returns:
+        int: Nombre de PDF signés
+    """
+    chemins = list(chemins)
+    certificat = certificat or os.environ.get(VARIABLE_SIGNATURE)
+    signataire(certificat)  # certificat invalide : refusé avant tout fichier
+    processus = min(processus or os.cpu_count() or 1, max(len(chemins), 1))
+    if processus == 1:
+        return sum(_signer_fichier(chemin, certificat) for chemin in chemins)
+    with ProcessPoolExecutor(max_workers=processus) as pool:
+        taille_paquet = max(1, len(chemins) // (4 * processus))
+        return sum(pool.map(_signer_fichier, chemins, [certificat] * len(chemins),
+                            chunksize=taille_paquet))
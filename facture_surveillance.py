@@ -0,0 +1,285 @@
+"""Surveillance d'un dossier de commandes
+
+Le système de la boutique dépose un fichier JSON par commande dans un
+dossier d'entrée (même format qu'une ligne d'un lot, voir facture_lot).
+Le démon détecte les nouveaux fichiers (inotify sous Linux, sinon
+consultation périodique du dossier), attend qu'ils ne changent plus
+pendant un court délai (fichiers en cours d'écriture), puis confie leur
+rendu à un pool de processus gardés chauds (modules importés, polices
+analysées). Une commande prise en charge est d'abord déplacée dans
+`en_cours/`, et le numéro qui lui est attribué y est écrit avant le rendu :
+après un arrêt brutal, le démon reprend ces fichiers au démarrage sans
+les numéroter une seconde fois. Chaque commande traitée est ensuite
+déplacée dans `traitees/`, ou dans `echecs/` avec un fichier .erreur
+expliquant l'échec ; une commande invalide y est envoyée avant qu'un
+numéro lui soit attribué, avec toutes ses erreurs (voir facture_schema).
+
+Le nombre de rendus en cours est borné et les processus sont renouvelés
+périodiquement : la mémoire reste stable sur de longues durées. Une
+modification du fichier d'identité (facture_identite) s'applique aux
+commandes suivantes sans redémarrer le démon.
+"""
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import signal
+import struct
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from facture_identite import identite_courante
+from facture_polices import precharger_polices
+from facture_schema import verifier_commande
+from facture_seiko import FactureMouvementAbsolu, assurer_dossier, get_next_order_number
+
+DOSSIER_EN_COURS = 'en_cours'
+DOSSIER_TRAITEES = 'traitees'
+DOSSIER_ECHECS = 'echecs'
+DELAI_STABILITE = 0.5       # secondes sans modification avant le rendu
+INTERVALLE_SONDAGE = 0.5    # secondes entre deux lectures du dossier
+RENDUS_PAR_PROCESSUS = 500  # renouvellement des processus de rendu
+
+
+def _est_commande(nom):
+    """Fichier de commande (les fichiers cachés ou temporaires sont ignorés)"""
+    return nom.endswith('.json') and not nom.startswith('.')
+
+
+def _destination_libre(dossier, nom):
+    """Chemin de nom dans dossier, horodaté si le nom y est déjà pris"""
+    destination = os.path.join(dossier, nom)
+    if os.path.exists(destination):
+        racine, extension = os.path.splitext(destination)
+        destination = f"{racine}-{time.strftime('%Y%m%d%H%M%S')}{extension}"
+    return destination
+
+
+class _SourceInotify:
+    """Notifications du noyau Linux (inotify), sans dépendance externe"""
+
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_Q_OVERFLOW = 0x4000
+    _ENTETE = struct.Struct('iIII')
+
+    def __init__(self, dossier):
+        self.dossier = dossier
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        masque = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self._fd, os.fsencode(dossier), masque) < 0:
+            erreur = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(erreur, "inotify_add_watch")
+
+    def attendre(self, delai):
+        """Noms des fichiers modifiés, en attendant au plus delai secondes"""
+        prets, _, _ = select.select([self._fd], [], [], delai)
+        if not prets:
+            return set()
+        try:
+            donnees = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        noms = set()
+        position = 0
+        while position < len(donnees):
+            _, masque, _, longueur = self._ENTETE.unpack_from(donnees, position)
+            position += self._ENTETE.size
+            nom = donnees[position:position + longueur].rstrip(b'\0')
+            position += longueur
+            if masque & self.IN_Q_OVERFLOW:
+                # File du noyau saturée : des évènements sont perdus, le
+                # dossier entier est relu
+                noms.update(os.listdir(self.dossier))
+            elif nom:
+                noms.add(os.fsdecode(nom))
+        return noms
+
+    def fermer(self):
+        os.close(self._fd)
+
+
+class _SourceSondage:
+    """Lecture périodique du dossier (autres systèmes, partages réseau)"""
+
+    def __init__(self, dossier, intervalle=INTERVALLE_SONDAGE):
+        self.dossier = dossier
+        self.intervalle = intervalle
+        self._signatures = {}
+
+    def attendre(self, delai):
+        """Noms des fichiers nouveaux ou modifiés depuis la lecture précédente"""
+        time.sleep(min(delai, self.intervalle))
+        signatures = {}
+        with os.scandir(self.dossier) as entrees:
+            for entree in entrees:
+                if entree.is_file():
+                    info = entree.stat()
+                    signatures[entree.name] = (info.st_size, info.st_mtime_ns)
+        noms = {nom for nom, signature in signatures.items()
+                if self._signatures.get(nom) != signature}
+        self._signatures = signatures
+        return noms
+
+    def fermer(self):
+        pass
+
+
+def _source(dossier, sondage=False):
+    """Source d'évènements : inotify si disponible, sinon sondage"""
+    if not sondage:
+        try:
+            return _SourceInotify(dossier)
+        except (OSError, AttributeError, TypeError):
+            pass  # Pas de libc ou pas d'inotify (macOS, Windows)
+    return _SourceSondage(dossier)
+
+
+def _initialiser_processus():
+    """Prépare un processus de rendu avant sa première commande"""
+    precharger_polices()
+    identite_courante()
+
+
+def _reecrire(chemin, commande):
+    """Remplace un fichier de commande de façon atomique"""
+    dossier, nom = os.path.split(chemin)
+    temporaire = os.path.join(dossier, f".{nom}.tmp")
+    with open(temporaire, 'w', encoding='utf-8') as f:
+        json.dump(commande, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporaire, chemin)
+
+
+def traiter_commande(chemin):
+    """Produit la facture d'un fichier de commande (dans un processus du pool)
+
+    Une commande sans numéro reçoit le suivant, enregistré dans le fichier
+    avant le rendu : reprise après un arrêt, elle garde ce numéro.
+
+    Returns:
+        str: Chemin du PDF généré
+    """
+    with open(chemin, encoding='utf-8') as f:
+        commande = verifier_commande(json.load(f), os.path.basename(chemin))
+    if not commande.get('num_commande'):
+        commande['num_commande'] = get_next_order_number(atelier=commande.get('atelier'))
+        _reecrire(chemin, commande)
+    return FactureMouvementAbsolu.depuis_commande(commande).generer_facture()
+
+
+class Surveillance:
+    """Démon de rendu des commandes déposées dans un dossier"""
+
+    def __init__(self, dossier, processus=None, delai=DELAI_STABILITE, sondage=False):
+        self.dossier = dossier
+        self.processus = processus or os.cpu_count() or 1
+        self.delai = delai
+        self.sondage = sondage
+        self.traitees = 0
+        self.echecs = 0
+        self._actif = False
+        # Identité invalide : refusée au lancement plutôt qu'à chaque commande
+        identite_courante()
+        for sous_dossier in (DOSSIER_EN_COURS, DOSSIER_TRAITEES, DOSSIER_ECHECS):
+            assurer_dossier(os.path.join(dossier, sous_dossier))
+
+    def arreter(self, *_):
+        """Demande l'arrêt après les rendus en cours (utilisable comme signal)"""
+        self._actif = False
+
+    def executer(self, limite=None):
+        """Boucle principale
+
+        Args:
+            limite (int, optional): S'arrête après ce nombre de commandes
+                (mesures, tests) ; sinon jusqu'à arreter() ou SIGTERM
+        """
+        self._actif = True
+        source = _source(self.dossier, self.sondage)
+        # Activité par fichier : nom -> dernier changement observé
+        vus = {nom: time.monotonic() for nom in os.listdir(self.dossier)}
+        en_cours = {}
+        pool = ProcessPoolExecutor(
+            max_workers=self.processus,
+            initializer=_initialiser_processus,
+            max_tasks_per_child=RENDUS_PAR_PROCESSUS,
+        )
+        try:
+            # Commandes prises en charge avant un arrêt : reprises telles
+            # quelles (numéro déjà attribué le cas échéant)
+            dossier_en_cours = os.path.join(self.dossier, DOSSIER_EN_COURS)
+            for nom in sorted(os.listdir(dossier_en_cours)):
+                chemin = os.path.join(dossier_en_cours, nom)
+                if _est_commande(nom):
+                    en_cours[pool.submit(traiter_commande, chemin)] = chemin
+            while self._actif or en_cours:
+                attente = self.delai if vus else 1.0
+                if en_cours:
+                    attente = min(attente, 0.05)
+                maintenant = time.monotonic()
+                for nom in source.attendre(attente):
+                    vus[nom] = maintenant
+
+                # Fichiers stables depuis le délai : confiés au pool
+                maintenant = time.monotonic()
+                for nom, instant in list(vus.items()):
+                    if not self._actif or len(en_cours) >= 2 * self.processus:
+                        break
+                    if maintenant - instant < self.delai:
+                        continue
+                    del vus[nom]
+                    chemin = os.path.join(self.dossier, nom)
+                    if _est_commande(nom) and os.path.isfile(chemin):
+                        try:
+                            chemin = self._prendre(chemin)
+                        except FileNotFoundError:
+                            continue  # Retiré entre-temps
+                        en_cours[pool.submit(traiter_commande, chemin)] = chemin
+
+                termines, _ = wait(en_cours, timeout=0, return_when=FIRST_COMPLETED)
+                for futur in termines:
+                    self._classer(en_cours.pop(futur), futur)
+                if limite is not None and self.traitees + self.echecs >= limite:
+                    self._actif = False
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            source.fermer()
+
+    def _prendre(self, chemin):
+        """Déplace une commande dans en_cours/ avant de la confier au pool"""
+        destination = _destination_libre(os.path.join(self.dossier, DOSSIER_EN_COURS),
+                                         os.path.basename(chemin))
+        os.replace(chemin, destination)
+        return destination
+
+    def _classer(self, chemin, futur):
+        """Déplace une commande traitée dans traitees/ ou echecs/"""
+        erreur = futur.exception()
+        sous_dossier = DOSSIER_ECHECS if erreur else DOSSIER_TRAITEES
+        destination = _destination_libre(os.path.join(self.dossier, sous_dossier),
+                                         os.path.basename(chemin))
+        os.replace(chemin, destination)
+        if erreur:
+            self.echecs += 1
+            with open(f"{destination}.erreur", 'w', encoding='utf-8') as f:
+                f.write(f"{type(erreur).__name__}: {erreur}\n")
+        else:
+            self.traitees += 1
+
+
+def surveiller(dossier, processus=None, delai=DELAI_STABILITE, sondage=False):
+    """Lance le démon jusqu'à SIGINT ou SIGTERM"""
+    surveillance = Surveillance(dossier, processus, delai, sondage)
+    signal.signal(signal.SIGTERM, surveillance.arreter)
+    signal.signal(signal.SIGINT, surveillance.arreter)
+    surveillance.executer()
+    return surveillance
@@ -0,0 +1,430 @@
+"""File de travaux durable pour le rendu des factures
+
+Les factures à produire sont enregistrées dans une base SQLite avant tout
+rendu. Des processus de rendu, sur une ou plusieurs machines partageant le
+dossier, prennent les travaux avec un bail, les exécutent puis les
+acquittent. Un travail dont le bail expire (processus arrêté) est repris
+par un autre ; un échec est retenté avec un délai croissant, puis placé en
+lettre morte après MAX_ESSAIS tentatives.
+
+Idempotence : chaque travail a une clé unique (le numéro de commande, ou à
+défaut une empreinte de son contenu). Le numéro de commande est attribué
+une seule fois, juste après l'enregistrement du travail : réenregistrer le
+même lot ne consomme aucun numéro et ne produit aucune facture en double.
+Le compteur note le travail pour lequel il a tiré son dernier numéro ; un
+travail interrompu avant d'avoir enregistré le sien le retrouve (repris
+par ajouter() ou prendre()) au lieu d'en consommer un second. L'archivage de la
+facture (registre, comptes, annuaire, recherche) est noté dans le travail :
+un travail repris après un arrêt entre l'écriture du PDF et l'acquittement
+archive la facture s'il ne l'a pas été, sans refaire le PDF.
+
+Pendant le rendu, le bail est renouvelé par un thread : un rendu plus long
+que DUREE_BAIL n'est pas repris par un autre processus.
+
+La base est en mode de journal classique (et non WAL), seul compatible avec
+un dossier partagé sur le réseau.
+"""
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from multiprocessing import Process
+
+from facture_schema import lire_commandes
+from facture_seiko import FactureMouvementAbsolu, assurer_dossier, get_next_order_number
+
+CHEMIN_TRAVAUX = os.path.join('factures', 'travaux.sqlite')
+
+DUREE_BAIL = 300.0    # secondes avant qu'un travail pris soit repris
+MAX_ESSAIS = 5        # au-delà : lettre morte
+DELAI_BASE = 30.0     # délai avant la première nouvelle tentative
+DELAI_MAX = 3600.0
+
+# États d'un travail
+ETATS = ('attente', 'en_cours', 'fait', 'echec')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS travaux (
+    id INTEGER PRIMARY KEY,
+    cle TEXT NOT NULL UNIQUE,
+    num_commande TEXT NOT NULL,
+    charge TEXT NOT NULL,
+    etat TEXT NOT NULL DEFAULT 'attente',
+    essais INTEGER NOT NULL DEFAULT 0,
+    disponible REAL NOT NULL,
+    proprietaire TEXT,
+    bail REAL,
+    erreur TEXT,
+    chemin TEXT,
+    archivee INTEGER NOT NULL DEFAULT 0,
+    cree REAL NOT NULL,
+    termine REAL
+);
+CREATE INDEX IF NOT EXISTS travaux_prets ON travaux (etat, disponible);
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class Travail:
+    """Travail pris dans la file par un processus de rendu"""
+    id: int
+    cle: str
+    num_commande: str
+    charge: dict
+    essais: int
+    archivee: bool = False
+
+
+def cle_charge(charge):
+    """Clé d'idempotence : numéro de commande, sinon empreinte du contenu"""
+    if charge.get('num_commande'):
+        return charge['num_commande']
+    contenu = json.dumps(charge, sort_keys=True, ensure_ascii=False)
+    return 'sha256:' + hashlib.sha256(contenu.encode('utf-8')).hexdigest()
+
+
+def delai_nouvel_essai(essais):
+    """Délai avant une nouvelle tentative : exponentiel et plafonné"""
+    return min(DELAI_MAX, DELAI_BASE * 2 ** (essais - 1))
+
+
+class FileTravaux:
+    """File de travaux SQLite partagée entre processus"""
+
+    def __init__(self, chemin=CHEMIN_TRAVAUX, duree_bail=DUREE_BAIL,
+                 max_essais=MAX_ESSAIS, horloge=time.time):
+        assurer_dossier(os.path.dirname(chemin) or '.')
+        self.chemin = os.path.abspath(chemin)
+        self.duree_bail = duree_bail
+        self.max_essais = max_essais
+        self.horloge = horloge
+        self.proprietaire = f"{socket.gethostname()}:{os.getpid()}"
+        # Transactions explicites (BEGIN IMMEDIATE) : pas de mode implicite
+        self._cnx = sqlite3.connect(chemin, timeout=30, isolation_level=None)
+        self._cnx.row_factory = sqlite3.Row
+        self._cnx.execute("PRAGMA journal_mode = DELETE")
+        self._cnx.execute("PRAGMA synchronous = FULL")
+        with self._transaction():
+            for instruction in SCHEMA.split(';'):
+                if instruction.strip():
+                    self._cnx.execute(instruction)
+            colonnes = {ligne['name'] for ligne in self._cnx.execute("PRAGMA table_info(travaux)")}
+            if 'archivee' not in colonnes:
+                # Base antérieure au suivi de l'archivage : les travaux faits
+                # ont été archivés avant leur acquittement
+                self._cnx.execute("ALTER TABLE travaux ADD COLUMN archivee INTEGER NOT NULL DEFAULT 0")
+                self._cnx.execute("UPDATE travaux SET archivee = 1 WHERE etat = 'fait'")
+
+    @contextmanager
+    def _transaction(self):
+        """Transaction verrouillant la base en écriture dès son début"""
+        self._cnx.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._cnx
+        except BaseException:
+            self._cnx.execute("ROLLBACK")
+            raise
+        self._cnx.execute("COMMIT")
+
+    def fermer(self):
+        self._cnx.close()
+
+    def ajouter(self, charge, cle=None):
+        """Enregistre une facture à produire
+
+        Args:
+            charge (dict): Données de la facture et liste 'articles'
+            cle (str, optional): Clé d'idempotence (voir cle_charge)
+
+        Returns:
+            tuple: (numéro de commande, True si le travail est nouveau)
+        """
+        cle = cle or cle_charge(charge)
+        with self._transaction() as cnx:
+            existant = cnx.execute(
+                "SELECT id, num_commande FROM travaux WHERE cle = ?", (cle,)
+            ).fetchone()
+            if existant is not None:
+                identifiant, num_commande, nouveau = existant['id'], existant['num_commande'], False
+            else:
+                # Enregistré sans numéro ('') : le compteur n'est pas touché
+                # dans cette transaction
+                num_commande = charge.get('num_commande') or ''
+                maintenant = self.horloge()
+                identifiant = cnx.execute(
+                    "INSERT INTO travaux (cle, num_commande, charge, disponible, cree) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (cle, num_commande, json.dumps(charge, ensure_ascii=False),
+                     maintenant, maintenant),
+                ).lastrowid
+                nouveau = True
+        if not num_commande:
+            num_commande = self._numeroter(identifiant, charge.get('atelier'))
+        return num_commande, nouveau
+
+    def _numeroter(self, identifiant, atelier=None):
+        """Attribue son numéro de commande à un travail enregistré sans numéro
+
+        Le jeton du travail rend le même numéro à une nouvelle tentative,
+        tant qu'aucun autre n'a été tiré entre-temps.
+        """
+        num_commande = get_next_order_number(
+            atelier=atelier, jeton=f"travaux {self.chemin} {identifiant}")
+        with self._transaction() as cnx:
+            cnx.execute(
+                "UPDATE travaux SET num_commande = ? WHERE id = ? AND num_commande = ''",
+                (num_commande, identifiant),
+            )
+            return cnx.execute(
+                "SELECT num_commande FROM travaux WHERE id = ?", (identifiant,)
+            ).fetchone()['num_commande']
+
+    def prendre(self):
+        """Prend le prochain travail disponible, avec un bail
+
+        Les travaux dont le bail a expiré sont repris ; s'ils ont épuisé
+        leurs tentatives, ils passent en lettre morte.
+
+        Returns:
+            Travail: ou None si aucun travail n'est disponible
+        """
+        maintenant = self.horloge()
+        with self._transaction() as cnx:
+            cnx.execute(
+                "UPDATE travaux SET etat = 'echec', erreur = 'bail expiré', termine = ? "
+                "WHERE etat = 'en_cours' AND bail < ? AND essais >= ?",
+                (maintenant, maintenant, self.max_essais),
+            )
+            ligne = cnx.execute(
+                "SELECT id, cle, num_commande, charge, essais, archivee FROM travaux "
+                "WHERE (etat = 'attente' AND disponible <= ?) "
+                "OR (etat = 'en_cours' AND bail < ?) "
+                "ORDER BY disponible, id LIMIT 1",
+                (maintenant, maintenant),
+            ).fetchone()
+            if ligne is None:
+                return None
+            cnx.execute(
+                "UPDATE travaux SET etat = 'en_cours', proprietaire = ?, bail = ?, "
+                "essais = essais + 1 WHERE id = ?",
+                (self.proprietaire, maintenant + self.duree_bail, ligne['id']),
+            )
+        charge = json.loads(ligne['charge'])
+        # Numérotation interrompue à l'enregistrement : achevée ici
+        num_commande = ligne['num_commande'] or self._numeroter(ligne['id'], charge.get('atelier'))
+        return Travail(ligne['id'], ligne['cle'], num_commande, charge, ligne['essais'] + 1,
+                       bool(ligne['archivee']))
+
+    def prolonger(self, travail):
+        """Renouvelle le bail d'un travail long ; False s'il a été perdu"""
+        with self._transaction() as cnx:
+            curseur = cnx.execute(
+                "UPDATE travaux SET bail = ? WHERE id = ? AND etat = 'en_cours' "
+                "AND proprietaire = ?",
+                (self.horloge() + self.duree_bail, travail.id, self.proprietaire),
+            )
+        return curseur.rowcount == 1
+
+    def marquer_archivee(self, travail):
+        """Note que la facture d'un travail est archivée
+
+        Quel que soit le détenteur du bail : c'est un fait sur la facture,
+        que le processus qui reprendrait le travail doit connaître.
+        """
+        with self._transaction() as cnx:
+            cnx.execute("UPDATE travaux SET archivee = 1 WHERE id = ?", (travail.id,))
+
+    def acquitter(self, travail, chemin):
+        """Marque un travail comme fait ; False si son bail a été repris
+        par un autre processus"""
+        with self._transaction() as cnx:
+            curseur = cnx.execute(
+                "UPDATE travaux SET etat = 'fait', chemin = ?, erreur = NULL, "
+                "termine = ? WHERE id = ? AND etat = 'en_cours' AND proprietaire = ?",
+                (chemin, self.horloge(), travail.id, self.proprietaire),
+            )
+        return curseur.rowcount == 1
+
+    def echouer(self, travail, erreur):
+        """Enregistre l'échec d'un travail : nouvel essai différé ou lettre morte"""
+        maintenant = self.horloge()
+        with self._transaction() as cnx:
+            if travail.essais >= self.max_essais:
+                cnx.execute(
+                    "UPDATE travaux SET etat = 'echec', erreur = ?, termine = ? "
+                    "WHERE id = ? AND proprietaire = ?",
+                    (erreur, maintenant, travail.id, self.proprietaire),
+                )
+            else:
+                cnx.execute(
+                    "UPDATE travaux SET etat = 'attente', erreur = ?, disponible = ?, "
+                    "proprietaire = NULL, bail = NULL WHERE id = ? AND proprietaire = ?",
+                    (erreur, maintenant + delai_nouvel_essai(travail.essais),
+                     travail.id, self.proprietaire),
+                )
+
+    def rejouer(self):
+        """Remet en attente les travaux en lettre morte ; retourne leur nombre"""
+        with self._transaction() as cnx:
+            curseur = cnx.execute(
+                "UPDATE travaux SET etat = 'attente', essais = 0, disponible = ?, "
+                "termine = NULL WHERE etat = 'echec'",
+                (self.horloge(),),
+            )
+        return curseur.rowcount
+
+    def etat(self):
+        """Nombre de travaux par état"""
+        comptes = dict.fromkeys(ETATS, 0)
+        for ligne in self._cnx.execute("SELECT etat, COUNT(*) AS n FROM travaux GROUP BY etat"):
+            comptes[ligne['etat']] = ligne['n']
+        return comptes
+
+    def lettres_mortes(self):
+        """Travaux abandonnés : liste de (numéro de commande, essais, erreur)"""
+        return [tuple(ligne) for ligne in self._cnx.execute(
+            "SELECT num_commande, essais, erreur FROM travaux "
+            "WHERE etat = 'echec' ORDER BY id"
+        )]
+
+
+def enregistrer_lot(chemin_lot, chemin=CHEMIN_TRAVAUX):
+    """Enregistre chaque facture d'un fichier JSON Lines (voir facture_lot)
+
+    Returns:
+        tuple: (travaux nouveaux, travaux déjà enregistrés)
+
+    Raises:
+        CommandesInvalides: lot refusé, avant toute attribution de numéro
+    """
+    commandes = lire_commandes(chemin_lot)
+    file = FileTravaux(chemin)
+    nouveaux = deja = 0
+    try:
+        for commande in commandes:
+            _, nouveau = file.ajouter(commande)
+            if nouveau:
+                nouveaux += 1
+            else:
+                deja += 1
+    finally:
+        file.fermer()
+    return nouveaux, deja
+
+
+def executer_travail(travail, file=None):
+    """Produit la facture d'un travail et retourne le chemin du PDF
+
+    Un PDF déjà présent provient d'une exécution interrompue avant
+    l'acquittement : il n'est pas refait, et n'est archivé que s'il ne
+    l'a pas encore été.
+
+    Args:
+        travail (Travail): Travail pris dans la file
+        file (FileTravaux, optional): File où noter l'archivage
+    """
+    facture = FactureMouvementAbsolu.depuis_commande(travail.charge)
+    facture.donnees['num_commande'] = travail.num_commande
+
+    chemin = facture.nom_fichier
+    if not os.path.exists(chemin):
+        contenu = facture.rendre_pdf()
+        # Écriture atomique : un PDF présent est toujours complet
+        assurer_dossier(os.path.dirname(chemin))
+        temporaire = f"{chemin}.{os.getpid()}.tmp"
+        with open(temporaire, 'wb') as f:
+            f.write(contenu)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporaire, chemin)
+    elif travail.archivee:
+        return chemin
+    facture._archiver(chemin)
+    if file is not None:
+        file.marquer_archivee(travail)
+    return chemin
+
+
+class _Bail(threading.Thread):
+    """Renouvelle le bail d'un travail pendant son exécution
+
+    Le thread a sa propre connexion (une connexion SQLite ne se partage pas
+    entre threads) ; le propriétaire, nom de machine et numéro de
+    processus, est le même que celui du processus de rendu.
+    """
+
+    def __init__(self, chemin, travail, duree_bail):
+        super().__init__(name='bail-travail', daemon=True)
+        self.chemin = chemin
+        self.travail = travail
+        self.duree_bail = duree_bail
+        self._fin = threading.Event()
+
+    def run(self):
+        file = FileTravaux(self.chemin, duree_bail=self.duree_bail)
+        try:
+            # Bail perdu (expiré et repris) : inutile d'insister
+            while not self._fin.wait(self.duree_bail / 3):
+                if not file.prolonger(self.travail):
+                    break
+        finally:
+            file.fermer()
+
+    def arreter(self):
+        self._fin.set()
+        self.join()
+
+
+def travailler(chemin=CHEMIN_TRAVAUX, attendre=False, intervalle=1.0):
+    """Boucle d'un processus de rendu
+
+    Args:
+        chemin (str, optional): Base de la file de travaux
+        attendre (bool, optional): Attend les nouveaux travaux au lieu de
+            s'arrêter quand la file est vide
+        intervalle (float, optional): Secondes entre deux consultations
+
+    Returns:
+        int: Nombre de factures produites
+    """
+    file = FileTravaux(chemin)
+    produites = 0
+    try:
+        while True:
+            travail = file.prendre()
+            if travail is None:
+                if not attendre:
+                    break
+                time.sleep(intervalle)
+                continue
+            bail = _Bail(chemin, travail, file.duree_bail)
+            bail.start()
+            try:
+                chemin_pdf = executer_travail(travail, file)
+            except Exception as e:
+                file.echouer(travail, f"{type(e).__name__}: {e}")
+            else:
+                # Bail repris par un autre processus : c'est lui qui acquitte
+                if file.acquitter(travail, chemin_pdf):
+                    produites += 1
+            finally:
+                bail.arreter()
+    finally:
+        file.fermer()
+    return produites
+
+
+def lancer_travailleurs(processus=None, chemin=CHEMIN_TRAVAUX, attendre=False):
+    """Lance plusieurs processus de rendu sur la même file et les attend"""
+    processus = processus or os.cpu_count() or 1
+    travailleurs = [Process(target=travailler, args=(chemin, attendre))
+                    for _ in range(processus)]
+    for travailleur in travailleurs:
+        travailleur.start()
+    for travailleur in travailleurs:
+        travailleur.join()
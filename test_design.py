@@ -1,8 +1,83 @@
 from facture_seiko import FactureMouvementAbsolu, get_next_order_number, Color, print_success
+from facture_modeles import Article, Composant
 from datetime import datetime
+import hashlib
 import os
 import sys
 
+def articles_exemple():
+    """Articles d'exemple utilisés par les factures de test"""
+    # Article de test 1
+    article1 = Article(
+        modele='Chronographe Classique',
+        reference='CC-2024-01',
+        composants=(
+            Composant('Mouvement', 'Valjoux 7750', 650.00),
+            Composant('Cadran', 'Noir mat', 120.00),
+            Composant('Boîtier', 'Acier 316L 42mm', 280.00),
+            Composant('Bracelet', 'Cuir noir', 90.00),
+            Composant('Main d\'œuvre', 'Assemblage', 210.00),
+        ),
+        quantite=1
+    )
+    
+    # Article de test 2 (plus simple)
+    article2 = Article(
+        modele='Dress Watch Élégante',
+        reference='DE-2024-02',
+        composants=(
+            Composant('Mouvement', 'Miyota 9015', 280.00),
+            Composant('Cadran', 'Blanc émaillé', 150.00),
+            Composant('Boîtier', 'Acier poli 38mm', 220.00),
+            Composant('Bracelet', 'Cuir croco noir', 180.00),
+            Composant('Main d\'œuvre', 'Montage', 150.00),
+        ),
+        quantite=2
+    )
+    
+    return [article1, article2]
+
+
+def verifier_rendu_reproductible(chemin_reference=None):
+    """Vérifie que deux rendus de la même facture sont identiques à l'octet
+
+    Si chemin_reference est fourni, le rendu est comparé à ce fichier de
+    référence (créé s'il n'existe pas encore).
+    """
+    donnees = {
+        'client_nom': 'DUPONT Jean',
+        'client_adresse': '123 Rue des Montres',
+        'client_cp': '75000',
+        'client_ville': 'PARIS',
+        'num_commande': 'SM-202401-0001',
+        'date_facture': '15/01/2024'
+    }
+    
+    rendus = []
+    for _ in range(2):
+        facture = FactureMouvementAbsolu(dict(donnees), deterministe=True)
+        facture.articles = articles_exemple()
+        rendus.append(facture.rendre_pdf())
+    
+    if rendus[0] != rendus[1]:
+        print(f"{Color.RED}Les deux rendus diffèrent{Color.RESET}")
+        return False
+    print_success(f"Rendu reproductible (sha256 {hashlib.sha256(rendus[0]).hexdigest()[:16]})")
+    
+    if chemin_reference:
+        if not os.path.exists(chemin_reference):
+            with open(chemin_reference, 'wb') as f:
+                f.write(rendus[0])
+            print_success(f"Fichier de référence créé : {chemin_reference}")
+        else:
+            with open(chemin_reference, 'rb') as f:
+                if f.read() != rendus[0]:
+                    print(f"{Color.RED}Le rendu diffère de {chemin_reference}{Color.RESET}")
+                    return False
+            print_success(f"Identique à la référence {chemin_reference}")
+    return True
+
+
 def generer_facture_test():
     """Génère une facture de test avec des données d'exemple"""
     # Désactiver l'affichage des entrées/sorties pendant le test
@@ -25,41 +100,11 @@ def generer_facture_test():
         # Création d'une instance de FactureMouvementAbsolu avec les données
         facture = FactureMouvementAbsolu(donnees)
         
-        # Article de test 1
-        article1 = {
-            'modele': 'Chronographe Classique',
-            'reference': 'CC-2024-01',
-            'composants': [
-                {'nom': 'Mouvement', 'reference': 'Valjoux 7750', 'prix': 650.00},
-                {'nom': 'Cadran', 'reference': 'Noir mat', 'prix': 120.00},
-                {'nom': 'Boîtier', 'reference': 'Acier 316L 42mm', 'prix': 280.00},
-                {'nom': 'Bracelet', 'reference': 'Cuir noir', 'prix': 90.00},
-                {'nom': 'Main d\'œuvre', 'reference': 'Assemblage', 'prix': 210.00},
-            ],
-            'prix_total': 1350.00,
-            'quantite': 1
-        }
-        
-        # Article de test 2 (plus simple)
-        article2 = {
-            'modele': 'Dress Watch Élégante',
-            'reference': 'DE-2024-02',
-            'composants': [
-                {'nom': 'Mouvement', 'reference': 'Miyota 9015', 'prix': 280.00},
-                {'nom': 'Cadran', 'reference': 'Blanc émaillé', 'prix': 150.00},
-                {'nom': 'Boîtier', 'reference': 'Acier poli 38mm', 'prix': 220.00},
-                {'nom': 'Bracelet', 'reference': 'Cuir croco noir', 'prix': 180.00},
-                {'nom': 'Main d\'œuvre', 'reference': 'Montage', 'prix': 150.00},
-            ],
-            'prix_total': 980.00,
-            'quantite': 2
-        }
-
         # Ajout des articles à la facture
-        facture.articles = [article1, article2]
+        facture.articles = articles_exemple()
         
         # Calcul du total HT
-        facture.total_ht = sum(art['prix_total'] * art['quantite'] for art in facture.articles)
+        facture.total_ht = sum(art.total_ligne for art in facture.articles)
         
         # Génération de la facture
         print(f"{Color.BLUE}Génération de la facture de test...{Color.RESET}")
@@ -80,4 +125,8 @@ def generer_facture_test():
         __builtins__.input = original_input
 
 if __name__ == "__main__":
+    # python test_design.py --reproductible [fichier_reference.pdf]
+    if '--reproductible' in sys.argv:
+        arguments = sys.argv[sys.argv.index('--reproductible') + 1:]
+        sys.exit(0 if verifier_rendu_reproductible(*arguments[:1]) else 1)
     generer_facture_test()
\ No newline at end of file